@@ -1,15 +1,24 @@
 import streamlit as st
-import openai
-import json
-import base64
-import io
-import os
 import pandas as pd
 from datetime import datetime
-from collections import defaultdict
-from pdf2image import convert_from_bytes
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+
+from docscan import aggregates
+from docscan.balancer import EndpointPool, resolve_api_key
+from docscan.cache import ExtractionCache
+from docscan.clients import ClientRegistry
+from docscan.config import MAX_PAGES, TABLE_FORMATS, TYPE_CONFIG, XLSX_MIME, ZIP_MIME
+from docscan.compact import DEFAULTS as COMPACT_DEFAULTS
+from docscan.dedup import POLICIES as DUPLICATE_POLICIES, NearDuplicateIndex
+from docscan.jobs import CANCELLED, EXTRACTED, FAILED, QUEUED, RUNNING, SKIPPED, JobRunner
+from docscan.layouts import load_layouts
+from docscan.repository import DEFAULT_BATCH, DocumentRepository
+from docscan.trace import path_summary, stage_table, summarize, usage_totals, validation_totals
+from docscan.uploads import Upload
+
+PAGE_SIZE = 100  # documents affichés par page dans le tableau de bord
+MAX_TRACES = 2000  # traces d'extraction gardées en session pour le tableau p50 / p95
+RESULTS_PER_PAGE = 10  # cartes de résultat affichées par page pour un travail
+JOB_POLL_INTERVAL = 1.0  # rafraîchissement (s) du suivi des travaux en cours
 
 # ─────────────────────────────────────────────
 # Page Config
@@ -48,6 +57,11 @@ st.markdown("""
         color: white; padding: 0.8rem 1.2rem; border-radius: 8px; margin: 0.5rem 0; font-weight: 500;
     }
     
+    .live-banner {
+        background: #f0f7ff; border-left: 4px solid #2d6a9f;
+        color: #1e293b; padding: 0.6rem 1rem; border-radius: 8px; margin: 0.3rem 0; font-size: 0.9rem;
+    }
+    
     div[data-testid="stFileUploader"] {
         border: 2px dashed #2d6a9f; border-radius: 12px; padding: 1rem; background: #f0f7ff;
     }
@@ -55,41 +69,197 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ─────────────────────────────────────────────
-# Config types
+# Dépôt des documents (SQLite, survit aux sessions, partagé par lot)
 # ─────────────────────────────────────────────
-TYPE_CONFIG = {
-    "facture":          {"icon": "🧾", "label": "Factures"},
-    "devis":            {"icon": "📝", "label": "Devis"},
-    "bon_de_commande":  {"icon": "📦", "label": "Bons de commande"},
-    "fiche_de_paie":    {"icon": "💰", "label": "Fiches de paie"},
-    "note_de_frais":    {"icon": "🧾", "label": "Notes de frais"},
-    "autre":            {"icon": "📄", "label": "Autres"},
-}
+@st.cache_resource
+def get_repository(batch):
+    return DocumentRepository(batch=batch)
 
 # ─────────────────────────────────────────────
 # Session State
 # ─────────────────────────────────────────────
-if "history" not in st.session_state:
-    st.session_state.history = []
+if "batch" not in st.session_state:
+    st.session_state.batch = DEFAULT_BATCH
+if "export_memo" not in st.session_state:
+    st.session_state.export_memo = {}
+if "traces" not in st.session_state:
+    st.session_state.traces = []
+if "watching" not in st.session_state:
+    st.session_state.watching = set()  # travaux lancés par cette session, pas encore vus terminés
+
+history = get_repository(st.session_state.batch.strip() or DEFAULT_BATCH)
+
+# ─────────────────────────────────────────────
+# Cache d'extraction (partagé entre sessions et reruns)
+# ─────────────────────────────────────────────
+@st.cache_resource
+def get_extraction_cache():
+    return ExtractionCache()
+
+extraction_cache = get_extraction_cache()
+
+
+@st.cache_resource
+def get_duplicate_index():
+    return NearDuplicateIndex()
+
+duplicate_index = get_duplicate_index()
+
+
+@st.cache_resource
+def get_client_registry():
+    return ClientRegistry()
+
+client_registry = get_client_registry()
+
+
+@st.cache_resource
+def get_raster_pool():
+    from docscan.raster import make_raster_pool
+    return make_raster_pool()
+
+
+@st.cache_resource
+def get_job_runner():
+    return JobRunner()
+
+job_runner = get_job_runner()
 
 # ─────────────────────────────────────────────
 # API Key resolution
 # ─────────────────────────────────────────────
 def get_api_key():
+    """Pool de points d'accès s'il est configuré (Secrets [[endpoints]], DOCSCAN_ENDPOINTS, OPENAI_API_KEYS), sinon la clé unique."""
     try:
-        sk = st.secrets.get("OPENAI_API_KEY", "")
-        if sk:
-            return sk
+        secrets = st.secrets
+        secrets.get("OPENAI_API_KEY", "")
     except Exception:
-        pass
-    env = os.environ.get("OPENAI_API_KEY", "")
-    if env:
-        return env
-    return st.session_state.get("sidebar_api_key", "")
+        secrets = None
+    try:
+        return resolve_api_key(secrets=secrets, fallback=st.session_state.get("sidebar_api_key", ""))
+    except (ValueError, OSError) as e:
+        st.error(f"❌ Points d'accès mal configurés : {e}")
+        return ""
 
 # ─────────────────────────────────────────────
 # Sidebar
 # ─────────────────────────────────────────────
+# Panneaux en fragments : toucher l'un de leurs widgets ne relance que le panneau, pas toute la page
+def settings_panel():
+    """Réglages lus au lancement d'une extraction (st.session_state) : rien d'autre à redessiner."""
+    with st.expander("⚡ Performance"):
+        st.number_input(
+            "Extractions en parallèle", min_value=1, max_value=16, value=4,
+            help="Nombre maximal d'appels GPT-4o en vol simultanément.",
+            key="max_in_flight"
+        )
+        st.number_input(
+            "Timeout par requête (s)", min_value=10, max_value=600, value=120, step=10,
+            key="request_timeout"
+        )
+        st.number_input(
+            "Tentatives sur erreur 429/5xx", min_value=0, max_value=10, value=3,
+            key="max_retries"
+        )
+        st.checkbox(
+            "Rasterisation PDF multi-processus", value=True,
+            help="Rend les PDF dans des processus séparés pendant que les appels API sont en vol.",
+            key="raster_processes"
+        )
+        st.checkbox(
+            "Affichage en flux", value=True,
+            help="Reçoit la réponse GPT-4o au fil de l'eau : type, client, n° et total s'affichent dès qu'ils sont lus.",
+            key="stream"
+        )
+        st.checkbox(
+            "Couche texte des PDF natifs", value=True,
+            help="Un PDF généré par un logiciel est lu par son texte (sans rendu d'image) ; "
+                 "les mises en page connues (layouts.json) sont lues sans appel API. Les scans restent en vision.",
+            key="text_layer"
+        )
+        st.selectbox(
+            "Quasi-doublons", ["off"] + list(DUPLICATE_POLICIES), index=1,
+            format_func=lambda p: DUPLICATE_POLICIES.get(p, "Ne pas chercher"),
+            help="Même document reçu en photo, en scan et en pièce jointe : repéré par l'empreinte de la page. "
+                 "Signaler l'extrait quand même ; Réutiliser reprend le résultat déjà obtenu ; Ignorer ne l'ajoute pas.",
+            key="duplicate_policy"
+        )
+        st.checkbox(
+            "PDF multi-pages", value=False,
+            help="Analyse toutes les pages (une par une) et fusionne lignes et totaux. Sinon, seule la 1re page est lue.",
+            key="multipage"
+        )
+        st.number_input(
+            "Pages max par document", min_value=1, max_value=200, value=MAX_PAGES,
+            key="max_pages"
+        )
+        st.checkbox(
+            "Compacter les images avant envoi", value=True,
+            help="Redresse, recadre les marges, réduit à la résolution utile au modèle et encode en JPEG/WebP.",
+            key="compact_images"
+        )
+        st.selectbox("Format envoyé", ["JPEG", "WEBP"], key="compact_format")
+        st.number_input(
+            "Taille cible par image (Ko)", min_value=50, max_value=2000, value=COMPACT_DEFAULTS["target_kb"], step=50,
+            key="compact_target_kb"
+        )
+
+
+def cache_panel():
+    """Compteurs du cache d'extraction ; le vider ne relance que ce panneau."""
+    with st.expander("🗄️ Cache d'extraction"):
+        cache_stats = extraction_cache.stats()
+        cc1, cc2 = st.columns(2)
+        cc1.metric("Hits", cache_stats["hits"])
+        cc2.metric("Misses", cache_stats["misses"])
+        st.caption(f"{cache_stats['entries']} document(s) en cache · {cache_stats['bytes'] / 1024:,.0f} Ko")
+        st.caption(f"{len(duplicate_index)} empreinte(s) de page pour les quasi-doublons")
+        if st.button("🧹 Vider le cache", width="stretch"):
+            extraction_cache.clear()
+            duplicate_index.clear()
+            st.rerun(scope="fragment")
+
+
+def clients_panel():
+    """Clients du lot ; une fusion ou une réinitialisation relance toute la page (tableau de bord)."""
+    if history:
+        st.markdown("### 👥 Clients détectés")
+        for cl, count, types_for_client in history.client_summary():
+            type_icons = " ".join(TYPE_CONFIG.get(t, {}).get("icon", "📄") for t in types_for_client)
+            st.markdown(f"**{cl}** — {count} doc(s) {type_icons}")
+        
+        with st.expander("🔗 Regrouper des clients"):
+            st.caption("Les variantes d'un même client (« SFR », « S.F.R. », « SFR SA ») sont regroupées à l'ingestion "
+                       "par SIREN et par nom ; corrigez ici ce qui a échappé au regroupement.")
+            merge_sources = st.multiselect("Clients à fusionner", history.clients(), key="merge_sources")
+            merge_target = st.text_input("Sous le nom", value=merge_sources[0] if merge_sources else "", key="merge_target").strip()
+            if st.button("Fusionner", width="stretch", disabled=not (merge_sources and merge_target)):
+                client_registry.merge(merge_sources, merge_target)
+                for name in merge_sources:
+                    if name != merge_target:
+                        history.rename_client(name, merge_target)
+                st.session_state.export_memo = {}
+                st.rerun()
+            with st.form("client_alias", clear_on_submit=True, border=False):
+                variant = st.text_input("Variante de nom", placeholder="ex. Sté Française du Radiotéléphone")
+                variant_client = st.selectbox("À ranger sous", history.clients())
+                if st.form_submit_button("Rattacher (prochains documents)", width="stretch") and variant.strip():
+                    client_registry.set_alias(variant, variant_client)
+            aliases = client_registry.aliases()
+            if not aliases.empty:
+                st.dataframe(aliases, width="stretch", hide_index=True)
+        
+        st.markdown("---")
+        st.metric("Total documents", len(history))
+        
+        if st.button("🗑️ Réinitialiser le lot", width="stretch"):
+            history.clear()
+            st.session_state.export_memo = {}
+            st.rerun()
+    else:
+        st.caption("Aucun document traité.")
+
+
 with st.sidebar:
     st.markdown("### ⚙️ Configuration")
     
@@ -99,7 +269,14 @@ with st.sidebar:
     except Exception:
         pass
     
-    if has_secret:
+    configured = get_api_key()
+    if isinstance(configured, EndpointPool):
+        st.success(f"✅ {len(configured)} points d'accès : appels répartis selon leurs quotas")
+        with st.expander("🔀 Points d'accès"):
+            st.dataframe(pd.DataFrame(configured.status()), hide_index=True, width="stretch")
+            st.caption("Disjoncteur ouvert : point d'accès écarté après des erreurs répétées, "
+                       "puis retenté par une seule requête.")
+    elif has_secret:
         st.success("✅ Clé API chargée via Secrets")
     else:
         st.text_input(
@@ -108,25 +285,16 @@ with st.sidebar:
             key="sidebar_api_key"
         )
     
+    st.fragment(settings_panel, key="settings")()
+    st.fragment(cache_panel, key="cache")()
     st.markdown("---")
     
-    if st.session_state.history:
-        st.markdown("### 👥 Clients détectés")
-        clients = sorted(set(h["client"] for h in st.session_state.history))
-        for cl in clients:
-            count = sum(1 for h in st.session_state.history if h["client"] == cl)
-            types_for_client = set(h["type"] for h in st.session_state.history if h["client"] == cl)
-            type_icons = " ".join(TYPE_CONFIG.get(t, {}).get("icon", "📄") for t in types_for_client)
-            st.markdown(f"**{cl}** — {count} doc(s) {type_icons}")
-        
-        st.markdown("---")
-        st.metric("Total documents", len(st.session_state.history))
-        
-        if st.button("🗑️ Réinitialiser", use_container_width=True):
-            st.session_state.history = []
-            st.rerun()
-    else:
-        st.caption("Aucun document traité.")
+    st.text_input(
+        "📁 Lot", key="batch",
+        help="Les documents sont enregistrés par lot : deux opérateurs sur le même lot partagent le même historique.",
+    )
+    
+    st.fragment(clients_panel, key="clients")()
 
 # ─────────────────────────────────────────────
 # Header
@@ -140,521 +308,475 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ─────────────────────────────────────────────
-# Prompt système
+# Export Excel
 # ─────────────────────────────────────────────
-SYSTEM_PROMPT = """Tu es un assistant expert en extraction de données documentaires.
-On te fournit l'image d'un document professionnel.
-
-MISSIONS :
-1. IDENTIFIER le type de document
-2. IDENTIFIER le client (= la personne/entreprise qui REÇOIT le document ou à qui il est adressé. Si c'est une facture, le client est le destinataire. Si c'est une fiche de paie, le client est l'employeur.)
-3. EXTRAIRE toutes les informations
-
-Réponds UNIQUEMENT avec un JSON valide (sans markdown, sans backticks) :
-
-{
-    "type_document": "facture | devis | bon_de_commande | fiche_de_paie | note_de_frais | autre",
-    "confiance_type": "haute | moyenne | basse",
-    "client_detecte": "Nom de l'entreprise/personne cliente identifiée",
-    "emetteur": {
-        "nom": "",
-        "adresse": "",
-        "telephone": "",
-        "email": "",
-        "siret": "",
-        "tva_intra": ""
-    },
-    "destinataire": {
-        "nom": "",
-        "adresse": "",
-        "telephone": "",
-        "email": "",
-        "siret": ""
-    },
-    "document": {
-        "numero": "",
-        "date_emission": "",
-        "date_echeance": "",
-        "reference": "",
-        "objet": ""
-    },
-    "lignes": [
-        {
-            "description": "",
-            "quantite": "",
-            "prix_unitaire_ht": "",
-            "montant_ht": "",
-            "tva_pourcent": ""
-        }
-    ],
-    "totaux": {
-        "total_ht": "",
-        "total_tva": "",
-        "total_ttc": "",
-        "devise": "EUR"
-    },
-    "paiement": {
-        "mode": "",
-        "iban": "",
-        "bic": "",
-        "conditions": ""
-    },
-    "notes": ""
-}
-
-Règles :
-- Remplis UNIQUEMENT les champs trouvés dans le document, laisse "" pour les absents
-- client_detecte : déduis le nom du client principal (destinataire pour facture/devis, employeur pour fiche de paie)
-- Montants en string "1234.56", dates en "JJ/MM/AAAA"
-- Si le type ne correspond à aucun listé, utilise "autre"
-"""
+# excel (openpyxl, xlsxwriter) et columnar (pyarrow) sont importés au premier export, pas au démarrage
+def organized_excel(history, ids):
+    from docscan.excel import build_organized_excel
+    return build_organized_excel(history, ids)
 
-# ─────────────────────────────────────────────
-# Core functions
-# ─────────────────────────────────────────────
-def encode_image(uploaded_file):
-    return base64.b64encode(uploaded_file.getvalue()).decode("utf-8")
 
+def client_zip(history, ids):
+    from docscan.excel import build_client_zip
+    return build_client_zip(history, ids, pool=get_raster_pool())
 
-def pdf_to_image_b64(uploaded_file):
-    """Convertit la première page d'un PDF en image base64."""
-    images = convert_from_bytes(uploaded_file.getvalue(), first_page=1, last_page=1, dpi=200)
-    buf = io.BytesIO()
-    images[0].save(buf, format="PNG")
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
 
+def tables_zip(table_format):
+    def build(history, ids):
+        from docscan.columnar import build_tables_zip
+        return build_tables_zip(history, table_format, ids)
+    return build
 
-def extract_data(image_base64, file_type, api_key):
-    client = openai.OpenAI(api_key=api_key)
-    mime_map = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "webp": "image/webp"}
-    mime = mime_map.get(file_type.lower(), "image/png")
-    
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": [
-                {"type": "text", "text": "Analyse ce document. Identifie le client, le type, et extrais toutes les données en JSON."},
-                {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{image_base64}", "detail": "high"}}
-            ]}
-        ],
-        max_tokens=4096,
-        temperature=0
-    )
-    
-    raw = response.choices[0].message.content.strip()
-    if raw.startswith("```"):
-        raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
-        if raw.endswith("```"):
-            raw = raw[:-3]
-        raw = raw.strip()
-    return json.loads(raw)
-
-
-def flatten_data(data):
-    flat = {}
-    flat["Client"] = data.get("client_detecte", "Non identifié")
-    flat["Type"] = data.get("type_document", "autre")
-    flat["Confiance"] = data.get("confiance_type", "")
-    
-    em = data.get("emetteur", {})
-    flat["Émetteur"] = em.get("nom", "")
-    flat["Émetteur Adresse"] = em.get("adresse", "")
-    flat["Émetteur Tél"] = em.get("telephone", "")
-    flat["Émetteur Email"] = em.get("email", "")
-    flat["Émetteur SIRET"] = em.get("siret", "")
-    
-    dest = data.get("destinataire", {})
-    flat["Destinataire"] = dest.get("nom", "")
-    flat["Destinataire Adresse"] = dest.get("adresse", "")
-    
-    doc = data.get("document", {})
-    flat["N° Document"] = doc.get("numero", "")
-    flat["Date émission"] = doc.get("date_emission", "")
-    flat["Date échéance"] = doc.get("date_echeance", "")
-    flat["Référence"] = doc.get("reference", "")
-    flat["Objet"] = doc.get("objet", "")
-    
-    tot = data.get("totaux", {})
-    flat["Total HT"] = tot.get("total_ht", "")
-    flat["Total TVA"] = tot.get("total_tva", "")
-    flat["Total TTC"] = tot.get("total_ttc", "")
-    flat["Devise"] = tot.get("devise", "EUR")
-    
-    paie = data.get("paiement", {})
-    flat["Mode paiement"] = paie.get("mode", "")
-    flat["IBAN"] = paie.get("iban", "")
-    flat["Notes"] = data.get("notes", "")
-    return flat
-
-
-def lines_to_df(data):
-    lignes = data.get("lignes", [])
-    if not lignes:
-        return None
-    rows = []
-    for l in lignes:
-        rows.append({
-            "Description": l.get("description", ""),
-            "Quantité": l.get("quantite", ""),
-            "Prix unitaire HT": l.get("prix_unitaire_ht", ""),
-            "Montant HT": l.get("montant_ht", ""),
-            "TVA (%)": l.get("tva_pourcent", ""),
-        })
-    return pd.DataFrame(rows)
-
-
-def safe_sheet_name(name, max_len=31):
-    for ch in ['\\', '/', '*', '?', ':', '[', ']']:
-        name = name.replace(ch, '_')
-    return name[:max_len]
-
-
-def format_worksheet(ws, header_color="1e3a5f"):
-    """Applique un formatage professionnel à une feuille Excel."""
-    header_fill = PatternFill(start_color=header_color, end_color=header_color, fill_type="solid")
-    header_font = Font(name="Calibri", bold=True, color="FFFFFF", size=11)
-    cell_font = Font(name="Calibri", size=10)
-    header_align = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    cell_align = Alignment(vertical="center", wrap_text=True)
-    thin_border = Border(
-        left=Side(style="thin", color="D0D0D0"),
-        right=Side(style="thin", color="D0D0D0"),
-        top=Side(style="thin", color="D0D0D0"),
-        bottom=Side(style="thin", color="D0D0D0"),
-    )
-    alt_fill = PatternFill(start_color="F8FAFC", end_color="F8FAFC", fill_type="solid")
-    
-    # Formater les en-têtes
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = header_align
-        cell.border = thin_border
-    
-    # Formater les données
-    for row_idx, row in enumerate(ws.iter_rows(min_row=2), start=2):
-        for cell in row:
-            cell.font = cell_font
-            cell.alignment = cell_align
-            cell.border = thin_border
-            if row_idx % 2 == 0:
-                cell.fill = alt_fill
-    
-    # Auto-ajuster la largeur des colonnes
-    for col_idx, col in enumerate(ws.columns, 1):
-        max_length = 0
-        col_letter = get_column_letter(col_idx)
-        for cell in col:
-            try:
-                cell_len = len(str(cell.value or ""))
-                if cell_len > max_length:
-                    max_length = cell_len
-            except Exception:
-                pass
-        # Limiter entre 10 et 45 caractères
-        adjusted = min(max(max_length + 3, 10), 45)
-        ws.column_dimensions[col_letter].width = adjusted
-    
-    # Figer la première ligne (en-têtes)
-    ws.freeze_panes = "A2"
 
+def single_excel(flat, lines_df):
+    from docscan.excel import build_single_excel
+    return build_single_excel(flat, lines_df)
 
-def build_organized_excel(history):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        
-        # 1. INDEX GÉNÉRAL
-        all_flats = []
-        for h in history:
-            row = h["flat"].copy()
-            row["Fichier source"] = h["filename"]
-            row["Date extraction"] = h["timestamp"]
-            all_flats.append(row)
-        pd.DataFrame(all_flats).to_excel(writer, sheet_name="Index général", index=False)
-        format_worksheet(writer.sheets["Index général"], "1e3a5f")
-        
-        # 2. PAR CLIENT → PAR TYPE
-        by_client = defaultdict(list)
-        for h in history:
-            by_client[h["client"]].append(h)
-        
-        # Couleurs par type de document
-        type_colors = {
-            "facture": "2563eb",
-            "devis": "7c3aed",
-            "bon_de_commande": "db2777",
-            "fiche_de_paie": "ea580c",
-            "note_de_frais": "059669",
-            "autre": "64748b",
-        }
-        
-        for client_name, client_docs in sorted(by_client.items()):
-            by_type = defaultdict(list)
-            for doc in client_docs:
-                by_type[doc["type"]].append(doc)
-            
-            for type_key, type_docs in sorted(by_type.items()):
-                type_label = TYPE_CONFIG.get(type_key, {}).get("label", type_key)
-                sheet_name = safe_sheet_name(f"{client_name} - {type_label}")
-                color = type_colors.get(type_key, "64748b")
-                
-                rows = []
-                for doc in type_docs:
-                    row = doc["flat"].copy()
-                    row["Fichier source"] = doc["filename"]
-                    rows.append(row)
-                pd.DataFrame(rows).to_excel(writer, sheet_name=sheet_name, index=False)
-                format_worksheet(writer.sheets[sheet_name], color)
-                
-                # Lignes détaillées
-                all_lines = []
-                for doc in type_docs:
-                    if doc["lines_df"] is not None and not doc["lines_df"].empty:
-                        ldf = doc["lines_df"].copy()
-                        ldf.insert(0, "N° Document", doc["flat"].get("N° Document", ""))
-                        ldf.insert(0, "Fichier", doc["filename"])
-                        all_lines.append(ldf)
-                
-                if all_lines:
-                    combined = pd.concat(all_lines, ignore_index=True)
-                    lines_sheet = safe_sheet_name(f"{client_name} - {type_label} DET")
-                    combined.to_excel(writer, sheet_name=lines_sheet, index=False)
-                    format_worksheet(writer.sheets[lines_sheet], color)
-    
-    return output.getvalue()
 
+def memoized_export(key, ids=None, build=organized_excel):
+    """Construit l'export (Excel organisé par défaut) une seule fois par (version de l'historique, filtres).
 
-def build_single_excel(flat, lines_df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        # Feuille résumé — transposée pour une meilleure lisibilité
-        summary_data = {"Champ": list(flat.keys()), "Valeur": list(flat.values())}
-        pd.DataFrame(summary_data).to_excel(writer, sheet_name="Résumé", index=False)
-        format_worksheet(writer.sheets["Résumé"], "1e3a5f")
-        
-        # Ajuster la colonne Valeur plus large
-        writer.sheets["Résumé"].column_dimensions["B"].width = 50
-        
-        if lines_df is not None and not lines_df.empty:
-            lines_df.to_excel(writer, sheet_name="Lignes détaillées", index=False)
-            format_worksheet(writer.sheets["Lignes détaillées"], "2563eb")
-    return output.getvalue()
+    Appelé uniquement au clic sur le bouton de téléchargement (data callable) ;
+    tant que l'historique ne change pas, les clics suivants resservent les mêmes octets.
+    """
+    state = (history.batch, history.version)
+    memo_key = (state,) + key
+    memo = st.session_state.export_memo
+    if memo_key not in memo:
+        # Les entrées d'une version précédente de l'historique (ou d'un autre lot) ne serviront plus
+        for stale in [k for k in memo if k[0] != state]:
+            del memo[stale]
+        memo[memo_key] = build(history, ids)
+    return memo[memo_key]
 
 
 # ─────────────────────────────────────────────
 # UPLOAD & EXTRACTION
 # ─────────────────────────────────────────────
+def upload_panel(api_key):
+    """Dépôt et lancement : ajouter ou retirer un fichier ne relance que ce panneau."""
+    uploaded_files = st.file_uploader(
+        "Glisse tes documents ici — factures, devis, bons de commande, fiches de paie...",
+        type=["png", "jpg", "jpeg", "webp", "pdf"],
+        accept_multiple_files=True,
+        help="Formats : PNG, JPG, JPEG, WEBP, PDF · Max 20 Mo par fichier"
+    )
+
+    if uploaded_files and not api_key:
+        st.warning("⚠️ Entre ta clé API OpenAI dans la barre latérale ou configure les Secrets Streamlit.")
+
+    if uploaded_files and api_key:
+        force_extract = st.checkbox(
+            "🔄 Forcer la ré-extraction",
+            help="Ignore le cache et rappelle GPT-4o même pour un document déjà analysé."
+        )
+        if st.button("🚀 Lancer l'extraction", type="primary", width="stretch"):
+            compaction = None
+            if st.session_state.get("compact_images", True):
+                compaction = {
+                    "format": st.session_state.get("compact_format", "JPEG"),
+                    "target_kb": int(st.session_state.get("compact_target_kb", COMPACT_DEFAULTS["target_kb"])),
+                }
+            text_layer = bool(st.session_state.get("text_layer", True))
+            duplicate_policy = st.session_state.get("duplicate_policy", "flag")
+        
+            # Le travail part dans la file de fond : les reruns suivants ne l'interrompent plus
+            job = job_runner.submit(
+                [Upload.from_file(f.name, f) for f in uploaded_files], history, api_key,
+                batch=history.batch, clients=client_registry,
+                max_in_flight=int(st.session_state.get("max_in_flight", 4)),
+                cache=extraction_cache, force=force_extract,
+                raster_pool=get_raster_pool() if st.session_state.get("raster_processes", True) else None,
+                multipage=bool(st.session_state.get("multipage", False)),
+                max_pages=int(st.session_state.get("max_pages", MAX_PAGES)),
+                compaction=compaction,
+                text_layer=text_layer, layouts=load_layouts() if text_layer else [],
+                duplicates=duplicate_index if duplicate_policy in DUPLICATE_POLICIES else None,
+                duplicate_policy=duplicate_policy,
+                timeout=float(st.session_state.get("request_timeout", 120)),
+                max_retries=int(st.session_state.get("max_retries", 3)),
+                stream=bool(st.session_state.get("stream", True)),
+            )
+            st.session_state.watching.add(job.id)
+            st.session_state.selected_job = job.id
+            st.rerun()  # suivi et résultats du nouveau travail : hors du fragment
+
+
 st.markdown("## 📤 Uploader des documents")
+st.fragment(upload_panel, key="upload")(configured)
 
-uploaded_files = st.file_uploader(
-    "Glisse tes documents ici — factures, devis, bons de commande, fiches de paie...",
-    type=["png", "jpg", "jpeg", "webp", "pdf"],
-    accept_multiple_files=True,
-    help="Formats : PNG, JPG, JPEG, WEBP, PDF · Max 20 Mo par fichier"
-)
 
-api_key = get_api_key()
+# ─────────────────────────────────────────────
+# SUIVI DES TRAVAUX (hors du script : survit aux reruns et au rechargement)
+# ─────────────────────────────────────────────
+def render_partial(doc):
+    partial = doc["partial"]
+    type_conf = TYPE_CONFIG.get(partial.get("type_document"), {})
+    return (
+        f'<div class="live-banner">⏳ <b>{doc["name"]}</b>'
+        f' · {type_conf.get("icon", "📄")} {type_conf.get("label", "…").upper()}'
+        f' · Client : {partial.get("client_detecte", "…")}'
+        f' · N° {partial.get("numero", "…")} · {partial.get("date_emission", "…")}'
+        f' · {partial.get("total_ttc", "…")} € · {doc["lignes"]} ligne(s) reçue(s)</div>'
+    )
 
-if uploaded_files and not api_key:
-    st.warning("⚠️ Entre ta clé API OpenAI dans la barre latérale ou configure les Secrets Streamlit.")
 
-if uploaded_files and api_key:
-    if st.button("🚀 Lancer l'extraction", type="primary", use_container_width=True):
+def show_jobs():
+    """État des travaux du lot, rafraîchi seul (fragment) tant qu'un travail est en cours."""
+    jobs = job_runner.jobs(history.batch)
+    active = [j for j in jobs if not j.finished]
+    for job in active:
+        counts = job.counts()
+        jc1, jc2 = st.columns([4, 1])
+        with jc1:
+            st.progress(job.progress(), text=(
+                f"🔍 Travail {job.id} · {job.status} · {counts[EXTRACTED]} extrait(s), {counts[QUEUED]} en attente"
+                f" sur {len(job.documents)}" + (f" · {counts[FAILED]} erreur(s)" if counts[FAILED] else "")
+            ))
+        with jc2:
+            if st.button("⏹️ Annuler", key=f"cancel_{job.id}", width="stretch"):
+                job.cancel()
+        running = [doc for doc in job.documents if doc["status"] == RUNNING]
+        if running:
+            st.markdown("".join(render_partial(doc) for doc in running), unsafe_allow_html=True)
+    
+    # Un travail suivi par cette session vient de finir : rerun complet (résultats, tableau de bord)
+    finished = [job_id for job_id in st.session_state.watching if (job := job_runner.get(job_id)) is None or job.finished]
+    if finished:
+        for job_id in finished:
+            st.session_state.watching.discard(job_id)
+            job = job_runner.get(job_id)
+            if job is not None:
+                st.session_state.traces = (st.session_state.traces + job.traces())[-MAX_TRACES:]
+        st.rerun()
+
+
+jobs = job_runner.jobs(history.batch)
+if any(not j.finished for j in jobs):
+    st.markdown("### ⏳ Extractions en cours")
+    st.caption("Elles continuent en arrière-plan : changer un réglage ou recharger la page ne les interrompt pas.")
+    st.fragment(show_jobs, run_every=JOB_POLL_INTERVAL)()
+
+
+def show_result(doc):
+    """Carte d'un document terminé : aperçu, champs clés, lignes, trace et Excel individuel."""
+    name = doc["name"]
+    st.markdown(f"---\n### 📄 {name}")
+    col_img, col_result = st.columns([1, 1.5])
+    
+    with col_img:
+        if doc.get("preview") is not None:
+            st.image(doc["preview"], caption=name, width="stretch")
+        elif name.lower().endswith(".pdf"):
+            st.info(f"📄 Fichier PDF : {name}")
+    
+    with col_result:
+        if doc["status"] == SKIPPED:
+            dup = doc["duplicate"]
+            st.info(f"⏭️ Ignoré : quasi-doublon de {dup['file']} (distance {dup['distance']}), déjà extrait.")
+            return
+        if doc["status"] == CANCELLED:
+            st.info("⏹️ Annulé avant la fin de l'extraction.")
+            return
+        if doc["status"] == FAILED:
+            st.error(f"❌ {doc['error']}")
+            return
+        
+        data, flat, lines_df, trace = doc["data"], doc["flat"], doc["lines_df"], doc["trace"]
+        doc_type = data.get("type_document", "autre")
+        client_name = flat["Client"]
+        type_conf = TYPE_CONFIG.get(doc_type, TYPE_CONFIG["autre"])
+        st.markdown(
+            f'<div class="success-banner">'
+            f'✅ {type_conf["icon"]} {type_conf["label"].upper()} · Client : {client_name}'
+            f'</div>',
+            unsafe_allow_html=True
+        )
+        
+        doc_info = data.get("document", {})
+        totaux = data.get("totaux", {})
+        
+        mc1, mc2, mc3 = st.columns(3)
+        with mc1:
+            st.markdown(f'<div class="stat-card"><h3>{doc_info.get("numero", "—")}</h3><p>N° Document</p></div>', unsafe_allow_html=True)
+        with mc2:
+            st.markdown(f'<div class="stat-card"><h3>{doc_info.get("date_emission", "—")}</h3><p>Date</p></div>', unsafe_allow_html=True)
+        with mc3:
+            st.markdown(f'<div class="stat-card"><h3>{totaux.get("total_ttc", "—")} €</h3><p>Total TTC</p></div>', unsafe_allow_html=True)
         
-        progress = st.progress(0, text="Préparation...")
+        if lines_df is not None and not lines_df.empty:
+            st.markdown("**📋 Lignes :**")
+            st.dataframe(lines_df, width="stretch", hide_index=True)
+        
+        if trace.get("duplicate"):
+            dup = trace["duplicate"]
+            if trace.get("path") == "doublon":
+                st.info(f"♻️ Quasi-doublon de {dup['file']} : résultat repris sans appel API (distance {dup['distance']})")
+            else:
+                st.warning(f"⚠️ Quasi-doublon probable de {dup['file']} (distance {dup['distance']}) : à vérifier")
+        if trace.get("path") == "local":
+            st.caption(f"⚡ PDF natif lu localement (mise en page « {trace['layout']} ») : aucun appel API")
+        elif trace.get("path") == "texte":
+            st.caption(f"📝 PDF natif : {trace['text_chars']:,} caractères de texte envoyés au lieu d'une image")
+        elif trace.get("payload"):
+            pl = trace["payload"]
+            st.caption(
+                f"📦 Envoyé : {pl['bytes_before'] / 1024:,.0f} Ko → {pl['bytes_after'] / 1024:,.0f} Ko"
+                f" · ~{pl['tokens_after']:,} tokens image (au lieu de ~{pl['tokens_before']:,})"
+            )
         
-        for i, uploaded_file in enumerate(uploaded_files):
-            progress.progress(i / len(uploaded_files), text=f"📄 Analyse de {uploaded_file.name} ({i+1}/{len(uploaded_files)})...")
-            
-            st.markdown(f"---\n### 📄 {uploaded_file.name}")
-            col_img, col_result = st.columns([1, 1.5])
-            
-            with col_img:
-                file_ext = uploaded_file.name.rsplit(".", 1)[-1].lower()
-                if file_ext == "pdf":
-                    # Afficher la première page du PDF comme image
-                    try:
-                        preview_images = convert_from_bytes(uploaded_file.getvalue(), first_page=1, last_page=1, dpi=150)
-                        st.image(preview_images[0], caption=uploaded_file.name, use_container_width=True)
-                    except Exception:
-                        st.info(f"📄 Fichier PDF : {uploaded_file.name}")
-                else:
-                    st.image(uploaded_file, caption=uploaded_file.name, use_container_width=True)
-            
-            with col_result:
-                with st.spinner("🔍 GPT-4o Vision analyse..."):
-                    try:
-                        file_ext = uploaded_file.name.rsplit(".", 1)[-1].lower()
-                        
-                        # Convertir PDF en image, sinon encoder directement
-                        if file_ext == "pdf":
-                            img_b64 = pdf_to_image_b64(uploaded_file)
-                            send_ext = "png"
-                        else:
-                            img_b64 = encode_image(uploaded_file)
-                            send_ext = file_ext
-                        
-                        data = extract_data(img_b64, send_ext, api_key)
-                        
-                        flat = flatten_data(data)
-                        lines_df = lines_to_df(data)
-                        
-                        doc_type = data.get("type_document", "autre")
-                        client_name = data.get("client_detecte", "Non identifié") or "Non identifié"
-                        
-                        st.session_state.history.append({
-                            "filename": uploaded_file.name,
-                            "raw": data,
-                            "flat": flat,
-                            "lines_df": lines_df,
-                            "type": doc_type,
-                            "client": client_name,
-                            "timestamp": datetime.now().strftime("%d/%m/%Y %H:%M")
-                        })
-                        
-                        type_conf = TYPE_CONFIG.get(doc_type, TYPE_CONFIG["autre"])
-                        st.markdown(
-                            f'<div class="success-banner">'
-                            f'✅ {type_conf["icon"]} {type_conf["label"].upper()} · Client : {client_name}'
-                            f'</div>',
-                            unsafe_allow_html=True
-                        )
-                        
-                        doc_info = data.get("document", {})
-                        totaux = data.get("totaux", {})
-                        
-                        mc1, mc2, mc3 = st.columns(3)
-                        with mc1:
-                            st.markdown(f'<div class="stat-card"><h3>{doc_info.get("numero", "—")}</h3><p>N° Document</p></div>', unsafe_allow_html=True)
-                        with mc2:
-                            st.markdown(f'<div class="stat-card"><h3>{doc_info.get("date_emission", "—")}</h3><p>Date</p></div>', unsafe_allow_html=True)
-                        with mc3:
-                            st.markdown(f'<div class="stat-card"><h3>{totaux.get("total_ttc", "—")} €</h3><p>Total TTC</p></div>', unsafe_allow_html=True)
-                        
-                        if lines_df is not None and not lines_df.empty:
-                            st.markdown("**📋 Lignes :**")
-                            st.dataframe(lines_df, use_container_width=True, hide_index=True)
-                        
-                        excel_bytes = build_single_excel(flat, lines_df)
-                        st.download_button(
-                            label=f"📥 Excel · {uploaded_file.name}",
-                            data=excel_bytes,
-                            file_name=f"{client_name}_{doc_type}_{uploaded_file.name.rsplit('.', 1)[0]}.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
-                        
-                        with st.expander("🔧 JSON brut"):
-                            st.json(data)
-                        
-                    except json.JSONDecodeError as e:
-                        st.error(f"❌ Erreur parsing JSON : {e}")
-                    except openai.AuthenticationError:
-                        st.error("❌ Clé API invalide.")
-                        break
-                    except Exception as e:
-                        st.error(f"❌ Erreur : {str(e)}")
+        with st.expander(f"⏱️ Trace · {trace['total'] * 1000:,.0f} ms" + (" (cache)" if trace.get("cached") else "")):
+            st.dataframe(stage_table(trace), width="stretch", hide_index=True)
+            if trace.get("usage"):
+                u = trace["usage"]
+                st.caption(
+                    f"🧾 {u['prompt_tokens']:,} tokens prompt + {u['completion_tokens']:,} tokens réponse"
+                    f" · {trace.get('attempts', 1)} tentative(s)"
+                    + (" · réponse réparée" if trace.get("repaired") else "")
+                )
         
-        progress.progress(1.0, text="✅ Extraction terminée !")
+        if trace.get("pages"):
+            if trace["pages_total"] > len(trace["pages"]):
+                st.warning(f"⚠️ {trace['pages_total']} pages : seules les {len(trace['pages'])} premières ont été analysées.")
+            with st.expander(f"⏱️ {len(trace['pages'])} page(s) analysée(s)"):
+                st.dataframe(pd.DataFrame(trace["pages"]), width="stretch", hide_index=True)
+        
+        st.download_button(
+            label=f"📥 Excel · {name}",
+            data=lambda: single_excel(flat, lines_df),
+            file_name=f"{client_name}_{doc_type}_{name.rsplit('.', 1)[0]}.xlsx",
+            mime=XLSX_MIME,
+            key=f"single_{id(doc)}",
+        )
+        
+        with st.expander("🔧 JSON brut"):
+            st.json(data)
+
+
+def results_panel():
+    """Résultats d'un travail (le dernier lancé par défaut), documents dans l'ordre où ils ont fini.
+
+    Changer de travail ou de page ne relance que ce panneau.
+    """
+    jobs = job_runner.jobs(history.batch)
+    st.markdown("---")
+    job_ids = [j.id for j in jobs]
+    selected = st.session_state.get("selected_job")
+    # Libellés stables (sans l'état) : le choix ne change pas quand le travail avance
+    shown = st.selectbox(
+        "🗂️ Travail", job_ids, index=job_ids.index(selected) if selected in job_ids else 0,
+        format_func=lambda job_id: f"{job_id} · {len(job_runner.get(job_id).documents)} document(s)",
+    )
+    st.session_state.selected_job = shown
+    job = job_runner.get(shown)
+    counts = job.counts()
+    st.caption(
+        f"État : {job.status} · {counts[EXTRACTED]} extrait(s), {counts[SKIPPED]} ignoré(s),"
+        f" {counts[FAILED]} erreur(s), {counts[CANCELLED]} annulé(s)" + (f" · {job.error}" if job.error else "")
+    )
+    done = job.completed()
+    if done:
+        n_pages = (len(done) - 1) // RESULTS_PER_PAGE + 1
+        page = st.number_input(f"Résultats (page sur {n_pages})", min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
+        for doc in done[(page - 1) * RESULTS_PER_PAGE:page * RESULTS_PER_PAGE]:
+            show_result(doc)
+    
+    job_traces = job.traces()
+    if job.finished and job_traces:
+        st.markdown("---")
+        st.markdown("### ⏱️ Où passe le temps (ce lot)")
+        st.dataframe(summarize(job_traces), width="stretch", hide_index=True)
+        u = usage_totals(job_traces)
+        st.caption(f"🧾 {u['prompt_tokens']:,} tokens prompt + {u['completion_tokens']:,} tokens réponse sur {len(job_traces)} document(s)")
+        v = validation_totals(job_traces)
+        if v["calls"]:
+            st.caption(
+                f"🧩 {v['parse_failures']} réponse(s) hors schéma sur {v['calls']} appel(s) ({v['wasted']:.1%} perdus)"
+                f" · {v['repaired']}/{v['repairs']} réparée(s) sans ré-extraction · {v['local_fixes']} champ(s) corrigé(s) localement"
+            )
+        st.dataframe(path_summary(job_traces), width="stretch", hide_index=True)
+
+
+if jobs:
+    st.fragment(results_panel, key="results")()
 
 
 # ─────────────────────────────────────────────
 # HISTORIQUE, FILTRES & EXPORT
 # ─────────────────────────────────────────────
-if st.session_state.history:
+# Tableau et synthèse mis en cache par (lot, version de l'historique, documents), pour toutes les sessions :
+# revenir sur un filtre ou une page déjà vus ne relit ni ne renormalise l'historique
+@st.cache_data(max_entries=200)
+def page_table(batch, version, ids):
+    rows = get_repository(batch).documents(ids, internal=True)
+    type_display = {t: f"{c['icon']} {c['label']}" for t, c in TYPE_CONFIG.items()}
+    return pd.DataFrame({
+        "Client": rows["_client"],
+        "Type": rows["_type"].map(type_display).fillna(type_display["autre"]),
+        "N° Document": rows["N° Document"],
+        "Date": rows["Date émission"],
+        "Émetteur": rows["Émetteur"],
+        "Total TTC": rows["Total TTC"],
+        "Fichier": rows["Fichier source"],
+        "Extrait le": rows["Date extraction"],
+    })
+
+
+@st.cache_data(max_entries=200)
+def synthesis(batch, version, ids):
+    history = get_repository(batch)
+    amounts = history.amounts(ids)
+    return {
+        "client": aggregates.by_client(amounts),
+        "type": aggregates.by_type(amounts),
+        "month": aggregates.by_month(amounts),
+        "vat": aggregates.vat_breakdown(history.vat_lines(ids)),
+    }
+
+
+def dashboard():
+    """Tableau de bord du lot : filtrer, paginer ou choisir un format d'export ne relance que lui."""
     st.markdown("---")
     st.markdown("## 📊 Tableau de bord")
     
-    all_clients = sorted(set(h["client"] for h in st.session_state.history))
-    all_types = sorted(set(h["type"] for h in st.session_state.history))
+    all_clients = history.clients()
+    all_types = history.types()
     
     c1, c2, c3, c4 = st.columns(4)
     with c1:
-        st.markdown(f'<div class="stat-card"><h3>{len(st.session_state.history)}</h3><p>Documents</p></div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="stat-card"><h3>{len(history)}</h3><p>Documents</p></div>', unsafe_allow_html=True)
     with c2:
         st.markdown(f'<div class="stat-card"><h3>{len(all_clients)}</h3><p>Clients</p></div>', unsafe_allow_html=True)
     with c3:
         st.markdown(f'<div class="stat-card"><h3>{len(all_types)}</h3><p>Types</p></div>', unsafe_allow_html=True)
     with c4:
-        total = 0
-        for h in st.session_state.history:
-            ttc = h["raw"].get("totaux", {}).get("total_ttc", "0")
-            try:
-                total += float(str(ttc).replace(",", ".").replace(" ", ""))
-            except (ValueError, TypeError):
-                pass
+        total = history.total_ttc()
         st.markdown(f'<div class="stat-card"><h3>{total:,.2f} €</h3><p>Total TTC</p></div>', unsafe_allow_html=True)
     
     st.markdown("")
     
     # Filtres
     st.markdown("### 🔍 Filtrer")
-    fc1, fc2 = st.columns(2)
+    fc1, fc2, fc3 = st.columns(3)
     with fc1:
         filter_client = st.selectbox("👤 Client", ["Tous"] + all_clients)
     with fc2:
-        type_options = ["Tous"] + [f"{TYPE_CONFIG.get(t, {}).get('icon', '📄')} {TYPE_CONFIG.get(t, {}).get('label', t)}" for t in all_types]
-        filter_type_display = st.selectbox("📋 Type", type_options)
+        type_keys = {f"{TYPE_CONFIG.get(t, {}).get('icon', '📄')} {TYPE_CONFIG.get(t, {}).get('label', t)}": t for t in all_types}
+        filter_type_display = st.selectbox("📋 Type", ["Tous"] + list(type_keys))
+    with fc3:
+        filter_numero = st.text_input("🔢 N° document").strip()
     
-    filtered = st.session_state.history
-    if filter_client != "Tous":
-        filtered = [h for h in filtered if h["client"] == filter_client]
-    if filter_type_display != "Tous":
-        for t_key, t_conf in TYPE_CONFIG.items():
-            if t_conf["label"] in filter_type_display:
-                filtered = [h for h in filtered if h["type"] == t_key]
-                break
+    # Filtrage par requêtes indexées : coût proportionnel au résultat, pas à l'historique
+    filtered = history.select(
+        client=None if filter_client == "Tous" else filter_client,
+        doc_type=type_keys.get(filter_type_display),
+        numero=filter_numero or None,
+    )
     
     if filtered:
         st.markdown(f"### 📋 Documents ({len(filtered)} résultat{'s' if len(filtered) > 1 else ''})")
         
-        display_rows = []
-        for h in filtered:
-            type_conf = TYPE_CONFIG.get(h["type"], TYPE_CONFIG["autre"])
-            display_rows.append({
-                "Client": h["client"],
-                "Type": f"{type_conf['icon']} {type_conf['label']}",
-                "N° Document": h["flat"].get("N° Document", ""),
-                "Date": h["flat"].get("Date émission", ""),
-                "Émetteur": h["flat"].get("Émetteur", ""),
-                "Total TTC": h["flat"].get("Total TTC", ""),
-                "Fichier": h["filename"],
-                "Extrait le": h["timestamp"],
-            })
-        st.dataframe(pd.DataFrame(display_rows), use_container_width=True, hide_index=True)
+        # Pagination : seuls les documents de la page affichée sont chargés
+        n_pages = (len(filtered) - 1) // PAGE_SIZE + 1
+        page = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
+        version = history.version
+        display_df = page_table(history.batch, version, tuple(filtered[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]))
+        st.dataframe(display_df, width="stretch", hide_index=True, column_config={
+            "Date": st.column_config.DateColumn(format="DD/MM/YYYY"),
+            "Total TTC": st.column_config.NumberColumn(format="%.2f €"),
+        })
+        
+        # Synthèse des documents filtrés : groupby sur les colonnes typées à l'ingestion
+        st.markdown("### 📈 Synthèse")
+        tables = synthesis(history.batch, version, tuple(filtered))
+        money = {c: st.column_config.NumberColumn(format="%.2f €") for c in ("Total HT", "Total TVA", "Total TTC", "Base HT", "TVA calculée")}
+        tab_client, tab_type, tab_month, tab_vat = st.tabs(["👤 Par client", "📋 Par type", "📅 Par mois", "🧾 TVA"])
+        with tab_client:
+            st.dataframe(tables["client"], width="stretch", hide_index=True, column_config=money)
+        with tab_type:
+            st.dataframe(tables["type"], width="stretch", hide_index=True, column_config=money)
+        with tab_month:
+            months = tables["month"]
+            dated = months[months["Mois"] != aggregates.NO_DATE]
+            if len(dated) > 1:
+                st.bar_chart(dated, x="Mois", y="Total TTC")
+            st.dataframe(months, width="stretch", hide_index=True, column_config=money)
+        with tab_vat:
+            st.dataframe(tables["vat"], width="stretch", hide_index=True, column_config=money)
+            st.caption("TVA calculée = base HT des lignes × taux ; les lignes sans taux lisible sont regroupées à part.")
     else:
         st.info("Aucun document ne correspond aux filtres.")
     
+    if st.session_state.traces:
+        with st.expander(f"⏱️ Temps par étape · {len(st.session_state.traces)} extraction(s) de la session"):
+            st.dataframe(summarize(st.session_state.traces), width="stretch", hide_index=True)
+            st.caption("p50 / p95 par document. En multi-pages, les étapes cumulent les pages traitées en parallèle.")
+    
     # Exports
     st.markdown("---")
     st.markdown("### 📥 Export organisé")
     st.caption("L'Excel contient : **Index général** + une feuille par **Client × Type** + **lignes détaillées**")
     
-    exp1, exp2 = st.columns(2)
+    exp1, exp2, exp3 = st.columns(3)
     
     with exp1:
-        global_excel = build_organized_excel(st.session_state.history)
         st.download_button(
             label="📥 Export complet (tous clients, tous types)",
-            data=global_excel,
+            data=lambda: memoized_export(("Tous", "Tous", "")),
             file_name=f"DocScan_Export_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            mime=XLSX_MIME,
             type="primary",
-            use_container_width=True
+            width="stretch"
         )
     
     with exp2:
-        if filter_client != "Tous" or filter_type_display != "Tous":
-            filtered_excel = build_organized_excel(filtered)
+        if filter_client != "Tous" or filter_type_display != "Tous" or filter_numero:
+            filter_key = (filter_client, filter_type_display, filter_numero)
+            filtered_ids = list(filtered)
             st.download_button(
                 label=f"📥 Export filtré ({filter_client})",
-                data=filtered_excel,
+                data=lambda: memoized_export(filter_key, filtered_ids),
                 file_name=f"DocScan_{filter_client}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True
+                mime=XLSX_MIME,
+                width="stretch"
             )
         else:
             st.caption("💡 Utilise les filtres pour exporter un client ou type spécifique.")
+    
+    with exp3:
+        # Un classeur par client, écrits par le pool de processus partagé (démarré une fois par serveur)
+        zip_key = ("zip", filter_client, filter_type_display, filter_numero)
+        zip_ids = list(filtered)
+        n_zip_clients = len({client for client, _, _ in history.groups(zip_ids)})
+        st.download_button(
+            label=f"📦 Un classeur par client (ZIP, {n_zip_clients} client{'s' if n_zip_clients > 1 else ''})",
+            data=lambda: memoized_export(zip_key, zip_ids, build=client_zip),
+            file_name=f"DocScan_Clients_{datetime.now().strftime('%Y%m%d_%H%M')}.zip",
+            mime=ZIP_MIME,
+            width="stretch",
+            disabled=not zip_ids,
+        )
+
+    # Tables pour l'ETL comptable : écrites par tranches depuis l'historique, sans passer par le classeur
+    tab1, tab2 = st.columns([1, 2])
+    with tab1:
+        table_format = st.selectbox("Format des tables", list(TABLE_FORMATS), format_func=TABLE_FORMATS.get,
+                                    key="table_format")
+    with tab2:
+        tables_key = ("tables", table_format, filter_client, filter_type_display, filter_numero)
+        tables_ids = list(filtered)
+        st.download_button(
+            label=f"🗂️ Tables documents + lignes ({TABLE_FORMATS[table_format]}, ZIP)",
+            data=lambda: memoized_export(tables_key, tables_ids, build=tables_zip(table_format)),
+            file_name=f"DocScan_Tables_{datetime.now().strftime('%Y%m%d_%H%M')}.zip",
+            mime=ZIP_MIME,
+            width="stretch",
+            disabled=not tables_ids,
+        )
+
+
+if history:
+    st.fragment(dashboard, key="dashboard")()
 
 # ─────────────────────────────────────────────
 # Footer
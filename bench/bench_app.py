@@ -0,0 +1,154 @@
+"""Démarrage à froid et coût des reruns de app.py, selon la taille de l'historique.
+
+    python -m bench.bench_app --docs 10 100 1000
+
+Pour chaque taille, un historique synthétique est enregistré dans un dossier de données neuf
+(DOCSCAN_DATA_DIR), puis l'app est exécutée par streamlit.testing (AppTest), sans navigateur :
+- démarrage à froid : premier run du script dans un processus neuf (Streamlit déjà importé),
+  imports des modules de docscan et des dépendances lourdes compris ; les dépendances lourdes
+  chargées à ce moment sont listées ;
+- reruns : temps du run que déclenche chaque interaction, app déjà chargée. Un widget placé dans
+  un fragment (st.fragment(key=...)) ne relance que ce fragment : le run est alors rejoué limité au
+  fragment, comme le ferait le serveur ; sinon c'est un rerun complet du script.
+Valeurs médianes sur --repeat mesures (--cold-runs processus pour le démarrage). st.cache_data est
+partagé entre les mesures d'un même processus, comme entre les sessions d'un serveur : une interaction
+répétée est servie par le cache.
+"""
+import argparse
+import dataclasses
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+HEAVY_MODULES = ("pandas", "numpy", "PIL", "openpyxl", "xlsxwriter", "pyarrow", "openai", "pdf2image")
+
+
+def _tiny_png():
+    import io
+
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), "white").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def widget(at, kind, label):
+    """Premier widget de ce type dont le libellé commence par label (None s'il n'est pas affiché)."""
+    return next((w for w in getattr(at, kind) if w.label.startswith(label)), None)
+
+
+def pick(w):
+    """Choisit la deuxième option de la liste w (la première est celle par défaut) ; False si elle n'existe pas."""
+    return bool(w and len(w.options) > 1 and w.select_index(1))
+
+
+# (libellé, clé du fragment qui contient le widget, interaction : renvoie False si le widget est absent)
+SCENARIOS = [
+    ("Rerun complet (fin d'un travail)", None, lambda at: True),
+    ("Fichiers déposés", "upload", lambda at: bool(
+        (w := widget(at, "file_uploader", "Glisse")) and w.set_value([(f"scan_{i}.png", _tiny_png(), "image/png")
+                                                                       for i in range(3)]))),
+    ("Réglage (Performance)", "settings", lambda at: bool(
+        (w := widget(at, "number_input", "Extractions en parallèle")) and w.set_value(8))),
+    ("Filtre client", "dashboard", lambda at: pick(widget(at, "selectbox", "👤 Client"))),
+    ("Page du tableau", "dashboard", lambda at: bool(
+        (w := widget(at, "number_input", "Page (sur")) and w.set_value(2))),
+    ("Format des tables", "dashboard", lambda at: bool(
+        (w := widget(at, "selectbox", "Format des tables")) and w.set_value("csv"))),
+]
+
+
+def populate(data_dir, docs):
+    os.environ["DOCSCAN_DATA_DIR"] = data_dir
+    from bench.synthetic import make_history
+    from docscan.repository import DocumentRepository
+    make_history(docs, history=DocumentRepository())
+
+
+def cold_start(data_dir):
+    """Dans un processus neuf : durée du premier run (s) et dépendances lourdes chargées."""
+    os.environ["DOCSCAN_DATA_DIR"] = data_dir
+    from streamlit.testing.v1 import AppTest
+    before = set(sys.modules)
+    t0 = time.perf_counter()
+    at = AppTest.from_file(APP, default_timeout=120).run()
+    elapsed = time.perf_counter() - t0
+    assert not at.exception, at.exception
+    loaded = [m for m in HEAVY_MODULES if m in sys.modules and m not in before]
+    return elapsed, loaded
+
+
+def _fragment_runner():
+    """LocalScriptRunner dont les runs peuvent être limités à des fragments (fragment_id_queue)."""
+    from streamlit.testing.v1 import app_test
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    class FragmentRunner(LocalScriptRunner):
+        fragment_ids = []
+
+        def request_rerun(self, rerun_data):
+            requested = super().request_rerun(rerun_data)
+            if FragmentRunner.fragment_ids:
+                # Le runner de test est créé avec une demande de rerun complet en attente, qui absorberait
+                # une demande limitée à un fragment : c'est donc la demande en attente qui est limitée
+                self._requests._rerun_data = dataclasses.replace(
+                    self._requests._rerun_data, fragment_id_queue=list(FragmentRunner.fragment_ids),
+                    is_fragment_scoped_rerun=True)
+            return requested
+
+    app_test.LocalScriptRunner = FragmentRunner
+    return FragmentRunner
+
+
+def reruns(data_dir, repeat):
+    """Dans un processus (app déjà importée) : {scénario: (portée, ms médianes)}."""
+    os.environ["DOCSCAN_DATA_DIR"] = data_dir
+    from streamlit.testing.v1 import AppTest
+    runner = _fragment_runner()
+    AppTest.from_file(APP, default_timeout=120).run()  # imports et ressources partagées prêts
+    results = {}
+    for label, fragment, interact in SCENARIOS:
+        times, scope = [], None
+        for _ in range(repeat):
+            at = AppTest.from_file(APP, default_timeout=120).run()
+            if not interact(at):
+                break
+            try:
+                runner.fragment_ids = at._fragment_storage.resolve_target(fragment) if fragment else []
+                scope = "fragment" if runner.fragment_ids else "script"
+            except Exception:  # pas de fragment de ce nom : rerun complet
+                runner.fragment_ids, scope = [], "script"
+            t0 = time.perf_counter()
+            at.run()
+            times.append(time.perf_counter() - t0)
+            runner.fragment_ids = []
+            assert not at.exception, at.exception
+        if times:
+            results[label] = (scope, statistics.median(times) * 1000)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cold-runs", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")  # hérité par les processus de mesure
+    context = multiprocessing.get_context("spawn")
+    spawn = lambda fn, *a: ProcessPoolExecutor(max_workers=1, mp_context=context).submit(fn, *a).result()
+    for docs in args.docs:
+        with tempfile.TemporaryDirectory() as data_dir:
+            spawn(populate, data_dir, docs)
+            colds = [spawn(cold_start, data_dir) for _ in range(args.cold_runs)]
+            print(f"\n{docs} document(s) dans l'historique")
+            print(f"  démarrage à froid : {statistics.median(c[0] for c in colds) * 1000:,.0f} ms"
+                  f" (chargés : {', '.join(colds[0][1]) or 'aucun'})")
+            for label, (scope, ms) in spawn(reruns, data_dir, args.repeat).items():
+                print(f"  {label:<34} {scope:<9} {ms:>8,.0f} ms")
@@ -0,0 +1,80 @@
+"""Clé unique vs pool de points d'accès, face à des serveurs stub aux quotas différents.
+
+    python -m bench.bench_balancer --docs 60 --in-flight 16
+
+Trois points d'accès locaux (un serveur stub chacun, quotas en requêtes par fenêtre de --window s) :
+A (en-têtes OpenAI), B (chemins et en-têtes Azure OpenAI : restes seuls, quota déclaré dans la
+configuration), C (plus gros quota, mais dégradé : --degraded des réponses en 503).
+- « clé unique A » : l'ancien chemin (une clé, retry avec backoff sur 429/5xx) ;
+- « pool A » : même quota, avec contre-pression (seaux recalés sur les en-têtes) ;
+- « pool A+B+C » : requêtes réparties, C écarté par son disjoncteur quand il enchaîne les échecs.
+Chaque scénario repart de serveurs neufs (quotas pleins).
+"""
+import argparse
+import time
+
+from bench.bench_concurrency import TINY_PNG, FakeUpload
+from bench.stub_openai import start_stub_server
+from docscan.balancer import Endpoint, EndpointPool
+from docscan.engine import run_concurrent
+from docscan.extraction import extract_document
+
+
+def start_endpoints(args):
+    """Serveurs A, B, C ; renvoie ({nom: (server, state)}, {nom: spec d'Endpoint})."""
+    a, b, c = args.quotas
+    servers, specs = {}, {}
+    server, state, url = start_stub_server(latency=args.latency, rpm=a, window=args.window)
+    servers["A"], specs["A"] = (server, state), {"api_key": "sk-stub-a", "base_url": url, "name": "A"}
+    server, state, url = start_stub_server(latency=args.latency, rpm=b, window=args.window, azure=True)
+    servers["B"], specs["B"] = (server, state), {
+        "api_key": "stub-b", "azure_endpoint": url.rsplit("/v1", 1)[0], "deployment": "gpt-4o",
+        "api_version": "2024-06-01", "name": "B", "rpm": round(b * 60 / args.window)}
+    server, state, url = start_stub_server(latency=args.latency, rpm=c, window=args.window,
+                                           error_rate=args.degraded, error_codes=(503,))
+    servers["C"], specs["C"] = (server, state), {"api_key": "sk-stub-c", "base_url": url, "name": "C"}
+    return servers, specs
+
+
+def run(args, scenario):
+    servers, specs = start_endpoints(args)
+    if scenario == "clé unique A":
+        key = "sk-stub-a"
+        options = {"base_url": specs["A"]["base_url"]}
+    else:
+        names = ["A"] if scenario == "pool A" else ["A", "B", "C"]
+        key = EndpointPool([Endpoint.from_spec(specs[n]) for n in names], cooldown=args.cooldown)
+        options = {}
+    files = [FakeUpload(f"doc_{i:04d}.png", TINY_PNG) for i in range(args.docs)]
+    worker = lambda f: extract_document(f, key, timeout=30, max_retries=args.retries, **options)
+    failed = 0
+    t0 = time.perf_counter()
+    for _, _, error in run_concurrent(files, worker, max_in_flight=args.in_flight):
+        failed += error is not None
+    elapsed = time.perf_counter() - t0
+    states = {name: state for name, (_, state) in servers.items()}
+    for server, _ in servers.values():
+        server.shutdown()
+    throttled = sum(s.throttled for s in states.values())
+    outages = sum(s.errors for s in states.values())
+    split = " ".join(f"{name}:{s.completed}" for name, s in states.items() if s.requests)
+    return elapsed, failed, throttled, outages, split
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=60)
+    parser.add_argument("--in-flight", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--quotas", type=int, nargs=3, default=[10, 20, 40], metavar=("A", "B", "C"),
+                        help="requêtes par fenêtre de chaque point d'accès")
+    parser.add_argument("--window", type=float, default=5.0, help="fenêtre des quotas (s) ; 60 = par minute")
+    parser.add_argument("--degraded", type=float, default=0.5, help="part des réponses en 503 sur C")
+    parser.add_argument("--cooldown", type=float, default=5.0, help="durée d'ouverture du disjoncteur (s)")
+    parser.add_argument("--retries", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'scénario':<14} {'durée (s)':>10} {'docs/s':>7} {'échecs':>7} {'429':>5} {'503':>5}  réussies par point d'accès")
+    for scenario in ("clé unique A", "pool A", "pool A+B+C"):
+        elapsed, failed, throttled, outages, split = run(args, scenario)
+        print(f"{scenario:<14} {elapsed:>10.2f} {args.docs / elapsed:>7.2f} {failed:>7} {throttled:>5} {outages:>5}  {split}")
@@ -0,0 +1,63 @@
+"""Export « un classeur par client » (ZIP) : passage à l'échelle selon le nombre de processus.
+
+    python -m bench.bench_client_zip --docs 20000 --clients 40 --workers 1 2 4 8
+
+Référence : le classeur organisé unique (build_organized_excel, un seul thread). Le pool est
+démarré et chauffé avant la mesure (comme le pool partagé de l'app) ; son démarrage est affiché à part.
+Le gain ne peut dépasser ni le nombre de cœurs ni le nombre de clients.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bench.synthetic import make_truth
+from docscan.excel import _client_workbook, build_client_zip, build_organized_excel
+from docscan.extraction import flatten_data, lines_to_df
+from docscan.history import HistoryStore
+from docscan.normalize import normalize_document
+
+
+def make_history(n, clients):
+    """Historique synthétique réparti sur `clients` clients (make_history n'en a que 6)."""
+    history = HistoryStore()
+    for i in range(n):
+        data = make_truth(i)
+        client = f"Client {i % clients:03d}"
+        flat, lines_df = normalize_document(flatten_data(data), lines_to_df(data))
+        flat["Client"] = client
+        history.add(f"scan_{i:06d}.pdf", flat, lines_df, data["type_document"], client, "01/03/2024 10:00")
+    return history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=40)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    history = make_history(args.docs, args.clients)
+    print(f"{args.docs} documents, {args.clients} clients, {os.cpu_count()} cœur(s)")
+    t0 = time.perf_counter()
+    size = len(build_organized_excel(history))
+    single = time.perf_counter() - t0
+    print(f"Classeur unique : {single:.2f} s, {size / 1e6:.1f} Mo")
+
+    print(f"\n{'processus':>9} {'démarrage (s)':>14} {'ZIP (s)':>9} {'Mo':>6} {'accélération':>13}")
+    base = None
+    for workers in args.workers:
+        startup, pool = 0.0, None
+        if workers > 1:
+            t0 = time.perf_counter()
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            list(pool.map(_client_workbook, [[]] * workers))  # chauffe : imports faits dans chaque processus
+            startup = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        size = len(build_client_zip(history, workers=1, pool=pool))
+        elapsed = time.perf_counter() - t0
+        if pool is not None:
+            pool.shutdown()
+        base = base or elapsed
+        print(f"{workers:>9} {startup:>14.2f} {elapsed:>9.2f} {size / 1e6:>6.1f} {base / elapsed:>12.2f}x")
@@ -0,0 +1,107 @@
+"""Résolution des clients : regroupement des variantes de nom et coût d'une résolution selon la taille de la base.
+
+    python -m bench.bench_clients --clients 100 1000 10000 --docs 5
+
+Pour chaque taille, une base de clients synthétiques (noms composés, SIREN valides) reçoit
+--docs documents par client, sous des variantes de nom (casse, sigle pointé, forme juridique,
+faute de frappe), avec le SIRET du client sur la moitié d'entre eux. Mesures :
+- clients obtenus en groupant sur le nom brut (avant) et après résolution ;
+- documents d'un vrai client éclatés sur plusieurs clients (fragmentation) et clients mêlant
+  deux vrais clients (fusions à tort) ;
+- temps par résolution avec l'index de trigrammes, et avec une comparaison à toutes les variantes
+  (mesurée sur un échantillon) pour voir l'écart croître avec la base.
+"""
+import argparse
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+from docscan.clients import ClientRegistry, _similarity, normalize_name, trigrams
+
+WORDS = ["ALPHA", "ATLAS", "AUSTRAL", "AZUR", "BOIS", "BOURBON", "CAP", "CORAIL", "CREOLE", "DISTRIB", "ECO", "ELEC",
+         "EST", "FLEUR", "FRET", "GRAND", "ILE", "INFO", "KREOL", "LAGON", "LITTORAL", "MAREE", "MASCAREIGNES",
+         "NORD", "OCEAN", "PITON", "PLAINE", "PORT", "RAVINE", "RECIF", "SABLE", "SERVICES", "SOLEIL", "SUD",
+         "TAMARIN", "TECHNO", "TRANSPORTS", "TROPIC", "VACOA", "VANILLE", "VOLCAN"]
+FORMS = ["SARL", "SAS", "SA", "EURL"]
+
+
+def luhn_siren(rng):
+    """SIREN aléatoire dont la clé de Luhn est correcte."""
+    digits = [rng.randrange(10) for _ in range(8)]
+    total = sum(d if i % 2 == 0 else (2 * d - 9 if d > 4 else 2 * d) for i, d in enumerate(digits))
+    return "".join(map(str, digits)) + str(-total % 10)
+
+
+def make_base(n, rng):
+    """n clients distincts : (nom, SIREN). Chaque nom porte un patronyme inventé (« Transports Bakoli Sud »)."""
+    tokens, names = set(), []
+    while len(names) < n:
+        token = "".join(rng.choice("BDFGKLMNPRSTV") + rng.choice("AEIOU") for _ in range(rng.choice((2, 3))))
+        if token in tokens:
+            continue
+        tokens.add(token)
+        words = rng.sample(WORDS, 2)
+        names.append(rng.choice([f"{words[0]} {token}", f"{token} {words[0]}", f"{words[0]} {token} {words[1]}"]).title())
+    return [(name, luhn_siren(rng)) for name in names]
+
+
+def variant(name, rng):
+    """Le nom tel qu'un document peut l'écrire."""
+    kind = rng.choice(["exact", "casse", "forme", "sigle", "faute"])
+    if kind == "casse":
+        return name.upper()
+    if kind == "forme":
+        return f"{name} {rng.choice(FORMS)}"
+    if kind == "sigle":
+        return name.replace(" ", ". ") + "."
+    if kind == "faute":
+        i = rng.randrange(1, len(name) - 1)
+        return name[:i] + name[i + 1:] if name[i] != " " else name
+    return name
+
+
+def document(name, siren, with_siret):
+    party = {"nom": name, "adresse": "", "telephone": "", "email": "", "siret": f"{siren}00012" if with_siret else ""}
+    return {"type_document": "facture", "client_detecte": name, "destinataire": party, "emetteur": {"nom": "Fournisseur"}}
+
+
+def linear_closest(registry, key):
+    """Référence sans index : similarité calculée contre toutes les variantes connues."""
+    grams = trigrams(key)
+    return max(registry._aliases, key=lambda k: _similarity(grams, trigrams(k)), default=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--docs", type=int, default=5, help="documents par client")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'docs':>7} {'avant':>7} {'après':>7} {'éclatés':>8} {'fusions':>8}"
+          f" {'index (µs)':>11} {'linéaire (µs)':>14}")
+    for n in args.clients:
+        rng = random.Random(args.seed)
+        base = make_base(n, rng)
+        docs = [(truth, variant(name, rng), siren, rng.random() < 0.5)
+                for truth, (name, siren) in enumerate(base) for _ in range(args.docs)]
+        rng.shuffle(docs)
+        registry = ClientRegistry(tempfile.mktemp(suffix=".sqlite"))
+        resolved = defaultdict(set)
+        t0 = time.perf_counter()
+        for truth, name, siren, with_siret in docs:
+            resolved[truth].add(registry.resolve(document(name, siren, with_siret)))
+        per_doc = (time.perf_counter() - t0) / len(docs)
+        owners = defaultdict(set)
+        for truth, clients in resolved.items():
+            for client in clients:
+                owners[client].add(truth)
+        sample = [normalize_name(name) for _, name, _, _ in docs[:200]]
+        t0 = time.perf_counter()
+        for key in sample:
+            linear_closest(registry, key)
+        linear = (time.perf_counter() - t0) / len(sample)
+        print(f"{n:>8} {len(docs):>7} {len({name for _, name, _, _ in docs}):>7} {len(registry):>7}"
+              f" {sum(len(c) > 1 for c in resolved.values()):>8} {sum(len(t) > 1 for t in owners.values()):>8}"
+              f" {per_doc * 1e6:>11.0f} {linear * 1e6:>14.0f}")
@@ -0,0 +1,116 @@
+"""Taille envoyée vs fidélité selon les réglages de compaction, sur des documents synthétiques.
+
+    python -m bench.bench_compaction --docs 6
+    OPENAI_API_KEY=sk-... python -m bench.bench_compaction --docs 6 --accuracy
+
+Sans --accuracy, la fidélité est approchée par le PSNR de l'image compactée face à la même
+image (même recadrage, même réduction) encodée sans perte : cela mesure les artefacts de
+compression, pas la lisibilité par le modèle.
+Avec --accuracy, chaque variante est réellement extraite par GPT-4o et comparée à la vérité terrain.
+"""
+import argparse
+import base64
+import io
+import math
+import os
+import statistics
+import time
+
+from PIL import Image, ImageChops, ImageStat
+
+from bench.synthetic import as_phone_photo, make_truth, render_pages, to_bytes
+from docscan.compact import compact_image_bytes, estimate_image_tokens
+
+SETTINGS = [
+    ("brut", None),
+    ("JPEG 768 / 300 Ko", {"short_side": 768, "target_kb": 300}),
+    ("JPEG 768 / 150 Ko", {"short_side": 768, "target_kb": 150}),
+    ("JPEG 1024 / 400 Ko", {"short_side": 1024, "target_kb": 400}),
+    ("JPEG 512 / 100 Ko", {"short_side": 512, "target_kb": 100}),
+    ("WEBP 768 / 150 Ko", {"short_side": 768, "target_kb": 150, "format": "WEBP"}),
+    ("JPEG 768 sans recadrage", {"short_side": 768, "crop": False}),
+]
+
+FIELDS = [
+    ("client_detecte",), ("type_document",), ("document", "numero"), ("document", "date_emission"),
+    ("totaux", "total_ht"), ("totaux", "total_ttc"),
+]
+
+
+def field_accuracy(pred, truth):
+    """Part des champs clés identiques (montants comparés numériquement) + lignes bien comptées."""
+    def get(d, path):
+        for k in path:
+            d = (d or {}).get(k, "")
+        return str(d or "").strip()
+
+    def same(a, b):
+        try:
+            return abs(float(a.replace(" ", "").replace(",", ".")) - float(b)) < 0.01
+        except ValueError:
+            return a.lower() == b.lower()
+
+    ok = sum(same(get(pred, p), get(truth, p)) for p in FIELDS)
+    ok += len(pred.get("lignes", []) or []) == len(truth["lignes"])
+    return ok / (len(FIELDS) + 1)
+
+
+def psnr(payload, reference):
+    img = Image.open(io.BytesIO(payload)).convert("L")
+    ref = Image.open(io.BytesIO(reference)).convert("L")
+    mse = statistics.fmean(v ** 2 for v in ImageStat.Stat(ImageChops.difference(img, ref)).rms) or 1e-9
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def corpus(n):
+    docs = []
+    for i in range(n):
+        truth = make_truth(i)
+        page = render_pages(truth, size=(1654, 2339))[0]  # ~200 dpi, comme le rendu PDF
+        if i % 2:
+            photo = as_phone_photo(page, seed=i)
+            docs.append(("photo", to_bytes(photo, "JPEG", quality=95), photo, truth))
+        else:
+            docs.append(("scan", to_bytes(page, "PNG"), page, truth))
+    return docs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=6)
+    parser.add_argument("--accuracy", action="store_true", help="appelle réellement GPT-4o (payant)")
+    args = parser.parse_args()
+
+    docs = corpus(args.docs)
+    if args.accuracy:
+        from docscan.extraction import extract_data
+        api_key = os.environ["OPENAI_API_KEY"]
+
+    print(f"{'réglage':<26} {'Ko moyen':>9} {'gain':>6} {'tokens':>7} {'ms':>6} {'PSNR':>6}"
+          + (f" {'précision':>9}" if args.accuracy else ""))
+    raw_kb = statistics.fmean(len(raw) for _, raw, _, _ in docs) / 1024
+    for label, opts in SETTINGS:
+        sizes, tokens, times, psnrs, accs = [], [], [], [], []
+        for kind, raw, image, truth in docs:
+            t0 = time.perf_counter()
+            if opts is None:
+                payload, ext = raw, "png" if kind == "scan" else "jpeg"
+                tok = estimate_image_tokens(*image.size)
+            else:
+                payload, ext, stats = compact_image_bytes(raw, **opts)
+                tok = stats["tokens_after"]
+            times.append((time.perf_counter() - t0) * 1000)
+            if opts is not None:
+                lossless, _, _ = compact_image_bytes(raw, **dict(opts, format="PNG"))
+                psnrs.append(psnr(payload, lossless))
+            sizes.append(len(payload) / 1024)
+            tokens.append(tok)
+            if args.accuracy:
+                pred = extract_data(base64.b64encode(payload).decode("utf-8"), ext, api_key)
+                accs.append(field_accuracy(pred, truth))
+        kb = statistics.fmean(sizes)
+        line = (f"{label:<26} {kb:>9.0f} {raw_kb / kb:>5.1f}x {statistics.fmean(tokens):>7.0f}"
+                f" {statistics.fmean(times):>6.0f} {statistics.fmean(psnrs) if psnrs else float('inf'):>6.1f}")
+        if args.accuracy:
+            line += f" {statistics.fmean(accs):>9.0%}"
+        print(line)
@@ -0,0 +1,55 @@
+"""Débit de l'extraction concurrente contre le serveur stub local.
+
+    python -m bench.bench_concurrency --docs 40 --latency 1.0 --error-rate 0.1
+"""
+import argparse
+import io
+import time
+
+from bench.stub_openai import start_stub_server
+from docscan.engine import run_concurrent
+from docscan.extraction import extract_document
+
+# PNG 1×1 : le stub ne regarde pas l'image
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d4944415478da63f8ffff3f0005fe02fea7d6a4b50000000049454e44ae426082"
+)
+
+
+class FakeUpload(io.BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def run(docs, max_in_flight, base_url, max_retries):
+    files = [FakeUpload(f"doc_{i:04d}.png", TINY_PNG) for i in range(docs)]
+    order, errors = [], 0
+    t0 = time.perf_counter()
+    worker = lambda f: extract_document(f, "sk-stub", base_url=base_url, timeout=30,
+                                        max_retries=max_retries)
+    for f, result, err in run_concurrent(files, worker, max_in_flight=max_in_flight):
+        order.append(f.name)
+        errors += err is not None
+    return time.perf_counter() - t0, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    server, state, url = start_stub_server(latency=args.latency, jitter=args.jitter,
+                                           error_rate=args.error_rate)
+    print(f"{'en vol':>7} {'durée (s)':>10} {'docs/s':>8} {'échecs':>7} {'max vu':>7}")
+    for n in args.in_flight:
+        state.max_in_flight = 0
+        elapsed, errors = run(args.docs, n, url, args.retries)
+        print(f"{n:>7} {elapsed:>10.2f} {args.docs / elapsed:>8.2f} {errors:>7} {state.max_in_flight:>7}")
+    server.shutdown()
@@ -0,0 +1,67 @@
+"""Quasi-doublons : fidélité de l'empreinte perceptuelle et vitesse de l'index.
+
+    python -m bench.bench_dedup --docs 40 --index-sizes 10000 50000
+
+Chaque document synthétique est décliné en photo de téléphone, JPEG recompressé et rendu à
+plus basse résolution : ces copies doivent être retrouvées (rappel), tandis que deux documents
+différents du même modèle ne doivent pas l'être (fausses alertes), selon le seuil de distance.
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from bench.synthetic import as_phone_photo, make_truth, render_pages, to_bytes
+from docscan.dedup import HASH_BITS, MAX_DISTANCE, NearDuplicateIndex, fingerprint_image, hamming
+
+VARIANTS = ["photo", "jpeg q50", "100 dpi"]
+
+
+def variants(page, seed):
+    return [
+        as_phone_photo(page, seed=seed),
+        Image.open(io.BytesIO(to_bytes(page, "JPEG", quality=50))),
+        page.resize((827, 1169)),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[8, 12, 16, 20, 24])
+    parser.add_argument("--index-sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    originals, copies, elapsed = [], [], []
+    for i in range(args.docs):
+        page = render_pages(make_truth(i))[0]
+        t0 = time.perf_counter()
+        originals.append(fingerprint_image(page))
+        elapsed.append(time.perf_counter() - t0)
+        copies.append([fingerprint_image(v) for v in variants(page, i)])
+    print(f"Empreinte : p50 {np.median(elapsed) * 1000:.0f} ms par page (A4 150 dpi)")
+
+    same = np.array([[hamming(o, c) for c in cs] for o, cs in zip(originals, copies)])
+    others = np.array([hamming(originals[i], h) for i in range(args.docs) for j in range(args.docs) if i != j
+                       for h in [originals[j]] + copies[j][:1]])
+    print(f"\n{'seuil':>6} " + " ".join(f"{v:>10}" for v in VARIANTS) + f" {'fausses alertes':>16}")
+    for t in args.thresholds:
+        mark = " ←" if t == MAX_DISTANCE else ""
+        print(f"{t:>6} " + " ".join(f"{(same[:, k] <= t).mean():>10.0%}" for k in range(len(VARIANTS)))
+              + f" {int((others <= t).sum()):>8} / {len(others)}{mark}")
+
+    rng = np.random.default_rng(0)
+    print(f"\n{'empreintes':>10} {'remplissage (s)':>16} {'recherche (ms)':>15}")
+    for n in args.index_sizes:
+        index = NearDuplicateIndex(":memory:")
+        hashes = rng.integers(0, 256, size=(n, HASH_BITS // 8), dtype=np.uint8)
+        t0 = time.perf_counter()
+        for h in hashes:
+            index.add(h.tobytes(), "x.pdf", {})
+        fill = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for o in originals:
+            index.find(o)
+        print(f"{n:>10} {fill:>16.2f} {(time.perf_counter() - t0) / len(originals) * 1000:>15.2f}")
@@ -0,0 +1,58 @@
+"""Temps et pic mémoire de l'export Excel organisé : ancien chemin (pandas + format_worksheet) vs writer rapide.
+
+    python -m bench.bench_excel --sizes 1000 10000 50000
+"""
+import argparse
+import gc
+import io
+import time
+import tracemalloc
+
+import pandas as pd
+
+from bench.synthetic import make_history
+from docscan.excel import build_organized_excel, format_worksheet, organized_sheets
+
+
+def build_legacy(history):
+    """Chemin d'origine : to_excel cellule par cellule puis mise en forme objet par objet."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for title, df, color in organized_sheets(history):
+            df.to_excel(writer, sheet_name=title, index=False)
+            format_worksheet(writer.sheets[title], color)
+    return output.getvalue()
+
+
+def measure(fn, history, memory):
+    gc.collect()
+    t0 = time.perf_counter()
+    size = len(fn(history))
+    elapsed = time.perf_counter() - t0
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        fn(history)
+        peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    return elapsed, peak, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--legacy-max", type=int, default=10000, help="au-delà, l'ancien chemin est ignoré (trop lent)")
+    parser.add_argument("--no-memory", action="store_true", help="ne pas mesurer le pic mémoire (tracemalloc ralentit)")
+    args = parser.parse_args()
+
+    print(f"{'docs':>7} {'chemin':<8} {'durée (s)':>10} {'pic Mo':>8} {'xlsx Mo':>8}")
+    for n in args.sizes:
+        history = make_history(n)
+        paths = [("rapide", build_organized_excel)]
+        if n <= args.legacy_max:
+            paths.insert(0, ("ancien", build_legacy))
+        for label, fn in paths:
+            elapsed, peak, size = measure(fn, history, not args.no_memory)
+            peak_txt = f"{peak:>8.0f}" if peak is not None else f"{'—':>8}"
+            print(f"{n:>7} {label:<8} {elapsed:>10.2f} {peak_txt} {size / 1024 ** 2:>8.1f}")
@@ -0,0 +1,110 @@
+"""Mémoire et latence de l'historique : ancienne liste de dicts vs HistoryStore en colonnes
+vs DocumentRepository (SQLite sur disque).
+
+    python -m bench.bench_history --docs 10000
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from bench.synthetic import make_truth
+from docscan.config import TYPE_CONFIG
+from docscan.extraction import flatten_data, lines_to_df
+from docscan.history import HistoryStore
+from docscan.normalize import normalize_document
+from docscan.repository import DocumentRepository
+
+PAGE_SIZE = 100
+
+
+def build_legacy(extractions):
+    return [{"filename": f, "raw": d, "flat": flatten_data(d), "lines_df": lines_to_df(d),
+             "type": d["type_document"], "client": d["client_detecte"], "timestamp": "01/03/2024 10:00"}
+            for f, d in extractions]
+
+
+def build_store(extractions, store=None):
+    store = HistoryStore() if store is None else store
+    for f, d in extractions:
+        flat, lines_df = normalize_document(flatten_data(d), lines_to_df(d))
+        store.add(f, flat, lines_df, d["type_document"], d["client_detecte"], "01/03/2024 10:00")
+    return store
+
+
+def legacy_rerun(history, client, doc_type):
+    """Ce que faisait chaque rerun : résumé latéral, total TTC, filtres, tableau affiché."""
+    for cl in sorted(set(h["client"] for h in history)):
+        sum(1 for h in history if h["client"] == cl)
+        set(h["type"] for h in history if h["client"] == cl)
+    total = 0
+    for h in history:
+        try:
+            total += float(str(h["raw"].get("totaux", {}).get("total_ttc", "0")).replace(",", ".").replace(" ", ""))
+        except (ValueError, TypeError):
+            pass
+    filtered = [h for h in history if h["client"] == client]
+    filtered = [h for h in filtered if h["type"] == doc_type]
+    return pd.DataFrame([{"Client": h["client"], "Type": TYPE_CONFIG[h["type"]]["label"],
+                          "N° Document": h["flat"]["N° Document"], "Fichier": h["filename"]} for h in filtered])
+
+
+def store_rerun(store, client, doc_type):
+    """Rerun actuel : résumé latéral, total TTC, filtres, première page du tableau."""
+    store.client_summary()
+    store.total_ttc()
+    rows = store.documents(store.select(client, doc_type)[:PAGE_SIZE], internal=True)
+    return pd.DataFrame({"Client": rows["_client"], "Type": rows["_type"], "N° Document": rows["N° Document"],
+                         "Fichier": rows["Fichier source"]})
+
+
+def memory(build, extractions):
+    gc.collect()
+    tracemalloc.start()
+    obj = build(extractions)
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, current / 1024 ** 2
+
+
+def latency(fn, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10000)
+    args = parser.parse_args()
+
+    extractions = [(f"scan_{i:06d}.pdf", make_truth(i)) for i in range(args.docs)]
+    legacy, legacy_mb = memory(build_legacy, extractions)
+    store, store_mb = memory(build_store, extractions)
+    store.documents()  # matérialisation unique, comme au premier rerun
+
+    db_path = os.path.join(tempfile.mkdtemp(), "documents.sqlite")
+    t0 = time.perf_counter()
+    repo, repo_mb = memory(lambda e: build_store(e, DocumentRepository(db_path)), extractions)
+    repo_insert = (time.perf_counter() - t0) / args.docs * 1000
+    repo_file_mb = sum(os.path.getsize(db_path + ext) for ext in ("", "-wal") if os.path.exists(db_path + ext)) / 1024 ** 2
+
+    print(f"{args.docs} documents")
+    print(f"{'':<28} {'liste de dicts':>15} {'HistoryStore':>13} {'SQLite':>9}")
+    print(f"{'mémoire (Mo)':<28} {legacy_mb:>15.1f} {store_mb:>13.1f} {repo_mb:>9.1f}")
+    print(f"{'sur disque (Mo)':<28} {'—':>15} {'—':>13} {repo_file_mb:>9.1f}")
+    print(f"{'ajout par document (ms)':<28} {'—':>15} {'—':>13} {repo_insert:>9.2f}")
+    print(f"{'rerun tableau de bord (ms)':<28} {latency(legacy_rerun, legacy, 'SFR', 'facture'):>15.1f}"
+          f" {latency(store_rerun, store, 'SFR', 'facture'):>13.1f}"
+          f" {latency(store_rerun, repo, 'SFR', 'facture'):>9.1f}")
+    print(f"{'filtre client×type (ms)':<28}"
+          f" {latency(lambda: [h for h in legacy if h['client'] == 'SFR' and h['type'] == 'facture']):>15.2f}"
+          f" {latency(lambda: store.select('SFR', 'facture')):>13.4f}"
+          f" {latency(lambda: repo.select('SFR', 'facture')):>9.2f}")
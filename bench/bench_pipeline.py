@@ -0,0 +1,208 @@
+"""Suite de bout en bout reproductible : documents synthétiques → extraction → historique → classeur, face au stub.
+
+    python -m bench.bench_pipeline --docs 60 --latency 0.5 --in-flight 4
+    python -m bench.bench_pipeline --save base.json         # référence, puis après une modification :
+    python -m bench.bench_pipeline --baseline base.json     # écarts à la référence
+
+Le lot (graine --seed) mélange factures, devis et fiches de paie sous les formes de --kinds :
+scan (PNG d'une page), photo (JPEG de téléphone, grand et flou), pdf (scan de --pages pages),
+natif (PDF texte de --pages pages). Chaque document suit le chemin de l'app et de la CLI :
+extract_document (lecture, couche texte, empreinte, rendu poppler, compaction, base64, requête,
+parse), add_to_history (mise à plat, normalisation, dépôt SQLite), puis build_organized_excel sur
+tout le lot. Le stub (latence --latency, gigue --jitter) répond à chaque requête par la vérité
+terrain d'un document du lot, choisie par l'empreinte de la requête : même lot, mêmes réponses.
+
+Chaque exécution tourne dans un processus neuf (dépôt et index vides, modules déjà importés) :
+docs/s du lot complet (export compris), p50 / p95 par étape, pic mémoire (RSS) au-delà du
+processus prêt. Avec --repeat, l'exécution de durée médiane est retenue. Les PDF nécessitent
+poppler (pdftoppm, pdftotext) : sans lui, ils sont retirés du lot (signalé).
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bench.stub_openai import start_stub_server
+from bench.synthetic import TYPES, as_phone_photo, make_truth, render_pages, to_bytes, to_pdf, to_text_pdf
+
+KINDS = {"scan": "png", "photo": "jpg", "pdf": "pdf", "natif": "pdf"}
+LINES_PER_PAGE = 4
+
+
+def make_corpus(directory, docs, kinds, pages, seed=0):
+    """Écrit le lot sur disque ; renvoie [(chemin, vérité terrain)]. Même graine, mêmes fichiers."""
+    corpus = []
+    for i in range(docs):
+        kind = kinds[i % len(kinds)]
+        doc_type = TYPES[(i // len(kinds)) % len(TYPES)]
+        if kind in ("pdf", "natif"):
+            truth = make_truth(seed + i, doc_type, n_lines=LINES_PER_PAGE * pages)
+            data = (to_pdf(render_pages(truth, lines_per_page=LINES_PER_PAGE)) if kind == "pdf"
+                    else to_text_pdf(truth, lines_per_page=LINES_PER_PAGE))
+        else:
+            truth = make_truth(seed + i, doc_type)
+            page = render_pages(truth)[0]
+            data = to_bytes(page) if kind == "scan" else to_bytes(as_phone_photo(page, seed + i), "JPEG", quality=90)
+        path = os.path.join(directory, f"{kind}_{i:04d}.{KINDS[kind]}")
+        with open(path, "wb") as f:
+            f.write(data)
+        corpus.append((path, truth))
+    return corpus
+
+
+def responder(truths):
+    """Réponse du stub : vérité terrain choisie par l'empreinte des messages (déterministe)."""
+    def respond(request):
+        digest = hashlib.sha256(json.dumps(request.get("messages"), sort_keys=True).encode("utf-8")).digest()
+        return truths[int.from_bytes(digest[:4], "big") % len(truths)]
+    return respond
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+def measure(paths, url, options, in_flight):
+    """Dans un processus neuf : traite le lot de bout en bout ; renvoie le résultat (dict sérialisable)."""
+    import resource
+    data_dir = tempfile.mkdtemp(prefix="docscan-bench-")
+    os.environ["DOCSCAN_DATA_DIR"] = data_dir
+    from bench.bench_concurrency import TINY_PNG, FakeUpload
+    from docscan.dedup import NearDuplicateIndex
+    from docscan.engine import run_concurrent
+    from docscan.excel import build_organized_excel
+    from docscan.extraction import add_to_history, extract_document
+    from docscan.repository import DocumentRepository
+    from docscan.trace import stage, summarize
+    from docscan.uploads import Upload
+
+    options = dict(options, base_url=url, with_preview=False)
+    if options.pop("duplicates"):
+        options["duplicates"] = NearDuplicateIndex()
+    history = DocumentRepository()
+    # Client HTTP et SDK prêts avant la mesure : seul le lot est mesuré
+    extract_document(FakeUpload("warmup.png", TINY_PNG), "sk-stub", base_url=url, with_preview=False)
+    start = rss_mb()
+
+    def worker(path):
+        trace = {}
+        data, _ = extract_document(Upload(os.path.basename(path), path=path), "sk-stub", trace=trace, **options)
+        return data, trace
+
+    traces, failed = [], []
+    t0 = time.perf_counter()
+    for path, result, error in run_concurrent(paths, worker, max_in_flight=in_flight):
+        if error is not None:
+            failed.append(f"{os.path.basename(path)} : {type(error).__name__}: {error}")
+            continue
+        data, trace = result
+        with stage(trace, "Mise à plat"):
+            add_to_history(history, os.path.basename(path), data, "01/03/2024 10:00")
+        traces.append(trace)
+    t1 = time.perf_counter()
+    workbook = build_organized_excel(history)
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return {
+        "docs": len(paths), "failed": failed, "elapsed": elapsed, "docs_per_s": len(paths) / elapsed,
+        "export_s": elapsed - (t1 - t0), "excel_kb": len(workbook) / 1024,
+        "peak_mb": peak, "peak_above_start_mb": peak - start,
+        "stages": summarize(traces).to_dict("records"),
+    }
+
+
+def report(result):
+    print(f"{result['docs']} document(s) en {result['elapsed']:.2f} s : {result['docs_per_s']:.2f} docs/s"
+          f" · export Excel {result['export_s']:.2f} s ({result['excel_kb']:.0f} Ko)"
+          f" · pic RSS {result['peak_mb']:.0f} Mo (+{result['peak_above_start_mb']:.0f} Mo pendant le lot)")
+    for failure in result["failed"]:
+        print(f"  ❌ {failure}")
+    print()
+    columns = ["Étape", "Docs", "p50 (ms)", "p95 (ms)", "Total (s)", "Part"]
+    rows = result["stages"]
+    widths = [max(len(c), *(len(str(r[c])) for r in rows)) for c in columns]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for r in rows:
+        print("  ".join(str(r[c]).rjust(w) for c, w in zip(columns, widths)))
+
+
+def compare(result, baseline):
+    """Écarts à une exécution de référence (--save) : débit, pic mémoire, p95 par étape."""
+    def line(label, old, new, fmt):
+        change = f"{(new - old) / old:+.0%}" if old else "—"
+        print(f"  {label:<22} {old:>9{fmt}} → {new:>9{fmt}}  {change}")
+
+    print(f"\nÉcart à la référence ({baseline['docs']} docs) :")
+    line("docs/s", baseline["docs_per_s"], result["docs_per_s"], ".2f")
+    line("pic RSS (Mo)", baseline["peak_mb"], result["peak_mb"], ".0f")
+    before = {r["Étape"]: r["p95 (ms)"] for r in baseline["stages"]}
+    for r in result["stages"]:
+        if r["Étape"] in before:
+            line(f"p95 {r['Étape']} (ms)", before[r["Étape"]], r["p95 (ms)"], ".1f")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=60)
+    parser.add_argument("--kinds", nargs="+", choices=list(KINDS), default=list(KINDS))
+    parser.add_argument("--pages", type=int, default=3, help="pages des PDF (scannés et natifs)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.5, help="latence simulée de l'API (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="gigue de la latence (s)")
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--multipage", action="store_true", help="analyser toutes les pages des PDF")
+    parser.add_argument("--no-compact", action="store_true")
+    parser.add_argument("--no-text-layer", action="store_true")
+    parser.add_argument("--no-duplicates", action="store_true", help="sans recherche de quasi-doublons")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--save", help="enregistrer le résultat (JSON) comme référence")
+    parser.add_argument("--baseline", help="comparer à une référence enregistrée par --save")
+    args = parser.parse_args()
+
+    kinds = args.kinds
+    if shutil.which("pdftoppm") is None or shutil.which("pdftotext") is None:
+        kinds = [k for k in kinds if KINDS[k] != "pdf"]
+        print("poppler introuvable (pdftoppm, pdftotext) : PDF retirés du lot.", file=sys.stderr)
+        if not kinds:
+            sys.exit("Aucun type de document à traiter sans poppler : ajouter scan ou photo à --kinds.")
+
+    random.seed(args.seed)  # gigue du stub
+    options = {
+        "compaction": None if args.no_compact else {}, "text_layer": not args.no_text_layer, "layouts": [],
+        "multipage": args.multipage, "duplicates": not args.no_duplicates, "timeout": 60,
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = make_corpus(directory, args.docs, kinds, args.pages, args.seed)
+        paths = [path for path, _ in corpus]
+        size = sum(os.path.getsize(p) for p in paths) / 1024 ** 2
+        print(f"Lot : {len(paths)} document(s), {size:.1f} Mo ({', '.join(kinds)}), {args.in_flight} en vol,"
+              f" latence {args.latency} s\n")
+        server, state, url = start_stub_server(latency=args.latency, jitter=args.jitter,
+                                               responder=responder([truth for _, truth in corpus]))
+        context = multiprocessing.get_context("spawn")
+        runs = []
+        for _ in range(args.repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                runs.append(pool.submit(measure, paths, url, options, args.in_flight).result())
+        server.shutdown()
+
+    result = sorted(runs, key=lambda r: r["elapsed"])[len(runs) // 2]
+    result["args"] = {k: v for k, v in vars(args).items() if k not in ("save", "baseline")}
+    report(result)
+    if args.repeat > 1:
+        rates = ", ".join(f"{r['docs_per_s']:.2f}" for r in runs)
+        print(f"\ndocs/s sur {args.repeat} exécutions : {rates}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(result, json.load(f))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
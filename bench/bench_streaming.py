@@ -0,0 +1,34 @@
+"""Délai jusqu'au premier champ utile et durée totale, avec et sans flux, contre le serveur stub.
+
+    python -m bench.bench_streaming --docs 8 --lines 20 --latency 0.8 --token-delay 0.01
+
+Le stub envoie le JSON par tranches de 4 caractères (≈ 1 token) espacées de token-delay secondes.
+Le résultat final doit être identique dans les deux modes : le script s'arrête sinon.
+"""
+import argparse
+
+from bench.stub_openai import start_stub_server
+from bench.synthetic import make_truth
+from docscan.extraction import extract_data
+from docscan.trace import summarize
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=8)
+    parser.add_argument("--lines", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.8)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    args = parser.parse_args()
+
+    server, state, url = start_stub_server(latency=args.latency, token_delay=args.token_delay)
+    for stream in (False, True):
+        traces = []
+        for i in range(args.docs):
+            state.document = make_truth(i, n_lines=args.lines)
+            trace = {}
+            data = extract_data("AAAA", "png", "sk-stub", base_url=url, trace=trace, stream=stream)
+            assert data == state.document, "résultat différent du document envoyé"
+            traces.append(trace)
+        print(f"\n{'En flux' if stream else 'Sans flux'} ({args.docs} documents, {args.lines} lignes)")
+        print(summarize(traces).to_string(index=False))
+    server.shutdown()
@@ -0,0 +1,90 @@
+"""Exports pour l'ETL : classeur Excel organisé vs tables Parquet / CSV / JSONL, sur un grand historique synthétique.
+
+    python -m bench.bench_tables --sizes 10000 50000
+
+Pour chaque format : temps d'écriture, pic mémoire Python (tracemalloc, sur une seconde écriture),
+taille des fichiers produits, et temps de relecture complète par pandas côté ETL.
+Le classeur est écrit en mémoire (BytesIO) comme dans l'app ; les tables sont écrites sur disque,
+par tranches, comme avec --tables dans la CLI.
+"""
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from bench.synthetic import make_history
+from docscan.columnar import FORMATS, export_tables
+from docscan.excel import build_organized_excel
+
+
+def write_excel(history, directory):
+    path = os.path.join(directory, "export.xlsx")
+    with open(path, "wb") as f:
+        f.write(build_organized_excel(history))
+    return [path]
+
+
+def read_excel(paths):
+    """L'ETL lit toutes les feuilles : les lignes sont réparties dans les feuilles DET par client × type."""
+    return pd.read_excel(paths[0], sheet_name=None)
+
+
+def writer(fmt):
+    return lambda history, directory: list(export_tables(history, fmt, directory).values())
+
+
+READERS = {
+    "parquet": lambda paths: [pd.read_parquet(p) for p in paths],
+    "csv": lambda paths: [pd.read_csv(p) for p in paths],
+    "jsonl": lambda paths: [pd.read_json(p, lines=True) for p in paths],
+}
+
+
+def measure(write, read, history, memory, skip_read):
+    directory = tempfile.mkdtemp()
+    try:
+        gc.collect()
+        t0 = time.perf_counter()
+        paths = write(history, directory)
+        elapsed = time.perf_counter() - t0
+        size = sum(os.path.getsize(p) for p in paths)
+        peak = None
+        if memory:
+            gc.collect()
+            tracemalloc.start()
+            write(history, directory)
+            peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            tracemalloc.stop()
+        read_time = None
+        if not skip_read:
+            t0 = time.perf_counter()
+            read(paths)
+            read_time = time.perf_counter() - t0
+        return elapsed, peak, size, read_time
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--no-memory", action="store_true", help="ne pas mesurer le pic mémoire (tracemalloc ralentit)")
+    parser.add_argument("--excel-read-max", type=int, default=10000,
+                        help="au-delà, la relecture du classeur est ignorée (openpyxl, trop lent)")
+    args = parser.parse_args()
+
+    print(f"{'docs':>7} {'format':<8} {'écriture (s)':>13} {'pic Mo':>8} {'taille Mo':>10} {'relecture (s)':>14}")
+    for n in args.sizes:
+        history = make_history(n)
+        paths = [("xlsx", write_excel, read_excel)] + [(fmt, writer(fmt), READERS[fmt]) for fmt in FORMATS]
+        for label, write, read in paths:
+            skip_read = label == "xlsx" and n > args.excel_read_max
+            elapsed, peak, size, read_time = measure(write, read, history, not args.no_memory, skip_read)
+            peak_txt = f"{peak:>8.0f}" if peak is not None else f"{'—':>8}"
+            read_txt = f"{read_time:>14.2f}" if read_time is not None else f"{'—':>14}"
+            print(f"{n:>7} {label:<8} {elapsed:>13.2f} {peak_txt} {size / 1024 ** 2:>10.1f} {read_txt}")
@@ -0,0 +1,84 @@
+"""Part des PDF lus par leur couche texte, et gain en temps / tokens face à la vision, contre le serveur stub.
+
+    python -m bench.bench_textlayer --docs 30 --native 0.6 --known-suppliers 2
+
+Le lot mélange des PDF natifs (to_text_pdf) et des scans (to_pdf de l'image rendue). Il est
+extrait deux fois : tout en vision (couche texte ignorée), puis avec la couche texte. Les
+fournisseurs des known-suppliers premières mises en page de --layouts sont lus localement,
+les autres PDF natifs envoient leur texte. Nécessite poppler (pdftotext, pdftoppm).
+Le stub facture ~1 token / 4 caractères et les images selon leurs tuiles de 512 px.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bench.stub_openai import start_stub_server
+from bench.synthetic import make_truth, render_pages, to_pdf, to_text_pdf
+from docscan.extraction import extract_document
+from docscan.layouts import load_layouts
+from docscan.textlayer import has_pdftotext
+from docscan.trace import path_summary, usage_totals
+
+
+class FakeUpload(io.BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def make_batch(n, native_share, seed=0):
+    rnd = random.Random(seed)
+    docs = []
+    for i in range(n):
+        truth = make_truth(seed + i)
+        native = rnd.random() < native_share
+        pdf = to_text_pdf(truth) if native else to_pdf(render_pages(truth))
+        docs.append((FakeUpload(f"{'natif' if native else 'scan'}_{i:04d}.pdf", pdf), truth))
+    return docs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=30)
+    parser.add_argument("--native", type=float, default=0.6, help="part de PDF natifs dans le lot")
+    parser.add_argument("--layouts", default=os.path.join(os.path.dirname(__file__), "layouts_synthetic.json"))
+    parser.add_argument("--known-suppliers", type=int, default=2, help="mises en page connues (lecture locale)")
+    parser.add_argument("--latency", type=float, default=0.8)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    args = parser.parse_args()
+
+    if not has_pdftotext():
+        sys.exit("pdftotext introuvable : installer poppler (poppler-utils) pour mesurer la couche texte.")
+
+    with open(args.layouts, encoding="utf-8") as f:
+        specs = json.load(f)[:args.known_suppliers]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "layouts.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(specs, f)
+        layouts = load_layouts(path)
+
+    docs = make_batch(args.docs, args.native)
+    server, state, url = start_stub_server(latency=args.latency, token_delay=args.token_delay)
+    for text_layer in (False, True):
+        state.requests = 0
+        traces, mismatches = [], 0
+        t0 = time.perf_counter()
+        for upload, truth in docs:
+            state.document = truth
+            trace = {}
+            data, _ = extract_document(upload, "sk-stub", base_url=url, trace=trace, with_preview=False,
+                                       text_layer=text_layer, layouts=layouts)
+            mismatches += data != truth
+            traces.append(trace)
+        elapsed = time.perf_counter() - t0
+        u = usage_totals(traces)
+        print(f"\n{'Couche texte' if text_layer else 'Tout en vision'} : {len(docs)} PDF en {elapsed:.1f} s,"
+              f" {state.requests} appel(s) API, {u['total_tokens']:,} tokens, {mismatches} écart(s) à la vérité")
+        print(path_summary(traces).to_string(index=False))
+    server.shutdown()
@@ -0,0 +1,149 @@
+"""Pic mémoire (RSS) d'un lot de gros fichiers envoyés : ancien chemin (copies en mémoire) vs fichiers sur disque.
+
+    python -m bench.bench_uploads --docs 8 --mb 20 --in-flight 1 4
+
+Chaque mesure tourne dans un processus neuf, face au serveur stub (lancé dans le processus
+parent : les corps reçus n'y sont pas comptés). Les fichiers envoyés (PNG de bruit, ~--mb Mo,
+incompressibles) sont d'abord chargés en mémoire comme les garde l'uploader Streamlit, dans les
+deux cas ; le pic est mesuré au-delà de ce point de départ.
+- « ancien » : chaque fichier gardé en mémoire tout le travail (Upload), getvalue(), base64 en bytes
+  puis en str, URL data:, JSON du SDK, et le fichier entier gardé comme aperçu ;
+- « disque » : Upload.from_file (recopie par morceaux sur disque), JobRunner et extract_document
+  (corps JSON écrit en octets, base64 par morceaux), fichier libéré dès le document terminé.
+Le RSS inclut ce que malloc garde après libération ; MALLOC_MMAP_THRESHOLD_=1048576 dans
+l'environnement rend les gros tampons au système dès leur libération (pic plus proche du besoin réel).
+"""
+import argparse
+import base64
+import io
+import math
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from bench.stub_openai import start_stub_server
+from bench.synthetic import make_truth
+from docscan.engine import run_concurrent
+from docscan.extraction import add_to_history, build_request, get_client, parse_document
+from docscan.history import HistoryStore
+from docscan.jobs import JobRunner
+from docscan.uploads import Upload
+
+
+def tiny_png():
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), "white").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+TINY_PNG = tiny_png()
+
+
+def make_files(directory, docs, mb):
+    """docs PNG de bruit d'environ mb Mo chacun (un seul tiré, recopié sous plusieurs noms)."""
+    side = int(math.sqrt(mb * 1024 ** 2 / 3))
+    pixels = np.random.default_rng(0).integers(0, 256, (side, side, 3), dtype=np.uint8)
+    first = os.path.join(directory, "scan_0000.png")
+    Image.fromarray(pixels).save(first, compress_level=1)
+    paths = [first]
+    for i in range(1, docs):
+        paths.append(os.path.join(directory, f"scan_{i:04d}.png"))
+        os.link(first, paths[-1])
+    return paths
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+class Received(io.BytesIO):
+    """Fichier tel que reçu par l'uploader Streamlit (en mémoire)."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            super().__init__(f.read())
+        self.name = os.path.basename(path)
+
+    @classmethod
+    def from_bytes(cls, name, data):
+        received = cls.__new__(cls)
+        io.BytesIO.__init__(received, data)
+        received.name = name
+        return received
+
+
+def run_legacy(received, url, in_flight):
+    copies = [Received.from_bytes(f.name, f.getvalue()) for f in received]
+    client = get_client("sk-stub", url)
+    history, previews = HistoryStore(), []
+
+    def worker(i):
+        file_bytes = copies[i].getvalue()
+        img_b64 = base64.b64encode(file_bytes).decode("utf-8")
+        body = build_request(img_b64, "png")
+        response = client.chat.completions.create(**body, timeout=120)
+        return parse_document(response.choices[0].message.content)[0]
+
+    for i, data, error in run_concurrent(range(len(copies)), worker, max_in_flight=in_flight):
+        if error is not None:
+            raise error
+        add_to_history(history, copies[i].name, data, "01/03/2024 10:00")
+        previews.append(copies[i].getvalue())
+    return len(previews)
+
+
+def run_spooled(received, url, in_flight):
+    runner = JobRunner()
+    job = runner.submit([Upload.from_file(f.name, f) for f in received], HistoryStore(), "sk-stub",
+                        max_in_flight=in_flight, base_url=url)
+    while not job.finished:
+        time.sleep(0.05)
+    if job.error:
+        raise RuntimeError(job.error)
+    return job.counts()["extrait"]
+
+
+def measure(mode, paths, url, in_flight):
+    """Dans un processus neuf : charge les fichiers, traite le lot, renvoie (pic au-delà du départ en Mo, durée, docs)."""
+    received = [Received(p) for p in paths]
+    # Un petit travail d'abord (client HTTP, SDK, historique prêts) : seul le traitement du lot est mesuré
+    run_spooled([Received.from_bytes("warmup.png", TINY_PNG)], url, 1)
+    start = rss_mb()
+    t0 = time.perf_counter()
+    done = (run_legacy if mode == "ancien" else run_spooled)(received, url, in_flight)
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak - start, elapsed, done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=8)
+    parser.add_argument("--mb", type=float, default=20, help="taille de chaque fichier (Mo)")
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--latency", type=float, default=0.3, help="latence simulée de l'API (s)")
+    args = parser.parse_args()
+
+    server, state, url = start_stub_server(latency=args.latency)
+    state.document = make_truth(0)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_files(directory, args.docs, args.mb)
+        size = os.path.getsize(paths[0]) / 1024 ** 2
+        print(f"{args.docs} fichier(s) de {size:.1f} Mo\n")
+        print(f"{'en vol':>7} {'chemin':<8} {'pic Mo':>8} {'Mo / doc en vol':>16} {'× fichier':>10} {'durée (s)':>10}")
+        context = multiprocessing.get_context("spawn")
+        for in_flight in args.in_flight:
+            for mode in ("ancien", "disque"):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    peak, elapsed, done = pool.submit(measure, mode, paths, url, in_flight).result()
+                assert done == args.docs, f"{done} document(s) extrait(s) sur {args.docs}"
+                per_doc = peak / min(in_flight, args.docs)
+                print(f"{in_flight:>7} {mode:<8} {peak:>8.0f} {per_doc:>16.0f} {per_doc / size:>10.1f} {elapsed:>10.2f}")
+    server.shutdown()
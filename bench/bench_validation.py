@@ -0,0 +1,52 @@
+"""Réponses hors schéma : appels et tokens perdus, ré-extraction complète vs réparation ciblée, contre le serveur stub.
+
+    python -m bench.bench_validation --docs 200 --invalid-rate 0.1
+
+« Ré-extraction » reproduit l'ancien comportement (une réponse illisible oblige à renvoyer toute
+la requête, image comprise : ici jusqu'à --max-resubmit fois) ; « Réparation » est celui de
+complete() : corrections locales, puis un seul appel texte avec la réponse fautive.
+Chaque document extrait doit être identique au document du stub : le script s'arrête sinon.
+"""
+import argparse
+import time
+
+from bench.stub_openai import start_stub_server
+from bench.synthetic import make_truth
+from docscan.extraction import extract_data
+from docscan.schema import InvalidResponse, conform
+from docscan.trace import usage_totals, validation_totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=10)
+    parser.add_argument("--invalid-rate", type=float, default=0.1)
+    parser.add_argument("--max-resubmit", type=int, default=2)
+    args = parser.parse_args()
+
+    server, state, url = start_stub_server(latency=0.0, invalid_rate=args.invalid_rate)
+    print(f"{args.docs} documents, {args.invalid_rate:.0%} de réponses hors schéma\n")
+    print(f"{'mode':<15} {'appels':>7} {'perdus':>7} {'réparés':>8} {'échecs':>7} {'tokens prompt':>14} {'temps (s)':>10}")
+    for repair in (False, True):
+        state.invalid.clear()
+        traces, lost = [], 0
+        t0 = time.perf_counter()
+        for i in range(args.docs):
+            state.document = make_truth(i, n_lines=args.lines)
+            trace = {}
+            for _ in range(1 + (0 if repair else args.max_resubmit)):
+                try:
+                    data = extract_data("AAAA", "png", "sk-stub", base_url=url, trace=trace, repair=repair)
+                except InvalidResponse:
+                    continue
+                assert data == conform(state.document)[0], "résultat différent du document envoyé"
+                break
+            else:
+                lost += 1
+            traces.append(trace)
+        elapsed = time.perf_counter() - t0
+        v, u = validation_totals(traces), usage_totals(traces)
+        print(f"{'Réparation' if repair else 'Ré-extraction':<15} {v['calls']:>7} {v['parse_failures']:>7}"
+              f" {v['repaired']:>8} {lost:>7} {u['prompt_tokens']:>14,} {elapsed:>10.2f}")
+        print(f"{'':<15} défauts injectés : {dict(state.invalid)}")
+    server.shutdown()
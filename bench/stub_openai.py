@@ -0,0 +1,451 @@
+"""Serveur local imitant /v1/chat/completions, avec latence et erreurs injectées.
+
+Usage :
+    python -m bench.stub_openai --port 8765 --latency 1.5 --error-rate 0.2 --token-delay 0.01
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run app.py
+
+latency est le délai avant le premier token ; token_delay simule la génération (par tranche de
+CHUNK_CHARS caractères), envoyée en flux SSE si la requête demande stream=True, d'un bloc sinon.
+
+invalid_rate est la part des réponses chat rendues hors schéma (JSON tronqué, littéral nu, échappement
+invalide, structure fausse ou champs corrigibles localement : voir corrupt) ; une requête de réparation (docscan.schema.REPAIR_PROMPT)
+reçoit toujours le document correct.
+
+rpm / tpm imposent des quotas (seaux à jetons remplis en window secondes, 60 = par minute) : chaque
+réponse porte les en-têtes x-ratelimit-* d'OpenAI (limite, reste, délai de remise à zéro), une
+requête hors quota reçoit un 429 avec retry-after. Avec azure=True, le serveur répond aussi sur
+/openai/deployments/<nom>/chat/completions et n'envoie, comme Azure OpenAI, que les restes
+(x-ratelimit-remaining-*) et retry-after-ms. down=True simule une panne (503 sur tout).
+
+Imite aussi la Batch API (/v1/files, /v1/batches) : un lot passe « completed » batch_delay
+secondes après sa création, chaque ligne étant traitée comme une requête chat (error_rate compris).
+"""
+import argparse
+import base64
+import copy
+import email
+import email.policy
+import io
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from docscan.compact import estimate_image_tokens
+from docscan.schema import REPAIR_PROMPT
+
+# ~1 token = 4 caractères
+CHUNK_CHARS = 4
+
+SAMPLE_DOCUMENT = {
+    "type_document": "facture",
+    "confiance_type": "haute",
+    "client_detecte": "SFR",
+    "emetteur": {"nom": "Fournisseur Test", "adresse": "1 rue du Test, 97400 Saint-Denis",
+                 "telephone": "", "email": "", "siret": "12345678900011", "tva_intra": ""},
+    "destinataire": {"nom": "SFR", "adresse": "", "telephone": "", "email": "", "siret": ""},
+    "document": {"numero": "F-0001", "date_emission": "12/03/2024", "date_echeance": "",
+                 "reference": "", "objet": ""},
+    "lignes": [
+        {"description": "Prestation", "quantite": "2", "prix_unitaire_ht": "50.00",
+         "montant_ht": "100.00", "tva_pourcent": "8.5"},
+    ],
+    "totaux": {"total_ht": "100.00", "total_tva": "8.50", "total_ttc": "108.50", "devise": "EUR"},
+    "paiement": {"mode": "", "iban": "", "bic": "", "conditions": ""},
+    "notes": "",
+}
+
+
+class Quota:
+    """Quota côté serveur : seau de limit jetons, rempli en window secondes."""
+
+    def __init__(self, limit, window=60.0):
+        self.limit = limit
+        self.rate = limit / window
+        self.level = float(limit)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.limit, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, n):
+        """Secondes avant que n jetons soient là."""
+        return max(0.0, (min(n, self.limit) - self.level) / self.rate)
+
+    def reset(self):
+        """Délai avant seau plein, au format des en-têtes OpenAI (« 1.5s », « 2m3s », « 120ms »)."""
+        seconds = (self.limit - self.level) / self.rate
+        if seconds < 1:
+            return f"{int(seconds * 1000)}ms"
+        minutes, seconds = divmod(seconds, 60)
+        return (f"{int(minutes)}m" if minutes else "") + f"{seconds:.3f}".rstrip("0").rstrip(".") + "s"
+
+
+class StubState:
+    def __init__(self, latency=0.5, jitter=0.0, error_rate=0.0, error_codes=(429, 500, 503),
+                 document=None, token_delay=0.0, responder=None, batch_delay=1.0, invalid_rate=0.0,
+                 rpm=None, tpm=None, window=60.0, azure=False, down=False):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.responder = responder
+        self.batch_delay = batch_delay
+        self.files = {}
+        self.batches = {}
+        self.ids = itertools.count(1)
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.invalid_rate = invalid_rate
+        self.invalid = Counter()
+        self.repairs = 0
+        self.document = document or SAMPLE_DOCUMENT
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.quotas = {kind: Quota(limit, window) for kind, limit in (("requests", rpm), ("tokens", tpm)) if limit}
+        self.azure = azure
+        self.down = down
+        self.throttled = 0
+        self.completed = 0
+
+    def admit(self, request):
+        """Décompte la requête des quotas : renvoie (admise, en-têtes de limites).
+
+        Comme chez OpenAI, une requête compte pour ses tokens d'entrée plus max_tokens.
+        """
+        if not self.quotas:
+            return True, {}
+        cost = {"requests": 1, "tokens": usage_for(request, "")["prompt_tokens"] + (request.get("max_tokens") or 0)}
+        with self.lock:
+            now = time.monotonic()
+            for quota in self.quotas.values():
+                quota.refill(now)
+            wait = max(quota.wait(cost[kind]) for kind, quota in self.quotas.items())
+            if not wait:
+                for kind, quota in self.quotas.items():
+                    quota.level -= min(cost[kind], quota.limit)
+            else:
+                self.throttled += 1
+            headers = {}
+            for kind, quota in self.quotas.items():
+                headers[f"x-ratelimit-remaining-{kind}"] = str(max(0, int(quota.level)))
+                if not self.azure:
+                    headers[f"x-ratelimit-limit-{kind}"] = str(quota.limit)
+                    headers[f"x-ratelimit-reset-{kind}"] = quota.reset()
+        if wait:
+            if self.azure:
+                headers["retry-after-ms"] = str(int(wait * 1000) + 1)
+            else:
+                headers["retry-after"] = str(math.ceil(wait))
+        return not wait, headers
+
+    def respond(self, request):
+        """Document renvoyé pour une requête chat : responder(request) si fourni, sinon document."""
+        return self.responder(request) if self.responder else self.document
+
+    def content(self, request):
+        """Texte de la réponse : le document en JSON, abîmé avec la probabilité invalid_rate (sauf réparation)."""
+        document = self.respond(request)
+        if request.get("messages", [{}])[0].get("content") == REPAIR_PROMPT:
+            with self.lock:
+                self.repairs += 1
+        elif random.random() < self.invalid_rate:
+            kind = random.choice(CORRUPTIONS)
+            with self.lock:
+                self.invalid[kind] += 1
+            return corrupt(document, kind)
+        return json.dumps(document, ensure_ascii=False)
+
+    def new_id(self, prefix):
+        with self.lock:
+            return f"{prefix}-stub{next(self.ids)}"
+
+
+# Défauts injectés : JSON coupé (max_tokens atteint), chaîne sans guillemets ("haute" → haute),
+# échappement invalide (\q), structure fausse, écarts corrigibles sans appel
+CORRUPTIONS = ("tronqué", "littéral", "échappement", "structure", "corrigible")
+
+
+def corrupt(document, kind):
+    """Réponse hors schéma d'un des types de CORRUPTIONS."""
+    text = json.dumps(document, ensure_ascii=False)
+    if kind == "tronqué":
+        return text[:len(text) * 2 // 3]
+    if kind == "littéral":
+        value = json.dumps(document["type_document"], ensure_ascii=False)
+        return text.replace(f'"type_document": {value}', f'"type_document": {value[1:-1]}', 1)
+    if kind == "échappement":
+        return text.replace('"type_document": "', '"type_document": "\\q', 1)
+    document = copy.deepcopy(document)
+    if kind == "structure":
+        document["emetteur"] = document["emetteur"].get("nom", "")
+        document["lignes"] = {str(i): line for i, line in enumerate(document.get("lignes", []))}
+    else:
+        document["type_document"] = document["type_document"].upper()
+        document["commentaire"] = "extrait automatiquement"
+        for section in ("emetteur", "destinataire", "paiement"):
+            document[section] = {k: v or None for k, v in document[section].items()}
+    return "```json\n" + json.dumps(document, ensure_ascii=False) + "\n```"
+
+
+def completion(content, usage):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage,
+    }
+
+
+# Tokens facturés pour une image quand ses dimensions ne sont pas lisibles (page A4 en détail haut)
+IMAGE_TOKENS = 1105
+
+
+def _image_tokens(url):
+    try:
+        width, height = Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1]))).size
+    except Exception:
+        return IMAGE_TOKENS
+    return estimate_image_tokens(width, height)
+
+
+def usage_for(request, content):
+    """Usage imitant la facturation : ~1 token pour 4 caractères de texte, tuiles de 512 px pour les images."""
+    prompt = 0
+    for message in request.get("messages", []):
+        parts = message["content"] if isinstance(message["content"], list) else [{"type": "text", "text": message["content"]}]
+        for part in parts:
+            if part["type"] == "text":
+                prompt += -(-len(part["text"]) // CHUNK_CHARS)
+            else:
+                prompt += _image_tokens(part["image_url"]["url"])
+    completion_tokens = -(-len(content) // CHUNK_CHARS)
+    return {"prompt_tokens": prompt, "completion_tokens": completion_tokens, "total_tokens": prompt + completion_tokens}
+
+
+# ─────────────────────────────────────────────
+# Batch API
+# ─────────────────────────────────────────────
+def file_object(file_id, entry):
+    return {"id": file_id, "object": "file", "bytes": len(entry["data"]), "created_at": entry["created_at"],
+            "filename": entry["filename"], "purpose": entry["purpose"], "status": "processed"}
+
+
+def run_batch(state, batch_id):
+    """Traite un lot en arrière-plan : chaque ligne du fichier d'entrée devient une ligne de sortie ou d'erreur."""
+    time.sleep(state.batch_delay / 2)
+    batch = state.batches[batch_id]
+    batch.update(status="in_progress", in_progress_at=int(time.time()))
+    time.sleep(state.batch_delay / 2)
+    outputs, errors = [], []
+    for line in state.files[batch["input_file_id"]]["data"].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        if random.random() < state.error_rate:
+            errors.append({"id": state.new_id("batch_req"), "custom_id": request["custom_id"], "response": None,
+                           "error": {"code": "server_error", "message": "injected"}})
+            continue
+        content = state.content(request["body"])
+        outputs.append({"id": state.new_id("batch_req"), "custom_id": request["custom_id"], "error": None,
+                        "response": {"status_code": 200, "request_id": "req-stub", "body": completion(content, usage_for(request["body"], content))}})
+    random.shuffle(outputs)  # l'ordre de sortie n'est pas garanti par la Batch API
+    for key, lines in (("output_file_id", outputs), ("error_file_id", errors)):
+        if lines:
+            file_id = state.new_id("file")
+            state.files[file_id] = {"data": "\n".join(json.dumps(l) for l in lines).encode("utf-8"),
+                                    "filename": f"{batch_id}_{key}.jsonl", "purpose": "batch_output",
+                                    "created_at": int(time.time())}
+            batch[key] = file_id
+    batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+    batch.update(status="completed", completed_at=int(time.time()))
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, content, usage, headers=None):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+
+            def event(delta, finish_reason=None, **extra):
+                chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": "gpt-4o", "choices": [] if delta is None else
+                         [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            event({"role": "assistant", "content": ""})
+            for i in range(0, len(content), CHUNK_CHARS):
+                time.sleep(state.token_delay)
+                event({"content": content[i:i + CHUNK_CHARS]})
+            event({}, "stop")
+            if usage is not None:
+                event(None, usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def _upload(self, body):
+            """POST /files (multipart) : conserve le fichier en mémoire."""
+            message = email.message_from_bytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body,
+                policy=email.policy.HTTP,
+            )
+            fields = {}
+            for part in message.iter_parts():
+                fields[part.get_param("name", header="content-disposition")] = (
+                    part.get_filename(), part.get_payload(decode=True))
+            filename, data = fields["file"]
+            file_id = state.new_id("file")
+            state.files[file_id] = {"data": data, "filename": filename, "purpose": fields["purpose"][1].decode(),
+                                    "created_at": int(time.time())}
+            self._send(200, file_object(file_id, state.files[file_id]))
+
+        def _create_batch(self, request):
+            if request.get("input_file_id") not in state.files:
+                self._send(404, {"error": {"message": "input file not found"}})
+                return
+            batch_id = state.new_id("batch")
+            state.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+                "status": "validating", "created_at": int(time.time()), "metadata": request.get("metadata"),
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            threading.Thread(target=run_batch, args=(state, batch_id), daemon=True).start()
+            self._send(200, state.batches[batch_id])
+
+        def do_GET(self):
+            parts = self.path.rstrip("/").split("/")
+            if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in state.batches:
+                self._send(200, state.batches[parts[-1]])
+            elif parts[-1] == "content" and parts[-2] in state.files:
+                data = state.files[parts[-2]]["data"]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            path = self.path.split("?", 1)[0]
+            if path.endswith("/files"):
+                self._upload(body)
+                return
+            request = json.loads(body or b"{}")
+            if path.endswith("/batches"):
+                self._create_batch(request)
+                return
+            if not path.endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+
+            with state.lock:
+                state.requests += 1
+            if state.down:
+                with state.lock:
+                    state.errors += 1
+                self._send(503, {"error": {"message": "service unavailable", "type": "stub", "code": 503}})
+                return
+            admitted, limits = state.admit(request)
+            if not admitted:
+                self._send(429, {"error": {"message": "rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                           headers=limits)
+                return
+            with state.lock:
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                time.sleep(max(0.0, state.latency + random.uniform(-state.jitter, state.jitter)))
+                if random.random() < state.error_rate:
+                    with state.lock:
+                        state.errors += 1
+                    code = random.choice(state.error_codes)
+                    self._send(code, {"error": {"message": "injected", "type": "stub", "code": code}},
+                               headers={"retry-after": "0"})
+                    return
+                content = state.content(request)
+                usage = usage_for(request, content)
+                with state.lock:
+                    state.completed += 1
+                if request.get("stream"):
+                    self._stream(content, usage if (request.get("stream_options") or {}).get("include_usage") else None,
+                                 limits)
+                    return
+                time.sleep(state.token_delay * -(-len(content) // CHUNK_CHARS))
+                self._send(200, completion(content, usage), headers=limits)
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+    return Handler
+
+
+def start_stub_server(port=0, **kwargs):
+    """Démarre le serveur dans un thread ; renvoie (server, state, base_url)."""
+    state = StubState(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.0, help="secondes par tranche de 4 caractères")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="part des réponses rendues hors schéma")
+    parser.add_argument("--batch-delay", type=float, default=5.0, help="durée de traitement d'un lot Batch API (s)")
+    parser.add_argument("--rpm", type=int, help="quota de requêtes par fenêtre")
+    parser.add_argument("--tpm", type=int, help="quota de tokens par fenêtre")
+    parser.add_argument("--window", type=float, default=60.0, help="durée de la fenêtre des quotas (s)")
+    parser.add_argument("--azure", action="store_true", help="en-têtes et chemins d'Azure OpenAI")
+    args = parser.parse_args()
+
+    server, state, url = start_stub_server(args.port, latency=args.latency, jitter=args.jitter,
+                                           error_rate=args.error_rate, token_delay=args.token_delay,
+                                           batch_delay=args.batch_delay, invalid_rate=args.invalid_rate,
+                                           rpm=args.rpm, tpm=args.tpm, window=args.window, azure=args.azure)
+    print(f"Stub OpenAI sur {url} (Ctrl+C pour arrêter)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
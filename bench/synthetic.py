@@ -0,0 +1,224 @@
+"""Documents synthétiques (factures, devis, fiches de paie) générés localement, avec leur vérité terrain.
+
+Le JSON renvoyé suit exactement la structure de SYSTEM_PROMPT : il sert à la fois de
+vérité terrain pour mesurer la précision et de réponse du serveur stub.
+"""
+import io
+import random
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+CLIENTS = ["SFR", "Orange Réunion", "Leclerc Portail", "Mairie de Saint-Paul", "Cafés Bourbon", "EDF SEI"]
+SUPPLIERS = ["Imprimerie du Sud", "Réunion Bureautique", "Transports Payet", "Clim Services 974"]
+ITEMS = ["Ramette papier A4", "Cartouche toner", "Maintenance clim", "Livraison", "Forfait installation",
+         "Heures de main d'œuvre", "Câble réseau 20 m", "Licence logicielle"]
+TYPES = ["facture", "devis", "fiche_de_paie"]
+
+A4_150DPI = (1240, 1754)
+
+
+def _font(size):
+    return ImageFont.load_default(size=size)
+
+
+def make_truth(seed, doc_type=None, n_lines=None):
+    rnd = random.Random(seed)
+    doc_type = doc_type or rnd.choice(TYPES)
+    client = rnd.choice(CLIENTS)
+    n_lines = n_lines if n_lines is not None else rnd.randint(2, 8)
+    lignes, total_ht = [], 0.0
+    for _ in range(n_lines):
+        qty = rnd.randint(1, 12)
+        pu = round(rnd.uniform(5, 400), 2)
+        montant = round(qty * pu, 2)
+        total_ht += montant
+        lignes.append({"description": rnd.choice(ITEMS), "quantite": str(qty),
+                       "prix_unitaire_ht": f"{pu:.2f}", "montant_ht": f"{montant:.2f}", "tva_pourcent": "8.5"})
+    total_ht = round(total_ht, 2)
+    tva = round(total_ht * 0.085, 2)
+    day, month = rnd.randint(1, 28), rnd.randint(1, 12)
+    return {
+        "type_document": doc_type,
+        "confiance_type": "haute",
+        "client_detecte": client,
+        "emetteur": {"nom": rnd.choice(SUPPLIERS), "adresse": f"{rnd.randint(1, 99)} rue de Paris, 97400 Saint-Denis",
+                     "telephone": f"0262 {rnd.randint(10, 99)} {rnd.randint(10, 99)} {rnd.randint(10, 99)}",
+                     "email": "", "siret": f"{rnd.randint(10**13, 10**14 - 1)}", "tva_intra": ""},
+        "destinataire": {"nom": client, "adresse": "", "telephone": "", "email": "", "siret": ""},
+        "document": {"numero": f"{doc_type[:2].upper()}-{seed:05d}", "date_emission": f"{day:02d}/{month:02d}/2024",
+                     "date_echeance": "", "reference": "", "objet": ""},
+        "lignes": lignes,
+        "totaux": {"total_ht": f"{total_ht:.2f}", "total_tva": f"{tva:.2f}",
+                   "total_ttc": f"{total_ht + tva:.2f}", "devise": "EUR"},
+        "paiement": {"mode": "Virement", "iban": "", "bic": "", "conditions": ""},
+        "notes": "",
+    }
+
+
+def render_pages(truth, size=A4_150DPI, lines_per_page=25):
+    """Dessine le document sur une ou plusieurs pages (les lignes débordent sur les pages suivantes)."""
+    w, h = size
+    s = w / A4_150DPI[0]
+    title_font, font, small = _font(int(44 * s)), _font(int(24 * s)), _font(int(20 * s))
+    chunks = [truth["lignes"][i:i + lines_per_page] for i in range(0, len(truth["lignes"]), lines_per_page)] or [[]]
+    pages = []
+    for page_no, chunk in enumerate(chunks, start=1):
+        img = Image.new("RGB", size, "white")
+        d = ImageDraw.Draw(img)
+        m = int(110 * s)
+        y = m
+        if page_no == 1:
+            em = truth["emetteur"]
+            d.text((m, y), em["nom"], fill="black", font=title_font)
+            y += int(60 * s)
+            for txt in (em["adresse"], f"Tél : {em['telephone']}", f"SIRET : {em['siret']}"):
+                d.text((m, y), txt, fill="#333333", font=small)
+                y += int(30 * s)
+            y += int(30 * s)
+            label = truth["type_document"].replace("_", " ").upper()
+            d.text((m, y), f"{label} N° {truth['document']['numero']}", fill="#1e3a5f", font=title_font)
+            d.text((int(w * 0.6), y + int(10 * s)), f"Date : {truth['document']['date_emission']}", fill="black", font=font)
+            y += int(80 * s)
+            d.text((m, y), f"Client : {truth['client_detecte']}", fill="black", font=font)
+            y += int(70 * s)
+        cols = [m, int(w * 0.5), int(w * 0.62), int(w * 0.78)]
+        d.rectangle((m - 8, y - 6, w - m + 8, y + int(34 * s)), fill="#e2e8f0")
+        for x, head in zip(cols, ["Désignation", "Qté", "PU HT", "Montant HT"]):
+            d.text((x, y), head, fill="black", font=font)
+        y += int(48 * s)
+        for l in chunk:
+            for x, txt in zip(cols, [l["description"], l["quantite"], l["prix_unitaire_ht"], l["montant_ht"]]):
+                d.text((x, y), txt, fill="black", font=font)
+            y += int(38 * s)
+        if page_no == len(chunks):
+            y += int(40 * s)
+            t = truth["totaux"]
+            for label, val in (("Total HT", t["total_ht"]), ("TVA 8,5 %", t["total_tva"]), ("Total TTC", t["total_ttc"])):
+                d.text((cols[2], y), label, fill="black", font=font)
+                d.text((cols[3], y), f"{val} €", fill="black", font=font)
+                y += int(38 * s)
+        d.text((m, h - m), f"Page {page_no}/{len(chunks)}", fill="#64748b", font=small)
+        pages.append(img)
+    return pages
+
+
+def as_phone_photo(page, seed=0, size=(3024, 4032)):
+    """Simule une photo de téléphone : grande résolution, fond gris, légère rotation et flou."""
+    rnd = random.Random(seed)
+    bg = Image.new("RGB", size, (rnd.randint(90, 140),) * 3)
+    doc = page.resize((int(size[0] * 0.82), int(size[0] * 0.82 * page.height / page.width)))
+    doc = doc.rotate(rnd.uniform(-3, 3), expand=True, fillcolor=bg.getpixel((0, 0)))
+    bg.paste(doc, ((size[0] - doc.width) // 2, (size[1] - doc.height) // 2))
+    return bg.filter(ImageFilter.GaussianBlur(0.8))
+
+
+def to_bytes(image, fmt="PNG", **kwargs):
+    buf = io.BytesIO()
+    image.save(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+def to_pdf(pages, resolution=150):
+    buf = io.BytesIO()
+    pages[0].save(buf, format="PDF", save_all=True, append_images=pages[1:], resolution=resolution)
+    return buf.getvalue()
+
+
+def _pdf_string(text):
+    raw = text.encode("cp1252", errors="replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def to_text_pdf(truth, lines_per_page=25):
+    """PDF natif (texte vectoriel, comme un PDF exporté par un logiciel de facturation) : il a une couche texte.
+
+    Même contenu et même disposition que render_pages() ; to_pdf(render_pages()) en est la version scannée.
+    """
+    w, h, m = 595, 842, 53
+    cols = [m, 297, 369, 464]
+    chunks = [truth["lignes"][i:i + lines_per_page] for i in range(0, len(truth["lignes"]), lines_per_page)] or [[]]
+    streams = []
+    for page_no, chunk in enumerate(chunks, start=1):
+        items, y = [], h - m
+
+        def text(x, y, txt, size=10):
+            items.append(b"BT /F1 %d Tf %d %d Td " % (size, x, y) + _pdf_string(txt) + b" Tj ET")
+
+        if page_no == 1:
+            em = truth["emetteur"]
+            text(m, y, em["nom"], 18)
+            y -= 24
+            for txt in (em["adresse"], f"Tél : {em['telephone']}", f"SIRET : {em['siret']}"):
+                text(m, y, txt, 9)
+                y -= 13
+            y -= 14
+            label = truth["type_document"].replace("_", " ").upper()
+            text(m, y, f"{label} N° {truth['document']['numero']}", 16)
+            text(cols[2], y, f"Date : {truth['document']['date_emission']}")
+            y -= 30
+            text(m, y, f"Client : {truth['client_detecte']}")
+            y -= 30
+        for x, head in zip(cols, ["Désignation", "Qté", "PU HT", "Montant HT"]):
+            text(x, y, head)
+        y -= 20
+        for l in chunk:
+            for x, txt in zip(cols, [l["description"], l["quantite"], l["prix_unitaire_ht"], l["montant_ht"]]):
+                text(x, y, txt)
+            y -= 16
+        if page_no == len(chunks):
+            y -= 16
+            t = truth["totaux"]
+            for label, val in (("Total HT", t["total_ht"]), ("TVA 8,5 %", t["total_tva"]), ("Total TTC", t["total_ttc"])):
+                text(cols[2], y, label)
+                text(cols[3], y, f"{val} €")
+                y -= 16
+        text(m, m, f"Page {page_no}/{len(chunks)}", 8)
+        streams.append(b"\n".join(items))
+
+    n = len(streams)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {n} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, stream in enumerate(streams):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w} {h}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    buf = io.BytesIO()
+    buf.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(buf.tell())
+        buf.write(b"%d 0 obj\n" % i + obj + b"\nendobj\n")
+    xref = buf.tell()
+    buf.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        buf.write(b"%010d 00000 n \n" % off)
+    buf.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return buf.getvalue()
+
+
+def make_history(n, seed=0, timestamp="01/03/2024 10:00", history=None):
+    """Historique rempli comme par app.py, sans appel API (pour les benchmarks d'export et de stockage).
+
+    history : HistoryStore ou DocumentRepository à remplir (HistoryStore neuf par défaut).
+    """
+    from docscan.extraction import flatten_data, lines_to_df
+    from docscan.history import HistoryStore
+    from docscan.normalize import normalize_document
+
+    history = HistoryStore() if history is None else history
+    for i in range(seed, seed + n):
+        data = make_truth(i)
+        flat, lines_df = normalize_document(flatten_data(data), lines_to_df(data))
+        history.add(
+            filename=f"scan_{i:06d}.pdf",
+            flat=flat,
+            lines_df=lines_df,
+            doc_type=data["type_document"],
+            client=data["client_detecte"],
+            timestamp=timestamp,
+        )
+    return history
@@ -0,0 +1,5 @@
+"""DocScan Pro — fonctions métier (extraction, mise à plat, export), sans dépendance à Streamlit."""
+import os
+
+# Répertoire des données persistantes (cache d'extraction, etc.)
+DATA_DIR = os.environ.get("DOCSCAN_DATA_DIR", ".docscan")
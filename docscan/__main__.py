@@ -0,0 +1,5 @@
+import sys
+
+from docscan.cli import main
+
+sys.exit(main())
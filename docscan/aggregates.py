@@ -0,0 +1,46 @@
+"""Synthèses du tableau de bord : totaux par client, par type, par mois et ventilation de la TVA.
+
+Calculées par groupby sur les colonnes typées (history.amounts / history.vat_lines), sans relire
+les documents un à un : le coût suit le nombre de documents filtrés, pas le nombre de reruns.
+"""
+import pandas as pd
+
+from docscan.config import TYPE_CONFIG
+from docscan.normalize import AMOUNT_COLUMNS
+
+NO_DATE = "Sans date"
+NO_RATE = "Non précisé"
+
+
+def totals_by(amounts, key):
+    """Nombre de documents et totaux HT / TVA / TTC par valeur de key (colonne ou Series)."""
+    grouped = amounts.groupby(key, dropna=False, sort=True)
+    out = grouped[AMOUNT_COLUMNS].sum(min_count=1)
+    out.insert(0, "Documents", grouped.size())
+    return out.reset_index()
+
+
+def by_client(amounts):
+    return totals_by(amounts, "Client").sort_values("Total TTC", ascending=False, na_position="last", ignore_index=True)
+
+
+def by_type(amounts):
+    out = totals_by(amounts, "Type")
+    out["Type"] = out["Type"].map(lambda t: TYPE_CONFIG.get(t, {}).get("label", t))
+    return out.sort_values("Total TTC", ascending=False, na_position="last", ignore_index=True)
+
+
+def by_month(amounts):
+    """Par mois d'émission (AAAA-MM, ordre chronologique) ; les documents sans date lisible à la fin."""
+    month = amounts["Date émission"].dt.strftime("%Y-%m").fillna(NO_DATE).rename("Mois")
+    return totals_by(amounts, month)
+
+
+def vat_breakdown(lines):
+    """Base HT, TVA calculée et nombre de lignes par taux de TVA."""
+    grouped = lines.groupby("TVA (%)", dropna=False, sort=True)["Montant HT"]
+    out = pd.DataFrame({"Base HT": grouped.sum(min_count=1), "Lignes": grouped.size()})
+    out["TVA calculée"] = (out["Base HT"] * out.index.to_series() / 100).round(2)
+    out = out.reset_index().rename(columns={"TVA (%)": "Taux"})
+    out["Taux"] = out["Taux"].map(lambda r: NO_RATE if pd.isna(r) else f"{r:g} %")
+    return out[["Taux", "Lignes", "Base HT", "TVA calculée"]]
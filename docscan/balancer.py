@@ -0,0 +1,365 @@
+"""Répartition des appels entre plusieurs clés / déploiements (OpenAI, Azure OpenAI).
+
+Une seule clé plafonne le débit au quota d'un compte, et une rafale reçoit des 429 sans ralentir.
+Un EndpointPool répartit les requêtes entre ses points d'accès :
+- chaque point d'accès a deux seaux à jetons (requêtes, tokens), recalés sur les en-têtes
+  x-ratelimit-* de chaque réponse (lus par un hook httpx, 429 compris) ou, à défaut, sur les
+  limites déclarées (rpm, tpm) ; une requête réserve 1 requête et son estimation de tokens ;
+- la requête part vers le point d'accès qui a le plus de marge ; si aucun n'a de place, acquire()
+  attend qu'un seau se remplisse (contre-pression) au lieu d'envoyer une requête vouée au 429 ;
+- un 429 met le point d'accès en pause jusqu'à retry-after ; une erreur 5xx, un timeout ou une
+  coupure le mettent en pause (backoff), et FAILURE_THRESHOLD échecs de suite ouvrent son
+  disjoncteur : plus rien pendant COOLDOWN s, puis une seule requête d'essai (demi-ouvert) qui
+  le referme si elle passe.
+Une erreur transitoire est retentée aussitôt sur le point d'accès suivant disponible.
+
+Configuration (resolve_api_key) : secrets["endpoints"], DOCSCAN_ENDPOINTS (JSON, ou chemin d'un
+fichier JSON) ou OPENAI_API_KEYS (clés séparées par des virgules), sinon la clé unique OPENAI_API_KEY.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+FAILURE_THRESHOLD = 3
+COOLDOWN = 30.0
+# Pause après un 429 sans indication de durée (retry-after, reset)
+RATE_LIMIT_PAUSE = 1.0
+# Tokens d'une image dont la taille n'est pas connue (page A4 en détail haut)
+IMAGE_TOKENS = 1105
+
+CLOSED, OPEN, HALF_OPEN = "fermé", "ouvert", "demi-ouvert"
+SPEC_FIELDS = ("name", "api_key", "api_key_env", "base_url", "azure_endpoint", "deployment", "api_version",
+               "rpm", "tpm")
+
+
+class TokenBucket:
+    """Seau à jetons : capacity au plus, rempli de rate jetons par seconde ; sans limite connue, toujours plein."""
+
+    def __init__(self, per_minute=None):
+        self.capacity = per_minute or None
+        self.rate = self.capacity / 60 if self.capacity else None
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity is not None and now > self._updated:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = max(self._updated, now)
+
+    def headroom(self, now):
+        """Part disponible (1.0 sans limite connue)."""
+        self._refill(now)
+        return 1.0 if self.capacity is None else max(0.0, self.level) / self.capacity
+
+    def wait(self, n, now):
+        """Secondes avant que n jetons soient là (une demande plus grande que le seau attend qu'il soit plein)."""
+        self._refill(now)
+        if self.capacity is None:
+            return 0.0
+        return max(0.0, (min(n, self.capacity) - self.level) / self.rate)
+
+    def take(self, n, now):
+        self._refill(now)
+        if self.capacity is not None:
+            self.level -= min(n, self.capacity)
+
+    def sync(self, remaining, limit=None, reset=None, now=None):
+        """Recale le seau sur les en-têtes : reste côté serveur, limite, délai avant remplissage complet.
+
+        Le niveau ne remonte pas au-dessus de l'estimation locale : une réponse ne voit pas les
+        requêtes réservées depuis son envoi (ni celles encore en route).
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        known = self.capacity is not None
+        capacity = limit or max(remaining, self.capacity or 0, 1)
+        if reset and remaining < capacity:
+            self.rate = (capacity - remaining) / reset
+        elif self.rate is None or capacity != self.capacity:
+            self.rate = capacity / 60
+        self.capacity = capacity
+        self.level = min(self.level, remaining) if known else remaining
+
+
+def parse_duration(value):
+    """Durée des en-têtes x-ratelimit-reset-* (« 1s », « 6m0s », « 20ms », « 1h2m3.5s ») en secondes, ou None."""
+    if not value:
+        return None
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(n) * units[unit] for n, unit in parts)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(headers):
+    """Pause demandée par un 429 : retry-after-ms, retry-after, ou délai de remise à zéro du seau épuisé."""
+    ms = _number(headers.get("retry-after-ms"))
+    if ms is not None:
+        return ms / 1000
+    seconds = _number(headers.get("retry-after"))
+    if seconds is not None:
+        return seconds
+    resets = [parse_duration(headers.get(f"x-ratelimit-reset-{kind}")) for kind in ("requests", "tokens")
+              if _number(headers.get(f"x-ratelimit-remaining-{kind}")) == 0]
+    return max([r for r in resets if r is not None], default=None)
+
+
+def estimate_tokens(body):
+    """Tokens décomptés pour body : texte (~4 caractères par token), images, plus max_tokens (réservé d'avance)."""
+    total = body.get("max_tokens") or 0
+    for message in body.get("messages", []):
+        content = message.get("content") or ""
+        for part in content if isinstance(content, list) else [{"type": "text", "text": content}]:
+            total += IMAGE_TOKENS if part.get("type") == "image_url" else len(part.get("text", "")) // 4 + 1
+    return total
+
+
+def is_outage(exc):
+    """Erreur imputable au point d'accès (5xx, timeout, coupure) : compte pour le disjoncteur."""
+    import openai  # importé à l'usage : l'app lit la configuration sans charger le SDK
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+# ─────────────────────────────────────────────
+# Points d'accès
+# ─────────────────────────────────────────────
+class Endpoint:
+    """Une clé sur une base_url (OpenAI ou compatible), ou un déploiement Azure OpenAI (azure_endpoint + deployment)."""
+
+    def __init__(self, api_key, base_url=None, name=None, rpm=None, tpm=None, azure_endpoint=None, deployment=None,
+                 api_version=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.azure_endpoint = azure_endpoint
+        self.deployment = deployment
+        self.api_version = api_version
+        self.name = name or f"{deployment or base_url or 'openai'} …{api_key[-4:]}"
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.failures = 0          # échecs consécutifs (5xx, timeout, coupure)
+        self.open_until = 0.0      # disjoncteur ouvert jusqu'à (monotonic)
+        self.paused_until = 0.0    # pause après un 429 ou un échec isolé
+        self.probing = False       # requête d'essai en vol (demi-ouvert)
+        self.in_flight = 0
+        self.stats = Counter()
+        self.client = None
+
+    @classmethod
+    def from_spec(cls, spec):
+        spec = dict(spec)
+        unknown = set(spec) - set(SPEC_FIELDS)
+        if unknown:
+            raise ValueError(f"point d'accès : champ(s) inconnu(s) {', '.join(sorted(unknown))}")
+        env = spec.pop("api_key_env", None)
+        if env:
+            spec["api_key"] = os.environ.get(env, "")
+        if not spec.get("api_key"):
+            raise ValueError(f"point d'accès {spec.get('name') or spec.get('base_url') or ''} : clé absente")
+        return cls(**spec)
+
+    def make_client(self, on_response):
+        import openai
+        http_client = openai.DefaultHttpxClient(event_hooks={"response": [on_response]})
+        if self.azure_endpoint:
+            return openai.AzureOpenAI(api_key=self.api_key, azure_endpoint=self.azure_endpoint,
+                                      azure_deployment=self.deployment, api_version=self.api_version,
+                                      max_retries=0, http_client=http_client)
+        return openai.OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0, http_client=http_client)
+
+    def state(self, now, failure_threshold):
+        if self.failures < failure_threshold:
+            return CLOSED
+        return OPEN if now < self.open_until else HALF_OPEN
+
+
+class EndpointPool:
+    """Points d'accès partagés par tous les documents (et tous les travaux) : seaux, disjoncteurs et clients HTTP."""
+
+    def __init__(self, endpoints, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.endpoints = list(endpoints)
+        if not self.endpoints:
+            raise ValueError("pool vide")
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.waited = 0.0          # secondes passées à attendre une place (contre-pression)
+        self._cond = threading.Condition()
+        for endpoint in self.endpoints:
+            endpoint.client = endpoint.make_client(lambda response, e=endpoint: self._observe(e, response.headers))
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    @property
+    def client(self):
+        """Client du premier point d'accès (Batch API : les lots restent sur un seul compte)."""
+        return self.endpoints[0].client
+
+    def _observe(self, endpoint, headers):
+        """Hook httpx : recale les seaux du point d'accès sur les en-têtes x-ratelimit-* de la réponse."""
+        synced = False
+        with self._cond:
+            now = time.monotonic()
+            for bucket, kind in ((endpoint.requests, "requests"), (endpoint.tokens, "tokens")):
+                remaining = _number(headers.get(f"x-ratelimit-remaining-{kind}"))
+                if remaining is not None:
+                    bucket.sync(remaining, _number(headers.get(f"x-ratelimit-limit-{kind}")),
+                                parse_duration(headers.get(f"x-ratelimit-reset-{kind}")), now)
+                    synced = True
+            if synced:
+                self._cond.notify_all()
+
+    def _wait(self, endpoint, tokens, now):
+        """Secondes avant que endpoint puisse prendre la requête (0 : tout de suite, None : après un essai en vol)."""
+        state = endpoint.state(now, self.failure_threshold)
+        if state == OPEN:
+            return endpoint.open_until - now
+        if state == HALF_OPEN and endpoint.probing:
+            return None
+        return max(0.0, endpoint.paused_until - now, endpoint.requests.wait(1, now), endpoint.tokens.wait(tokens, now))
+
+    def acquire(self, tokens=0):
+        """Réserve une place (1 requête, tokens) sur le point d'accès le moins chargé ; attend s'il n'y en a aucune."""
+        started = None
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                waits = [(self._wait(e, tokens, now), e) for e in self.endpoints]
+                ready = [e for wait, e in waits if wait == 0]
+                if ready:
+                    endpoint = max(ready, key=lambda e: (min(e.requests.headroom(now), e.tokens.headroom(now)),
+                                                         -e.in_flight))
+                    endpoint.requests.take(1, now)
+                    endpoint.tokens.take(tokens, now)
+                    endpoint.in_flight += 1
+                    endpoint.stats["envoyées"] += 1
+                    if endpoint.state(now, self.failure_threshold) == HALF_OPEN:
+                        endpoint.probing = True
+                    if started is not None:
+                        self.waited += now - started
+                    return endpoint
+                started = now if started is None else started
+                delays = [wait for wait, _ in waits if wait is not None]
+                self._cond.wait(min(delays) if delays else None)
+
+    def release(self, endpoint, error=None):
+        """Fin d'une requête : succès, 429 (pause jusqu'à retry-after) ou panne (backoff, disjoncteur)."""
+        import openai
+        with self._cond:
+            now = time.monotonic()
+            endpoint.in_flight -= 1
+            endpoint.probing = False
+            if isinstance(error, openai.RateLimitError):
+                endpoint.stats["429"] += 1
+                endpoint.failures = 0
+                pause = retry_after(error.response.headers) if error.response is not None else None
+                endpoint.paused_until = max(endpoint.paused_until, now + (pause or RATE_LIMIT_PAUSE))
+            elif error is not None and is_outage(error):
+                endpoint.stats["échecs"] += 1
+                endpoint.failures += 1
+                if endpoint.failures >= self.failure_threshold:
+                    endpoint.open_until = now + self.cooldown
+                else:
+                    endpoint.paused_until = now + random.uniform(0.5, 1.0) * 2 ** (endpoint.failures - 1)
+            else:
+                # Succès, ou erreur due à la requête (400...) : le point d'accès répond
+                endpoint.stats["réussies" if error is None else "rejetées"] += 1
+                endpoint.failures = 0
+            self._cond.notify_all()
+
+    def call(self, fn, tokens=0, max_retries=3, retryable=is_outage, trace=None):
+        """fn(client) sur un point d'accès choisi par acquire() ; une erreur transitoire est retentée sur le suivant."""
+        attempt = 0
+        while True:
+            endpoint = self.acquire(tokens)
+            try:
+                result = fn(endpoint.client)
+            except Exception as e:
+                self.release(endpoint, e)
+                if attempt >= max_retries or not retryable(e):
+                    raise
+                attempt += 1
+                continue
+            self.release(endpoint)
+            if trace is not None:
+                trace["endpoint"] = endpoint.name
+            return result
+
+    def status(self):
+        """Une ligne par point d'accès : disjoncteur, marge des seaux, compteurs (affichage app / CLI)."""
+        with self._cond:
+            now = time.monotonic()
+            rows = []
+            for e in self.endpoints:
+                rows.append({
+                    "Point d'accès": e.name,
+                    "Disjoncteur": e.state(now, self.failure_threshold),
+                    "Marge requêtes": f"{e.requests.headroom(now):.0%}" if e.requests.capacity else "—",
+                    "Marge tokens": f"{e.tokens.headroom(now):.0%}" if e.tokens.capacity else "—",
+                    "En vol": e.in_flight,
+                    **{k: e.stats[k] for k in ("envoyées", "réussies", "429", "échecs")},
+                })
+            return rows
+
+
+# ─────────────────────────────────────────────
+# Configuration
+# ─────────────────────────────────────────────
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(specs, **options):
+    """Pool partagé par configuration : ses seaux et disjoncteurs survivent aux reruns Streamlit et aux travaux."""
+    key = json.dumps([dict(s) for s in specs], sort_keys=True) + json.dumps(options, sort_keys=True)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = EndpointPool([Endpoint.from_spec(s) for s in specs], **options)
+        return pool
+
+
+def load_specs(environ=None, secrets=None):
+    """Points d'accès configurés (liste de dicts de SPEC_FIELDS), ou [] pour la clé unique."""
+    environ = os.environ if environ is None else environ
+    if secrets:
+        specs = secrets.get("endpoints")
+        if specs:
+            return [dict(s) for s in specs]
+    raw = environ.get("DOCSCAN_ENDPOINTS", "").strip()
+    if raw:
+        if not raw.startswith("["):
+            with open(raw, encoding="utf-8") as f:
+                raw = f.read()
+        return json.loads(raw)
+    keys = [k.strip() for k in environ.get("OPENAI_API_KEYS", "").split(",") if k.strip()]
+    base_url = environ.get("OPENAI_BASE_URL") or None
+    return [{"api_key": k, "base_url": base_url} for k in keys]
+
+
+def resolve_api_key(environ=None, secrets=None, fallback=""):
+    """Pool des points d'accès configurés (plusieurs clés / déploiements), sinon la clé unique (str)."""
+    environ = os.environ if environ is None else environ
+    specs = load_specs(environ, secrets)
+    if specs:
+        return get_pool(specs)
+    key = ""
+    if secrets:
+        key = secrets.get("OPENAI_API_KEY", "")
+    return key or environ.get("OPENAI_API_KEY", "") or fallback
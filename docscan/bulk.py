@@ -0,0 +1,124 @@
+"""Mode différé : extraction par la Batch API (débit élevé, tarif réduit d'environ 50 %, résultat sous 24 h).
+
+Les requêtes sont exactement celles de extract_data() (build_request) ; chacune porte un
+custom_id qui permet de rattacher sa réponse au fichier source, quel que soit l'ordre de sortie.
+"""
+import io
+import json
+import os
+import time
+
+from docscan.extraction import build_request, parse_document, prepare_image
+from docscan.schema import InvalidResponse
+from docscan.uploads import as_upload, encode_body
+
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Limites de la Batch API : 50 000 requêtes et 200 Mo par fichier d'entrée (marge gardée)
+MAX_REQUESTS = 50000
+MAX_FILE_BYTES = 190 * 1024 ** 2
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+def batch_line(custom_id, body):
+    """Ligne JSONL (sans le saut de ligne final), dans le tampon de encode_body."""
+    return encode_body({"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body}).getbuffer()
+
+
+def build_batches(docs, raster_pool=None, compaction=None, max_requests=MAX_REQUESTS, max_bytes=MAX_FILE_BYTES):
+    """Découpe les documents en fichiers JSONL de lot ; génère (octets JSONL, {custom_id: document}).
+
+    Le custom_id est l'index du document dans docs : unique et sans caractères à échapper.
+    """
+    buf, members = io.BytesIO(), {}
+    for i, doc in enumerate(docs):
+        file_ext = doc.name.rsplit(".", 1)[-1].lower()
+        upload = as_upload(doc)
+        with upload.as_path() as file_path:
+            image, send_ext, _, _ = prepare_image(upload, file_path, file_ext, raster_pool, compaction)
+            line = batch_line(f"doc-{i:06d}", build_request(image, send_ext))
+        del image
+        if members and (len(members) >= max_requests or buf.tell() + len(line) + 1 > max_bytes):
+            yield buf.getvalue(), members
+            buf, members = io.BytesIO(), {}
+        buf.write(line)
+        buf.write(b"\n")
+        members[f"doc-{i:06d}"] = doc
+    if members:
+        yield buf.getvalue(), members
+
+
+def submit_batch(client, jsonl, metadata=None):
+    """Téléverse le fichier de lot puis crée le lot ; renvoie l'objet Batch."""
+    uploaded = client.files.create(file=("docscan_batch.jsonl", jsonl), purpose="batch")
+    return client.batches.create(
+        input_file_id=uploaded.id, endpoint=ENDPOINT, completion_window=COMPLETION_WINDOW,
+        metadata=metadata,
+    )
+
+
+def wait_for_batch(client, batch_id, poll_interval=60.0, timeout=None, log=print):
+    """Interroge le lot jusqu'à un état final (completed, failed, expired, cancelled)."""
+    started = time.monotonic()
+    last = None
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        state = (batch.status, counts.completed if counts else 0, counts.failed if counts else 0)
+        if state != last:
+            log(f"Lot {batch_id} : {batch.status}"
+                + (f" ({counts.completed}/{counts.total} terminées, {counts.failed} en échec)" if counts and counts.total else ""))
+            last = state
+        if batch.status in TERMINAL:
+            return batch
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError(f"lot {batch_id} toujours {batch.status} après {timeout:.0f} s")
+        time.sleep(poll_interval)
+
+
+def _read_file(client, file_id):
+    if not file_id:
+        return []
+    return [json.loads(line) for line in client.files.content(file_id).text.splitlines() if line.strip()]
+
+
+def batch_results(client, batch):
+    """Résultats d'un lot terminé : {custom_id: (data, erreur, usage)}.
+
+    Une réponse non 200, un JSON illisible ou hors schéma (après corrections locales) donne une
+    erreur pour ce document seulement.
+    Les requêtes absentes (lot expiré ou annulé) n'apparaissent pas : elles seront resoumises.
+    """
+    results = {}
+    for line in _read_file(client, batch.output_file_id) + _read_file(client, batch.error_file_id):
+        custom_id, response = line["custom_id"], line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or (response.get("body") or {}).get("error") or {}
+            results[custom_id] = (None, f"{error.get('code', response.get('status_code'))}: {error.get('message', '')}", None)
+            continue
+        body = response["body"]
+        try:
+            data, _ = parse_document(body["choices"][0]["message"]["content"])
+        except (json.JSONDecodeError, InvalidResponse, KeyError, IndexError) as e:
+            results[custom_id] = (None, f"{type(e).__name__}: {e}", body.get("usage"))
+            continue
+        results[custom_id] = (data, None, body.get("usage"))
+    return results
+
+
+# ─────────────────────────────────────────────
+# Manifeste (lots soumis, pour reprendre le suivi sans resoumettre)
+# ─────────────────────────────────────────────
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {"batches": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from docscan import DATA_DIR
+
+DEFAULT_CACHE_PATH = os.path.join(DATA_DIR, "cache.sqlite")
+# Entre deux recalculs complets (âge, taille totale en SQL), la taille du cache est tenue à jour à chaque put
+RECOUNT_EVERY = 500
+
+
+def cache_key(file_bytes, model=None, prompt=None, variant="", schema=None):
+    """Clé de contenu : hash du fichier + modèle + hash du prompt et du schéma de réponse (en changer invalide le cache).
+
+    model, prompt et schema valent par défaut ceux de docscan.extraction (importé ici seulement : l'app démarre
+    sans le SDK). variant distingue les modes qui donnent un résultat différent pour les mêmes octets
+    (ex. multi-pages, réglages de compaction : voir compaction_variant).
+    file_bytes peut aussi être un itérable de morceaux (Upload.chunks()) : même clé, sans tout charger.
+    """
+    if model is None or prompt is None or schema is None:
+        from docscan.extraction import MODEL, RESPONSE_FORMAT, SYSTEM_PROMPT
+        model, prompt = model or MODEL, prompt or SYSTEM_PROMPT
+        schema = RESPONSE_FORMAT if schema is None else schema
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    schema_hash = hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+    h = hashlib.sha256()
+    if isinstance(file_bytes, (bytes, bytearray, memoryview)):
+        h.update(file_bytes)
+    else:
+        for chunk in file_bytes:
+            h.update(chunk)
+    h.update(b"\0" + model.encode("utf-8") + b"\0" + prompt_hash.encode("ascii") + b"\0" + schema_hash.encode("ascii"))
+    if variant:
+        h.update(b"\0" + variant.encode("utf-8"))
+    return h.hexdigest()
+
+
+def compaction_variant(compaction):
+    """Part de variant pour une image envoyée : réglages de compaction effectifs (défauts compris), ou « brut »."""
+    if compaction is None:
+        return "brut"
+    from docscan.compact import DEFAULTS
+    return "compact:" + json.dumps(dict(DEFAULTS, **compaction), sort_keys=True)
+
+
+class ExtractionCache:
+    """Cache persistant (SQLite) des JSON extraits, avec éviction par âge et par taille.
+
+    Partagé entre les threads du pool d'extraction : toutes les opérations passent par un verrou.
+    La taille totale est suivie en mémoire ; evict() la recompte en SQL à l'ouverture puis toutes les
+    RECOUNT_EVERY écritures (autres processus sur la même base, entrées expirées).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=200 * 1024 * 1024, max_age_days=90):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._total = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_extractions_accessed ON extractions(accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    def key_for(self, file_bytes, variant=""):
+        return cache_key(file_bytes, variant=variant)
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, created_at FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1]):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            replaced = self._conn.execute("SELECT size FROM extractions WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, data, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, size, now, now),
+            )
+            self._total += size - (replaced[0] if replaced else 0)
+            self._puts += 1
+            if self._puts % RECOUNT_EVERY:
+                self._shrink()
+            self._conn.commit()
+        if not self._puts % RECOUNT_EVERY:
+            self.evict()
+
+    def evict(self):
+        """Supprime les entrées trop vieilles, recompte la taille totale, puis réduit le cache à max_bytes."""
+        with self._lock:
+            if self.max_age_days:
+                self._conn.execute(
+                    "DELETE FROM extractions WHERE created_at < ?",
+                    (time.time() - self.max_age_days * 86400,),
+                )
+            self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+            self._shrink()
+            self._conn.commit()
+
+    def _shrink(self):
+        """Supprime les entrées les moins récemment utilisées au-delà de max_bytes (verrou tenu)."""
+        if not self.max_bytes or self._total <= self.max_bytes:
+            return
+        excess = self._total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM extractions ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM extractions WHERE key = ?", victims)
+        self._total -= freed
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM extractions")
+            self._conn.commit()
+            self.hits = self.misses = self._total = 0
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions"
+            ).fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def _expired(self, created_at):
+        return bool(self.max_age_days) and created_at < time.time() - self.max_age_days * 86400
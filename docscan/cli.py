@@ -0,0 +1,380 @@
+"""Traitement par lot d'un dossier, sans interface Streamlit.
+
+    python -m docscan /chemin/scans -o export.xlsx --max-in-flight 8
+    python -m docscan /chemin/scans -o export.xlsx --batch-api      # différé, ~50 % moins cher
+    python -m docscan /chemin/scans -o export.zip --par-client      # un classeur par client
+    python -m docscan /chemin/scans -o export.xlsx --tables parquet # + export_tables/ pour l'ETL
+
+Chaque fichier terminé est ajouté au point de reprise JSONL (par défaut
+<dossier>/.docscan_checkpoint.jsonl) : relancer la même commande après une
+interruption ne rappelle pas l'API pour les fichiers déjà extraits.
+Avec --batch-api, les lots soumis sont notés dans <point de reprise>.batches.json :
+une relance reprend le suivi des lots en cours au lieu de les resoumettre.
+Le classeur organisé est écrit à la fin, à partir du point de reprise.
+Les PDF natifs sont lus par leur couche texte (pdftotext) : texte envoyé au lieu d'une image,
+ou lecture locale sans appel API pour les mises en page déclarées dans --layouts.
+Plusieurs clés ou déploiements (OPENAI_API_KEYS, DOCSCAN_ENDPOINTS ou --endpoints) : les appels
+sont répartis entre eux selon leurs quotas (docscan.balancer).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from docscan.balancer import EndpointPool, resolve_api_key
+from docscan.cache import ExtractionCache, compaction_variant
+from docscan.clients import ClientRegistry
+from docscan.compact import DEFAULTS as COMPACT_DEFAULTS
+from docscan.dedup import POLICIES as DUPLICATE_POLICIES, NearDuplicate, NearDuplicateIndex
+from docscan.columnar import FORMATS as TABLE_FORMATS, export_tables
+from docscan.engine import run_concurrent
+from docscan.excel import build_client_zip, build_organized_excel
+from docscan.extraction import MAX_PAGES, add_to_history, extract_document, get_client
+from docscan.history import HistoryStore
+from docscan.layouts import DEFAULT_LAYOUTS_PATH, load_layouts
+from docscan.trace import VALIDATION_FIELDS, path_summary, summarize, usage_totals, validation_totals
+from docscan.uploads import Upload
+
+EXTENSIONS = {"png", "jpg", "jpeg", "webp", "pdf"}
+CHECKPOINT_NAME = ".docscan_checkpoint.jsonl"
+
+
+class LocalFile(Upload):
+    """Fichier du disque présenté comme un fichier uploadé, lu par son chemin seulement au traitement."""
+
+    def __init__(self, root, path):
+        super().__init__(os.path.relpath(path, root), path=path)
+        self.mtime = os.stat(path).st_mtime_ns
+
+
+def find_documents(root, recursive=True):
+    """Fichiers image/PDF du dossier, triés par chemin relatif."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        paths += [os.path.join(dirpath, f) for f in filenames
+                  if not f.startswith(".") and f.rsplit(".", 1)[-1].lower() in EXTENSIONS]
+        if not recursive:
+            break
+    return [LocalFile(root, p) for p in sorted(paths)]
+
+
+# ─────────────────────────────────────────────
+# Point de reprise (JSONL, une ligne par fichier terminé)
+# ─────────────────────────────────────────────
+def load_checkpoint(path):
+    """Dernier enregistrement par fichier ; une ligne tronquée (arrêt brutal) est ignorée."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record["file"]] = record
+    return records
+
+
+def is_done(record, doc):
+    """Fichier inchangé depuis son extraction (ou depuis qu'il a été écarté comme quasi-doublon)."""
+    return (record is not None and record.get("status") in ("ok", "duplicate")
+            and record.get("size") == doc.size and record.get("mtime") == doc.mtime)
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self._file = open(path, "a+b")
+        # Ligne tronquée par un arrêt brutal : l'enregistrement suivant commence sur une nouvelle ligne,
+        # sinon il serait collé au fragment et ignoré avec lui à la relance
+        if self._file.tell():
+            self._file.seek(-1, os.SEEK_END)
+            if self._file.read(1) != b"\n":
+                self._file.write(b"\n")
+
+    def write(self, record):
+        self._file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def make_record(file, size, mtime, data=None, error=None, trace=None):
+    record = {"file": file, "size": size, "mtime": mtime}
+    if error is None:
+        record.update(status="ok", extracted_at=datetime.now().strftime("%d/%m/%Y %H:%M"),
+                      trace=trace or {}, data=data)
+    else:
+        record.update(status="error", error=error)
+    return record
+
+
+# ─────────────────────────────────────────────
+# Lot
+# ─────────────────────────────────────────────
+def add_to(history, doc, record, clients=None):
+    add_to_history(history, doc.name, record["data"], record["extracted_at"], duplicate_of=record.get("duplicate_of"),
+                   clients=clients)
+
+
+def run_batch(docs, records, checkpoint, api_key, max_in_flight=4, repository=None, log=print, clients=None, **options):
+    """Extrait les documents absents du point de reprise ; renvoie (extraits, échecs) de cette exécution."""
+    todo = [d for d in docs if not is_done(records.get(d.name), d)]
+    log(f"{len(docs)} fichier(s), {len(docs) - len(todo)} déjà extrait(s), {len(todo)} à traiter")
+
+    def worker(doc):
+        trace = {}
+        data, _ = extract_document(doc, api_key, with_preview=False, trace=trace, **options)
+        return data, trace
+
+    done, failed, skipped, traces = 0, 0, 0, []
+    for i, (doc, result, error) in enumerate(run_concurrent(todo, worker, max_in_flight=max_in_flight), start=1):
+        if error is None:
+            data, trace = result
+            record = make_record(doc.name, doc.size, doc.mtime, data, trace={
+                k: trace[k] for k in ("stages", "usage", "first_field", "total", "attempts", "cached", "path") + VALIDATION_FIELDS
+                if k in trace})
+            if trace.get("duplicate"):
+                record["duplicate_of"] = trace["duplicate"]["file"]
+            done += 1
+            traces.append(trace)
+            log(f"[{i}/{len(todo)}] ✅ {doc.name} · {data.get('type_document', 'autre')}"
+                f" · {data.get('client_detecte') or 'Non identifié'} ({trace['total']:.1f} s)")
+        elif isinstance(error, NearDuplicate):
+            record = {"file": doc.name, "size": doc.size, "mtime": doc.mtime, "status": "duplicate",
+                      "duplicate_of": error.match["file"]}
+            skipped += 1
+            log(f"[{i}/{len(todo)}] ⏭️ {doc.name} · {error}")
+        else:
+            record = make_record(doc.name, doc.size, doc.mtime, error=f"{type(error).__name__}: {error}")
+            failed += 1
+            log(f"[{i}/{len(todo)}] ❌ {doc.name} · {record['error']}")
+        checkpoint.write(record)
+        records[doc.name] = record
+        if error is None and repository is not None:
+            add_to(repository, doc, record, clients)
+
+    if traces:
+        log("\nTemps par étape :\n" + summarize(traces).to_string(index=False))
+        u = usage_totals(traces)
+        log(f"Tokens : {u['prompt_tokens']:,} prompt + {u['completion_tokens']:,} réponse")
+        log("\nChemins d'extraction :\n" + path_summary(traces).to_string(index=False))
+        v = validation_totals(traces)
+        log(f"Réponses hors schéma : {v['parse_failures']} sur {v['calls']} appel(s) ({v['wasted']:.1%}),"
+            f" {v['repaired']}/{v['repairs']} réparée(s) ; {v['local_fixes']} champ(s) corrigé(s) localement")
+    if skipped:
+        log(f"{skipped} quasi-doublon(s) ignoré(s)")
+    return done, failed
+
+
+def run_bulk(docs, records, checkpoint, api_key, manifest_path, repository=None, log=print, clients=None,
+             cache=None, raster_pool=None, compaction=None, poll_interval=60.0):
+    """Extraction différée par la Batch API ; renvoie (extraits, échecs) de cette exécution.
+
+    Les fichiers déjà dans un lot en cours (manifeste) ne sont pas resoumis : on reprend son suivi.
+    """
+    from docscan import bulk
+
+    client = get_client(api_key)
+    manifest = bulk.load_manifest(manifest_path)
+    in_flight = {m["file"] for b in manifest["batches"] if not b.get("ingested") for m in b["files"].values()}
+    todo = [d for d in docs if not is_done(records.get(d.name), d) and d.name not in in_flight]
+    log(f"{len(docs)} fichier(s), {len(in_flight)} dans un lot en cours, {len(todo)} à soumettre")
+
+    done, failed = 0, 0
+
+    def finish(doc, record):
+        checkpoint.write(record)
+        records[doc.name] = record
+        if record["status"] == "ok" and repository is not None:
+            add_to(repository, doc, record, clients)
+
+    # Documents déjà extraits (cache) : pas besoin de les soumettre
+    keys = {}
+    if cache is not None:
+        remaining = []
+        for doc in todo:
+            keys[doc.name] = cache.key_for(doc.chunks(), variant=compaction_variant(compaction))
+            cached = cache.get(keys[doc.name])
+            if cached is None:
+                remaining.append(doc)
+                continue
+            finish(doc, make_record(doc.name, doc.size, doc.mtime, cached, trace={"cached": True}))
+            done += 1
+        todo = remaining
+
+    for jsonl, members in bulk.build_batches(todo, raster_pool, compaction):
+        batch = bulk.submit_batch(client, jsonl, metadata={"source": "docscan"})
+        manifest["batches"].append({"id": batch.id, "files": {
+            custom_id: {"file": d.name, "size": d.size, "mtime": d.mtime, "cache_key": keys.get(d.name)}
+            for custom_id, d in members.items()
+        }})
+        bulk.save_manifest(manifest_path, manifest)
+        log(f"📤 Lot {batch.id} soumis : {len(members)} document(s), {len(jsonl) / 1024 ** 2:.1f} Mo")
+
+    usage = {}
+    by_name = {d.name: d for d in docs}
+    for entry in manifest["batches"]:
+        if entry.get("ingested"):
+            continue
+        batch = bulk.wait_for_batch(client, entry["id"], poll_interval=poll_interval, log=log)
+        results = bulk.batch_results(client, batch)
+        for custom_id, member in entry["files"].items():
+            doc = by_name.get(member["file"])
+            data, error, doc_usage = results.get(custom_id, (None, f"lot {batch.status} : requête non traitée", None))
+            for field, n in (doc_usage or {}).items():
+                if isinstance(n, int):
+                    usage[field] = usage.get(field, 0) + n
+            if error is None:
+                record = make_record(member["file"], member["size"], member["mtime"], data,
+                                     trace={"usage": doc_usage, "batch": entry["id"]})
+                if cache is not None and member.get("cache_key"):
+                    cache.put(member["cache_key"], data)
+                done += 1
+            else:
+                record = make_record(member["file"], member["size"], member["mtime"], error=error)
+                failed += 1
+                log(f"❌ {member['file']} · {error}")
+            if doc is not None:
+                finish(doc, record)
+            else:
+                checkpoint.write(record)  # fichier retiré du dossier depuis la soumission
+        entry["ingested"] = True
+        bulk.save_manifest(manifest_path, manifest)
+
+    if usage:
+        log(f"Tokens : {usage.get('prompt_tokens', 0):,} prompt + {usage.get('completion_tokens', 0):,} réponse (tarif Batch)")
+    return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m docscan", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="dossier contenant les scans (PNG, JPG, WEBP, PDF)")
+    parser.add_argument("-o", "--output", help="classeur Excel organisé (défaut : DocScan_Export_<date>.xlsx)")
+    parser.add_argument("--par-client", action="store_true",
+                        help="un classeur par client, écrits en parallèle, dans une archive ZIP (défaut : .zip)")
+    parser.add_argument("--export-workers", type=int, help="processus d'écriture des classeurs (défaut : nombre de cœurs)")
+    parser.add_argument("--tables", choices=list(TABLE_FORMATS),
+                        help="écrire aussi les tables documents et lignes dans <sortie>_tables/ (Parquet, CSV ou JSONL)")
+    parser.add_argument("--checkpoint", help=f"point de reprise JSONL (défaut : <dossier>/{CHECKPOINT_NAME})")
+    parser.add_argument("--no-recursive", action="store_true", help="ne pas descendre dans les sous-dossiers")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="appels GPT-4o simultanés")
+    parser.add_argument("--timeout", type=float, default=120, help="timeout par requête (s)")
+    parser.add_argument("--retries", type=int, default=3, help="tentatives sur erreur 429/5xx")
+    parser.add_argument("--multipage", action="store_true", help="analyser toutes les pages des PDF")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES)
+    parser.add_argument("--no-compact", action="store_true", help="envoyer les images sans compaction")
+    parser.add_argument("--format", choices=["JPEG", "WEBP"], default=COMPACT_DEFAULTS["format"])
+    parser.add_argument("--target-kb", type=int, default=COMPACT_DEFAULTS["target_kb"])
+    parser.add_argument("--no-text-layer", action="store_true",
+                        help="envoyer les PDF natifs en image comme les scans (sans lire leur couche texte)")
+    parser.add_argument("--layouts", default=DEFAULT_LAYOUTS_PATH,
+                        help="mises en page lues localement, sans appel API (défaut : %(default)s)")
+    parser.add_argument("--duplicates", choices=["off"] + list(DUPLICATE_POLICIES), default="flag",
+                        help="quasi-doublons (même page en photo, scan, pièce jointe) : les signaler (flag), "
+                             "reprendre le résultat déjà extrait (reuse), les écarter (skip)")
+    parser.add_argument("--no-cache", action="store_true", help="ignorer le cache d'extraction")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="soumettre en différé via la Batch API (résultat sous 24 h, ~50 %% moins cher)")
+    parser.add_argument("--poll-interval", type=float, default=60, help="intervalle de suivi des lots Batch API (s)")
+    parser.add_argument("--no-client-resolution", action="store_true",
+                        help="ranger les documents sous le nom de client lu, sans regrouper les variantes (SIREN, alias)")
+    parser.add_argument("--lot", help="enregistrer aussi les documents dans ce lot du dépôt partagé (visible dans l'app)")
+    parser.add_argument("--endpoints",
+                        help="fichier JSON des points d'accès (clés, déploiements Azure, quotas) entre lesquels répartir les appels")
+    args = parser.parse_args(argv)
+
+    environ = dict(os.environ, DOCSCAN_ENDPOINTS=args.endpoints) if args.endpoints else os.environ
+    try:
+        api_key = resolve_api_key(environ)
+    except (ValueError, OSError) as e:
+        parser.error(f"points d'accès mal configurés : {e}")
+    if not api_key:
+        parser.error("OPENAI_API_KEY (ou OPENAI_API_KEYS, DOCSCAN_ENDPOINTS) n'est pas défini")
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} n'est pas un dossier")
+    if args.batch_api and args.multipage:
+        parser.error("--batch-api n'analyse que la première page des PDF : incompatible avec --multipage")
+
+    log = lambda msg: print(msg, file=sys.stderr, flush=True)
+    checkpoint_path = args.checkpoint or os.path.join(args.directory, CHECKPOINT_NAME)
+    output = args.output or f"DocScan_Export_{datetime.now().strftime('%Y%m%d_%H%M')}.{'zip' if args.par_client else 'xlsx'}"
+
+    docs = find_documents(args.directory, recursive=not args.no_recursive)
+    records = load_checkpoint(checkpoint_path)
+    repository = None
+    if args.lot:
+        from docscan.repository import DocumentRepository
+        repository = DocumentRepository(batch=args.lot)
+
+    raster_pool = None
+    if any(d.name.lower().endswith(".pdf") for d in docs):
+        from docscan.raster import make_raster_pool
+        raster_pool = make_raster_pool()
+
+    clients = None if args.no_client_resolution else ClientRegistry()
+    checkpoint = Checkpoint(checkpoint_path)
+    t0 = time.perf_counter()
+    cache = None if args.no_cache else ExtractionCache()
+    compaction = None if args.no_compact else {"format": args.format, "target_kb": args.target_kb}
+    try:
+        if args.batch_api:
+            done, failed = run_bulk(
+                docs, records, checkpoint, api_key, checkpoint_path + ".batches.json",
+                repository=repository, log=log, clients=clients, cache=cache, raster_pool=raster_pool,
+                compaction=compaction, poll_interval=args.poll_interval,
+            )
+        else:
+            done, failed = run_batch(
+                docs, records, checkpoint, api_key,
+                max_in_flight=args.max_in_flight, repository=repository, log=log, clients=clients,
+                cache=cache, raster_pool=raster_pool,
+                multipage=args.multipage, max_pages=args.max_pages, compaction=compaction,
+                text_layer=not args.no_text_layer,
+                duplicates=None if args.duplicates == "off" else NearDuplicateIndex(),
+                duplicate_policy=args.duplicates,
+                layouts=[] if args.no_text_layer else load_layouts(args.layouts),
+                timeout=args.timeout, max_retries=args.retries,
+            )
+    except KeyboardInterrupt:
+        log(f"⏸️  Interrompu : relancer la même commande pour reprendre ({checkpoint_path}).")
+        return 130
+    finally:
+        checkpoint.close()
+        if raster_pool is not None:
+            raster_pool.shutdown(cancel_futures=True)
+    log(f"{done} extrait(s), {failed} échec(s) en {time.perf_counter() - t0:.1f} s")
+    if isinstance(api_key, EndpointPool) and not args.batch_api:
+        log("\nPoints d'accès :\n" + pd.DataFrame(api_key.status()).to_string(index=False)
+            + f"\nAttente d'un quota disponible : {api_key.waited:.0f} s cumulées")
+
+    # Classeur final : tous les documents extraits (cette exécution et les précédentes), dans l'ordre des fichiers
+    history = HistoryStore()
+    for doc in docs:
+        if is_done(records.get(doc.name), doc) and records[doc.name]["status"] == "ok":
+            add_to(history, doc, records[doc.name], clients)
+    if history and args.par_client:
+        build_client_zip(history, output=output, workers=args.export_workers)
+        log(f"📥 {len(history)} document(s), {len(history.clients())} classeur(s) client → {output}")
+    elif history:
+        with open(output, "wb") as f:
+            f.write(build_organized_excel(history))
+        log(f"📥 {len(history)} document(s) → {output}")
+    if history and args.tables:
+        directory = os.path.splitext(output)[0] + "_tables"
+        paths = export_tables(history, args.tables, directory)
+        log(f"📥 Tables {TABLE_FORMATS[args.tables]} → {', '.join(paths.values())}")
+    if not history:
+        log("Aucun document extrait : pas de classeur écrit.")
+
+    remaining = sum(not is_done(records.get(doc.name), doc) for doc in docs)
+    if remaining:
+        log(f"⚠️  {remaining} fichier(s) en échec : relancer la commande pour les retenter.")
+    return 1 if remaining else 0
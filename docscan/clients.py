@@ -0,0 +1,284 @@
+"""Résolution des clients : « SFR », « S.F.R. » et « SFR SA » deviennent un seul client.
+
+Le nom brut (client_detecte) est ramené à une clé normalisée (majuscules, sans accents ni
+ponctuation, sans forme juridique). Un document est rattaché, dans l'ordre :
+1. à la variante corrigée par un opérateur (alias manuel) ;
+2. au client de même SIREN (SIRET ou TVA intracommunautaire de la partie cliente, clé de Luhn vérifiée) ;
+3. au client dont une variante a la même clé ;
+4. au client dont une variante est assez proche (trigrammes) : l'index inversé ne compare que
+   les variantes qui partagent des trigrammes avec la clé, pas toute la base ;
+sinon un nouveau client est créé. Un SIREN lu qui diffère de ceux du client trouvé aux étapes 3-4
+désigne une autre entité : nouveau client aussi. Chaque nouvelle variante est mémorisée comme alias : la table
+(SQLite, DATA_DIR/clients.sqlite) est partagée par l'app et la CLI et s'applique à l'ingestion.
+"""
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+from docscan import DATA_DIR
+
+DEFAULT_REGISTRY_PATH = os.path.join(DATA_DIR, "clients.sqlite")
+UNKNOWN_CLIENT = "Non identifié"
+# Colonne ajoutée à la mise à plat quand le client retenu diffère du nom lu sur le document
+DETECTED_COLUMN = "Client détecté"
+
+# Mots retirés de la clé : formes juridiques et articles
+STOP_WORDS = {
+    "SA", "SAS", "SASU", "SARL", "EURL", "SCI", "SNC", "SCP", "SCOP", "SELARL", "EI", "EIRL", "GIE",
+    "STE", "SOCIETE", "ETS", "ETABLISSEMENTS", "CIE", "ET", "DE", "DU", "DES", "LA", "LE", "LES", "L", "D",
+}
+# Similarité de Dice minimale entre trigrammes pour rattacher une variante inconnue
+MIN_SIMILARITY = 0.8
+# Trigrammes trop fréquents (« MAI » de MAIRIE...) ignorés pour choisir les candidats
+MAX_POSTING = 500
+
+_PUNCT = re.compile(r"[^\w]+")
+
+
+def normalize_name(name):
+    """Clé de comparaison d'un nom : « S.F.R. SA » → « SFR », « Mairie de Saint-Paul » → « MAIRIE SAINT PAUL »."""
+    text = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().upper()
+    words = _PUNCT.sub(" ", text.replace(".", "").replace("_", " ")).split()
+    kept = [w for w in words if w not in STOP_WORDS]
+    return " ".join(kept or words)
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _luhn(digits):
+    total = 0
+    for i, d in enumerate(reversed(digits)):
+        d = int(d) * (2 if i % 2 else 1)
+        total += d - 9 if d > 9 else d
+    return total % 10 == 0
+
+
+def siren_of(siret="", tva=""):
+    """SIREN (9 chiffres) d'un SIRET ou d'un n° de TVA intracommunautaire français ; "" si illisible."""
+    digits = re.sub(r"\D", "", siret or "")
+    if len(digits) in (9, 14) and _luhn(digits[:9]):
+        return digits[:9]
+    tva = re.sub(r"[\s.]", "", (tva or "").upper())
+    if re.fullmatch(r"FR\w{2}\d{9}", tva) and _luhn(tva[-9:]):
+        return tva[-9:]
+    return ""
+
+
+def _similarity(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+def client_party(data):
+    """Partie du document qui est le client : celle dont le nom ressemble à client_detecte.
+
+    À défaut, l'employeur (émetteur) pour une fiche de paie, le destinataire sinon — la règle du prompt.
+    """
+    key = trigrams(normalize_name(data.get("client_detecte", "")))
+    parties = [data.get("destinataire") or {}, data.get("emetteur") or {}]
+    if data.get("type_document") == "fiche_de_paie":
+        parties.reverse()
+    for party in parties:
+        if isinstance(party, dict) and _similarity(key, trigrams(normalize_name(party.get("nom", "")))) >= MIN_SIMILARITY:
+            return party
+    return parties[0] if isinstance(parties[0], dict) else {}
+
+
+class ClientRegistry:
+    """Clients canoniques, leurs SIREN et leurs variantes de nom (alias), persistants et partagés entre threads.
+
+    Tout est chargé en mémoire au démarrage (dictionnaires et index de trigrammes) : une résolution
+    ne touche la base que pour enregistrer une nouvelle variante.
+    """
+
+    def __init__(self, path=DEFAULT_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS clients (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS sirens (
+                siren TEXT PRIMARY KEY,
+                client_id INTEGER NOT NULL REFERENCES clients(id)
+            );
+            CREATE TABLE IF NOT EXISTS aliases (
+                key TEXT PRIMARY KEY,
+                client_id INTEGER NOT NULL REFERENCES clients(id),
+                manual INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        self._names, self._ids, self._by_siren = {}, {}, {}
+        self._aliases, self._grams = {}, defaultdict(set)
+        for client_id, name in self._conn.execute("SELECT id, name FROM clients"):
+            self._names[client_id] = name
+            self._ids[name] = client_id
+        self._by_siren = dict(self._conn.execute("SELECT siren, client_id FROM sirens"))
+        self._sirens = defaultdict(set)
+        for siren, client_id in self._by_siren.items():
+            self._sirens[client_id].add(siren)
+        for key, client_id, manual in self._conn.execute("SELECT key, client_id, manual FROM aliases"):
+            self._index(key, client_id, bool(manual))
+
+    def __len__(self):
+        return len(self._names)
+
+    def _index(self, key, client_id, manual):
+        self._aliases[key] = (client_id, manual)
+        for gram in trigrams(key):
+            self._grams[gram].add(key)
+
+    def _closest(self, key):
+        """Variante connue la plus proche de key (Dice ≥ MIN_SIMILARITY), parmi celles qui partagent ses trigrammes."""
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            keys = self._grams.get(gram)
+            if keys and len(keys) <= MAX_POSTING:
+                shared.update(keys)
+        best, best_score = None, MIN_SIMILARITY
+        # Dice ≥ s impose au moins s·|A|/2 trigrammes communs : les autres sont écartés sans calcul
+        needed = MIN_SIMILARITY * len(grams) / 2
+        for candidate, n in shared.most_common():
+            if n < needed:
+                break
+            score = _similarity(grams, trigrams(candidate))
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    # ─────────────────────────────────────────
+    # Écriture (appelant : verrou tenu)
+    # ─────────────────────────────────────────
+    def _client(self, name):
+        client_id = self._ids.get(name)
+        if client_id is None:
+            client_id = self._conn.execute("INSERT INTO clients (name) VALUES (?)", (name,)).lastrowid
+            self._names[client_id] = name
+            self._ids[name] = client_id
+        return client_id
+
+    def _unique(self, name):
+        """Nom d'un nouveau client : suffixé si un client homonyme (autre SIREN) existe déjà."""
+        candidate, n = name, 1
+        while candidate in self._ids:
+            n += 1
+            candidate = f"{name} ({n})"
+        return candidate
+
+    def _alias(self, key, client_id, manual=False):
+        self._conn.execute(
+            "INSERT INTO aliases (key, client_id, manual) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET client_id = excluded.client_id, manual = excluded.manual",
+            (key, client_id, int(manual)),
+        )
+        self._index(key, client_id, manual)
+
+    def _set_siren(self, client_id, siren):
+        """SIREN lu pour la première fois : rattaché au client retenu (un client fusionné peut en avoir plusieurs)."""
+        if siren and siren not in self._by_siren:
+            self._conn.execute("INSERT INTO sirens (siren, client_id) VALUES (?, ?)", (siren, client_id))
+            self._by_siren[siren] = client_id
+            self._sirens[client_id].add(siren)
+
+    # ─────────────────────────────────────────
+    # Résolution
+    # ─────────────────────────────────────────
+    def resolve(self, data):
+        """Nom canonique du client d'un document extrait (voir l'ordre en tête du module)."""
+        raw = (data.get("client_detecte") or "").strip()
+        key = normalize_name(raw)
+        if not key:
+            return UNKNOWN_CLIENT
+        party = client_party(data)
+        siren = siren_of(party.get("siret", ""), party.get("tva_intra", ""))
+        with self._lock:
+            alias = self._aliases.get(key)
+            if alias is not None and alias[1]:
+                return self._names[alias[0]]
+            client_id = self._by_siren.get(siren) if siren else None
+            if client_id is None:
+                closest = key if alias is not None else self._closest(key)
+                client_id = self._aliases[closest][0] if closest else None
+                # Un SIREN connu et différent : même nom (ou presque), mais une autre entité
+                if client_id is not None and siren and self._sirens.get(client_id):
+                    client_id = None
+                if client_id is None:
+                    client_id = self._client(self._unique(raw))
+            self._set_siren(client_id, siren)
+            if alias is None or alias[0] != client_id:
+                self._alias(key, client_id)
+            self._conn.commit()
+            return self._names[client_id]
+
+    # ─────────────────────────────────────────
+    # Corrections des opérateurs
+    # ─────────────────────────────────────────
+    def set_alias(self, variant, client):
+        """Rattache une variante de nom à un client (créé au besoin) ; prioritaire sur SIREN et similarité."""
+        key = normalize_name(variant)
+        if not key:
+            return
+        with self._lock:
+            self._alias(key, self._client(client), manual=True)
+            self._conn.commit()
+
+    def merge(self, sources, target):
+        """Fusionne des clients dans target (existant ou nouveau nom) : variantes et SIREN passent à target.
+
+        Les noms fusionnés deviennent des alias manuels de target, même s'ils étaient inconnus de la table
+        (documents enregistrés avant elle). Les documents déjà enregistrés se renomment à part (rename_client).
+        """
+        with self._lock:
+            target_id = self._client(target)
+            self._alias(normalize_name(target), target_id, manual=True)
+            for name in sources:
+                if name == target:
+                    continue
+                source_id = self._ids.pop(name, None)
+                if source_id is not None:
+                    del self._names[source_id]
+                    self._conn.execute("UPDATE aliases SET client_id = ?, manual = 1 WHERE client_id = ?", (target_id, source_id))
+                    for key, (client_id, _) in list(self._aliases.items()):
+                        if client_id == source_id:
+                            self._aliases[key] = (target_id, True)
+                    for siren in self._sirens.pop(source_id, ()):
+                        self._by_siren[siren] = target_id
+                        self._sirens[target_id].add(siren)
+                    self._conn.execute("UPDATE sirens SET client_id = ? WHERE client_id = ?", (target_id, source_id))
+                    self._conn.execute("DELETE FROM clients WHERE id = ?", (source_id,))
+                if normalize_name(name):
+                    self._alias(normalize_name(name), target_id, manual=True)
+            self._conn.commit()
+
+    def aliases(self):
+        """Table des variantes connues : Variante (clé normalisée), Client, SIREN, Origine."""
+        with self._lock:
+            rows = [{"Variante": key, "Client": self._names[client_id],
+                     "SIREN": ", ".join(sorted(self._sirens.get(client_id, ()))),
+                     "Origine": "manuelle" if manual else "auto"}
+                    for key, (client_id, manual) in self._aliases.items()]
+        return pd.DataFrame(rows, columns=["Variante", "Client", "SIREN", "Origine"]).sort_values(
+            ["Client", "Variante"], ignore_index=True)
+
+    def clear(self):
+        with self._lock:
+            for table in ("aliases", "sirens", "clients"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.commit()
+            self._load()
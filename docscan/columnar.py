@@ -0,0 +1,180 @@
+"""Exports en tables pour les traitements en aval (ETL comptable) : Parquet, CSV, JSONL.
+
+Deux tables, aux colonnes fixes : documents (celles de flatten_data, plus Fichier source et
+Date extraction) et lignes (celles de lines_to_df, plus Fichier, N° Document et Date extraction).
+L'historique est lu par tranches de CHUNK_SIZE documents et chaque tranche est écrite aussitôt
+(un row group Parquet, un bloc de lignes CSV / JSONL) : ni classeur ni table complète en mémoire.
+Montants et quantités en nombres, dates en AAAA-MM-JJ (date Parquet), date d'extraction en
+AAAA-MM-JJTHH:MM:SS (horodatage Parquet), vides à null.
+"""
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from docscan.clients import DETECTED_COLUMN
+from docscan.config import TABLE_FORMATS as FORMATS
+from docscan.dedup import DUPLICATE_COLUMN
+from docscan.extraction import flatten_data, lines_to_df
+from docscan.normalize import (
+    AMOUNT_COLUMNS, DATE_COLUMNS, LINE_NUMBER_COLUMNS, RAW_COLUMN, to_date, to_number, to_records,
+)
+
+CHUNK_SIZE = 5000
+TABLES = ("documents", "lignes")
+EXTRACTED_AT = "Date extraction"
+EXTRACTED_AT_FORMAT = "%d/%m/%Y %H:%M"  # format enregistré dans l'historique
+
+DOCUMENT_COLUMNS = list(flatten_data({})) + [
+    DETECTED_COLUMN, DUPLICATE_COLUMN, RAW_COLUMN, "Fichier source", EXTRACTED_AT]
+LINE_COLUMNS = ["Fichier", "N° Document", EXTRACTED_AT] + list(lines_to_df({"lignes": [{}]}).columns) + [RAW_COLUMN]
+
+
+def _type(column, numbers):
+    if column in numbers:
+        return pa.float64()
+    if column in DATE_COLUMNS:
+        return pa.date32()
+    return pa.timestamp("s") if column == EXTRACTED_AT else pa.string()
+
+
+def _schema(columns, numbers):
+    return pa.schema([(c, _type(c, numbers)) for c in columns])
+
+
+SCHEMAS = {
+    "documents": _schema(DOCUMENT_COLUMNS, AMOUNT_COLUMNS),
+    "lignes": _schema(LINE_COLUMNS, LINE_NUMBER_COLUMNS),
+}
+
+
+def _conform(df, schema):
+    """Colonnes de schema dans l'ordre (absentes → vides), nombres et dates typés, textes en chaînes."""
+    df = df.reindex(columns=schema.names)
+    for field in schema:
+        column = df[field.name]
+        if field.type == pa.float64():
+            df[field.name] = to_number(column).to_numpy()
+        elif field.type == pa.date32():
+            dates = to_date(column)
+            df[field.name] = np.where(dates.isna(), None, dates.dt.date)
+        elif field.type == pa.timestamp("s"):
+            stamps = pd.to_datetime(column, format=EXTRACTED_AT_FORMAT, errors="coerce")
+            df[field.name] = np.where(stamps.isna(), None, stamps.dt.to_pydatetime())
+        else:
+            df[field.name] = column.astype("string").replace("", None).to_numpy(dtype=object, na_value=None)
+    return df
+
+
+def iter_tables(history, ids=None, chunk_size=CHUNK_SIZE):
+    """Tranches (documents, lignes) aux colonnes de SCHEMAS, dans l'ordre d'ajout."""
+    ids = list(history.select() if ids is None else ids)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        docs = history.documents(chunk)
+        lines = history.lines(chunk, internal=True)
+        if not lines.empty:
+            lines[EXTRACTED_AT] = lines["_doc_id"].map(docs[EXTRACTED_AT])
+        yield _conform(docs, SCHEMAS["documents"]), _conform(lines, SCHEMAS["lignes"])
+
+
+# ─────────────────────────────────────────────
+# Écrivains (un par format, alimentés tranche par tranche)
+# ─────────────────────────────────────────────
+class _ParquetSink:
+    def __init__(self, f, schema):
+        self._writer = pq.ParquetWriter(f, schema, compression="zstd")
+        self._schema = schema
+
+    def write(self, df):
+        if len(df):
+            self._writer.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        self._writer.close()
+
+
+class _TextSink:
+    def __init__(self, f, schema, fmt):
+        self._f = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        self._fmt = fmt
+        self._dates = [field.name for field in schema if field.type in (pa.date32(), pa.timestamp("s"))]
+        if fmt == "csv":
+            csv.writer(self._f).writerow(schema.names)
+
+    def write(self, df):
+        if not len(df):
+            return
+        df = df.copy()
+        for column in self._dates:
+            df[column] = df[column].map(lambda d: d.isoformat() if d is not None else None)
+        if self._fmt == "csv":
+            df.to_csv(self._f, header=False, index=False)
+        else:
+            self._f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in to_records(df))
+
+    def close(self):
+        self._f.flush()
+        self._f.detach()
+
+
+def _sink(fmt, f, schema):
+    return _ParquetSink(f, schema) if fmt == "parquet" else _TextSink(f, schema, fmt)
+
+
+def write_tables(history, fmt, files, ids=None, chunk_size=CHUNK_SIZE):
+    """Écrit les tables dans files = {"documents": fichier binaire, "lignes": fichier binaire} ; renvoie les nombres de lignes."""
+    sinks = {name: _sink(fmt, files[name], SCHEMAS[name]) for name in TABLES}
+    counts = dict.fromkeys(TABLES, 0)
+    try:
+        for tables in iter_tables(history, ids, chunk_size):
+            for name, df in zip(TABLES, tables):
+                sinks[name].write(df)
+                counts[name] += len(df)
+    finally:
+        for sink in sinks.values():
+            sink.close()
+    return counts
+
+
+def export_tables(history, fmt, directory, ids=None, chunk_size=CHUNK_SIZE):
+    """documents.<fmt> et lignes.<fmt> dans directory ; renvoie {table: chemin}."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, f"{name}.{fmt}") for name in TABLES}
+    files = {name: open(path, "wb") for name, path in paths.items()}
+    try:
+        write_tables(history, fmt, files, ids, chunk_size)
+    finally:
+        for f in files.values():
+            f.close()
+    return paths
+
+
+def build_tables_zip(history, fmt, ids=None, output=None, chunk_size=CHUNK_SIZE):
+    """Archive ZIP des deux tables (pour un téléchargement) ; renvoie ses octets si output est None.
+
+    Les tables passent par des fichiers temporaires (les deux s'écrivent en même temps), puis sont
+    recopiées en flux dans l'archive : Parquet déjà compressé y est rangé tel quel.
+    """
+    target = output if output is not None else io.BytesIO()
+    files = {name: tempfile.TemporaryFile() for name in TABLES}
+    try:
+        write_tables(history, fmt, files, ids, chunk_size)
+        compression = zipfile.ZIP_STORED if fmt == "parquet" else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(target, "w", compression=compression) as archive:
+            for name, f in files.items():
+                f.seek(0)
+                with archive.open(f"{name}.{fmt}", "w", force_zip64=True) as member:
+                    shutil.copyfileobj(f, member, 1024 * 1024)
+    finally:
+        for f in files.values():
+            f.close()
+    return target.getvalue() if output is None else None
@@ -0,0 +1,129 @@
+import io
+import math
+import os
+import time
+
+from PIL import Image, ImageOps, ImageStat
+
+# Réglages par défaut, choisis avec bench/bench_compaction.py
+DEFAULTS = {
+    "max_side": 2048,       # le modèle ramène l'image dans un carré de 2048 px...
+    "short_side": 768,      # ...puis le petit côté à 768 px (detail "high") : au-delà, c'est du poids perdu
+    "crop": True,
+    "grayscale": "auto",
+    "format": "JPEG",
+    "qualities": (85, 75, 65, 55),
+    "target_kb": 300,
+}
+
+MIME_EXT = {"JPEG": "jpeg", "WEBP": "webp", "PNG": "png"}
+
+
+def estimate_image_tokens(width, height, detail="high"):
+    """Estimation des tokens image facturés par GPT-4o (tuiles de 512 px après redimensionnement)."""
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height), 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def crop_margins(image, threshold=235, pad=12):
+    """Retire les marges blanches (scanner, page A4 peu remplie)."""
+    mask = image.convert("L").point(lambda p: 255 if p < threshold else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+    left, top, right, bottom = bbox
+    return image.crop((
+        max(0, left - pad), max(0, top - pad),
+        min(image.width, right + pad), min(image.height, bottom + pad),
+    ))
+
+
+def downsample(image, max_side=2048, short_side=768):
+    scale = min(1.0, max_side / max(image.size), short_side / min(image.size))
+    if scale >= 1.0:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def on_white(image):
+    """Image en RGB ou L ; la transparence (PNG RGBA, LA, palette) est posée sur fond blanc.
+
+    Un simple convert("RGB") rend noires les zones transparentes, et le texte noir qui s'y trouve disparaît.
+    """
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, "white")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image if image.mode in ("RGB", "L") else image.convert("RGB")
+
+
+def is_mostly_gray(image):
+    if image.mode in ("L", "1"):
+        return True
+    saturation = image.convert("RGB").reduce(4).convert("HSV").getchannel("S")
+    return ImageStat.Stat(saturation).mean[0] < 12
+
+
+def compact_image(image, bytes_before=0, **options):
+    """Normalise, recadre, réduit puis encode l'image au plus petit format qui tient dans target_kb.
+
+    Renvoie (payload_bytes, ext, stats) ; stats contient octets avant/après (avant : taille du fichier
+    source, ou de la page rendue pour un PDF), dimensions, qualité retenue et tokens image estimés avant/après.
+    """
+    opts = dict(DEFAULTS, **options)
+    original_size = image.size
+    image = on_white(ImageOps.exif_transpose(image))
+    if opts["crop"]:
+        image = crop_margins(image)
+    image = downsample(image, opts["max_side"], opts["short_side"])
+    if opts["grayscale"] is True or (opts["grayscale"] == "auto" and is_mostly_gray(image)):
+        image = image.convert("L")
+
+    fmt = opts["format"].upper()
+    payload, quality = b"", None
+    for quality in opts["qualities"]:
+        buf = io.BytesIO()
+        image.save(buf, format=fmt, quality=quality, optimize=True)
+        payload = buf.getvalue()
+        if len(payload) <= opts["target_kb"] * 1024:
+            break
+
+    stats = {
+        "bytes_before": bytes_before,
+        "bytes_after": len(payload),
+        "width": image.width,
+        "height": image.height,
+        "quality": quality,
+        "tokens_before": estimate_image_tokens(*original_size),
+        "tokens_after": estimate_image_tokens(image.width, image.height),
+    }
+    return payload, MIME_EXT[fmt], stats
+
+
+def compact_image_file(path, fingerprint=False, **options):
+    """Variante pour un fichier image sur disque : PIL le lit par son chemin, sans copie en mémoire.
+
+    Avec fingerprint=True, stats reçoit aussi l'empreinte de quasi-doublon de l'image déjà décodée
+    ("fingerprint", docscan.dedup) et sa durée ("fingerprint_s"), comme raster.rasterize_pdf.
+    """
+    with Image.open(path) as image:
+        image.load()
+        payload, ext, stats = compact_image(image, bytes_before=os.path.getsize(path), **options)
+        if fingerprint:
+            from docscan.dedup import fingerprint_image
+            t0 = time.perf_counter()
+            stats["fingerprint"] = fingerprint_image(image)
+            stats["fingerprint_s"] = time.perf_counter() - t0
+    return payload, ext, stats
+
+
+def compact_image_bytes(data, **options):
+    """Variante pour un fichier image brut (photo, scan) : décode puis compacte."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        return compact_image(image, bytes_before=len(data), **options)
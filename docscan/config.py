@@ -0,0 +1,32 @@
+# ─────────────────────────────────────────────
+# Config types
+# ─────────────────────────────────────────────
+TYPE_CONFIG = {
+    "facture":          {"icon": "🧾", "label": "Factures"},
+    "devis":            {"icon": "📝", "label": "Devis"},
+    "bon_de_commande":  {"icon": "📦", "label": "Bons de commande"},
+    "fiche_de_paie":    {"icon": "💰", "label": "Fiches de paie"},
+    "note_de_frais":    {"icon": "🧾", "label": "Notes de frais"},
+    "autre":            {"icon": "📄", "label": "Autres"},
+}
+
+# Couleurs d'en-tête Excel par type de document
+TYPE_COLORS = {
+    "facture": "2563eb",
+    "devis": "7c3aed",
+    "bon_de_commande": "db2777",
+    "fiche_de_paie": "ea580c",
+    "note_de_frais": "059669",
+    "autre": "64748b",
+}
+
+# ─────────────────────────────────────────────
+# Constantes partagées avec l'app
+# (ici plutôt que dans extraction, columnar, excel : l'app les lit sans importer le SDK OpenAI, pyarrow ni openpyxl)
+# ─────────────────────────────────────────────
+# Plafond de pages analysées par document en mode multi-pages
+MAX_PAGES = 50
+# Formats des tables d'export (docscan.columnar)
+TABLE_FORMATS = {"parquet": "Parquet", "csv": "CSV", "jsonl": "JSON Lines"}
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_MIME = "application/zip"
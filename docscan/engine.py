@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def run_concurrent(items, worker, max_in_flight=4, poll=None, poll_interval=0.1):
+    """Exécute worker(item) en parallèle et renvoie (item, résultat, erreur) dans l'ordre de complétion.
+
+    Au plus max_in_flight appels sont en vol à la fois : les suivants ne sont soumis
+    qu'au fur et à mesure que les premiers se terminent. Si l'appelant arrête
+    l'itération (break), les éléments non encore soumis ne sont jamais lancés.
+    poll() est appelé dans le thread de l'appelant toutes les poll_interval secondes
+    pendant l'attente (affichage de résultats partiels envoyés par les workers).
+    """
+    items = iter(items)
+    pool = ThreadPoolExecutor(max_workers=max(1, max_in_flight))
+    pending = {}
+
+    def submit_next():
+        for item in items:
+            pending[pool.submit(worker, item)] = item
+            return True
+        return False
+
+    try:
+        for _ in range(max(1, max_in_flight)):
+            if not submit_next():
+                break
+        while pending:
+            done, _ = wait(pending, timeout=poll_interval if poll else None, return_when=FIRST_COMPLETED)
+            if poll is not None:
+                poll()
+            for fut in done:
+                item = pending.pop(fut)
+                err = fut.exception()
+                yield item, (None if err else fut.result()), err
+                submit_next()
+    finally:
+        for fut in pending:
+            fut.cancel()
+        pool.shutdown(wait=False)
@@ -0,0 +1,325 @@
+import io
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+from docscan.config import TYPE_CONFIG, TYPE_COLORS, XLSX_MIME, ZIP_MIME
+from docscan.normalize import MONEY_COLUMNS
+
+# Formats Excel des cellules typées (docscan.normalize) : vraies dates et vrais nombres, triables et sommables
+DATE_FORMAT = "dd/mm/yyyy"
+MONEY_FORMAT = "#,##0.00"
+
+
+def safe_sheet_name(name, max_len=31):
+    for ch in ['\\', '/', '*', '?', ':', '[', ']']:
+        name = name.replace(ch, '_')
+    return name[:max_len]
+
+
+def unique_sheet_name(name, used, suffix=""):
+    """Nom de feuille valide (31 car. max, suffixe conservé) et unique dans le classeur.
+
+    Sans cela, deux noms identiques une fois tronqués écrasaient ou renommaient la feuille précédente.
+    """
+    candidate = safe_sheet_name(name, 31 - len(suffix)) + suffix
+    n = 2
+    while candidate.lower() in used:
+        tag = f" ({n})"
+        candidate = safe_sheet_name(name, 31 - len(suffix) - len(tag)) + tag + suffix
+        n += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def format_worksheet(ws, header_color="1e3a5f"):
+    """Applique un formatage professionnel à une feuille Excel."""
+    header_fill = PatternFill(start_color=header_color, end_color=header_color, fill_type="solid")
+    header_font = Font(name="Calibri", bold=True, color="FFFFFF", size=11)
+    cell_font = Font(name="Calibri", size=10)
+    header_align = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    cell_align = Alignment(vertical="center", wrap_text=True)
+    thin_border = Border(
+        left=Side(style="thin", color="D0D0D0"),
+        right=Side(style="thin", color="D0D0D0"),
+        top=Side(style="thin", color="D0D0D0"),
+        bottom=Side(style="thin", color="D0D0D0"),
+    )
+    alt_fill = PatternFill(start_color="F8FAFC", end_color="F8FAFC", fill_type="solid")
+
+    # Formater les en-têtes
+    for cell in ws[1]:
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_align
+        cell.border = thin_border
+
+    # Formater les données
+    for row_idx, row in enumerate(ws.iter_rows(min_row=2), start=2):
+        for cell in row:
+            cell.font = cell_font
+            cell.alignment = cell_align
+            cell.border = thin_border
+            if row_idx % 2 == 0:
+                cell.fill = alt_fill
+            if isinstance(cell.value, datetime):
+                cell.number_format = DATE_FORMAT
+
+    # Auto-ajuster la largeur des colonnes
+    for col_idx, col in enumerate(ws.columns, 1):
+        max_length = 0
+        col_letter = get_column_letter(col_idx)
+        for cell in col:
+            try:
+                cell_len = len(str(cell.value or ""))
+                if cell_len > max_length:
+                    max_length = cell_len
+            except Exception:
+                pass
+        # Limiter entre 10 et 45 caractères
+        adjusted = min(max(max_length + 3, 10), 45)
+        ws.column_dimensions[col_letter].width = adjusted
+
+    # Figer la première ligne (en-têtes)
+    ws.freeze_panes = "A2"
+
+
+# ─────────────────────────────────────────────
+# Classeur organisé (Index général + Client × Type + DET)
+# ─────────────────────────────────────────────
+def organized_sheets(history, ids=None):
+    """Décrit le classeur organisé : (nom de feuille, DataFrame, couleur d'en-tête), dans l'ordre des feuilles.
+
+    history est un HistoryStore ou un DocumentRepository ; ids restreint l'export à une sélection
+    (filtres du tableau de bord). Chaque groupe client × type est lu à part : seule la feuille en
+    cours d'écriture est en mémoire.
+    """
+    # 1. INDEX GÉNÉRAL
+    used = {"index général"}
+    yield "Index général", history.documents(ids), "1e3a5f"
+
+    # 2. PAR CLIENT → PAR TYPE (trié par client puis type, comme avant)
+    for client_name, type_key, group_ids in history.groups(ids):
+        type_label = TYPE_CONFIG.get(type_key, {}).get("label", type_key)
+        color = TYPE_COLORS.get(type_key, "64748b")
+        rows = history.documents(group_ids).drop(columns=["Date extraction"])
+        yield unique_sheet_name(f"{client_name} - {type_label}", used), rows, color
+
+        # Lignes détaillées
+        lines = history.lines(group_ids)
+        if not lines.empty:
+            yield unique_sheet_name(f"{client_name} - {type_label}", used, " DET"), lines, color
+
+
+# ─────────────────────────────────────────────
+# Écriture rapide (xlsxwriter en flux + formats partagés)
+# ─────────────────────────────────────────────
+_BASE_FORMAT = {"font_name": "Calibri", "border": 1, "border_color": "#D0D0D0", "valign": "vcenter", "text_wrap": True}
+
+
+def _cell_values(df):
+    """Matrice objet des valeurs, cellules vides à None (une seule conversion par feuille)."""
+    values = df.to_numpy(dtype=object)
+    values[pd.isna(values)] = None
+    return values
+
+
+# Une date s'affiche en JJ/MM/AAAA (10 caractères), quelle que soit sa représentation Python
+_text_len = np.frompyfunc(lambda v: 0 if v is None else 10 if isinstance(v, datetime) else len(str(v)), 1, 1)
+
+
+def column_widths(df, values=None):
+    """Largeurs de colonnes (entre 10 et 45) calculées en une passe vectorisée sur le DataFrame."""
+    values = _cell_values(df) if values is None else values
+    data_len = _text_len(values).max(axis=0) if len(values) else np.zeros(len(df.columns), dtype=int)
+    return [min(max(max(len(str(col)), int(n)) + 3, 10), 45) for col, n in zip(df.columns, data_len)]
+
+
+class _Formats:
+    """Un objet format par style, partagé par toutes les cellules du classeur (même rendu que format_worksheet)."""
+
+    def __init__(self, wb):
+        self.wb = wb
+        self.body = wb.add_format(dict(_BASE_FORMAT, font_size=10))
+        self.body_alt = wb.add_format(dict(_BASE_FORMAT, font_size=10, bg_color="#F8FAFC"))
+        self._headers = {}
+        self._typed = {}
+
+    def typed(self, num_format):
+        """(format, format sur fond alterné) d'une colonne de dates ou de montants."""
+        if num_format not in self._typed:
+            self._typed[num_format] = (
+                self.wb.add_format(dict(_BASE_FORMAT, font_size=10, num_format=num_format)),
+                self.wb.add_format(dict(_BASE_FORMAT, font_size=10, bg_color="#F8FAFC", num_format=num_format)),
+            )
+        return self._typed[num_format]
+
+    def header(self, color):
+        if color not in self._headers:
+            self._headers[color] = self.wb.add_format(dict(
+                _BASE_FORMAT, font_size=11, bold=True, font_color="#FFFFFF", bg_color=f"#{color}", align="center",
+            ))
+        return self._headers[color]
+
+
+_EXCEL_EPOCH = np.datetime64("1899-12-30")
+
+
+def _typed_columns(formats, df, values):
+    """{indice de colonne: (format, format alterné)} pour les colonnes de dates et de montants.
+
+    Les dates sont converties d'un bloc en numéros de série Excel dans values (cellule date native).
+    """
+    typed = {}
+    for col_idx, (name, dtype) in enumerate(df.dtypes.items()):
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            dates = df.iloc[:, col_idx].to_numpy()
+            serials = (dates - _EXCEL_EPOCH) / np.timedelta64(1, "D")
+            values[:, col_idx] = np.where(np.isnat(dates), None, serials)
+            typed[col_idx] = formats.typed(DATE_FORMAT)
+        elif name in MONEY_COLUMNS and pd.api.types.is_float_dtype(dtype):
+            typed[col_idx] = formats.typed(MONEY_FORMAT)
+    return typed
+
+
+def write_sheet(wb, formats, title, df, header_color="1e3a5f"):
+    """Écrit un DataFrame ligne à ligne (mode constant_memory) : largeurs et volets posés avant le flux.
+
+    Les dates et les montants typés sont écrits en cellules natives (date, nombre) avec leur format.
+    """
+    ws = wb.add_worksheet(title)
+    values = _cell_values(df)
+    for col_idx, width in enumerate(column_widths(df, values)):
+        ws.set_column(col_idx, col_idx, width)
+    ws.freeze_panes(1, 0)
+    ws.write_row(0, 0, [str(c) for c in df.columns], formats.header(header_color))
+    typed = _typed_columns(formats, df, values)
+    for row_idx, row in enumerate(values.tolist(), start=1):
+        # Ligne 2 (première ligne de données) sur fond alterné, comme format_worksheet
+        alt = row_idx % 2
+        ws.write_row(row_idx, 0, row, formats.body_alt if alt else formats.body)
+        # Même ligne réécrite pour les colonnes typées (le flux constant_memory garde la ligne courante)
+        for col_idx, fmt in typed.items():
+            ws.write(row_idx, col_idx, row[col_idx], fmt[alt])
+    return ws
+
+
+def write_workbook(sheets, output=None):
+    """Assemble un classeur .xlsx à partir de (nom, DataFrame, couleur) ; renvoie ses octets si output est None."""
+    target = output if output is not None else io.BytesIO()
+    wb = xlsxwriter.Workbook(target, {
+        "constant_memory": True,
+        # Valeurs écrites telles quelles, comme avec openpyxl : pas de formules ni de liens implicites
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+    })
+    formats = _Formats(wb)
+    for title, df, color in sheets:
+        write_sheet(wb, formats, title, df, color)
+    wb.close()
+    return target.getvalue() if output is None else None
+
+
+def build_organized_excel(history, ids=None):
+    return write_workbook(organized_sheets(history, ids))
+
+
+# ─────────────────────────────────────────────
+# Un classeur par client (pool de processus) → ZIP
+# ─────────────────────────────────────────────
+def safe_file_name(name, used, suffix=".xlsx"):
+    """Nom de fichier valide sous Windows comme sous Unix, et unique dans l'archive (insensible à la casse)."""
+    base = "".join("_" if ch in '\\/:*?"<>|' or ord(ch) < 32 else ch for ch in name).strip(" .") or "Sans nom"
+    candidate, n = base[:120] + suffix, 2
+    while candidate.lower() in used:
+        candidate = f"{base[:120]} ({n}){suffix}"
+        n += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def client_partitions(history, ids=None):
+    """[(client, ids du client dans l'ordre d'ajout)] trié par client."""
+    by_client = {}
+    for client, _, group in history.groups(ids):
+        by_client.setdefault(client, []).extend(group)
+    return [(client, sorted(group)) for client, group in by_client.items()]
+
+
+def _client_workbook(sheets):
+    """Tâche du pool : les feuilles arrivent déjà lues (DataFrames), seule l'écriture du .xlsx se fait ici."""
+    return write_workbook(sheets)
+
+
+def client_workbooks(history, ids=None, pool=None, max_in_flight=None):
+    """Génère (client, octets .xlsx) dans l'ordre des clients, chaque classeur au format du classeur organisé.
+
+    Les feuilles d'un client sont lues ici (l'historique reste dans ce processus) puis écrites par le
+    pool ; au plus max_in_flight clients sont en cours à la fois, ce qui borne la mémoire. Sans pool,
+    les classeurs sont écrits un par un dans le processus courant.
+    """
+    partitions = client_partitions(history, ids)
+    if pool is None:
+        for client, group in partitions:
+            yield client, write_workbook(organized_sheets(history, group))
+        return
+    max_in_flight = max_in_flight or 2 * (getattr(pool, "_max_workers", None) or os.cpu_count() or 1)
+    pending = deque()
+    for client, group in partitions:
+        pending.append((client, pool.submit(_client_workbook, list(organized_sheets(history, group)))))
+        if len(pending) >= max_in_flight:
+            done_client, future = pending.popleft()
+            yield done_client, future.result()
+    while pending:
+        done_client, future = pending.popleft()
+        yield done_client, future.result()
+
+
+def build_client_zip(history, ids=None, output=None, workers=None, pool=None):
+    """Archive ZIP d'un classeur par client ; renvoie ses octets si output est None.
+
+    workers : processus d'écriture (défaut : nombre de cœurs ; 1 = sans pool). Un pool existant
+    peut être fourni (pool), il n'est alors pas arrêté. Les .xlsx étant déjà compressés, ils sont
+    rangés sans recompression dans l'archive, au fur et à mesure qu'ils sont prêts.
+    """
+    target = output if output is not None else io.BytesIO()
+    own_pool = None
+    if pool is None and (workers or os.cpu_count() or 1) > 1:
+        own_pool = pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        used = set()
+        with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED) as archive:
+            for client, data in client_workbooks(history, ids, pool=pool):
+                archive.writestr(safe_file_name(client, used), data)
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown(cancel_futures=True)
+    return target.getvalue() if output is None else None
+
+
+def build_single_excel(flat, lines_df):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        # Feuille résumé — transposée pour une meilleure lisibilité
+        summary_data = {"Champ": list(flat.keys()), "Valeur": list(flat.values())}
+        pd.DataFrame(summary_data).to_excel(writer, sheet_name="Résumé", index=False)
+        format_worksheet(writer.sheets["Résumé"], "1e3a5f")
+
+        # Ajuster la colonne Valeur plus large
+        writer.sheets["Résumé"].column_dimensions["B"].width = 50
+
+        if lines_df is not None and not lines_df.empty:
+            lines_df.to_excel(writer, sheet_name="Lignes détaillées", index=False)
+            format_worksheet(writer.sheets["Lignes détaillées"], "2563eb")
+    return output.getvalue()
+
+
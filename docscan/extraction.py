@@ -0,0 +1,674 @@
+import json
+import random
+import threading
+import time
+
+import openai
+import pandas as pd
+from openai import Stream
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from docscan.balancer import EndpointPool, estimate_tokens
+from docscan.cache import compaction_variant
+from docscan.clients import DETECTED_COLUMN
+from docscan.config import MAX_PAGES
+from docscan.compact import compact_image_file
+from docscan.dedup import DUPLICATE_COLUMN, FLAG, REUSE, SKIP, NearDuplicate, fingerprint_file
+from docscan.engine import run_concurrent
+from docscan.layouts import parse_local
+from docscan.normalize import normalize_document
+from docscan.raster import RENDER_DPI, count_pages, rasterize_page, rasterize_pdf, render_preview, run_in_pool
+from docscan.schema import RESPONSE_FORMAT, InvalidResponse, build_repair_request, check_response
+from docscan.stream import KEY_FIELDS, IncrementalJSON
+from docscan.textlayer import compact_text, is_usable, pdf_text
+from docscan.trace import add_usage, count, merge_into, stage
+from docscan.uploads import DataURL, as_upload, encode_body, mime_type
+
+USER_PROMPT = "Analyse ce document. Identifie le client, le type, et extrais toutes les données en JSON."
+TEXT_PROMPT = ("Analyse ce document. Il t'est fourni en texte (couche texte du PDF, mise en page conservée) "
+               "et non en image. Identifie le client, le type, et extrais toutes les données en JSON.")
+
+MODEL = "gpt-4o"
+
+# ─────────────────────────────────────────────
+# Prompt système
+# ─────────────────────────────────────────────
+SYSTEM_PROMPT = """Tu es un assistant expert en extraction de données documentaires.
+On te fournit l'image d'un document professionnel.
+
+MISSIONS :
+1. IDENTIFIER le type de document
+2. IDENTIFIER le client (= la personne/entreprise qui REÇOIT le document ou à qui il est adressé. Si c'est une facture, le client est le destinataire. Si c'est une fiche de paie, le client est l'employeur.)
+3. EXTRAIRE toutes les informations
+
+Réponds UNIQUEMENT avec un JSON valide (sans markdown, sans backticks) :
+
+{
+    "type_document": "facture | devis | bon_de_commande | fiche_de_paie | note_de_frais | autre",
+    "confiance_type": "haute | moyenne | basse",
+    "client_detecte": "Nom de l'entreprise/personne cliente identifiée",
+    "emetteur": {
+        "nom": "",
+        "adresse": "",
+        "telephone": "",
+        "email": "",
+        "siret": "",
+        "tva_intra": ""
+    },
+    "destinataire": {
+        "nom": "",
+        "adresse": "",
+        "telephone": "",
+        "email": "",
+        "siret": ""
+    },
+    "document": {
+        "numero": "",
+        "date_emission": "",
+        "date_echeance": "",
+        "reference": "",
+        "objet": ""
+    },
+    "lignes": [
+        {
+            "description": "",
+            "quantite": "",
+            "prix_unitaire_ht": "",
+            "montant_ht": "",
+            "tva_pourcent": ""
+        }
+    ],
+    "totaux": {
+        "total_ht": "",
+        "total_tva": "",
+        "total_ttc": "",
+        "devise": "EUR"
+    },
+    "paiement": {
+        "mode": "",
+        "iban": "",
+        "bic": "",
+        "conditions": ""
+    },
+    "notes": ""
+}
+
+Règles :
+- Remplis UNIQUEMENT les champs trouvés dans le document, laisse "" pour les absents
+- client_detecte : déduis le nom du client principal (destinataire pour facture/devis, employeur pour fiche de paie)
+- Montants en string "1234.56", dates en "JJ/MM/AAAA"
+- Si le type ne correspond à aucun listé, utilise "autre"
+"""
+# La forme ci-dessus est aussi imposée par response_format (docscan.schema.DOCUMENT_SCHEMA)
+
+# ─────────────────────────────────────────────
+# Appel API avec retry
+# ─────────────────────────────────────────────
+def is_retryable(exc):
+    """Erreurs transitoires : 429, 5xx, timeout, coupure réseau."""
+    if isinstance(exc, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code >= 500
+    return False
+
+
+def retry_delay(attempt, base_delay=1.0, max_delay=30.0, exc=None):
+    """Backoff exponentiel avec full jitter, en respectant un éventuel Retry-After."""
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    response = getattr(exc, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after", ""))
+            delay = max(delay, min(retry_after, max_delay))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+def call_with_retry(fn, max_retries=3, base_delay=1.0, max_delay=30.0):
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            time.sleep(retry_delay(attempt, base_delay, max_delay, e))
+            attempt += 1
+
+
+def parse_response(raw):
+    """Nettoie d'éventuels backticks markdown puis décode le JSON."""
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
+        if raw.endswith("```"):
+            raw = raw[:-3]
+        raw = raw.strip()
+    return json.loads(raw)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+# Corps déjà encodé, passé au SDK sans nouvel encodage JSON (requirements.txt : openai>=1.99,<4) :
+# - openai >= 2.16 : post(content=...) accepte un fichier, lu par morceaux ;
+# - openai 1.99 à 2.15 : post(body=...) n'accepte que des octets (payload.getvalue(), une copie du corps).
+# Avant 1.99, des octets passés en body partaient en json= : non supporté.
+_SDK_VERSION = tuple(int(part) for part in openai.__version__.split(".")[:2])
+_RAW_BODY = "content" if _SDK_VERSION >= (2, 16) else "body"
+
+
+def get_client(api_key, base_url=None):
+    """Client OpenAI partagé par (clé, base_url) : son pool HTTP keep-alive sert à tous les documents.
+
+    Le cache est au niveau du module : il survit aux reruns Streamlit (app.py est réexécuté, pas docscan).
+    Les retries sont gérés ici (jitter) : on coupe ceux du SDK pour ne pas les cumuler.
+    base_url (ou OPENAI_BASE_URL) permet de viser un serveur local de test.
+    Avec un pool de points d'accès (docscan.balancer), c'est le client du premier.
+    """
+    if isinstance(api_key, EndpointPool):
+        return api_key.client
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        return client
+
+
+def build_request(image, file_type, user_text=USER_PROMPT):
+    """Corps de la requête chat.completions (modèle, prompts, image) : le même en direct et en Batch API.
+
+    image : base64 (str), ou octets / Upload encodés en base64 par morceaux à l'écriture du corps (encode_body).
+    """
+    url = f"data:{mime_type(file_type)};base64,{image}" if isinstance(image, str) else DataURL(image, file_type)
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": [
+                {"type": "text", "text": user_text},
+                {"type": "image_url", "image_url": {"url": url, "detail": "high"}}
+            ]}
+        ],
+        "response_format": RESPONSE_FORMAT,
+        "max_tokens": 4096,
+        "temperature": 0,
+    }
+
+
+def build_text_request(document_text, user_text=TEXT_PROMPT):
+    """Corps de la requête pour un PDF natif : le texte de la couche texte remplace l'image."""
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"{user_text}\n\n{document_text}"},
+        ],
+        "response_format": RESPONSE_FORMAT,
+        "max_tokens": 4096,
+        "temperature": 0,
+    }
+
+
+def _read_stream(stream, on_field=None, trace=None, started=None):
+    """Consomme une réponse en flux : renvoie (texte complet, usage).
+
+    Chaque valeur complète est passée à on_field(chemin, valeur) dès sa réception ;
+    trace["first_field"] note le délai jusqu'au premier champ clé (KEY_FIELDS).
+    """
+    parser = IncrementalJSON()
+    parts, usage = [], None
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        piece = chunk.choices[0].delta.content
+        parts.append(piece)
+        for path, value in parser.feed(piece):
+            if trace is not None and "first_field" not in trace and path in KEY_FIELDS:
+                trace["first_field"] = time.perf_counter() - started
+            if on_field is not None:
+                on_field(path, value)
+    return "".join(parts), usage
+
+
+def parse_document(raw):
+    """Décode et valide une réponse : (document conforme, corrections locales) ou JSONDecodeError / InvalidResponse."""
+    return check_response(parse_response(raw))
+
+
+def complete(body, api_key, timeout=60.0, max_retries=3, base_url=None, trace=None, stream=False, on_field=None,
+             repair=True):
+    """Envoie une requête chat.completions (image ou texte) et renvoie le JSON extrait.
+
+    Si trace est un dict, il reçoit les durées Requête / Parse, les tokens de response.usage,
+    le nombre de tentatives et le délai jusqu'au premier champ clé ("first_field").
+    Avec stream=True, la réponse arrive en flux et on_field(chemin, valeur) reçoit chaque
+    champ dès qu'il est complet ; le résultat renvoyé est le même qu'en mode normal
+    (parse_response sur le texte complet).
+
+    La réponse est validée contre le schéma (docscan.schema) après corrections locales. Si elle
+    reste illisible ou hors schéma, un seul appel de réparation (texte seul : réponse fautive et
+    erreurs, sans l'image) est tenté avant de lever InvalidResponse ; repair=False le désactive.
+    Compteurs dans trace : local_fixes, parse_failures, repairs, repaired.
+
+    Le corps JSON est écrit directement en octets (encode_body) puis passé tel quel au SDK, qui le lit
+    par morceaux : pas de copie de l'image en chaîne base64, ni de second encodage JSON par le SDK.
+
+    api_key peut être un EndpointPool (docscan.balancer) : chaque tentative part vers le point
+    d'accès qui a de la place (attente sinon), une erreur transitoire est retentée aussitôt sur un
+    autre ; trace["endpoint"] note celui qui a répondu.
+    """
+    pool = api_key if isinstance(api_key, EndpointPool) else None
+    client = None if pool is not None else get_client(api_key, base_url)
+    started = time.perf_counter()
+
+    def request(client, payload, streamed):
+        if trace is not None:
+            trace["attempts"] = trace.get("attempts", 0) + 1
+        payload.seek(0)  # nouvelle tentative : le corps est relu depuis le début
+        raw = payload if _RAW_BODY == "content" else payload.getvalue()
+        response = client.post(
+            "/chat/completions", cast_to=ChatCompletion, options={"timeout": timeout},
+            stream=streamed, stream_cls=Stream[ChatCompletionChunk], **{_RAW_BODY: raw},
+        )
+        if streamed:
+            return _read_stream(response, on_field, trace, started)
+        return response.choices[0].message.content, response.usage
+
+    def send(payload, streamed, tokens):
+        if pool is None:
+            return call_with_retry(lambda: request(client, payload, streamed), max_retries=max_retries)
+        return pool.call(lambda c: request(c, payload, streamed), tokens, max_retries=max_retries,
+                         retryable=is_retryable, trace=trace)
+
+    # Corps encodé une fois (image en base64 par morceaux), resservi tel quel aux nouvelles tentatives
+    with stage(trace, "Base64"):
+        payload = encode_body({**body, **({"stream": True, "stream_options": {"include_usage": True}} if stream else {})})
+    with stage(trace, "Requête"):
+        content, usage = send(payload, stream, estimate_tokens(body))
+    del payload
+    add_usage(trace, usage)
+
+    with stage(trace, "Parse"):
+        try:
+            data, fixes = parse_document(content)
+            error = None
+        except (json.JSONDecodeError, InvalidResponse) as e:
+            error = e
+    if error is not None:
+        count(trace, "parse_failures")
+        if not repair:
+            raise _invalid(error)
+        count(trace, "repairs")
+        errors = getattr(error, "errors", None) or [f"JSON illisible : {error}"]
+        with stage(trace, "Réparation"):
+            repair_body = build_repair_request(body["model"], content, errors)
+            content, usage = send(encode_body(repair_body), False, estimate_tokens(repair_body))
+            add_usage(trace, usage)
+            try:
+                data, fixes = parse_document(content)
+            except (json.JSONDecodeError, InvalidResponse) as e:
+                raise _invalid(e) from error
+        count(trace, "repaired")
+    count(trace, "local_fixes", fixes)
+    if trace is not None:
+        # Sans flux, le premier champ n'est lisible qu'une fois tout reçu et décodé
+        trace.setdefault("first_field", time.perf_counter() - started)
+    return data
+
+
+def _invalid(error):
+    if isinstance(error, InvalidResponse):
+        return error
+    return InvalidResponse(f"JSON illisible : {error}", [str(error)])
+
+
+def extract_data(image, file_type, api_key, user_text=USER_PROMPT, **kwargs):
+    """Envoie l'image (base64, octets ou Upload) à GPT-4o et renvoie le JSON extrait (options de complete())."""
+    return complete(build_request(image, file_type, user_text), api_key, **kwargs)
+
+
+def extract_text(document_text, api_key, user_text=TEXT_PROMPT, **kwargs):
+    """Envoie le texte d'un PDF natif à GPT-4o et renvoie le JSON extrait (options de complete())."""
+    return complete(build_text_request(document_text, user_text), api_key, **kwargs)
+
+
+# ─────────────────────────────────────────────
+# PDF multi-pages
+# ─────────────────────────────────────────────
+def _is_blank(value):
+    if isinstance(value, dict):
+        return all(_is_blank(v) for v in value.values())
+    return value in ("", None, [], {})
+
+
+def merge_pages(pages):
+    """Fusionne les JSON extraits page par page en un seul document.
+
+    En-têtes (émetteur, destinataire, document, paiement) : la première valeur non vide gagne.
+    Lignes : concaténées dans l'ordre des pages. Totaux : ceux de la dernière page qui en porte
+    (le récapitulatif est en fin de document), complétés par les pages précédentes.
+    """
+    merged = {}
+    for data in pages:
+        for key, value in data.items():
+            if key in ("lignes", "totaux"):
+                continue
+            if isinstance(value, dict):
+                section = merged.setdefault(key, {})
+                for field, field_value in value.items():
+                    if _is_blank(section.get(field)) and not _is_blank(field_value):
+                        section[field] = field_value
+                    section.setdefault(field, field_value)
+            elif _is_blank(merged.get(key)):
+                merged[key] = value
+
+    merged["lignes"] = [l for data in pages for l in data.get("lignes", []) or [] if not _is_blank(l)]
+
+    totaux = {}
+    for data in reversed(pages):
+        for field, value in (data.get("totaux") or {}).items():
+            if _is_blank(totaux.get(field)) and not _is_blank(value):
+                totaux[field] = value
+            totaux.setdefault(field, value)
+    merged["totaux"] = totaux
+    return merged
+
+
+def extract_pdf_pages(pdf_path, api_key, max_pages=MAX_PAGES, pages_in_flight=3, raster_pool=None,
+                      compaction=None, trace=None, **kwargs):
+    """Extrait un PDF (chemin du fichier) page par page puis fusionne le résultat. Renvoie (data, preview de la page 1).
+
+    poppler ne rend qu'une page par appel : au plus pages_in_flight rasters existent en même temps,
+    donc la mémoire ne croît pas avec le nombre de pages.
+    """
+    # L'affichage anticipé ne suit que la page 1 (en-têtes) : les autres pages ont leurs propres lignes
+    on_field = kwargs.pop("on_field", None)
+    total_pages = count_pages(pdf_path)
+    n_pages = min(total_pages, max_pages)
+
+    def page_worker(page):
+        page_trace = {}
+        t0 = time.perf_counter()
+        with stage(page_trace, "Rendu"):
+            payload, ext, preview, stats = run_in_pool(
+                raster_pool, rasterize_page, pdf_path, page, RENDER_DPI, page == 1, compaction
+            )
+        t1 = time.perf_counter()
+        data = extract_data(
+            payload, ext, api_key,
+            user_text=f"{USER_PROMPT} (Page {page} sur {n_pages} d'un même document : n'extrais que ce qui figure sur cette page.)",
+            trace=page_trace, on_field=on_field if page == 1 else None, **kwargs
+        )
+        timing = {"Page": page, "Rendu (s)": round(t1 - t0, 3), "API (s)": round(time.perf_counter() - t1, 3),
+                  "Ko envoyés": round(stats["bytes_after"] / 1024, 1), "Tokens image": stats["tokens_after"],
+                  "Lignes": len(data.get("lignes", []) or [])}
+        return data, preview, timing, stats, page_trace
+
+    results = {}
+    for page, result, error in run_concurrent(range(1, n_pages + 1), page_worker, max_in_flight=pages_in_flight):
+        if error is not None:
+            raise error
+        results[page] = result
+
+    if trace is not None:
+        # Temps cumulés sur les pages (traitées en parallèle : la somme dépasse le temps mur)
+        merge_into(trace, [results[p][4] for p in sorted(results)])
+        trace["pages"] = [results[p][2] for p in sorted(results)]
+        trace["pages_total"] = total_pages
+        trace["payload"] = {
+            k: sum(results[p][3][k] for p in results)
+            for k in ("bytes_before", "bytes_after", "tokens_before", "tokens_after")
+        }
+    return merge_pages([results[p][0] for p in sorted(results)]), results[1][1]
+
+
+def prepare_image(upload, file_path, file_ext, raster_pool=None, compaction=None, trace=None, fingerprint=False):
+    """Image à envoyer pour un fichier (1re page pour un PDF) : renvoie (image, extension, aperçu ou None, empreinte ou None).
+
+    image est l'Upload lui-même si le fichier part tel quel (lu par morceaux à l'envoi), sinon
+    les octets du rendu ou de la version compactée ; le base64 est fait à l'écriture du corps.
+    Avec fingerprint=True, l'empreinte de quasi-doublon est tirée de l'image déjà décodée : le rendu
+    poppler d'un PDF, ou l'image lue pour la compaction (None pour une image envoyée telle quelle).
+    """
+    # Convertir PDF en image (un seul rendu, éventuellement dans un autre processus), sinon envoyer le fichier
+    if file_ext == "pdf" or compaction is not None:
+        with stage(trace, "Rendu"):
+            if file_ext == "pdf":
+                payload, send_ext, preview, stats = run_in_pool(
+                    raster_pool, rasterize_pdf, file_path, RENDER_DPI, compaction, fingerprint
+                )
+            else:
+                preview = None
+                payload, send_ext, stats = run_in_pool(
+                    raster_pool, compact_image_file, file_path, fingerprint=fingerprint, **compaction
+                )
+    else:
+        preview, payload, send_ext, stats = None, upload, file_ext, None
+    hashed = None
+    if stats is not None:
+        hashed, seconds = stats.pop("fingerprint", None), stats.pop("fingerprint_s", 0.0)
+        if trace is not None:
+            if seconds:  # le temps de l'empreinte passe du rendu à sa propre étape
+                trace["stages"]["Rendu"] -= seconds
+                trace["stages"]["Empreinte"] = trace["stages"].get("Empreinte", 0.0) + seconds
+            trace["payload"] = stats
+    return payload, send_ext, preview, hashed
+
+
+def _preview(pdf_path, raster_pool):
+    """Aperçu seul d'un PDF (sans image pleine résolution) ; None si le rendu échoue."""
+    try:
+        return run_in_pool(raster_pool, render_preview, pdf_path)
+    except Exception:
+        return None
+
+
+def read_text_layer(pdf_path, last_page=1, trace=None):
+    """Texte des premières pages d'un PDF s'il a une vraie couche texte (PDF natif), sinon None (scan)."""
+    with stage(trace, "Texte"):
+        pages = pdf_text(pdf_path, last_page=last_page)
+    if not is_usable(pages):
+        return None
+    if trace is not None:
+        trace["text_chars"] = sum(len(p) for p in pages)
+    return pages
+
+
+def extract_document(uploaded_file, api_key, cache=None, force=False, raster_pool=None,
+                     multipage=False, max_pages=MAX_PAGES, pages_in_flight=3, compaction=None,
+                     trace=None, with_preview=True, text_layer=False, layouts=None,
+                     duplicates=None, duplicate_policy=FLAG, **kwargs):
+    """Encode un fichier uploadé (PDF ou image) puis l'envoie à GPT-4o. Sans appel Streamlit : sûr en thread.
+
+    uploaded_file est un Upload (docscan.uploads), ou un fichier name + getvalue / ouvert qui y est
+    recopié : un gros fichier est lu par son chemin et par morceaux, jamais chargé en entier.
+
+    Avec un ExtractionCache, un fichier déjà vu (mêmes octets, même modèle, même prompt)
+    est resservi sans appel API, sauf si force=True.
+
+    Renvoie (data, preview) : pour un PDF, preview est l'aperçu JPEG tiré du même rendu
+    poppler que l'image envoyée ; None pour une image (affichable telle quelle).
+    compaction (dict d'options de docscan.compact, {} pour les défauts) active la réduction
+    de l'image avant envoi ; None envoie le PNG / le fichier tel quel.
+    Si trace est un dict, il reçoit la taille envoyée et les tokens image estimés ("payload"),
+    les durées par étape ("stages"), les tokens facturés ("usage"), le temps total ("total"),
+    le chemin suivi ("path" : local, texte, vision ou cache) et les mesures par page en mode multi-pages.
+    with_preview=False évite le rendu d'aperçu sur un hit de cache (traitement par lot sans UI).
+
+    text_layer=True lit d'abord la couche texte d'un PDF (pdftotext) : un PDF natif est lu
+    localement si une mise en page de layouts (docscan.layouts) le reconnaît, sinon son texte
+    est envoyé à la place de l'image ; un scan (pas de couche texte) part en vision.
+
+    Avec un NearDuplicateIndex (duplicates), l'empreinte de la page est cherchée avant l'appel
+    API : un quasi-doublon est signalé dans trace["duplicate"] (FLAG), resservi depuis l'index
+    (REUSE, chemin "doublon") ou refusé par NearDuplicate (SKIP), sauf si force=True. Les documents
+    extraits y sont ajoutés.
+    """
+    t0 = time.perf_counter()
+    file_ext = uploaded_file.name.rsplit(".", 1)[-1].lower()
+    with stage(trace, "Lecture"):
+        upload = as_upload(uploaded_file)
+    is_pdf = file_ext == "pdf"
+    multipage = multipage and is_pdf
+    # poppler, pdftotext et PIL lisent le fichier par son chemin (fichier temporaire pour un petit fichier en mémoire)
+    with upload.as_path() as file_path:
+        pages_text = None
+        if is_pdf and text_layer:
+            pages_text = read_text_layer(file_path, last_page=max_pages if multipage else 1, trace=trace)
+            if pages_text is not None and layouts:
+                local = parse_local("\n".join(pages_text), layouts)
+                if local is not None:
+                    if trace is not None:
+                        trace.update(path="local", layout=local[1], total=time.perf_counter() - t0)
+                    return local[0], _preview(file_path, raster_pool) if with_preview else None
+        path = "vision" if pages_text is None else "texte"
+
+        key = None
+        if cache is not None:
+            # Le mode multi-pages, la couche texte et la compaction de l'image produisent un autre résultat
+            # pour les mêmes octets
+            if path == "texte":
+                variant = f"texte:{max_pages if multipage else 1}"
+            else:
+                variant = (f"pages:{max_pages}|" if multipage else "") + compaction_variant(compaction)
+            key = cache.key_for(upload.chunks(), variant=variant)
+            if not force:
+                cached = cache.get(key)
+                if cached is not None:
+                    preview = _preview(file_path, raster_pool) if is_pdf and with_preview else None
+                    if trace is not None:
+                        trace.update(path="cache", cached=True, total=time.perf_counter() - t0)
+                    return cached, preview
+
+        fingerprint, prepared = None, None
+        if duplicates is not None:
+            if path == "vision" and not multipage and (is_pdf or compaction is not None):
+                # L'empreinte vient de l'image qui part à l'API : le fichier n'est rendu ou décodé qu'une fois
+                prepared = prepare_image(upload, file_path, file_ext, raster_pool, compaction, trace, fingerprint=True)
+                fingerprint = prepared[3]
+            else:
+                with stage(trace, "Empreinte"):
+                    fingerprint = run_in_pool(raster_pool, fingerprint_file, file_path, file_ext)
+            match = None if force else duplicates.find(fingerprint)
+            if match is not None:
+                if duplicate_policy == SKIP:
+                    raise NearDuplicate(match)
+                if trace is not None:
+                    trace["duplicate"] = {"file": match["file"], "distance": match["distance"]}
+                if duplicate_policy == REUSE:
+                    if prepared is not None:
+                        preview = prepared[2] if with_preview else None
+                    else:
+                        preview = _preview(file_path, raster_pool) if is_pdf and with_preview else None
+                    if trace is not None:
+                        trace.update(path="doublon", total=time.perf_counter() - t0)
+                    return match["data"], preview
+
+        if path == "texte":
+            data = extract_text(compact_text(pages_text), api_key, trace=trace, **kwargs)
+            preview = _preview(file_path, raster_pool) if with_preview else None
+        elif multipage:
+            data, preview = extract_pdf_pages(
+                file_path, api_key, max_pages=max_pages, pages_in_flight=pages_in_flight,
+                raster_pool=raster_pool, compaction=compaction, trace=trace, **kwargs
+            )
+        else:
+            image, send_ext, preview, _ = prepared or prepare_image(
+                upload, file_path, file_ext, raster_pool, compaction, trace)
+            data = extract_data(image, send_ext, api_key, trace=trace, **kwargs)
+            del image, prepared
+
+    if cache is not None:
+        cache.put(key, data)
+    if fingerprint is not None:
+        duplicates.add(fingerprint, uploaded_file.name, data)
+    if trace is not None:
+        trace["path"] = path
+        trace["total"] = time.perf_counter() - t0
+    return data, preview
+
+
+# ─────────────────────────────────────────────
+# Mise à plat
+# ─────────────────────────────────────────────
+def flatten_data(data):
+    flat = {}
+    flat["Client"] = data.get("client_detecte", "Non identifié")
+    flat["Type"] = data.get("type_document", "autre")
+    flat["Confiance"] = data.get("confiance_type", "")
+
+    em = data.get("emetteur", {})
+    flat["Émetteur"] = em.get("nom", "")
+    flat["Émetteur Adresse"] = em.get("adresse", "")
+    flat["Émetteur Tél"] = em.get("telephone", "")
+    flat["Émetteur Email"] = em.get("email", "")
+    flat["Émetteur SIRET"] = em.get("siret", "")
+
+    dest = data.get("destinataire", {})
+    flat["Destinataire"] = dest.get("nom", "")
+    flat["Destinataire Adresse"] = dest.get("adresse", "")
+
+    doc = data.get("document", {})
+    flat["N° Document"] = doc.get("numero", "")
+    flat["Date émission"] = doc.get("date_emission", "")
+    flat["Date échéance"] = doc.get("date_echeance", "")
+    flat["Référence"] = doc.get("reference", "")
+    flat["Objet"] = doc.get("objet", "")
+
+    tot = data.get("totaux", {})
+    flat["Total HT"] = tot.get("total_ht", "")
+    flat["Total TVA"] = tot.get("total_tva", "")
+    flat["Total TTC"] = tot.get("total_ttc", "")
+    flat["Devise"] = tot.get("devise", "EUR")
+
+    paie = data.get("paiement", {})
+    flat["Mode paiement"] = paie.get("mode", "")
+    flat["IBAN"] = paie.get("iban", "")
+    flat["Notes"] = data.get("notes", "")
+    return flat
+
+
+def lines_to_df(data):
+    lignes = data.get("lignes", [])
+    if not lignes:
+        return None
+    rows = []
+    for l in lignes:
+        rows.append({
+            "Description": l.get("description", ""),
+            "Quantité": l.get("quantite", ""),
+            "Prix unitaire HT": l.get("prix_unitaire_ht", ""),
+            "Montant HT": l.get("montant_ht", ""),
+            "TVA (%)": l.get("tva_pourcent", ""),
+        })
+    return pd.DataFrame(rows)
+
+
+def add_to_history(history, filename, data, timestamp, duplicate_of=None, clients=None):
+    """Mise à plat typée d'un résultat puis enregistrement dans l'historique ; renvoie (flat, lines_df).
+
+    Avec clients (ClientRegistry), le document est rangé sous le client canonique (alias, SIREN,
+    nom proche) ; le nom lu sur le document reste dans la colonne « Client détecté » s'il diffère.
+    """
+    flat, lines_df = normalize_document(flatten_data(data), lines_to_df(data))
+    detected = data.get("client_detecte", "Non identifié") or "Non identifié"
+    client = detected if clients is None else clients.resolve(data)
+    flat["Client"] = client
+    if client != detected:
+        flat[DETECTED_COLUMN] = detected
+    if duplicate_of:
+        flat[DUPLICATE_COLUMN] = duplicate_of
+    history.add(
+        filename=filename,
+        flat=flat,
+        lines_df=lines_df,
+        doc_type=data.get("type_document", "autre"),
+        client=client,
+        timestamp=timestamp,
+    )
+    return flat, lines_df
@@ -0,0 +1,195 @@
+import sys
+from collections import defaultdict
+
+import pandas as pd
+
+from docscan.normalize import AMOUNT_COLUMNS
+
+LINE_ID = "_doc_id"
+
+
+class HistoryStore:
+    """Historique des documents extraits, stocké en colonnes avec index par client et par type.
+
+    Deux tables : documents (une ligne par document : champs de flatten_data + fichier, date
+    d'extraction, client, type) et lignes (toutes les lignes de détail, rattachées par _doc_id).
+    Les index client / type / client×type donnent comptes et filtres en O(résultat), sans
+    parcourir l'historique. Les DataFrames ne sont matérialisés qu'à la demande, une fois par version.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._docs = defaultdict(list)
+        self._doc_columns = []
+        self._lines = defaultdict(list)
+        self._line_columns = []
+        self._line_spans = []
+        self._n_lines = 0
+        self._by_client = defaultdict(list)
+        self._by_type = defaultdict(list)
+        self._by_client_type = defaultdict(list)
+        self._frames = {}
+        self.version = getattr(self, "version", 0) + 1
+
+    def __len__(self):
+        return len(self._line_spans)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    # ─────────────────────────────────────────
+    # Écriture
+    # ─────────────────────────────────────────
+    def add(self, filename, flat, lines_df, doc_type, client, timestamp):
+        doc_id = len(self)
+        client, doc_type = sys.intern(client), sys.intern(doc_type)
+        row = dict(flat)
+        row["Fichier source"] = filename
+        row["Date extraction"] = sys.intern(timestamp)
+        row["_client"] = client
+        row["_type"] = doc_type
+        self._append(self._docs, self._doc_columns, row, doc_id)
+
+        start = self._n_lines
+        if lines_df is not None and not lines_df.empty:
+            for line in lines_df.to_dict("records"):
+                line[LINE_ID] = doc_id
+                self._append(self._lines, self._line_columns, line, self._n_lines)
+                self._n_lines += 1
+        self._line_spans.append((start, self._n_lines))
+
+        self._by_client[client].append(doc_id)
+        self._by_type[doc_type].append(doc_id)
+        self._by_client_type[(client, doc_type)].append(doc_id)
+        self._frames = {}
+        self.version += 1
+        return doc_id
+
+    def rename_client(self, old, new):
+        """Range sous new les documents de old (fusion de clients)."""
+        ids = self._by_client.pop(old, [])
+        if not ids:
+            return
+        new = sys.intern(new)
+        for i in ids:
+            self._docs["_client"][i] = new
+            self._docs["Client"][i] = new
+        self._by_client[new] = sorted(self._by_client[new] + ids)
+        for (client, doc_type) in [k for k in self._by_client_type if k[0] == old]:
+            moved = self._by_client_type.pop((client, doc_type))
+            self._by_client_type[(new, doc_type)] = sorted(self._by_client_type[(new, doc_type)] + moved)
+        self._frames = {}
+        self.version += 1
+
+    @staticmethod
+    def _append(table, columns, row, n_rows):
+        for key in row:
+            if key not in table:
+                # Nouvelle colonne : complétée par "" pour les lignes déjà présentes
+                columns.append(key)
+                table[key].extend([""] * n_rows)
+        for key in columns:
+            table[key].append(row.get(key, ""))
+
+    # ─────────────────────────────────────────
+    # Index
+    # ─────────────────────────────────────────
+    def clients(self):
+        return sorted(self._by_client)
+
+    def types(self):
+        return sorted(self._by_type)
+
+    def count(self, client=None, doc_type=None, numero=None):
+        return len(self.select(client, doc_type, numero))
+
+    def types_for(self, client):
+        return sorted(t for (c, t) in self._by_client_type if c == client)
+
+    def client_summary(self):
+        """[(client, nombre de documents, types présents)] trié par client."""
+        types = defaultdict(set)
+        for (client, doc_type) in self._by_client_type:
+            types[client].add(doc_type)
+        return [(c, len(self._by_client[c]), sorted(types[c])) for c in self.clients()]
+
+    def select(self, client=None, doc_type=None, numero=None):
+        """Identifiants des documents correspondant aux filtres (None = tous), dans l'ordre d'ajout."""
+        if client is not None and doc_type is not None:
+            ids = self._by_client_type.get((client, doc_type), [])
+        elif client is not None:
+            ids = self._by_client.get(client, [])
+        elif doc_type is not None:
+            ids = self._by_type.get(doc_type, [])
+        else:
+            ids = range(len(self))
+        if numero is not None:
+            numbers = self._docs.get("N° Document", [])
+            ids = [i for i in ids if numbers[i] == numero]
+        return ids
+
+    def groups(self, ids=None):
+        """[(client, type, ids)] trié par client puis type, pour le classeur organisé."""
+        if ids is None:
+            return [(c, t, group) for (c, t), group in sorted(self._by_client_type.items())]
+        groups = defaultdict(list)
+        for i in ids:
+            groups[(self._docs["_client"][i], self._docs["_type"][i])].append(i)
+        return [(c, t, group) for (c, t), group in sorted(groups.items())]
+
+    def total_ttc(self, ids=None):
+        # Montants typés à l'ingestion (docscan.normalize) : plus de conversion de chaînes à chaque rerun
+        totals = self.documents(ids).get("Total TTC")
+        return 0.0 if totals is None else float(pd.to_numeric(totals, errors="coerce").sum())
+
+    def amounts(self, ids=None):
+        """Client, Type, Date émission et totaux de chaque document, pour les agrégats du tableau de bord."""
+        docs = self.documents(ids, internal=True).reset_index(drop=True)
+        df = pd.DataFrame({"Client": docs["_client"], "Type": docs["_type"]})
+        df["Date émission"] = pd.to_datetime(docs["Date émission"], errors="coerce") if "Date émission" in docs else pd.NaT
+        for column in AMOUNT_COLUMNS:
+            df[column] = pd.to_numeric(docs[column], errors="coerce") if column in docs else float("nan")
+        return df
+
+    def vat_lines(self, ids=None):
+        """Taux de TVA et montant HT de chaque ligne de détail."""
+        lines = self.lines(ids)
+        return pd.DataFrame({column: pd.to_numeric(lines[column], errors="coerce") if column in lines else []
+                             for column in ("TVA (%)", "Montant HT")}, dtype="float64")
+
+    # ─────────────────────────────────────────
+    # Lecture (DataFrames)
+    # ─────────────────────────────────────────
+    def _frame(self, name, table, columns):
+        if name not in self._frames:
+            self._frames[name] = pd.DataFrame({c: table[c] for c in columns}, columns=columns)
+        return self._frames[name]
+
+    def documents(self, ids=None, internal=False):
+        """Table des documents (colonnes de flatten_data + Fichier source + Date extraction)."""
+        df = self._frame("docs", self._docs, self._doc_columns)
+        if ids is not None:
+            df = df.iloc[list(ids)]
+        if not internal:
+            df = df.drop(columns=["_client", "_type"], errors="ignore")
+        return df
+
+    def lines(self, ids=None, internal=False):
+        """Table consolidée des lignes de détail, avec Fichier et N° Document en tête (et _doc_id si internal)."""
+        if not self._n_lines:
+            return pd.DataFrame()
+        df = self._frame("lines", self._lines, self._line_columns)
+        if ids is not None:
+            df = df.iloc[[r for i in ids for r in range(*self._line_spans[i])]]
+        docs = self._frame("docs", self._docs, self._doc_columns)
+        doc_ids = df[LINE_ID].to_numpy(dtype=int)
+        out = (df if internal else df.drop(columns=[LINE_ID])).reset_index(drop=True)
+        out.insert(0, "N° Document", docs["N° Document"].to_numpy()[doc_ids])
+        out.insert(0, "Fichier", docs["Fichier source"].to_numpy()[doc_ids])
+        return out
+
+    def column(self, name, ids=None):
+        values = self._docs.get(name, [])
+        return values if ids is None else [values[i] for i in ids]
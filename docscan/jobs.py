@@ -0,0 +1,249 @@
+"""File de travaux d'extraction, exécutée hors du script Streamlit.
+
+Un rerun (widget touché, page rechargée) relance app.py mais plus les extractions : elles
+tournent dans les threads d'un JobRunner partagé (st.cache_resource), qui enregistre chaque
+document dans l'historique dès qu'il est extrait. Le script ne fait que soumettre les travaux
+et afficher leur état ; un travail peut être annulé depuis n'importe quelle session du lot.
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+from docscan.dedup import NearDuplicate
+from docscan.engine import run_concurrent
+from docscan.stream import KEY_FIELDS
+from docscan.trace import stage
+
+# États d'un travail et de ses documents
+QUEUED, RUNNING, DONE, CANCELLED, FAILED = "en attente", "en cours", "terminé", "annulé", "erreur"
+# États propres aux documents : enregistré dans l'historique, ou écarté comme quasi-doublon
+EXTRACTED, SKIPPED = "extrait", "ignoré"
+FINISHED = {DONE, CANCELLED, FAILED}
+
+# Travaux terminés gardés en mémoire (résultats et aperçus affichables)
+MAX_JOBS = 20
+# Travaux exécutés en même temps, toutes sessions et tous lots confondus : un gros lot n'occupe qu'un
+# thread, les dépôts des autres opérateurs partent sur les suivants. Chaque travail garde son propre
+# max_in_flight : au pire JOB_WORKERS × max_in_flight appels API en vol.
+JOB_WORKERS = int(os.environ.get("DOCSCAN_JOB_WORKERS", "4"))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """Un lot de fichiers soumis ensemble : état global, état et résultat de chaque document."""
+
+    def __init__(self, job_id, batch, files, history, api_key, max_in_flight, options, clients=None):
+        self.id = job_id
+        self.batch = batch
+        self.created_at = time.time()
+        self.finished_at = None
+        self.status = QUEUED
+        self.error = None
+        self.documents = [{"name": f.name, "status": QUEUED, "partial": {}, "lignes": 0} for f in files]
+        self._files = list(files)
+        self._files_lock = threading.Lock()
+        self._history = history
+        self._clients = clients
+        self._api_key = api_key
+        self._max_in_flight = max_in_flight
+        self._options = options
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def cancel(self):
+        """Les documents pas encore lancés ne le seront pas ; ceux en vol sont abandonnés."""
+        self._cancel.set()
+
+    def counts(self):
+        return Counter(doc["status"] for doc in self.documents)
+
+    def progress(self):
+        """Part des documents sortis de la file (extraits, ignorés, en erreur ou annulés)."""
+        done = sum(doc["status"] not in (QUEUED, RUNNING) for doc in self.documents)
+        return done / len(self.documents) if self.documents else 1.0
+
+    def traces(self):
+        return [doc["trace"] for doc in self.documents if doc["status"] == EXTRACTED]
+
+    def completed(self):
+        """Documents sortis de la file, dans l'ordre où ils se sont terminés."""
+        return sorted((doc for doc in self.documents if "finished_at" in doc), key=lambda doc: doc["finished_at"])
+
+    def _take(self, i):
+        """Fichier i, retiré de la liste : le worker qui le prend le ferme lui-même (None s'il est déjà libéré)."""
+        with self._files_lock:
+            upload, self._files[i] = self._files[i], None
+        return upload
+
+    def _release(self):
+        """Ferme les fichiers qu'aucun worker n'a pris ; ceux en vol restent à leur worker, même abandonné."""
+        with self._files_lock:
+            uploads, self._files = self._files, [None] * len(self._files)
+        for upload in uploads:
+            if upload is not None:
+                upload.close()
+
+
+class JobRunner:
+    """File de travaux traitée par des threads de fond, indépendants des reruns du script.
+
+    workers travaux s'exécutent en même temps (les suivants attendent leur tour) ; à l'intérieur
+    d'un travail, max_in_flight documents sont extraits en parallèle comme avant.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_jobs=MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._loop, name=f"docscan-job-{i}", daemon=True).start()
+
+    def submit(self, files, history, api_key, batch="", max_in_flight=4, clients=None, **options):
+        """Met en file un travail (options : celles d'extract_document) et renvoie le Job, sans attendre.
+
+        clients (ClientRegistry) range chaque document sous son client canonique à l'enregistrement.
+        """
+        with self._lock:
+            job = Job(f"{datetime.now():%H%M%S}-{next(self._ids)}", batch, files, history, api_key,
+                      max_in_flight, options, clients)
+            self._jobs[job.id] = job
+            # Les plus anciens travaux terminés libèrent leur place
+            finished = [j for j in self._jobs.values() if j.finished]
+            for old in finished[:max(0, len(finished) - self.max_jobs)]:
+                del self._jobs[old.id]
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self, batch=None):
+        """Travaux (d'un lot, ou tous), du plus récent au plus ancien."""
+        with self._lock:
+            return [j for j in reversed(self._jobs.values()) if batch is None or j.batch == batch]
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as e:  # le thread doit survivre à un travail en échec
+                job.error = str(e)
+                job.status = FAILED
+
+    # ─────────────────────────────────────────
+    # Exécution d'un travail
+    # ─────────────────────────────────────────
+    def _run(self, job):
+        # Importés au premier travail : l'app démarre sans charger le SDK OpenAI ni le rendu PDF
+        import openai
+        from docscan.extraction import extract_document
+
+        job.status = RUNNING
+
+        def worker(i):
+            upload = job._take(i)
+            if upload is None or job._cancel.is_set():
+                raise JobCancelled
+            doc = job.documents[i]
+            doc["status"] = RUNNING
+            trace = {}
+            try:
+                data, preview = extract_document(
+                    upload, job._api_key, trace=trace,
+                    on_field=lambda path, value: _on_field(doc, path, value), **job._options,
+                )
+                if not doc["name"].lower().endswith(".pdf"):
+                    preview = _image_preview(upload)
+            finally:
+                # Fichier traité (ou abandonné) : sa copie disque ou mémoire est libérée par ce worker
+                upload.close()
+            return data, preview, trace
+
+        def poll():
+            if job._cancel.is_set():
+                raise JobCancelled
+
+        try:
+            if job._cancel.is_set():
+                raise JobCancelled
+            results = run_concurrent(range(len(job.documents)), worker, max_in_flight=job._max_in_flight,
+                                     poll=poll, poll_interval=0.2)
+            for i, result, error in results:
+                self._finish(job, i, result, error)
+                poll()
+        except JobCancelled:
+            pass
+        except openai.AuthenticationError:
+            # Inutile de continuer : tous les appels suivants échoueraient de même
+            job.error = "Clé API invalide."
+        finally:
+            now = time.time()
+            for doc in job.documents:
+                if doc["status"] in (QUEUED, RUNNING):
+                    doc.update(status=CANCELLED, finished_at=now)
+            job.status = FAILED if job.error else CANCELLED if job._cancel.is_set() else DONE
+            job.finished_at = now
+            # Fichiers jamais lancés : plus rien ne les lira (les aperçus sont gardés par document)
+            job._release()
+
+    def _finish(self, job, i, result, error):
+        import openai
+        from docscan.extraction import add_to_history
+
+        doc = job.documents[i]
+        if error is None:
+            data, preview, trace = result
+            try:
+                with stage(trace, "Mise à plat"):
+                    duplicate = trace.get("duplicate")
+                    flat, lines_df = add_to_history(
+                        job._history, doc["name"], data, datetime.now().strftime("%d/%m/%Y %H:%M"),
+                        duplicate_of=duplicate["file"] if duplicate else None, clients=job._clients,
+                    )
+            except Exception as e:
+                error = e
+            else:
+                trace["total"] = trace.get("total", 0.0) + trace["stages"]["Mise à plat"]
+                doc.update(status=EXTRACTED, data=data, flat=flat, lines_df=lines_df, trace=trace, preview=preview)
+        if error is not None:
+            if isinstance(error, JobCancelled):
+                doc.update(status=CANCELLED)
+            elif isinstance(error, NearDuplicate):
+                doc.update(status=SKIPPED, duplicate=error.match)
+            else:
+                doc.update(status=FAILED, error=str(error))
+        doc["finished_at"] = time.time()
+        if isinstance(error, openai.AuthenticationError):
+            raise error
+
+
+def _image_preview(upload):
+    """Image affichée par la carte de résultat : le fichier s'il est petit, sinon un aperçu réduit."""
+    if not upload.spooled:
+        return upload.getvalue()
+    from docscan.raster import image_preview
+    try:
+        return image_preview(upload.path)
+    except Exception:
+        return None
+
+
+def _on_field(doc, path, value):
+    """Champs reçus en flux : affichés par la vue de suivi pendant que le document est en cours."""
+    if path in KEY_FIELDS:
+        doc["partial"][path[-1]] = value
+    elif len(path) == 2 and path[0] == "lignes" and isinstance(value, dict):
+        doc["lignes"] += 1
@@ -0,0 +1,148 @@
+"""Lecture locale des mises en page connues : un PDF natif d'un fournisseur récurrent est extrait sans appel API.
+
+Les mises en page sont déclarées dans un fichier JSON (DATA_DIR/layouts.json par défaut), une
+entrée par fournisseur :
+
+    {
+      "name": "Imprimerie du Sud",
+      "match": "Imprimerie du Sud",
+      "fields": {
+        "type_document": "^\\s*(FACTURE|DEVIS)\\b",
+        "document.numero": "N° (\\S+)",
+        "document.date_emission": "Date : (\\d{2}/\\d{2}/\\d{4})",
+        "client_detecte": "Client : (.+)",
+        "totaux.total_ht": "Total HT\\s+([\\d ,.]+)",
+        "totaux.total_ttc": "Total TTC\\s+([\\d ,.]+)"
+      },
+      "line": "^\\s*(?P<description>\\S.*?)\\s{2,}(?P<quantite>\\d+)\\s{2,}(?P<prix_unitaire_ht>[\\d.,]+)\\s{2,}(?P<montant_ht>[\\d.,]+)\\s*$",
+      "constants": {"emetteur.nom": "Imprimerie du Sud", "totaux.devise": "EUR"},
+      "line_constants": {"tva_pourcent": "8.5"},
+      "required": ["document.numero", "totaux.total_ttc"]
+    }
+
+match est cherché dans le texte de la couche texte (pdftotext -layout) ; chaque motif de fields
+prend son premier groupe, line donne une ligne de détail par correspondance (groupes nommés) et
+constants / line_constants fixent les valeurs que le texte ne porte pas. Le résultat n'est retenu
+que si les champs requis sont trouvés et que la somme des lignes retombe sur le total HT : sinon
+le document part à l'API comme avant.
+"""
+import copy
+import json
+import os
+import re
+
+from docscan import DATA_DIR
+
+DEFAULT_LAYOUTS_PATH = os.path.join(DATA_DIR, "layouts.json")
+AMOUNT_FIELDS = {"quantite", "prix_unitaire_ht", "montant_ht", "total_ht", "total_tva", "total_ttc"}
+# Écart toléré entre la somme des lignes et le total HT (arrondis)
+TOLERANCE = 0.05
+
+EMPTY_DOCUMENT = {
+    "type_document": "autre",
+    "confiance_type": "haute",
+    "client_detecte": "",
+    "emetteur": {"nom": "", "adresse": "", "telephone": "", "email": "", "siret": "", "tva_intra": ""},
+    "destinataire": {"nom": "", "adresse": "", "telephone": "", "email": "", "siret": ""},
+    "document": {"numero": "", "date_emission": "", "date_echeance": "", "reference": "", "objet": ""},
+    "lignes": [],
+    "totaux": {"total_ht": "", "total_tva": "", "total_ttc": "", "devise": "EUR"},
+    "paiement": {"mode": "", "iban": "", "bic": "", "conditions": ""},
+    "notes": "",
+}
+
+
+def load_layouts(path=DEFAULT_LAYOUTS_PATH):
+    """Mises en page compilées ; liste vide si le fichier n'existe pas."""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        specs = json.load(f)
+    layouts = []
+    for spec in specs:
+        layouts.append({
+            "name": spec["name"],
+            "match": re.compile(spec["match"], re.MULTILINE),
+            "fields": {k: re.compile(v, re.MULTILINE) for k, v in spec.get("fields", {}).items()},
+            "line": re.compile(spec["line"], re.MULTILINE) if spec.get("line") else None,
+            "constants": spec.get("constants", {}),
+            "line_constants": spec.get("line_constants", {}),
+            "required": spec.get("required", []),
+        })
+    return layouts
+
+
+def normalize_amount(raw):
+    """« 1 234,56 € » → « 1234.56 » (format des montants du schéma)."""
+    s = raw.replace("€", "").replace(" ", "").replace(" ", "").strip()
+    if "," in s and "." in s:
+        s = s.replace(".", "").replace(",", ".") if s.rfind(",") > s.rfind(".") else s.replace(",", "")
+    else:
+        s = s.replace(",", ".")
+    float(s)  # ValueError si ce n'est pas un nombre
+    return s
+
+
+def _set(data, path, value):
+    keys = path.split(".")
+    node = data
+    for key in keys[:-1]:
+        node = node[key]
+    if keys[-1] in AMOUNT_FIELDS:
+        value = normalize_amount(value)
+    elif keys[-1] == "type_document":
+        value = value.strip().lower().replace(" ", "_")
+    node[keys[-1]] = value.strip()
+
+
+def _get(data, path):
+    node = data
+    for key in path.split("."):
+        node = node[key]
+    return node
+
+
+def parse_with(layout, text):
+    """Extrait le document selon une mise en page ; None si un champ requis manque ou si les totaux ne collent pas."""
+    data = copy.deepcopy(EMPTY_DOCUMENT)
+    try:
+        for path, value in layout["constants"].items():
+            _set(data, path, value)
+        for path, pattern in layout["fields"].items():
+            m = pattern.search(text)
+            if m:
+                _set(data, path, m.group(1))
+        if layout["line"] is not None:
+            for m in layout["line"].finditer(text):
+                line = {"description": "", "quantite": "", "prix_unitaire_ht": "", "montant_ht": "", "tva_pourcent": "",
+                        **layout["line_constants"]}
+                for field, value in m.groupdict().items():
+                    if value is not None:
+                        line[field] = normalize_amount(value) if field in AMOUNT_FIELDS else value.strip()
+                data["lignes"].append(line)
+    except (ValueError, KeyError):
+        return None
+
+    if any(not _get(data, path) for path in layout["required"]):
+        return None
+    total_ht = data["totaux"]["total_ht"]
+    if data["lignes"] and total_ht:
+        lines_sum = sum(float(l["montant_ht"] or 0) for l in data["lignes"])
+        if abs(lines_sum - float(total_ht)) > TOLERANCE:
+            return None
+    if not data["destinataire"]["nom"]:
+        data["destinataire"]["nom"] = data["client_detecte"]
+    return data
+
+
+def parse_local(text, layouts):
+    """Première mise en page dont la signature figure dans le texte et qui se lit entièrement ; sinon None.
+
+    Renvoie (data, nom de la mise en page).
+    """
+    for layout in layouts:
+        if layout["match"].search(text):
+            data = parse_with(layout, text)
+            if data is not None:
+                return data, layout["name"]
+    return None
@@ -0,0 +1,154 @@
+"""Typage des montants et des dates à l'ingestion : une seule conversion, en colonnes.
+
+Le modèle renvoie des chaînes (« 1 234,56 », « 12/03/2024 », « 8,5 % ») : elles sont
+converties une fois, après flatten_data(), en float et en dates. Les agrégats du tableau de
+bord et les cellules Excel (nombres, dates natives) travaillent ensuite sur ces colonnes.
+Une valeur illisible devient vide (None / NaN / NaT) et son texte d'origine est gardé dans la
+colonne RAW_COLUMN (« Date émission : Mars 2024 ») : il reste visible dans l'historique et l'export.
+"""
+import numpy as np
+import pandas as pd
+
+# Colonnes de flatten_data() et de lines_to_df() converties
+AMOUNT_COLUMNS = ["Total HT", "Total TVA", "Total TTC"]
+DATE_COLUMNS = ["Date émission", "Date échéance"]
+LINE_NUMBER_COLUMNS = ["Quantité", "Prix unitaire HT", "Montant HT", "TVA (%)"]
+# Colonnes affichées en montant (#,##0.00) dans l'export
+MONEY_COLUMNS = set(AMOUNT_COLUMNS) | {"Prix unitaire HT", "Montant HT"}
+# Texte d'origine des montants et dates non convertis, par document et par ligne
+RAW_COLUMN = "Valeurs illisibles"
+
+MONTHS = {
+    "janvier": 1, "janv": 1, "jan": 1, "février": 2, "fevrier": 2, "févr": 2, "fevr": 2, "fév": 2, "fev": 2,
+    "mars": 3, "avril": 4, "avr": 4, "mai": 5, "juin": 6, "juillet": 7, "juil": 7,
+    "août": 8, "aout": 8, "septembre": 9, "sept": 9, "sep": 9, "octobre": 10, "oct": 10,
+    "novembre": 11, "nov": 11, "décembre": 12, "decembre": 12, "déc": 12, "dec": 12,
+}
+
+_NUMERIC_DATE = r"^(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{2}|\d{4})$"
+_ISO_DATE = r"^(\d{4})-(\d{1,2})-(\d{1,2})(?:[t ].*)?$"  # texte déjà en minuscules
+_TEXT_DATE = r"^(\d{1,2})(?:er)?\s+([a-zéûè]+)\.?\s+(\d{4})$"
+# « 12.345.678 » : plusieurs points ne peuvent être que des milliers. Un point seul (« 1.859 ») reste une
+# décimale : le prompt demande « 1234.56 », et un prix unitaire ou une quantité peut avoir trois décimales
+_DOT_THOUSANDS = r"-?[1-9]\d{0,2}(?:\.\d{3}){2,}"
+
+
+def _strings(values):
+    return pd.Series(values, dtype=object).astype("string").str.strip()
+
+
+def to_number(values):
+    """Nombres au format français ou anglais → float64 (NaN si illisible), sur toute la colonne d'un coup.
+
+    « 1 234,56 € », « 1.234,56 », « 1,234.56 », « 1234.56 », « 8,5 % », « (12,00) » ; un nombre déjà typé
+    est gardé. Quand virgule et point coexistent, le dernier des deux est le séparateur décimal ; un point
+    seul est décimal (« 2.500 » vaut deux et demi), plusieurs points séparent les milliers.
+    """
+    values = pd.Series(values, dtype=object)
+    numbers = pd.to_numeric(values, errors="coerce").astype("float64")
+    todo = numbers.isna() & values.notna()
+    if not todo.any():
+        return numbers.astype("float64")
+    s = _strings(values[todo]).str.replace(r"[\s  €%]|EUR", "", regex=True)
+    s = s.str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+    s = s.where(~s.str.fullmatch(_DOT_THOUSANDS).fillna(False), s.str.replace(".", "", regex=False))
+    comma, dot = s.str.rfind(","), s.str.rfind(".")
+    decimal_comma = (comma > dot).fillna(False)
+    s = s.where(~decimal_comma, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    s = s.where(decimal_comma, s.str.replace(",", "", regex=False))
+    numbers[todo] = pd.to_numeric(s, errors="coerce").astype("float64").to_numpy(na_value=np.nan)
+    return numbers.astype("float64")
+
+
+def to_date(values):
+    """Dates « JJ/MM/AAAA » (ou -, ., année sur 2 chiffres), ISO, « 12 mars 2024 » → datetime64 (NaT si illisible)."""
+    values = pd.Series(values, dtype=object)
+    s = _strings(values).str.lower()
+    parts = s.str.extract(_NUMERIC_DATE).rename(columns={0: "day", 1: "month", 2: "year"})
+    iso = s.str.extract(_ISO_DATE).rename(columns={0: "year", 1: "month", 2: "day"})
+    text = s.str.extract(_TEXT_DATE).rename(columns={0: "day", 1: "month", 2: "year"})
+    text["month"] = text["month"].map(MONTHS)
+    parts = parts.fillna(iso).fillna(text)
+    year = pd.to_numeric(parts["year"], errors="coerce").astype("float64")
+    year = year.where(year >= 100, year + 2000)
+    month = pd.to_numeric(parts["month"], errors="coerce").astype("float64")
+    day = pd.to_numeric(parts["day"], errors="coerce").astype("float64")
+    # AAAAMMJJ entier puis format strict : les dates impossibles (31/02) deviennent NaT
+    stamp = (year * 10000 + month * 100 + day).astype("Int64").astype("string")
+    dates = pd.to_datetime(stamp, format="%Y%m%d", errors="coerce")
+    # Valeurs déjà typées (datetime, Timestamp)
+    typed = values.map(lambda v: isinstance(v, (pd.Timestamp, np.datetime64)) or hasattr(v, "isoformat"))
+    if typed.any():
+        dates[typed] = pd.to_datetime(values[typed], errors="coerce")
+    return dates.set_axis(values.index)
+
+
+def _convert(df, column, convert):
+    """Convertit df[column] ; le texte des valeurs illisibles est ajouté à RAW_COLUMN (« colonne : texte »)."""
+    typed = convert(df[column])
+    missing = typed.isna().to_numpy() & df[column].notna().to_numpy()
+    if missing.any():
+        raw = _strings(df[column][missing])
+        raw = raw[raw.ne("").fillna(False)]
+        if len(raw):
+            notes = df[RAW_COLUMN].astype(object) if RAW_COLUMN in df else pd.Series(None, index=df.index, dtype=object)
+            previous = notes[raw.index].fillna("")
+            notes[raw.index] = ((previous + " ; ").where(previous.ne(""), "") + (column + " : " + raw)).astype(object)
+            df[RAW_COLUMN] = notes
+    df[column] = typed.to_numpy()
+
+
+def normalize_documents(df):
+    """Colonnes montants et dates d'une table de documents (ou de flat) converties en place de copie."""
+    df = df.copy()
+    for column in AMOUNT_COLUMNS:
+        if column in df:
+            _convert(df, column, to_number)
+    for column in DATE_COLUMNS:
+        if column in df:
+            _convert(df, column, to_date)
+    return df
+
+
+def normalize_lines(df):
+    if df is None or df.empty:
+        return df
+    df = df.copy()
+    for column in LINE_NUMBER_COLUMNS:
+        if column in df:
+            _convert(df, column, to_number)
+    return df
+
+
+def _scalar(value):
+    """NaN / NaT → None ; numpy → type Python (JSON, SQLite)."""
+    if pd.isna(value):
+        return None
+    if isinstance(value, np.datetime64):
+        return pd.Timestamp(value)
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def normalize_document(flat, lines_df):
+    """Étape d'ingestion après flatten_data() / lines_to_df() : renvoie (flat typé, lignes typées)."""
+    row = normalize_documents(pd.DataFrame([flat]))
+    typed = dict(flat)
+    for column in AMOUNT_COLUMNS + DATE_COLUMNS + [RAW_COLUMN]:
+        if column in row:
+            typed[column] = _scalar(row[column].iloc[0])
+    return typed, normalize_lines(lines_df)
+
+
+def to_records(df):
+    """Lignes d'un DataFrame typé en dicts Python (NaN / NaT → None), prêtes pour JSON ou SQLite."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def iso(value):
+    """Date typée → « AAAA-MM-JJ » (stockage SQLite / JSON) ; None si ce n'est pas une date."""
+    return value.strftime("%Y-%m-%d") if hasattr(value, "strftime") and not pd.isna(value) else None
+
+
+def json_default(value):
+    """json.dumps(default=...) : dates typées écrites en ISO."""
+    return iso(value) if hasattr(value, "strftime") else str(value)
@@ -0,0 +1,100 @@
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+
+from docscan.compact import compact_image, estimate_image_tokens, on_white
+
+RENDER_DPI = 200
+PREVIEW_DPI = 150
+PREVIEW_MAX_SIZE = (1000, 1400)
+
+
+def make_raster_pool(max_workers=None):
+    """Pool de processus pour poppler + encodage PNG (CPU), lancé en 'spawn' pour ne pas forker Streamlit."""
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _preview_bytes(page):
+    preview = page.copy()
+    preview.thumbnail(PREVIEW_MAX_SIZE)
+    buf = io.BytesIO()
+    on_white(preview).convert("RGB").save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _payload(image, compaction):
+    """PNG sans perte, ou version compactée si des options de compaction sont fournies.
+
+    Avec compaction, le PNG 200 dpi n'est pas encodé pour sa seule taille : bytes_before est celle de
+    la page rendue non compressée (largeur × hauteur × canaux), sans coût ; bench/bench_compaction.py
+    mesure le gain par rapport au PNG.
+    """
+    if compaction is not None:
+        raw_bytes = image.width * image.height * len(image.getbands())
+        return compact_image(image, bytes_before=raw_bytes, **compaction)
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    png_bytes = buf.getvalue()
+    tokens = estimate_image_tokens(*image.size)
+    return png_bytes, "png", {
+        "bytes_before": len(png_bytes), "bytes_after": len(png_bytes),
+        "width": image.width, "height": image.height, "quality": None,
+        "tokens_before": tokens, "tokens_after": tokens,
+    }
+
+
+def rasterize_pdf(pdf_path, dpi=RENDER_DPI, compaction=None, fingerprint=False):
+    """Rend la première page une seule fois : image pour l'API + aperçu réduit en mémoire.
+
+    poppler lit le PDF par son chemin : seul le chemin passe au pool de processus, pas les octets.
+    Renvoie (payload_bytes, ext, preview_jpeg_bytes, stats) — des octets, donc transportable
+    depuis un pool de processus. Sans compaction, payload est le PNG 200 dpi.
+    Avec fingerprint=True, stats reçoit aussi l'empreinte de quasi-doublon de ce même rendu
+    ("fingerprint", docscan.dedup) et sa durée ("fingerprint_s").
+    """
+    page = convert_from_path(pdf_path, first_page=1, last_page=1, dpi=dpi)[0]
+    payload, ext, stats = _payload(page, compaction)
+    if fingerprint:
+        from docscan.dedup import fingerprint_image
+        t0 = time.perf_counter()
+        stats["fingerprint"] = fingerprint_image(page)
+        stats["fingerprint_s"] = time.perf_counter() - t0
+    return payload, ext, _preview_bytes(page), stats
+
+
+def rasterize_page(pdf_path, page, dpi=RENDER_DPI, with_preview=False, compaction=None):
+    """Rend une seule page depuis un fichier : une page en mémoire à la fois, quel que soit le nombre de pages.
+
+    Renvoie (payload_bytes, ext, preview_jpeg_bytes ou None, stats).
+    """
+    image = convert_from_path(pdf_path, first_page=page, last_page=page, dpi=dpi)[0]
+    payload, ext, stats = _payload(image, compaction)
+    return payload, ext, (_preview_bytes(image) if with_preview else None), stats
+
+
+def count_pages(pdf_path):
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def render_preview(pdf_path, dpi=PREVIEW_DPI):
+    """Aperçu seul, quand l'image pleine résolution n'est pas nécessaire (document déjà en cache)."""
+    page = convert_from_path(pdf_path, first_page=1, last_page=1, dpi=dpi)[0]
+    return _preview_bytes(page)
+
+
+def image_preview(image_path):
+    """Aperçu JPEG réduit d'une image (un JPEG est décodé directement à la taille réduite)."""
+    with Image.open(image_path) as image:
+        image.draft("RGB", PREVIEW_MAX_SIZE)
+        return _preview_bytes(image)
+
+
+def run_in_pool(pool, fn, *args, **kwargs):
+    """Exécute fn dans le pool de processus s'il y en a un, sinon dans le thread courant."""
+    if pool is None:
+        return fn(*args, **kwargs)
+    return pool.submit(fn, *args, **kwargs).result()
@@ -0,0 +1,322 @@
+import json
+import os
+import sqlite3
+import threading
+from itertools import groupby
+
+import pandas as pd
+
+from docscan import DATA_DIR
+from docscan.normalize import (
+    AMOUNT_COLUMNS, RAW_COLUMN, iso, json_default, normalize_documents, normalize_lines, to_records,
+)
+
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "documents.sqlite")
+DEFAULT_BATCH = "principal"
+
+# Limite prudente du nombre de paramètres par requête IN (...)
+_CHUNK = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    batch TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    extracted_at TEXT NOT NULL,
+    client TEXT NOT NULL,
+    type TEXT NOT NULL,
+    doc_number TEXT,
+    doc_date TEXT,
+    total_ht REAL,
+    total_tva REAL,
+    total_ttc REAL,
+    flat TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_client ON documents(batch, client, type);
+CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(batch, type);
+CREATE INDEX IF NOT EXISTS idx_documents_date ON documents(batch, doc_date);
+CREATE INDEX IF NOT EXISTS idx_documents_number ON documents(batch, doc_number);
+
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    montant_ht REAL,
+    tva_rate REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lines_doc ON lines(doc_id, position);
+
+-- Révision de chaque lot, incrémentée à chaque écriture (ajout, réinitialisation, client renommé) : version
+CREATE TABLE IF NOT EXISTS batch_revisions (
+    batch TEXT PRIMARY KEY,
+    n INTEGER NOT NULL
+);
+DROP TABLE IF EXISTS revisions;
+"""
+
+
+# Colonnes typées ajoutées après coup : (table, colonne) créées par _migrate() sur une base existante
+_TYPED_COLUMNS = [("documents", "total_ht"), ("documents", "total_tva"), ("lines", "montant_ht"), ("lines", "tva_rate")]
+
+
+def _real(value):
+    return float(value) if isinstance(value, (int, float)) and not pd.isna(value) else None
+
+
+def _dumps(row):
+    return json.dumps(row, ensure_ascii=False, default=json_default)
+
+
+_BUMP = "INSERT INTO batch_revisions (batch, n) VALUES (?, 1) ON CONFLICT(batch) DO UPDATE SET n = n + 1"
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), _CHUNK):
+        yield ids[i:i + _CHUNK]
+
+
+class DocumentRepository:
+    """Dépôt persistant (SQLite, WAL) des documents extraits, partageable entre sessions et opérateurs.
+
+    Même interface que HistoryStore : l'app et l'export Excel lisent l'un ou l'autre sans distinction.
+    Les documents sont rangés par lot (batch) : deux opérateurs sur le même lot voient les mêmes
+    documents, et réinitialiser un lot ne touche pas aux autres. Les lectures passent par des requêtes
+    indexées (client, type, date, n° de document) et ne chargent que les lignes demandées.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, batch=DEFAULT_BATCH):
+        self.path = path
+        self.batch = batch
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        """Base créée avant le typage : ajoute les colonnes typées et convertit les documents déjà présents, en une passe."""
+        missing = [(table, column) for table, column in _TYPED_COLUMNS
+                   if column not in {r[1] for r in self._conn.execute(f"PRAGMA table_info({table})")}]
+        if not missing:
+            return
+        for table, column in missing:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} REAL")
+
+        rows = self._conn.execute("SELECT id, flat FROM documents").fetchall()
+        if rows:
+            flats = [json.loads(flat) for _, flat in rows]
+            docs = normalize_documents(pd.DataFrame(flats))
+            self._conn.executemany(
+                "UPDATE documents SET doc_date = ?, total_ht = ?, total_tva = ?, total_ttc = ?, flat = ? WHERE id = ?",
+                [(iso(row.get("Date émission")), *(_real(row.get(c)) for c in AMOUNT_COLUMNS),
+                  _dumps({k: row[k] for k in flat} | ({RAW_COLUMN: row[RAW_COLUMN]} if row.get(RAW_COLUMN) else {})),
+                  doc_id)
+                 for (doc_id, _), flat, row in zip(rows, flats, to_records(docs))],
+            )
+        rows = self._conn.execute("SELECT id, data FROM lines").fetchall()
+        if rows:
+            lines = normalize_lines(pd.DataFrame([json.loads(data) for _, data in rows]))
+            self._conn.executemany(
+                "UPDATE lines SET montant_ht = ?, tva_rate = ?, data = ? WHERE id = ?",
+                [(_real(row.get("Montant HT")), _real(row.get("TVA (%)")), _dumps(row), line_id)
+                 for (line_id, _), row in zip(rows, to_records(lines))],
+            )
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ─────────────────────────────────────────
+    # Écriture
+    # ─────────────────────────────────────────
+    def add(self, filename, flat, lines_df, doc_type, client, timestamp):
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO documents (batch, filename, extracted_at, client, type, doc_number, doc_date,"
+                " total_ht, total_tva, total_ttc, flat) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.batch, filename, timestamp, client, doc_type, flat.get("N° Document", ""),
+                 iso(flat.get("Date émission")), *(_real(flat.get(c)) for c in AMOUNT_COLUMNS), _dumps(flat)),
+            )
+            doc_id = cur.lastrowid
+            if lines_df is not None and not lines_df.empty:
+                self._conn.executemany(
+                    "INSERT INTO lines (doc_id, position, montant_ht, tva_rate, data) VALUES (?, ?, ?, ?, ?)",
+                    [(doc_id, i, _real(line.get("Montant HT")), _real(line.get("TVA (%)")), _dumps(line))
+                     for i, line in enumerate(to_records(lines_df))],
+                )
+            self._conn.execute(_BUMP, (self.batch,))
+            self._conn.commit()
+        return doc_id
+
+    def rename_client(self, old, new):
+        """Range sous new les documents de old (fusion de clients), dans tous les lots : la table des clients est commune."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO batch_revisions (batch, n) SELECT DISTINCT batch, 1 FROM documents WHERE client = ?"
+                " ON CONFLICT(batch) DO UPDATE SET n = n + 1", (old,))
+            self._conn.execute(
+                "UPDATE documents SET client = ?, flat = json_set(flat, '$.Client', ?) WHERE client = ?", (new, new, old))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE batch = ?", (self.batch,))
+            self._conn.execute(_BUMP, (self.batch,))
+            self._conn.commit()
+
+    # ─────────────────────────────────────────
+    # Index
+    # ─────────────────────────────────────────
+    @property
+    def version(self):
+        """Révision du lot : change à chaque ajout, réinitialisation ou client renommé, y compris par une autre session.
+
+        Un compteur plutôt que (nombre, plus grand id) : après clear(), SQLite réattribue les mêmes id.
+        """
+        rows = self._query("SELECT n FROM batch_revisions WHERE batch = ?", (self.batch,))
+        return rows[0][0] if rows else 0
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM documents WHERE batch = ?", (self.batch,))[0][0]
+
+    def __bool__(self):
+        return bool(self._query("SELECT 1 FROM documents WHERE batch = ? LIMIT 1", (self.batch,)))
+
+    def clients(self):
+        return [r[0] for r in self._query(
+            "SELECT DISTINCT client FROM documents WHERE batch = ? ORDER BY client", (self.batch,))]
+
+    def types(self):
+        return [r[0] for r in self._query(
+            "SELECT DISTINCT type FROM documents WHERE batch = ? ORDER BY type", (self.batch,))]
+
+    def client_summary(self):
+        """[(client, nombre de documents, types présents)] trié par client."""
+        summary = {}
+        for client, doc_type, n in self._query(
+            "SELECT client, type, COUNT(*) FROM documents WHERE batch = ? GROUP BY client, type ORDER BY client, type",
+            (self.batch,),
+        ):
+            _, count, types = summary.setdefault(client, (client, 0, []))
+            types.append(doc_type)
+            summary[client] = (client, count + n, types)
+        return list(summary.values())
+
+    def _where(self, client=None, doc_type=None, numero=None):
+        clauses, params = ["batch = ?"], [self.batch]
+        for column, value in (("client", client), ("type", doc_type), ("doc_number", numero)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return " AND ".join(clauses), params
+
+    def select(self, client=None, doc_type=None, numero=None):
+        """Identifiants des documents correspondant aux filtres (None = tous), dans l'ordre d'ajout."""
+        where, params = self._where(client, doc_type, numero)
+        return [r[0] for r in self._query(f"SELECT id FROM documents WHERE {where} ORDER BY id", params)]
+
+    def count(self, client=None, doc_type=None, numero=None):
+        where, params = self._where(client, doc_type, numero)
+        return self._query(f"SELECT COUNT(*) FROM documents WHERE {where}", params)[0][0]
+
+    def total_ttc(self, ids=None):
+        if ids is None:
+            return self._query("SELECT COALESCE(SUM(total_ttc), 0) FROM documents WHERE batch = ?", (self.batch,))[0][0]
+        total = 0.0
+        for chunk in _chunks(ids):
+            marks = ",".join("?" * len(chunk))
+            total += self._query(f"SELECT COALESCE(SUM(total_ttc), 0) FROM documents WHERE id IN ({marks})", chunk)[0][0]
+        return total
+
+    def groups(self, ids=None):
+        """[(client, type, ids)] trié par client puis type, pour le classeur organisé."""
+        if ids is None:
+            rows = self._query(
+                "SELECT client, type, id FROM documents WHERE batch = ? ORDER BY client, type, id", (self.batch,))
+        else:
+            rows = []
+            for chunk in _chunks(ids):
+                marks = ",".join("?" * len(chunk))
+                rows += self._query(f"SELECT client, type, id FROM documents WHERE id IN ({marks})", chunk)
+            rows.sort()
+        return [(client, doc_type, [r[2] for r in grp])
+                for (client, doc_type), grp in groupby(rows, key=lambda r: (r[0], r[1]))]
+
+    # ─────────────────────────────────────────
+    # Lecture (DataFrames)
+    # ─────────────────────────────────────────
+    def documents(self, ids=None, internal=False):
+        """Table des documents (colonnes de flatten_data + Fichier source + Date extraction), dans l'ordre de ids."""
+        ids = self.select() if ids is None else list(ids)
+        by_id = {}
+        for chunk in _chunks(ids):
+            marks = ",".join("?" * len(chunk))
+            for doc_id, flat, filename, extracted_at, client, doc_type in self._query(
+                f"SELECT id, flat, filename, extracted_at, client, type FROM documents WHERE id IN ({marks})", chunk
+            ):
+                row = json.loads(flat)
+                row["Fichier source"] = filename
+                row["Date extraction"] = extracted_at
+                if internal:
+                    row["_client"] = client
+                    row["_type"] = doc_type
+                by_id[doc_id] = row
+        df = pd.DataFrame([by_id[i] for i in ids if i in by_id], index=[i for i in ids if i in by_id])
+        # JSON : dates en ISO, montants en nombres → mêmes types qu'à l'ingestion
+        return normalize_documents(df)
+
+    def lines(self, ids=None, internal=False):
+        """Table consolidée des lignes de détail, avec Fichier et N° Document en tête (et _doc_id si internal)."""
+        ids = self.select() if ids is None else list(ids)
+        order = {doc_id: i for i, doc_id in enumerate(ids)}
+        rows = []
+        for chunk in _chunks(ids):
+            marks = ",".join("?" * len(chunk))
+            rows += self._query(
+                f"SELECT l.doc_id, l.position, d.filename, d.doc_number, l.data FROM lines l"
+                f" JOIN documents d ON d.id = l.doc_id WHERE l.doc_id IN ({marks})", chunk)
+        rows.sort(key=lambda r: (order[r[0]], r[1]))
+        records = []
+        for doc_id, _, filename, doc_number, data in rows:
+            record = {"Fichier": filename, "N° Document": doc_number}
+            record.update(json.loads(data))
+            if internal:
+                record["_doc_id"] = doc_id
+            records.append(record)
+        return normalize_lines(pd.DataFrame(records))
+
+    # ─────────────────────────────────────────
+    # Agrégats (colonnes typées, sans relire le JSON)
+    # ─────────────────────────────────────────
+    def amounts(self, ids=None):
+        """Client, Type, Date émission et totaux de chaque document, pour les agrégats du tableau de bord."""
+        sql = "SELECT client, type, doc_date, total_ht, total_tva, total_ttc FROM documents WHERE "
+        if ids is None:
+            rows = self._query(sql + "batch = ?", (self.batch,))
+        else:
+            rows = []
+            for chunk in _chunks(ids):
+                rows += self._query(sql + f"id IN ({','.join('?' * len(chunk))})", chunk)
+        df = pd.DataFrame(rows, columns=["Client", "Type", "Date émission", *AMOUNT_COLUMNS])
+        df["Date émission"] = pd.to_datetime(df["Date émission"], format="%Y-%m-%d", errors="coerce")
+        df[AMOUNT_COLUMNS] = df[AMOUNT_COLUMNS].astype("float64")
+        return df
+
+    def vat_lines(self, ids=None):
+        """Taux de TVA et montant HT de chaque ligne de détail."""
+        sql = "SELECT l.tva_rate, l.montant_ht FROM lines l JOIN documents d ON d.id = l.doc_id WHERE "
+        if ids is None:
+            rows = self._query(sql + "d.batch = ?", (self.batch,))
+        else:
+            rows = []
+            for chunk in _chunks(ids):
+                rows += self._query(sql + f"l.doc_id IN ({','.join('?' * len(chunk))})", chunk)
+        return pd.DataFrame(rows, columns=["TVA (%)", "Montant HT"], dtype="float64")
+
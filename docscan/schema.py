@@ -0,0 +1,198 @@
+"""Schéma JSON de la réponse d'extraction : sortie contrainte côté API, validation et réparation côté client.
+
+Le schéma reprend la structure décrite dans SYSTEM_PROMPT. Il est envoyé en response_format
+(json_schema, strict) pour que le modèle ne puisse pas en sortir, et compilé une fois en
+fonctions Python pour valider chaque réponse sans repasser par le schéma. Une réponse hors
+schéma est d'abord corrigée localement (conform : champ manquant, nombre au lieu de texte,
+type inconnu) ; seul ce qui reste invalide justifie un appel de réparation (texte seul, sans image).
+"""
+import copy
+
+from docscan.config import TYPE_CONFIG
+from docscan.layouts import EMPTY_DOCUMENT
+
+CONFIDENCE_LEVELS = ["haute", "moyenne", "basse"]
+EMPTY_LINE = {"description": "", "quantite": "", "prix_unitaire_ht": "", "montant_ht": "", "tva_pourcent": ""}
+# Valeur de repli d'une énumération hors liste
+ENUM_FALLBACK = {"type_document": "autre", "confiance_type": "basse"}
+
+# Erreurs citées dans un message (les suivantes sont seulement comptées)
+MAX_ERRORS_SHOWN = 5
+
+
+class InvalidResponse(ValueError):
+    """Réponse illisible ou hors schéma, même après réparation."""
+
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+def _schema_for(template, key=None):
+    """Schéma strict (tous les champs requis, aucun champ en plus) déduit d'un document vide."""
+    if isinstance(template, dict):
+        return {
+            "type": "object",
+            "properties": {k: _schema_for(v, k) for k, v in template.items()},
+            "required": list(template),
+            "additionalProperties": False,
+        }
+    if isinstance(template, list):
+        return {"type": "array", "items": _schema_for(EMPTY_LINE)}
+    if key == "type_document":
+        return {"type": "string", "enum": list(TYPE_CONFIG)}
+    if key == "confiance_type":
+        return {"type": "string", "enum": CONFIDENCE_LEVELS}
+    return {"type": "string"}
+
+
+DOCUMENT_SCHEMA = _schema_for(EMPTY_DOCUMENT)
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "document_extrait", "strict": True, "schema": DOCUMENT_SCHEMA},
+}
+
+
+# ─────────────────────────────────────────────
+# Validation (schéma compilé une fois)
+# ─────────────────────────────────────────────
+def _compile(schema):
+    """Transforme un nœud du schéma en check(valeur, chemin, erreurs) ; les sous-nœuds sont compilés d'avance."""
+    kind = schema["type"]
+    if kind == "object":
+        fields = [(name, _compile(sub)) for name, sub in schema["properties"].items()]
+        allowed = frozenset(schema["properties"])
+
+        def check(value, path, errors):
+            if not isinstance(value, dict):
+                errors.append(f"{path or '/'} : objet attendu")
+                return
+            for name, sub in fields:
+                if name in value:
+                    sub(value[name], f"{path}/{name}", errors)
+                else:
+                    errors.append(f"{path}/{name} : champ manquant")
+            for name in value.keys() - allowed:
+                errors.append(f"{path}/{name} : champ inattendu")
+        return check
+
+    if kind == "array":
+        item = _compile(schema["items"])
+
+        def check(value, path, errors):
+            if not isinstance(value, list):
+                errors.append(f"{path} : liste attendue")
+                return
+            for i, v in enumerate(value):
+                item(v, f"{path}/{i}", errors)
+        return check
+
+    choices = frozenset(schema.get("enum", ()))
+
+    def check(value, path, errors):
+        if not isinstance(value, str):
+            errors.append(f"{path} : texte attendu")
+        elif choices and value not in choices:
+            errors.append(f"{path} : valeur « {value} » hors liste")
+    return check
+
+
+_check_document = _compile(DOCUMENT_SCHEMA)
+
+
+def validate(data):
+    """Erreurs de schéma de data (liste vide si la réponse est conforme)."""
+    errors = []
+    _check_document(data, "", errors)
+    return errors
+
+
+# ─────────────────────────────────────────────
+# Corrections locales (sans appel API)
+# ─────────────────────────────────────────────
+def _conform(value, template, key, fixes):
+    if isinstance(template, dict):
+        if not isinstance(value, dict):
+            raise TypeError(key)
+        out = {}
+        for name, default in template.items():
+            if name in value:
+                out[name] = _conform(value[name], default, name, fixes)
+            else:
+                out[name] = copy.deepcopy(default)
+                fixes[0] += 1
+        fixes[0] += len(value.keys() - template.keys())
+        return out
+    if isinstance(template, list):
+        if not isinstance(value, list):
+            raise TypeError(key)
+        lines = []
+        for line in value:
+            if not isinstance(line, dict):
+                raise TypeError(key)
+            lines.append(_conform(line, EMPTY_LINE, None, fixes))
+        return lines
+    if isinstance(value, str):
+        text = value
+    elif value is None:
+        text = ""
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        text = f"{value:.2f}" if isinstance(value, float) else str(value)
+    else:
+        raise TypeError(key)
+    if key in ENUM_FALLBACK:
+        text = text.strip().lower().replace(" ", "_")
+        if text not in DOCUMENT_SCHEMA["properties"][key]["enum"]:
+            text = ENUM_FALLBACK[key]
+    if text != value:
+        fixes[0] += 1
+    return text
+
+
+def conform(data):
+    """Corrige localement ce qui peut l'être ; renvoie (document, nombre de corrections) ou (None, 0).
+
+    Champs manquants remplis à vide, champs inconnus retirés, nombres et null convertis en texte,
+    type ou confiance hors liste ramenés à « autre » / « basse ». Une structure incohérente
+    (liste à la place d'un objet, objet à la place d'un texte...) n'est pas devinée : None.
+    """
+    fixes = [0]
+    try:
+        return _conform(data, EMPTY_DOCUMENT, None, fixes), fixes[0]
+    except TypeError:
+        return None, 0
+
+
+def describe(errors):
+    """Erreurs résumées pour un message (les premières seulement)."""
+    shown = "; ".join(errors[:MAX_ERRORS_SHOWN])
+    return shown + (f" (+{len(errors) - MAX_ERRORS_SHOWN})" if len(errors) > MAX_ERRORS_SHOWN else "")
+
+
+REPAIR_PROMPT = """Tu corriges la réponse JSON d'un extracteur de documents qui ne respecte pas le schéma attendu.
+Renvoie UNIQUEMENT le JSON corrigé : mêmes valeurs, structure conforme au schéma, "" pour une valeur absente.
+Si la réponse est tronquée, ferme-la proprement sans inventer de valeurs."""
+
+
+def build_repair_request(model, raw, errors):
+    """Requête de réparation : texte seul (réponse fautive + erreurs), beaucoup moins chère qu'une ré-extraction."""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": REPAIR_PROMPT},
+            {"role": "user", "content": f"Erreurs : {describe(errors)}\n\nRéponse à corriger :\n{raw}"},
+        ],
+        "response_format": RESPONSE_FORMAT,
+        "max_tokens": 4096,
+        "temperature": 0,
+    }
+
+
+def check_response(data):
+    """Document conforme (après corrections locales) ou InvalidResponse ; renvoie (document, corrections)."""
+    fixed, fixes = conform(data)
+    errors = validate(fixed) if fixed is not None else validate(data)
+    if fixed is None or errors:
+        raise InvalidResponse(f"Réponse hors schéma : {describe(errors)}", errors)
+    return fixed, fixes
@@ -0,0 +1,112 @@
+import json
+
+# Champs affichés dès qu'ils sont complets (bandeau et cartes), dans l'ordre du schéma
+KEY_FIELDS = [
+    ("type_document",),
+    ("client_detecte",),
+    ("document", "numero"),
+    ("document", "date_emission"),
+    ("totaux", "total_ttc"),
+]
+
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = _WHITESPACE + ",}]"
+
+
+class IncrementalJSON:
+    """Parseur JSON incrémental pour une réponse reçue en flux.
+
+    feed(texte) renvoie les valeurs devenues complètes depuis l'appel précédent, sous forme de
+    (chemin, valeur) : chemin est un tuple de clés / indices, par ex. ("document", "numero") ou
+    ("lignes", 2). Les objets et listes sont signalés à leur fermeture ; value contient à tout
+    instant l'arbre partiel déjà reçu. Le texte avant la première accolade (```json) et après la
+    dernière est ignoré. Ce parseur ne sert qu'à l'affichage anticipé : le résultat final reste
+    celui de parse_response() sur le texte complet.
+
+    Un texte qui n'est pas du JSON valide (littéral nu, échappement invalide, accolade en trop) ne
+    lève pas d'erreur : le parseur s'arrête d'émettre (broken=True) et le texte complet part au
+    décodage final, puis à la réparation.
+    """
+
+    def __init__(self):
+        self.value = None
+        self._stack = []      # [(conteneur, chemin)]
+        self._key = None      # clé en attente de sa valeur (objet courant)
+        self._token = None    # chaîne ou littéral en cours
+        self._in_string = False
+        self._escape = False
+        self._done = False
+        self.broken = False
+
+    def _attach(self, value):
+        """Range une valeur complète (ou un conteneur qui s'ouvre) dans son parent ; renvoie son chemin."""
+        if not self._stack:
+            self.value = value
+            return ()
+        parent, path = self._stack[-1]
+        if isinstance(parent, dict):
+            path = path + (self._key,)
+            parent[self._key] = value
+            self._key = None
+        else:
+            path = path + (len(parent),)
+            parent.append(value)
+        return path
+
+    def _scalar(self, value, events):
+        events.append((self._attach(value), value))
+
+    def feed(self, text):
+        events = []
+        try:
+            self._feed(text, events)
+        except (ValueError, IndexError):  # JSONDecodeError, ou fermeture sans ouverture
+            self.broken = self._done = True
+        return events
+
+    def _feed(self, text, events):
+        for ch in text:
+            if self._done:
+                break
+            if self._in_string:
+                self._token.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    value = json.loads("".join(self._token))
+                    self._token = None
+                    top = self._stack[-1][0] if self._stack else None
+                    if isinstance(top, dict) and self._key is None:
+                        self._key = value
+                    else:
+                        self._scalar(value, events)
+                continue
+
+            if self._token is not None:
+                if ch not in _DELIMITERS:
+                    self._token.append(ch)
+                    continue
+                self._scalar(json.loads("".join(self._token)), events)
+                self._token = None
+
+            if not self._stack and self.value is None and ch != "{" and ch != "[":
+                continue  # préambule (```json, espaces)
+            if ch in _WHITESPACE or ch in ":,":
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._token = [ch]
+            elif ch in "{[":
+                container = {} if ch == "{" else []
+                path = self._attach(container)
+                self._stack.append((container, path))
+            elif ch in "}]":
+                container, path = self._stack.pop()
+                events.append((path, container))
+                if not self._stack:
+                    self._done = True
+            else:
+                self._token = [ch]
@@ -0,0 +1,64 @@
+"""Couche texte des PDF natifs (générés par un logiciel) : lue par pdftotext, sans rendu ni vision.
+
+Un scan n'a pas de couche texte (ou seulement quelques caractères d'OCR) : is_usable() le
+détecte et le document repart en vision comme avant.
+"""
+import re
+import shutil
+import subprocess
+
+# Une page native porte au moins ce nombre de caractères alphanumériques
+MIN_CHARS_PER_PAGE = 80
+# Part maximale de caractères illisibles (polices sans table Unicode → texte inexploitable)
+MAX_GARBAGE = 0.02
+# Au-delà, le texte est tronqué avant envoi (≈ 8 000 tokens)
+MAX_TEXT_CHARS = 32000
+
+_SPACES = re.compile(r"[ \t]{3,}")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def has_pdftotext():
+    return shutil.which("pdftotext") is not None
+
+
+def pdf_text(pdf_path, last_page=1, timeout=30):
+    """Texte des pages 1..last_page d'un fichier PDF (une chaîne par page), colonnes conservées (-layout).
+
+    Renvoie None si pdftotext est absent ou échoue : l'appelant repasse en vision.
+    """
+    binary = shutil.which("pdftotext")
+    if binary is None:
+        return None
+    try:
+        out = subprocess.run(
+            [binary, "-layout", "-enc", "UTF-8", "-f", "1", "-l", str(last_page), pdf_path, "-"],
+            capture_output=True, timeout=timeout, check=True,
+        ).stdout.decode("utf-8", errors="replace")
+    except (subprocess.SubprocessError, OSError):
+        return None
+    pages = out.split("\f")
+    if pages and not pages[-1].strip():
+        pages.pop()
+    return pages
+
+
+def is_usable(pages):
+    """Vraie couche texte : assez de caractères par page en moyenne, et lisibles."""
+    if not pages:
+        return False
+    text = "".join(pages)
+    if sum(ch.isalnum() for ch in text) < MIN_CHARS_PER_PAGE * len(pages):
+        return False
+    garbage = sum(1 for ch in text if ch == "�" or (ord(ch) < 32 and ch not in "\n\r\t"))
+    return garbage <= MAX_GARBAGE * len(text)
+
+
+def compact_text(pages, max_chars=MAX_TEXT_CHARS):
+    """Texte envoyé au modèle : colonnes réduites à deux espaces, lignes vides regroupées, pages numérotées."""
+    parts = []
+    for i, page in enumerate(pages, start=1):
+        body = "\n".join(_SPACES.sub("  ", line.rstrip()) for line in page.splitlines())
+        body = _BLANK_LINES.sub("\n\n", body).strip()
+        parts.append(f"--- Page {i} ---\n{body}" if len(pages) > 1 else body)
+    return "\n\n".join(parts)[:max_chars]
@@ -0,0 +1,137 @@
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Étapes mesurées, dans l'ordre du traitement d'un document
+STAGES = ["Lecture", "Texte", "Empreinte", "Rendu", "Base64", "Requête", "Parse", "Réparation", "Mise à plat"]
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+# Compteurs de validation des réponses (extraction.complete) : champs corrigés localement, réponses
+# hors schéma, appels de réparation envoyés et réussis
+VALIDATION_FIELDS = ("local_fixes", "parse_failures", "repairs", "repaired")
+# Mesures hors étapes : délai jusqu'au premier champ clé (depuis l'envoi de la requête), temps total
+METRICS = [("1er champ", "first_field"), ("Total", "total")]
+# Chemins d'extraction (trace["path"]) : lecture locale, texte envoyé, image envoyée, cache, quasi-doublon
+PATHS = [("local", "Lecture locale"), ("texte", "Texte"), ("vision", "Vision"), ("cache", "Cache"),
+         ("doublon", "Doublon réutilisé")]
+
+
+@contextmanager
+def stage(trace, name):
+    """Chronomètre un bloc et cumule sa durée dans trace["stages"][name] (sans effet si trace est None)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            stages = trace.setdefault("stages", {})
+            stages[name] = stages.get(name, 0.0) + time.perf_counter() - t0
+
+
+def add_usage(trace, usage):
+    """Cumule response.usage (tokens prompt / complétion) dans trace["usage"]."""
+    if trace is None or usage is None:
+        return
+    totals = trace.setdefault("usage", {})
+    for field in USAGE_FIELDS:
+        totals[field] = totals.get(field, 0) + (getattr(usage, field, 0) or 0)
+
+
+def count(trace, name, n=1):
+    """Incrémente le compteur trace[name] (sans effet si trace est None)."""
+    if trace is not None and n:
+        trace[name] = trace.get(name, 0) + n
+
+
+def merge_into(trace, parts):
+    """Additionne les traces partielles (une par page) dans trace : temps cumulés, pas temps mur."""
+    if trace is None:
+        return
+    for part in parts:
+        for name, seconds in part.get("stages", {}).items():
+            trace.setdefault("stages", {})[name] = trace.get("stages", {}).get(name, 0.0) + seconds
+        for field, n in part.get("usage", {}).items():
+            trace.setdefault("usage", {})[field] = trace.get("usage", {}).get(field, 0) + n
+        for name in ("attempts",) + VALIDATION_FIELDS:
+            count(trace, name, part.get(name, 0))
+
+
+def stage_table(trace):
+    """Trace d'un document : une ligne par étape (ms)."""
+    stages = trace.get("stages", {})
+    rows = [{"Étape": name, "ms": round(stages[name] * 1000, 1)} for name in STAGES if name in stages]
+    rows += [{"Étape": name, "ms": round(trace[key] * 1000, 1)} for name, key in METRICS if key in trace]
+    return pd.DataFrame(rows)
+
+
+def summarize(traces):
+    """Agrégat d'un lot : p50 / p95 / total par étape, et part du temps total.
+
+    Les documents servis par le cache n'ont que Lecture (et Mise à plat) : ils comptent pour ces étapes seulement.
+    """
+    rows = []
+    grand_total = sum(sum(t.get("stages", {}).values()) for t in traces) or 1.0
+    metrics = dict(METRICS)
+    for name in STAGES + list(metrics):
+        if name in metrics:
+            values = [t[metrics[name]] for t in traces if metrics[name] in t]
+        else:
+            values = [t["stages"][name] for t in traces if name in t.get("stages", {})]
+        if not values:
+            continue
+        ms = np.array(values) * 1000
+        rows.append({
+            "Étape": name,
+            "Docs": len(values),
+            "p50 (ms)": round(float(np.percentile(ms, 50)), 1),
+            "p95 (ms)": round(float(np.percentile(ms, 95)), 1),
+            "Total (s)": round(float(ms.sum()) / 1000, 2),
+            "Part": "" if name in metrics else f"{sum(values) / grand_total:.0%}",
+        })
+    return pd.DataFrame(rows)
+
+
+def usage_totals(traces):
+    return {field: sum(t.get("usage", {}).get(field, 0) for t in traces) for field in USAGE_FIELDS}
+
+
+def validation_totals(traces):
+    """Compteurs de validation du lot, avec le nombre d'appels API et la part d'appels perdus.
+
+    Un appel est perdu quand sa réponse est inutilisable : chaque échec de parse en coûte un, qu'il
+    soit ensuite réparé (pour le prix d'un appel texte) ou non.
+    """
+    totals = {name: sum(t.get(name, 0) for t in traces) for name in VALIDATION_FIELDS}
+    totals["calls"] = sum(t.get("attempts", 0) for t in traces)
+    totals["wasted"] = totals["parse_failures"] / totals["calls"] if totals["calls"] else 0.0
+    return totals
+
+
+def path_summary(traces):
+    """Part des documents par chemin d'extraction, avec temps et tokens moyens.
+
+    Le gain est mesuré par rapport aux documents du même lot passés en vision (vide sans référence).
+    """
+    rows = []
+    by_path = {key: [t for t in traces if t.get("path") == key] for key, _ in PATHS}
+    vision = by_path["vision"]
+    ref_ms = float(np.median([t["total"] for t in vision])) * 1000 if vision else None
+    ref_tokens = np.mean([t.get("usage", {}).get("total_tokens", 0) for t in vision]) if vision else None
+    n = sum(len(v) for v in by_path.values()) or 1
+    for key, label in PATHS:
+        group = by_path[key]
+        if not group:
+            continue
+        ms = float(np.median([t.get("total", 0.0) for t in group])) * 1000
+        tokens = float(np.mean([t.get("usage", {}).get("total_tokens", 0) for t in group]))
+        rows.append({
+            "Chemin": label,
+            "Docs": len(group),
+            "Part": f"{len(group) / n:.0%}",
+            "p50 total (ms)": round(ms, 1),
+            "Tokens / doc": round(tokens),
+            "Gain temps": "" if ref_ms is None or key == "vision" else f"{1 - ms / ref_ms:.0%}",
+            "Gain tokens": "" if not ref_tokens or key == "vision" else f"{1 - tokens / ref_tokens:.0%}",
+        })
+    return pd.DataFrame(rows)
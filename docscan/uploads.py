@@ -0,0 +1,197 @@
+"""Fichiers envoyés : petits en mémoire, gros sur disque, lus par morceaux jusqu'au corps de la requête.
+
+Un scan de 20 Mo restait en mémoire tout le travail, puis coexistait, par document en vol, avec
+son base64 en bytes puis en str, l'URL data: et le JSON du SDK (chacun ~4/3 de la taille du fichier).
+Ici le fichier est recopié une fois, par morceaux, dans un fichier temporaire (au-delà de
+SPOOL_THRESHOLD) ; poppler, pdftotext, PIL et le hash du cache le lisent par son chemin, et le
+corps JSON de la requête est écrit directement en octets, l'image encodée en base64 morceau par
+morceau (encode_body) dans un tampon que le SDK lit tel quel : par document en vol, une seule
+copie de la taille du fichier (le corps, ~4/3).
+"""
+import base64
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import weakref
+
+# Au-delà, le fichier envoyé est recopié sur disque au lieu de rester en mémoire
+SPOOL_THRESHOLD = 1024 ** 2
+# Taille des lectures : multiple de 3, pour encoder chaque morceau en base64 sans remplissage
+READ_CHUNK = 3 * 256 * 1024
+
+MIME_TYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def _remove(path):
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+
+class Upload:
+    """Fichier à extraire (name, size) : octets en mémoire, ou fichier sur disque (path).
+
+    Un fichier recopié sur disque par from_file() est supprimé par close() ou quand l'objet disparaît ;
+    un path fourni (fichier de l'utilisateur, CLI) n'est jamais supprimé.
+    """
+
+    def __init__(self, name, data=None, path=None):
+        self.name = name
+        self._data = data
+        self.path = path
+        self.size = len(data) if data is not None else os.path.getsize(path)
+        self._finalizer = None
+
+    @classmethod
+    def from_file(cls, name, source, threshold=SPOOL_THRESHOLD):
+        """Copie d'un fichier ouvert (UploadedFile de Streamlit, BytesIO...), indépendante de la session qui l'a reçu."""
+        source.seek(0)
+        head = source.read(threshold + 1)
+        if len(head) <= threshold:
+            return cls(name, data=head)
+        suffix = os.path.splitext(name)[1]
+        with tempfile.NamedTemporaryFile(prefix="docscan-", suffix=suffix, delete=False) as f:
+            f.write(head)
+            del head
+            shutil.copyfileobj(source, f, READ_CHUNK)
+        upload = cls(name, path=f.name)
+        upload._finalizer = weakref.finalize(upload, _remove, f.name)
+        return upload
+
+    @property
+    def spooled(self):
+        return self._finalizer is not None
+
+    def open(self):
+        """Fichier binaire en lecture (à fermer par l'appelant)."""
+        return io.BytesIO(self._data) if self._data is not None else open(self.path, "rb")
+
+    def chunks(self, size=READ_CHUNK):
+        with self.open() as f:
+            while chunk := f.read(size):
+                yield chunk
+
+    def getvalue(self):
+        """Tous les octets (pour les petits fichiers ; les gros se lisent par chunks() ou as_path())."""
+        if self._data is not None:
+            return self._data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    @contextlib.contextmanager
+    def as_path(self):
+        """Chemin d'un fichier contenant les octets : le sien, ou un fichier temporaire pour un petit fichier en mémoire."""
+        if self.path is not None:
+            yield self.path
+            return
+        fd, path = tempfile.mkstemp(prefix="docscan-", suffix=os.path.splitext(self.name)[1])
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._data)
+            yield path
+        finally:
+            _remove(path)
+
+    def close(self):
+        """Libère les octets (supprime la copie sur disque) : le fichier ne sert plus."""
+        if self._finalizer is not None:
+            self._finalizer()
+        self._data = None
+
+
+def as_upload(uploaded_file):
+    """Upload d'un fichier quelconque (Upload, fichier ouvert avec name, ou objet name + getvalue)."""
+    if isinstance(uploaded_file, Upload):
+        return uploaded_file
+    if hasattr(uploaded_file, "seek") and hasattr(uploaded_file, "read"):
+        return Upload.from_file(uploaded_file.name, uploaded_file)
+    return Upload(uploaded_file.name, data=uploaded_file.getvalue())
+
+
+# ─────────────────────────────────────────────
+# Corps de requête
+# ─────────────────────────────────────────────
+def b64_chunks(chunks):
+    """Base64 d'un flux de morceaux, morceau par morceau (même résultat que b64encode sur le tout)."""
+    rest = b""
+    for chunk in chunks:
+        if rest:
+            chunk = rest + chunk
+        cut = len(chunk) - len(chunk) % 3
+        rest = chunk[cut:]
+        if cut:
+            yield base64.b64encode(memoryview(chunk)[:cut])
+    if rest:
+        yield base64.b64encode(rest)
+
+
+def mime_type(file_type):
+    return MIME_TYPES.get(file_type.lower(), "image/png")
+
+
+class DataURL:
+    """URL data: d'une image (octets ou Upload), encodée en base64 seulement à l'écriture du corps."""
+
+    def __init__(self, source, file_type):
+        self.source = source
+        self.mime = mime_type(file_type)
+
+    def __len__(self):
+        """Longueur de l'URL encodée, connue sans encoder."""
+        size = self.source.size if isinstance(self.source, Upload) else memoryview(self.source).nbytes
+        return len(f"data:{self.mime};base64,") + 4 * -(-size // 3)
+
+    def write(self, out):
+        out.write(f"data:{self.mime};base64,".encode("ascii"))
+        if isinstance(self.source, Upload):
+            chunks = self.source.chunks()
+        else:
+            view = memoryview(self.source)
+            chunks = (view[i:i + READ_CHUNK] for i in range(0, len(view), READ_CHUNK))
+        for encoded in b64_chunks(chunks):
+            out.write(encoded)
+
+    def __str__(self):
+        out = io.BytesIO()
+        self.write(out)
+        return out.getvalue().decode("ascii")
+
+
+def encode_body(body):
+    """JSON (octets UTF-8) de body, dans un fichier en mémoire rembobiné ; les DataURL y sont écrites par morceaux.
+
+    Le tampon est réservé d'emblée à la taille finale et rendu tel quel (pas de getvalue()) : le SDK
+    le lit par morceaux, Content-Length tiré de sa taille ; c'est la seule copie du corps.
+    """
+    images = []
+
+    def placeholder(value):
+        if isinstance(value, DataURL):
+            images.append(value)
+            return f"\x00image{len(images) - 1}\x00"
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    text = json.dumps(body, ensure_ascii=False, default=placeholder)
+    if not images:
+        return io.BytesIO(text.encode("utf-8"))
+    parts = []
+    for i in range(len(images)):
+        head, text = text.split(f'"\\u0000image{i}\\u0000"', 1)
+        parts.append(head.encode("utf-8"))
+    tail = text.encode("utf-8")
+    # Tampon réservé d'emblée à la taille finale : pas de réallocations (ni de copie) à mesure qu'il se remplit
+    total = sum(map(len, parts)) + sum(len(image) + 2 for image in images) + len(tail)
+    out = io.BytesIO()
+    out.seek(total - 1)
+    out.write(b"\0")
+    out.seek(0)
+    for head, image in zip(parts, images):
+        out.write(head)
+        out.write(b'"')
+        image.write(out)
+        out.write(b'"')
+    out.write(tail)
+    out.seek(0)
+    return out
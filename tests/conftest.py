@@ -0,0 +1,66 @@
+"""Fixtures communes : données dans un répertoire temporaire, faux serveur OpenAI (bench/stub_openai.py)."""
+import os
+import tempfile
+
+# Avant tout import de docscan : les chemins par défaut (cache, dépôt, clients) en dépendent
+os.environ["DOCSCAN_DATA_DIR"] = tempfile.mkdtemp(prefix="docscan-tests-")
+
+import pytest
+
+from bench.stub_openai import start_stub_server
+
+
+@pytest.fixture
+def stub():
+    """Démarre un faux serveur par appel stub(**réglages de StubState) ; renvoie (state, base_url). Sans latence par défaut."""
+    servers = []
+
+    def start(**kwargs):
+        server, state, url = start_stub_server(**{"latency": 0.0, **kwargs})
+        servers.append(server)
+        return state, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    """Retries de call_with_retry sans attente (backoff)."""
+    import docscan.extraction
+    monkeypatch.setattr(docscan.extraction, "retry_delay", lambda *args, **kwargs: 0.0)
+
+
+@pytest.fixture
+def corruptions(monkeypatch):
+    """Restreint les défauts injectés par le stub (invalid_rate) : corruptions("littéral", ...)."""
+    import bench.stub_openai
+
+    def restrict(*kinds):
+        monkeypatch.setattr(bench.stub_openai, "CORRUPTIONS", kinds)
+
+    return restrict
+
+
+@pytest.fixture
+def poppler(monkeypatch):
+    """Rendu PDF sans poppler : poppler(pages) fait rendre ces images PIL par docscan.raster.
+
+    Renvoie la liste des rendus demandés, (page, dpi) par appel : on compte ainsi les passages dans poppler.
+    """
+    import docscan.raster
+
+    def install(pages):
+        calls = []
+
+        def convert_from_path(pdf_path, first_page=1, last_page=None, dpi=200):
+            calls.append((first_page, dpi))
+            return [pages[first_page - 1].copy()]
+
+        monkeypatch.setattr(docscan.raster, "convert_from_path", convert_from_path)
+        monkeypatch.setattr(docscan.raster, "pdfinfo_from_path", lambda pdf_path: {"Pages": len(pages)})
+        return calls
+
+    return install
@@ -0,0 +1,53 @@
+"""app.py exécuté par streamlit.testing (AppTest), dans un processus neuf : imports lourds et exports différés."""
+import json
+import os
+import subprocess
+import sys
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+DEFERRED = ("openai", "pdf2image", "openpyxl", "xlsxwriter", "docscan.extraction", "docscan.excel", "docscan.columnar")
+
+SCRIPT = """
+import json, sys
+from streamlit.testing.v1 import AppTest
+app, docs, modules = sys.argv[1], int(sys.argv[2]), sys.argv[3:]
+if docs:
+    from bench.synthetic import make_history
+    from docscan.repository import DocumentRepository
+    make_history(docs, history=DocumentRepository())
+    modules = [m for m in modules if m not in sys.modules]
+at = AppTest.from_file(app, default_timeout=60).run()
+clients = next((w for w in at.selectbox if w.label.startswith("👤 Client")), None)
+if clients is not None and len(clients.options) > 1:
+    clients.select_index(1).run()
+print(json.dumps({
+    "exception": [e.value for e in at.exception],
+    "warnings": [w.value for w in at.warning],
+    "loaded": [m for m in modules if m in sys.modules],
+    "exports": len(at.session_state["export_memo"]),
+    "filtered": clients is not None,
+}))
+"""
+
+
+def run_app(data_dir, docs=0):
+    """Premier run de app.py (après un changement de filtre client s'il y a un historique) ; résumé en dict."""
+    env = dict(os.environ, DOCSCAN_DATA_DIR=str(data_dir), OPENAI_API_KEY="")
+    out = subprocess.run([sys.executable, "-c", SCRIPT, APP, str(docs), *DEFERRED], env=env, capture_output=True,
+                         text=True, timeout=120, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    assert result["exception"] == []
+    return result
+
+
+def test_cold_start_defers_heavy_imports(tmp_path):
+    result = run_app(tmp_path)
+    assert not any("deprecat" in w.lower() for w in result["warnings"])
+    assert result["loaded"] == []
+
+
+def test_exports_are_built_on_download_only(tmp_path):
+    """Tableau de bord affiché et filtré : aucun classeur construit, ni Excel ni pyarrow importés pour l'export."""
+    result = run_app(tmp_path, docs=30)
+    assert result["filtered"] and result["exports"] == 0
+    assert not {"openpyxl", "xlsxwriter", "docscan.excel", "docscan.columnar"} & set(result["loaded"])
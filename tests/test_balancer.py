@@ -0,0 +1,88 @@
+import time
+
+import openai
+import pytest
+
+from docscan.balancer import (
+    CLOSED, OPEN, Endpoint, EndpointPool, load_specs, parse_duration, resolve_api_key, retry_after,
+)
+from docscan.extraction import extract_text
+
+
+def pool_for(*urls, **options):
+    return EndpointPool([Endpoint("sk-test", url, name=name) for name, url in zip("ab", urls)], **options)
+
+
+def status(pool):
+    return {row["Point d'accès"]: row for row in pool.status()}
+
+
+def test_failover_to_healthy_endpoint(stub):
+    down, down_url = stub(down=True)
+    up, up_url = stub()
+    pool = pool_for(down_url, up_url, failure_threshold=1, cooldown=60)
+    for _ in range(3):
+        trace = {}
+        assert extract_text("Facture", pool, trace=trace)["type_document"] == "facture"
+        assert trace["endpoint"] == "b"
+    assert down.requests == 1 and up.completed == 3
+    assert status(pool)["a"]["Disjoncteur"] == OPEN
+    assert status(pool)["b"]["réussies"] == 3
+
+
+def test_half_open_probe_closes_circuit(stub):
+    state, url = stub(down=True)
+    _, other = stub()
+    pool = pool_for(url, other, failure_threshold=1, cooldown=0.05)
+    extract_text("Facture", pool)
+    state.down = False
+    time.sleep(0.1)
+    trace = {}
+    extract_text("Facture", pool, trace=trace)
+    assert trace["endpoint"] == "a"
+    assert status(pool)["a"]["Disjoncteur"] == CLOSED
+
+
+def test_all_endpoints_down_raises(stub):
+    a, url_a = stub(down=True)
+    b, url_b = stub(down=True)
+    pool = pool_for(url_a, url_b, failure_threshold=1, cooldown=0.01)
+    with pytest.raises(openai.APIStatusError) as exc:
+        extract_text("Facture", pool, max_retries=2)
+    assert exc.value.status_code == 503
+    assert a.requests + b.requests == 3
+
+
+def test_exhausted_quota_goes_elsewhere(stub):
+    _, limited = stub(rpm=1)
+    _, free = stub()
+    pool = pool_for(limited, free)
+    endpoints = []
+    for _ in range(3):
+        trace = {}
+        extract_text("Facture", pool, trace=trace)
+        endpoints.append(trace["endpoint"])
+    assert endpoints == ["a", "b", "b"]
+    assert pool.waited == 0
+
+
+def test_rate_limit_headers():
+    assert parse_duration("1.5s") == 1.5
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("") is None
+    assert retry_after({"retry-after-ms": "250", "retry-after": "3"}) == 0.25
+    assert retry_after({"retry-after": "3"}) == 3
+    assert retry_after({"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "2m3s",
+                        "x-ratelimit-remaining-requests": "5", "x-ratelimit-reset-requests": "1s"}) == 123
+    assert retry_after({}) is None
+
+
+def test_configuration():
+    assert load_specs({"OPENAI_API_KEYS": "sk-a, sk-b", "OPENAI_BASE_URL": "http://stub/v1"}) == [
+        {"api_key": "sk-a", "base_url": "http://stub/v1"}, {"api_key": "sk-b", "base_url": "http://stub/v1"}]
+    assert resolve_api_key({"OPENAI_API_KEY": "sk-seule"}) == "sk-seule"
+    pool = resolve_api_key({}, secrets={"endpoints": [{"name": "x", "api_key": "sk-x"}]})
+    assert isinstance(pool, EndpointPool) and [e.name for e in pool.endpoints] == ["x"]
+    with pytest.raises(ValueError):
+        Endpoint.from_spec({"api_key": "sk-x", "modele": "gpt-4o"})
@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+
+from bench.bench_pipeline import make_corpus, responder
+from bench.stub_openai import SAMPLE_DOCUMENT
+from bench.synthetic import make_truth
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def corpus_bytes(directory, seed):
+    corpus = make_corpus(str(directory), 6, ["scan", "photo", "natif"], 2, seed=seed)
+    files = {}
+    for path, _ in corpus:
+        with open(path, "rb") as f:
+            files[os.path.basename(path)] = f.read()
+    return files, [truth for _, truth in corpus]
+
+
+def test_same_seed_same_corpus(tmp_path):
+    (tmp_path / "a").mkdir(), (tmp_path / "b").mkdir(), (tmp_path / "c").mkdir()
+    files, truths = corpus_bytes(tmp_path / "a", seed=3)
+    assert (files, truths) == corpus_bytes(tmp_path / "b", seed=3)
+    other, _ = corpus_bytes(tmp_path / "c", seed=4)
+    assert list(other) == list(files) and all(other[name] != files[name] for name in files)
+    assert list(files) == ["scan_0000.png", "photo_0001.jpg", "natif_0002.pdf", "scan_0003.png", "photo_0004.jpg",
+                           "natif_0005.pdf"]
+    assert [t["type_document"] for t in truths[::3]] == ["facture", "devis"]
+    assert make_truth(7) == make_truth(7) != make_truth(8)
+
+
+def test_stub_answers_are_deterministic():
+    truths = [make_truth(i) for i in range(5)]
+    respond = responder(truths)
+    requests = [{"messages": [{"role": "user", "content": f"document {i}"}]} for i in range(20)]
+    answers = [respond(r) for r in requests]
+    assert answers == [responder(truths)(r) for r in requests] and len({id(a) for a in answers}) > 1
+    assert respond({"messages": SAMPLE_DOCUMENT}) in truths
+
+
+def test_pipeline_benchmark_runs(tmp_path):
+    """Lot réduit (scans et photos : pas de poppler requis) ; --save puis --baseline sur la même référence."""
+    saved = tmp_path / "base.json"
+    command = [sys.executable, "-m", "bench.bench_pipeline", "--docs", "4", "--kinds", "scan", "photo",
+               "--latency", "0"]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    subprocess.run(command + ["--save", str(saved)], cwd=ROOT, env=env, capture_output=True, check=True, timeout=240)
+    result = json.loads(saved.read_text(encoding="utf-8"))
+    assert result["docs"] == 4 and result["failed"] == [] and result["docs_per_s"] > 0
+    assert {"Lecture", "Empreinte", "Rendu", "Requête", "Mise à plat", "Total"} <= {r["Étape"] for r in result["stages"]}
+    out = subprocess.run(command + ["--baseline", str(saved)], cwd=ROOT, env=env, capture_output=True, text=True,
+                         check=True, timeout=240).stdout
+    assert "Écart à la référence (4 docs)" in out and "docs/s" in out
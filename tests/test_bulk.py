@@ -0,0 +1,94 @@
+import json
+
+from bench.stub_openai import SAMPLE_DOCUMENT
+from bench.synthetic import make_truth, render_pages, to_bytes
+from docscan import bulk
+from docscan.cli import main
+from docscan.extraction import build_request, get_client
+from docscan.uploads import Upload, encode_body
+
+
+def scans(tmp_path, n):
+    docs = []
+    for i in range(n):
+        path = tmp_path / f"scan_{i}.png"
+        path.write_bytes(to_bytes(render_pages(make_truth(i, "facture"))[0].resize((124, 175))))
+        docs.append(Upload(path.name, path=str(path)))
+    return docs
+
+
+def test_batches_are_split_by_count_and_size(tmp_path):
+    docs = scans(tmp_path, 5)
+    batches = list(bulk.build_batches(docs, max_requests=2))
+    assert [list(members) for _, members in batches] == [["doc-000000", "doc-000001"], ["doc-000002", "doc-000003"],
+                                                         ["doc-000004"]]
+    for jsonl, members in batches:
+        lines = [json.loads(line) for line in jsonl.decode("utf-8").splitlines()]
+        assert [l["custom_id"] for l in lines] == list(members)
+        for line in lines:
+            expected = json.loads(encode_body(build_request(members[line["custom_id"]], "png")).getvalue())
+            assert line["method"] == "POST" and line["url"] == bulk.ENDPOINT and line["body"] == expected
+    one_line = len(batches[0][0]) // 2
+    assert [len(m) for _, m in bulk.build_batches(docs, max_bytes=one_line + 1)] == [1] * 5
+
+
+def test_batch_round_trip(stub, tmp_path):
+    docs = scans(tmp_path, 3)
+
+    def responder(request):
+        url = request["messages"][-1]["content"][-1]["image_url"]["url"]
+        return {**SAMPLE_DOCUMENT, "notes": str(len(url))}
+
+    state, url = stub(responder=responder, batch_delay=0.05)
+    client = get_client("sk-bulk", url)
+    (jsonl, members), = bulk.build_batches(docs)
+    batch = bulk.wait_for_batch(client, bulk.submit_batch(client, jsonl).id, poll_interval=0.01, log=lambda m: None)
+    assert batch.status == "completed" and batch.request_counts.completed == 3
+    results = bulk.batch_results(client, batch)
+    lengths = {json.loads(line)["custom_id"]: len(json.loads(line)["body"]["messages"][-1]["content"][-1]["image_url"]["url"])
+               for line in jsonl.splitlines()}
+    assert {cid: (data["notes"], error) for cid, (data, error, _) in results.items()} == \
+        {cid: (str(n), None) for cid, n in lengths.items()}
+    assert all(usage["total_tokens"] > 0 for _, _, usage in results.values())
+
+    state.error_rate = 1.0
+    batch = bulk.wait_for_batch(client, bulk.submit_batch(client, jsonl).id, poll_interval=0.01, log=lambda m: None)
+    assert {error for _, error, _ in bulk.batch_results(client, batch).values()} == {"server_error: injected"}
+
+
+def test_cli_batch_api_resumes_without_resubmitting(stub, monkeypatch, tmp_path):
+    root = tmp_path / "scans"
+    root.mkdir()
+    scans(root, 3)
+    state, url = stub(batch_delay=0.05)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-bulk-cli")
+    monkeypatch.setenv("OPENAI_BASE_URL", url)
+    args = [str(root), "-o", str(tmp_path / "export.xlsx"), "--batch-api", "--poll-interval", "0.01", "--no-cache",
+            "--no-client-resolution"]
+    assert main(args) == 0 and len(state.batches) == 1
+    manifest = bulk.load_manifest(str(root / ".docscan_checkpoint.jsonl.batches.json"))
+    assert [b["ingested"] for b in manifest["batches"]] == [True] and len(manifest["batches"][0]["files"]) == 3
+    assert main(args) == 0 and len(state.batches) == 1 and state.requests == 0
+
+
+def test_cli_follows_a_batch_left_in_flight(stub, monkeypatch, tmp_path):
+    """Lot soumis puis commande interrompue : la relance suit ce lot au lieu de le resoumettre."""
+    from docscan.cli import find_documents, load_checkpoint
+
+    root = tmp_path / "scans"
+    root.mkdir()
+    scans(root, 2)
+    state, url = stub(batch_delay=0.05)
+    docs = find_documents(str(root))
+    (jsonl, members), = bulk.build_batches(docs)
+    batch = bulk.submit_batch(get_client("sk-bulk-resume", url), jsonl)
+    checkpoint = root / ".docscan_checkpoint.jsonl"
+    bulk.save_manifest(str(checkpoint) + ".batches.json", {"batches": [{"id": batch.id, "files": {
+        cid: {"file": d.name, "size": d.size, "mtime": d.mtime} for cid, d in members.items()}}]})
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-bulk-resume")
+    monkeypatch.setenv("OPENAI_BASE_URL", url)
+    assert main([str(root), "-o", str(tmp_path / "export.xlsx"), "--batch-api", "--poll-interval", "0.01",
+                 "--no-cache", "--no-client-resolution"]) == 0
+    assert len(state.batches) == 1
+    assert {r["status"] for r in load_checkpoint(str(checkpoint)).values()} == {"ok"}
@@ -0,0 +1,91 @@
+import json
+
+from docscan.cache import ExtractionCache, cache_key, compaction_variant
+from docscan.extraction import MODEL, RESPONSE_FORMAT, SYSTEM_PROMPT
+
+DATA = {"type_document": "facture", "notes": "x" * 100}
+
+
+def size(data):
+    return len(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def test_miss_then_hit():
+    cache = ExtractionCache(":memory:")
+    key = cache.key_for(b"scan")
+    assert cache.get(key) is None
+    cache.put(key, DATA)
+    assert cache.get(key) == DATA
+    assert cache.stats() == {"entries": 1, "bytes": size(DATA), "hits": 1, "misses": 1}
+
+
+def test_key_covers_request_settings():
+    base = cache_key(b"scan")
+    assert base == cache_key(b"scan", MODEL, SYSTEM_PROMPT, schema=RESPONSE_FORMAT)
+    assert base == cache_key([b"sc", b"an"])
+    others = [
+        cache_key(b"scan2"),
+        cache_key(b"scan", model="gpt-4o-mini"),
+        cache_key(b"scan", prompt=SYSTEM_PROMPT + " "),
+        cache_key(b"scan", schema={"type": "object"}),
+        cache_key(b"scan", variant=compaction_variant(None)),
+        cache_key(b"scan", variant=compaction_variant({})),
+        cache_key(b"scan", variant=compaction_variant({"quality": 40})),
+    ]
+    assert len({base, *others}) == len(others) + 1
+
+
+def test_compaction_variant_includes_defaults():
+    from docscan.compact import DEFAULTS
+    name, value = next(iter(DEFAULTS.items()))
+    assert compaction_variant({}) == compaction_variant({name: value})
+
+
+def test_eviction_keeps_recently_used():
+    cache = ExtractionCache(":memory:", max_bytes=3 * size(DATA))
+    for i in range(3):
+        cache.put(f"k{i}", DATA)
+    cache.get("k0")
+    cache.put("k3", DATA)
+    assert cache.get("k1") is None
+    assert all(cache.get(k) == DATA for k in ("k0", "k2", "k3"))
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_replacing_an_entry_does_not_count_twice():
+    cache = ExtractionCache(":memory:", max_bytes=2 * size(DATA))
+    cache.put("a", DATA)
+    for _ in range(5):
+        cache.put("b", DATA)
+    assert cache.get("a") == DATA
+    assert cache.stats()["entries"] == 2
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    import docscan.cache
+    cache = ExtractionCache(":memory:", max_age_days=1)
+    cache.put("old", DATA)
+    now = docscan.cache.time.time()
+    monkeypatch.setattr(docscan.cache.time, "time", lambda: now + 2 * 86400)
+    assert cache.get("old") is None
+    cache.evict()
+    assert cache.stats()["entries"] == 0
+
+
+def test_persists_and_recounts_on_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ExtractionCache(path).put("a", DATA)
+    reopened = ExtractionCache(path, max_bytes=size(DATA))
+    assert reopened.get("a") == DATA
+    reopened.put("b", DATA)
+    assert reopened.get("a") is None and reopened.get("b") == DATA
+
+
+def test_clear():
+    cache = ExtractionCache(":memory:", max_bytes=2 * size(DATA))
+    cache.put("a", DATA)
+    cache.clear()
+    assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 0, "misses": 0}
+    cache.put("b", DATA)
+    cache.put("c", DATA)
+    assert cache.get("b") == cache.get("c") == DATA
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+from openpyxl import load_workbook
+
+from bench.synthetic import make_truth, render_pages, to_bytes
+from docscan.cli import CHECKPOINT_NAME, find_documents, load_checkpoint, main
+
+
+@pytest.fixture
+def scans(tmp_path):
+    """Dossier de trois scans (dont un dans un sous-dossier), plus des fichiers que le lot doit ignorer."""
+    root = tmp_path / "scans"
+    (root / "2024").mkdir(parents=True)
+    (root / ".cache").mkdir()
+    for i, name in enumerate(["a.png", "b.jpg", "2024/c.png"]):
+        page = render_pages(make_truth(i, "facture"))[0].resize((310, 438))
+        (root / name).write_bytes(to_bytes(page, "PNG" if name.endswith("png") else "JPEG"))
+    (root / "notes.txt").write_text("x")
+    (root / ".hidden.png").write_bytes(b"x")
+    (root / ".cache" / "d.png").write_bytes(b"x")
+    return root
+
+
+def run(root, stub_url, monkeypatch, key, *args):
+    # Clé propre à chaque serveur : get_client garde un client par (clé, base_url)
+    monkeypatch.setenv("OPENAI_API_KEY", key)
+    monkeypatch.setenv("OPENAI_BASE_URL", stub_url)
+    output = root.parent / "export.xlsx"
+    code = main([str(root), "-o", str(output), "--no-cache", "--duplicates", "off", "--retries", "0",
+                 "--no-client-resolution", *args])
+    return code, output
+
+
+def test_find_documents(scans):
+    assert [d.name for d in find_documents(str(scans))] == ["2024/c.png", "a.png", "b.jpg"]
+    assert [d.name for d in find_documents(str(scans), recursive=False)] == ["a.png", "b.jpg"]
+
+
+def test_resume_after_failures_and_changes(stub, no_backoff, monkeypatch, scans):
+    checkpoint = scans / CHECKPOINT_NAME
+
+    # API indisponible : tout échoue, rien n'est écrit, code de sortie 1
+    state, url = stub(down=True)
+    code, output = run(scans, url, monkeypatch, "sk-cli-down")
+    assert code == 1 and state.requests == 3 and not output.exists()
+    assert {r["status"] for r in load_checkpoint(str(checkpoint)).values()} == {"error"}
+
+    # Relance : les échecs sont retentés, le classeur contient les trois documents
+    state, url = stub()
+    code, output = run(scans, url, monkeypatch, "sk-cli-up")
+    assert code == 0 and state.requests == 3
+    assert load_workbook(output)["Index général"].max_row == 4
+
+    # Arrêt brutal pendant l'écriture d'une ligne : elle est ignorée à la relance
+    with open(checkpoint, "a", encoding="utf-8") as f:
+        f.write('{"file": "a.png", "sta')
+    code, _ = run(scans, url, monkeypatch, "sk-cli-up")
+    assert code == 0 and state.requests == 3
+
+    # Fichier modifié depuis son extraction : seul celui-ci repart
+    stat = os.stat(scans / "b.jpg")
+    os.utime(scans / "b.jpg", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    code, output = run(scans, url, monkeypatch, "sk-cli-up")
+    assert code == 0 and state.requests == 4
+    assert load_workbook(output)["Index général"].max_row == 4
+    records = load_checkpoint(str(checkpoint))
+    assert sorted(records) == ["2024/c.png", "a.png", "b.jpg"]
+    assert all(r["status"] == "ok" and r["data"]["type_document"] == "facture" for r in records.values())
+    assert json.loads(checkpoint.read_text(encoding="utf-8").splitlines()[-1])["file"] == "b.jpg"
+
+
+def test_missing_key_is_an_error(monkeypatch, scans, capsys):
+    for name in ("OPENAI_API_KEY", "OPENAI_API_KEYS", "DOCSCAN_ENDPOINTS"):
+        monkeypatch.delenv(name, raising=False)
+    with pytest.raises(SystemExit) as exc:
+        main([str(scans)])
+    assert exc.value.code == 2 and "OPENAI_API_KEY" in capsys.readouterr().err
@@ -0,0 +1,48 @@
+import io
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl import load_workbook
+
+from bench.synthetic import make_history
+from docscan.excel import build_client_zip, client_partitions, organized_sheets, safe_file_name
+
+
+def read_zip(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+        return {name: load_workbook(io.BytesIO(archive.read(name))) for name in archive.namelist()}
+
+
+def test_one_workbook_per_client():
+    history = make_history(25)
+    partitions = client_partitions(history)
+    assert [c for c, _ in partitions] == history.clients()
+    assert sorted(i for _, ids in partitions for i in ids) == list(range(25))
+
+    workbooks = read_zip(build_client_zip(history, workers=1))
+    assert list(workbooks) == [safe_file_name(c, set()) for c in history.clients()]
+    for (client, ids), wb in zip(partitions, workbooks.values()):
+        assert wb.sheetnames == [title for title, _, _ in organized_sheets(history, ids)]
+        rows = list(wb["Index général"].values)
+        column = rows[0].index("Fichier source")
+        assert [row[column] for row in rows[1:]] == history.documents(ids)["Fichier source"].tolist()
+        assert {row[rows[0].index("Client")] for row in rows[1:]} == {client}
+
+
+def test_pool_gives_the_same_archive():
+    history = make_history(12)
+    ids = list(range(0, 12, 3))
+    serial = read_zip(build_client_zip(history, ids, workers=1))
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        pooled = read_zip(build_client_zip(history, ids, pool=pool))
+    assert list(serial) == list(pooled)
+    for name in serial:
+        assert [list(ws.values) for ws in serial[name].worksheets] == [list(ws.values) for ws in pooled[name].worksheets]
+
+
+def test_safe_file_names():
+    used = set()
+    names = [safe_file_name(n, used) for n in ("SFR", "sfr", "A/B: C?", " . ", "x" * 300)]
+    assert names[:4] == ["SFR.xlsx", "sfr (2).xlsx", "A_B_ C_.xlsx", "Sans nom.xlsx"]
+    assert len(names[4]) == 125
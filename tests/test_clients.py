@@ -0,0 +1,73 @@
+from docscan.clients import UNKNOWN_CLIENT, ClientRegistry, normalize_name, siren_of
+
+SIREN = "732829320"
+OTHER_SIREN = "552100554"
+
+
+def doc(name, siret=""):
+    return {"type_document": "facture", "client_detecte": name,
+            "destinataire": {"nom": name, "siret": siret}, "emetteur": {"nom": "Fournisseur"}}
+
+
+def test_normalized_names():
+    assert normalize_name("S.F.R. SA") == normalize_name("sfr") == "SFR"
+    assert normalize_name("Mairie de Saint-Paul") == "MAIRIE SAINT PAUL"
+    assert normalize_name("SA") == "SA"
+
+
+def test_siren():
+    assert siren_of(SIREN + "00013") == SIREN
+    assert siren_of(tva=f"FR 12 {SIREN}") == SIREN
+    assert siren_of("123456789") == ""
+
+
+def test_variants_resolve_to_first_name():
+    registry = ClientRegistry(":memory:")
+    assert {registry.resolve(doc(name)) for name in ("SFR", "S.F.R.", "SFR SA", "sfr")} == {"SFR"}
+    assert registry.resolve(doc("Boulangerie Martin")) == "Boulangerie Martin"
+    assert registry.resolve(doc("Boulangeries Martin")) == "Boulangerie Martin"
+    assert registry.resolve(doc("Garage Payet")) == "Garage Payet"
+    assert registry.resolve(doc("")) == UNKNOWN_CLIENT
+    assert len(registry) == 3
+
+
+def test_siren_links_different_names():
+    registry = ClientRegistry(":memory:")
+    assert registry.resolve(doc("Société Française du Radiotéléphone", SIREN)) == "Société Française du Radiotéléphone"
+    assert registry.resolve(doc("SFR", SIREN + "00013")) == "Société Française du Radiotéléphone"
+
+
+def test_same_name_other_siren_is_another_client():
+    registry = ClientRegistry(":memory:")
+    assert registry.resolve(doc("Garage Hoarau", SIREN)) == "Garage Hoarau"
+    assert registry.resolve(doc("Garage Hoarau", OTHER_SIREN)) == "Garage Hoarau (2)"
+
+
+def test_manual_alias_wins():
+    registry = ClientRegistry(":memory:")
+    registry.resolve(doc("Garage Hoarau", SIREN))
+    registry.set_alias("Garage Hoareau", "Hoareau Frères")
+    assert registry.resolve(doc("Garage Hoareau", SIREN)) == "Hoareau Frères"
+
+
+def test_merge():
+    registry = ClientRegistry(":memory:")
+    registry.resolve(doc("Orange", SIREN))
+    registry.resolve(doc("France Télécom"))
+    registry.merge(["Orange", "France Télécom"], "Orange Business")
+    assert registry.resolve(doc("France Telecom")) == "Orange Business"
+    assert registry.resolve(doc("Autre nom", SIREN)) == "Orange Business"
+    assert len(registry) == 1
+    aliases = registry.aliases()
+    assert set(aliases["Client"]) == {"Orange Business"}
+    assert set(aliases.loc[aliases["Variante"] == "ORANGE", "Origine"]) == {"manuelle"}
+
+
+def test_persisted_between_sessions(tmp_path):
+    path = str(tmp_path / "clients.sqlite")
+    ClientRegistry(path).resolve(doc("S.F.R.", SIREN))
+    registry = ClientRegistry(path)
+    assert registry.resolve(doc("SFR SA")) == "S.F.R."
+    assert registry.resolve(doc("Nom inconnu", SIREN)) == "S.F.R."
+    registry.clear()
+    assert len(ClientRegistry(path)) == 0
@@ -0,0 +1,70 @@
+import io
+import json
+import zipfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from bench.synthetic import make_history
+from docscan.columnar import (
+    DOCUMENT_COLUMNS, FORMATS, LINE_COLUMNS, SCHEMAS, TABLES, build_tables_zip, export_tables, write_tables,
+)
+
+
+@pytest.fixture(scope="module")
+def history():
+    return make_history(23)
+
+
+def read(fmt, path):
+    if fmt == "parquet":
+        return pq.read_table(path).to_pandas()
+    if fmt == "csv":
+        return pd.read_csv(path, dtype=str, keep_default_na=False).replace("", None)
+    with open(path, encoding="utf-8") as f:
+        return pd.DataFrame([json.loads(line) for line in f], columns=None)
+
+
+@pytest.mark.parametrize("fmt", list(FORMATS))
+def test_tables_round_trip(history, fmt, tmp_path):
+    paths = export_tables(history, fmt, str(tmp_path), chunk_size=5)
+    docs, lines = (read(fmt, paths[name]) for name in TABLES)
+    assert list(docs.columns) == DOCUMENT_COLUMNS and list(lines.columns) == LINE_COLUMNS
+    source = history.documents()
+    assert len(docs) == len(source) and len(lines) == len(history.lines())
+    assert docs["Fichier source"].tolist() == source["Fichier source"].tolist()
+    totals = pd.to_numeric(docs["Total TTC"]).tolist()
+    assert totals == pytest.approx(source["Total TTC"].tolist())
+    issued = pd.to_datetime(docs["Date émission"]).dt.strftime("%Y-%m-%d").tolist()
+    assert issued == source["Date émission"].dt.strftime("%Y-%m-%d").tolist()
+    assert str(docs["Date extraction"].iloc[0]).startswith("2024-03-01") and "10:00" in str(docs["Date extraction"].iloc[0])
+    assert set(lines["Fichier"]) == set(source["Fichier source"])
+
+
+def test_parquet_schema_and_row_groups(history, tmp_path):
+    paths = export_tables(history, "parquet", str(tmp_path), chunk_size=10)
+    for name in TABLES:
+        # Parquet n'a pas d'horodatage à la seconde : il est relu en millisecondes
+        written = pq.read_schema(paths[name])
+        assert written.names == SCHEMAS[name].names
+        assert all(a.type == b.type or pa.types.is_timestamp(a.type) and pa.types.is_timestamp(b.type)
+                   for a, b in zip(written, SCHEMAS[name]))
+    assert pq.ParquetFile(paths["documents"]).num_row_groups == 3
+
+
+def test_selection_and_zip(history):
+    ids = history.select(client=history.clients()[0])
+    counts = write_tables(history, "jsonl", {name: io.BytesIO() for name in TABLES}, ids)
+    assert counts["documents"] == len(ids)
+    with zipfile.ZipFile(io.BytesIO(build_tables_zip(history, "csv", ids))) as archive:
+        assert archive.namelist() == ["documents.csv", "lignes.csv"]
+        docs = pd.read_csv(archive.open("documents.csv"))
+    assert docs["Fichier source"].tolist() == history.documents(ids)["Fichier source"].tolist()
+
+
+def test_empty_history(tmp_path):
+    from docscan.history import HistoryStore
+    paths = export_tables(HistoryStore(), "parquet", str(tmp_path))
+    assert pq.read_table(paths["documents"]).num_rows == 0
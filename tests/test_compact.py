@@ -0,0 +1,64 @@
+import io
+
+from PIL import Image
+
+from bench.synthetic import as_phone_photo, make_truth, render_pages, to_bytes
+from docscan.compact import compact_image, compact_image_bytes, compact_image_file, estimate_image_tokens, on_white
+from docscan.raster import _payload
+
+
+def _page():
+    return render_pages(make_truth(1, "facture"))[0]
+
+
+def test_photo_is_compacted_within_target():
+    data = to_bytes(as_phone_photo(_page(), seed=1), "JPEG", quality=92)
+    payload, ext, stats = compact_image_bytes(data)
+    assert ext == "jpeg" and stats["bytes_before"] == len(data)
+    assert stats["bytes_after"] == len(payload) <= 300 * 1024 < len(data)
+    assert min(stats["width"], stats["height"]) <= 768
+    assert stats["tokens_after"] <= stats["tokens_before"]  # l'API réduit déjà l'image : pas de tokens en plus
+    with Image.open(io.BytesIO(payload)) as image:
+        assert image.mode == "L"  # facture noir sur blanc : niveaux de gris
+
+
+def test_transparency_is_put_on_white():
+    image = Image.new("RGBA", (40, 40), (0, 0, 0, 0))
+    image.paste((0, 0, 0, 255), (10, 10, 30, 30))
+    flat = on_white(image)
+    assert flat.mode == "RGB" and flat.getpixel((0, 0)) == (255, 255, 255) and flat.getpixel((20, 20)) == (0, 0, 0)
+
+
+def test_exif_orientation_is_applied():
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buf = io.BytesIO()
+    Image.new("RGB", (1200, 800), "white").save(buf, format="JPEG", exif=exif.tobytes())
+    _, _, stats = compact_image_bytes(buf.getvalue(), crop=False)
+    assert stats["height"] > stats["width"]
+
+
+def test_file_variant_and_fingerprint(tmp_path):
+    path = tmp_path / "scan.png"
+    path.write_bytes(to_bytes(_page()))
+    payload, ext, stats = compact_image_file(str(path), fingerprint=True)
+    assert stats["bytes_before"] == path.stat().st_size
+    assert (payload, ext) == compact_image_bytes(path.read_bytes())[:2]
+    assert stats["fingerprint"] and stats["fingerprint_s"] >= 0
+
+
+def test_rendered_page_sizes():
+    """Page rendue (raster) : sans compaction, le PNG ; avec, la taille brute des pixels comme référence."""
+    page = _page()
+    png, ext, stats = _payload(page, None)
+    assert ext == "png" and stats["bytes_before"] == stats["bytes_after"] == len(png)
+    payload, ext, stats = _payload(page, {})
+    assert ext == "jpeg" and stats["bytes_before"] == page.width * page.height * len(page.getbands())
+    assert stats["bytes_after"] == len(payload) < len(png)
+
+
+def test_image_tokens():
+    assert estimate_image_tokens(100, 100, detail="low") == 85
+    assert estimate_image_tokens(512, 512) == 85 + 170
+    assert estimate_image_tokens(2480, 3508) == estimate_image_tokens(768, 1086) == 85 + 170 * 2 * 3
+    assert compact_image(Image.new("L", (64, 64), 255))[2]["bytes_before"] == 0
@@ -0,0 +1,109 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from bench.synthetic import as_phone_photo, make_truth, render_pages, to_bytes
+from docscan import dedup
+from docscan.dedup import (
+    FLAG, MAX_DISTANCE, REUSE, SKIP, NearDuplicate, NearDuplicateIndex, bit_distances, fingerprint_file,
+    fingerprint_image, hamming,
+)
+from docscan.extraction import extract_document
+from docscan.uploads import Upload
+
+
+@pytest.fixture(scope="module")
+def pages():
+    """Deux factures du même modèle (mêmes colonnes, montants différents)."""
+    return [render_pages(make_truth(seed, "facture"))[0] for seed in (1, 2)]
+
+
+def test_copies_match_and_other_documents_do_not(pages):
+    page, other = pages
+    reference = fingerprint_image(page)
+    copies = [as_phone_photo(page, seed=1), Image.open(io.BytesIO(to_bytes(page, "JPEG", quality=50))),
+              page.resize((827, 1169))]
+    assert all(hamming(reference, fingerprint_image(copy)) <= MAX_DISTANCE for copy in copies)
+    assert hamming(reference, fingerprint_image(other)) > MAX_DISTANCE
+
+
+def test_exif_orientation_of_a_decoded_photo(pages, tmp_path):
+    """Photo déjà décodée en pleine résolution (compaction) et tournée par son EXIF : même empreinte que le fichier."""
+    photo = as_phone_photo(pages[0], seed=3)
+    exif = Image.Exif()
+    exif[0x0112] = 6  # à tourner de 90°
+    path = tmp_path / "photo.jpg"
+    photo.rotate(90, expand=True).save(path, quality=90, exif=exif.tobytes())
+    with Image.open(path) as image:
+        image.load()
+        decoded = fingerprint_image(image)
+    assert hamming(decoded, fingerprint_file(str(path), "jpg")) <= 4
+    assert hamming(decoded, fingerprint_image(pages[0])) <= MAX_DISTANCE
+
+
+def test_popcount_without_bitwise_count(monkeypatch):
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 63, size=(50, 4), dtype=np.uint64)
+    expected = bit_distances(hashes, hashes[0])
+    monkeypatch.delattr(np, "bitwise_count", raising=False)
+    assert bit_distances(hashes, hashes[0]).tolist() == expected.tolist()
+    assert expected[0] == 0
+
+
+def test_index(tmp_path, pages):
+    path = str(tmp_path / "fingerprints.sqlite")
+    index = NearDuplicateIndex(path)
+    a, b = (fingerprint_image(p) for p in pages)
+    assert index.find(a) is None
+    index.add(a, "a.png", {"n": 1})
+    match = index.find(fingerprint_image(pages[0].resize((827, 1169))))
+    assert (match["file"], match["data"]) == ("a.png", {"n": 1}) and match["distance"] <= MAX_DISTANCE
+    assert index.find(b) is None
+    assert len(NearDuplicateIndex(path)) == 1
+    index.clear()
+    assert index.find(a) is None and len(NearDuplicateIndex(path)) == 0
+
+
+@pytest.mark.parametrize("compaction", [{}, None])
+def test_policies(stub, pages, tmp_path, monkeypatch, compaction):
+    state, url = stub()
+    photo = tmp_path / "photo.jpg"
+    photo.write_bytes(to_bytes(as_phone_photo(pages[0], seed=1), "JPEG", quality=90))
+    scan = tmp_path / "scan.png"
+    scan.write_bytes(to_bytes(pages[0]))
+    if compaction is not None:
+        # Image compactée : l'empreinte vient de l'image décodée pour la compaction, pas d'une seconde lecture
+        monkeypatch.setattr("docscan.extraction.fingerprint_file", None)
+    index = NearDuplicateIndex(":memory:")
+    options = dict(base_url=url, duplicates=index, compaction=compaction, with_preview=False)
+
+    trace = {}
+    extract_document(Upload("scan.png", path=str(scan)), "sk-test", trace=trace, **options)
+    assert "duplicate" not in trace and len(index) == 1
+    assert "Empreinte" in trace["stages"]
+
+    trace = {}
+    extract_document(Upload("photo.jpg", path=str(photo)), "sk-test", trace=trace, duplicate_policy=FLAG, **options)
+    assert trace["duplicate"]["file"] == "scan.png" and state.requests == 2
+
+    trace = {}
+    data, _ = extract_document(Upload("photo.jpg", path=str(photo)), "sk-test", trace=trace,
+                               duplicate_policy=REUSE, **options)
+    assert trace["path"] == "doublon" and data["type_document"] == "facture" and state.requests == 2
+
+    with pytest.raises(NearDuplicate) as exc:
+        extract_document(Upload("photo.jpg", path=str(photo)), "sk-test", duplicate_policy=SKIP, **options)
+    # le plus proche est désormais la photo elle-même, indexée après l'extraction signalée (FLAG)
+    assert exc.value.match["file"] == "photo.jpg" and state.requests == 2
+
+    extract_document(Upload("photo.jpg", path=str(photo)), "sk-test", duplicate_policy=SKIP, force=True, **options)
+    assert state.requests == 3
+
+
+def test_skew_search_finds_rotation(pages):
+    ink = pages[0].convert("L").point(lambda p: 255 if p < dedup._INK else 0)
+    ink.thumbnail((300, 300))
+    for angle in (0.0, 1.5, -3.0):
+        assert abs(dedup._skew_angle(ink.rotate(angle, resample=Image.BILINEAR, fillcolor=0)) + angle) <= 0.5
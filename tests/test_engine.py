@@ -0,0 +1,94 @@
+import threading
+import time
+
+import openai
+import pytest
+
+from docscan.engine import run_concurrent
+from docscan.extraction import extract_text, is_retryable
+
+
+def test_results_in_completion_order_with_errors():
+    def worker(item):
+        time.sleep(item / 100)
+        if item == 2:
+            raise ValueError("deux")
+        return item * 10
+
+    results = list(run_concurrent([3, 1, 2], worker, max_in_flight=3))
+    assert [item for item, _, _ in results] == [1, 2, 3]
+    assert results[0][1:] == (10, None)
+    assert results[1][1] is None and isinstance(results[1][2], ValueError)
+
+
+def test_max_in_flight():
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def worker(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return item
+
+    assert sorted(r for _, r, _ in run_concurrent(range(12), worker, max_in_flight=3)) == list(range(12))
+    assert peak[0] == 3
+
+
+def test_break_stops_submission():
+    submitted = []
+
+    def items():
+        for i in range(100):
+            submitted.append(i)
+            yield i
+
+    for _ in run_concurrent(items(), lambda i: i, max_in_flight=2):
+        break
+    assert len(submitted) <= 3
+
+
+def test_concurrent_requests_against_stub(stub):
+    state, url = stub(latency=0.1)
+    texts = [f"Facture {i}" for i in range(8)]
+    results = list(run_concurrent(texts, lambda t: extract_text(t, "sk-test", base_url=url), max_in_flight=4))
+    assert all(error is None for _, _, error in results)
+    assert state.completed == 8
+    assert state.max_in_flight == 4
+
+
+def test_transient_errors_are_retried(stub, no_backoff):
+    state, url = stub(error_rate=1.0, error_codes=(503,))
+    trace = {}
+    with pytest.raises(openai.APIStatusError) as exc:
+        extract_text("Facture", "sk-test", base_url=url, max_retries=2, trace=trace)
+    assert exc.value.status_code == 503 and is_retryable(exc.value)
+    assert trace["attempts"] == state.requests == 3
+
+
+def test_client_errors_are_not_retried(stub, no_backoff):
+    state, url = stub(error_rate=1.0, error_codes=(400,))
+    trace = {}
+    with pytest.raises(openai.BadRequestError) as exc:
+        extract_text("Facture", "sk-test", base_url=url, max_retries=2, trace=trace)
+    assert not is_retryable(exc.value)
+    assert trace["attempts"] == state.requests == 1
+
+
+def test_rate_limit_is_retried_until_success(stub, no_backoff):
+    state, url = stub(error_rate=1.0, error_codes=(429,))
+
+    def recover():
+        # Les 429 cessent après quelques requêtes refusées, pas après un délai (suite chargée)
+        while state.requests < 3:
+            time.sleep(0.01)
+        state.error_rate = 0.0
+
+    threading.Thread(target=recover, daemon=True).start()
+    trace = {}
+    data = extract_text("Facture", "sk-test", base_url=url, max_retries=1000, trace=trace)
+    assert data["type_document"] == "facture"
+    assert trace["attempts"] == state.requests > 1
@@ -0,0 +1,60 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from bench.synthetic import make_history
+from docscan.excel import (
+    DATE_FORMAT, MONEY_FORMAT, build_organized_excel, build_single_excel, organized_sheets, unique_sheet_name,
+    write_workbook,
+)
+
+
+def test_organized_workbook_reads_back():
+    history = make_history(20)
+    wb = load_workbook(io.BytesIO(build_organized_excel(history)))
+    expected = list(organized_sheets(history))
+    assert wb.sheetnames == [title for title, _, _ in expected]
+
+    for (title, df, color), ws in zip(expected, wb.worksheets):
+        rows = list(ws.values)
+        assert list(rows[0]) == [str(c) for c in df.columns] and len(rows) == len(df) + 1
+        header = ws.cell(1, 1)
+        assert header.font.bold and header.fill.fgColor.rgb.endswith(color.upper())
+        assert ws.freeze_panes == "A2"
+
+    index = wb["Index général"]
+    columns = [c.value for c in index[1]]
+    issued, total = index.cell(2, columns.index("Date émission") + 1), index.cell(2, columns.index("Total TTC") + 1)
+    assert isinstance(issued.value, datetime) and issued.number_format == DATE_FORMAT
+    assert isinstance(total.value, float) and total.number_format == MONEY_FORMAT
+    documents = history.documents()
+    assert [row[columns.index("Total TTC")] for row in index.iter_rows(min_row=2, values_only=True)] == \
+        documents["Total TTC"].tolist()
+    assert all(10 <= index.column_dimensions[letter].width <= 45 for letter in "ABC")
+
+
+def test_cells_are_written_as_given():
+    df = pd.DataFrame({"Notes": ["=1+1", "https://example.com", None], "Total TTC": [1.5, None, 2.0]})
+    wb = load_workbook(io.BytesIO(write_workbook([("Feuille", df, "1e3a5f")])))
+    assert [row for row in wb["Feuille"].iter_rows(min_row=2, values_only=True)] == [
+        ("=1+1", 1.5), ("https://example.com", None), (None, 2.0)]
+    assert wb["Feuille"].cell(2, 1).data_type == "s"
+
+
+def test_sheet_names_stay_unique_when_truncated():
+    used = {"index général"}
+    long = "Communauté d'agglomération du Sud - Facture"
+    names = [unique_sheet_name(long, used), unique_sheet_name(long, used), unique_sheet_name(long, used, " DET"),
+             unique_sheet_name("Index général", used), unique_sheet_name("a/b:c?", used)]
+    assert all(len(n) <= 31 for n in names) and len({n.lower() for n in names}) == len(names)
+    assert names[1].endswith(" (2)") and names[2].endswith(" DET") and names[4] == "a_b_c_"
+
+
+def test_single_document_workbook():
+    history = make_history(1)
+    flat = history.documents().iloc[0].to_dict()
+    wb = load_workbook(io.BytesIO(build_single_excel(flat, history.lines())))
+    assert wb.sheetnames[0] == "Résumé"
+    assert [c.value for c in wb["Résumé"][1]] == ["Champ", "Valeur"] and wb["Résumé"].max_row == len(flat) + 1
@@ -0,0 +1,57 @@
+import pandas as pd
+
+from bench.synthetic import make_history
+from docscan.history import HistoryStore
+
+
+def test_indexes_match_a_full_scan():
+    history = make_history(40)
+    docs = history.documents(internal=True)
+    assert len(history) == len(docs) == 40
+    assert history.clients() == sorted(docs["_client"].unique())
+    assert history.types() == sorted(docs["_type"].unique())
+    for client in history.clients():
+        assert list(history.select(client=client)) == docs.index[docs["_client"] == client].tolist()
+        assert history.types_for(client) == sorted(docs.loc[docs["_client"] == client, "_type"].unique())
+        for doc_type in history.types_for(client):
+            expected = docs.index[(docs["_client"] == client) & (docs["_type"] == doc_type)].tolist()
+            assert list(history.select(client, doc_type)) == expected
+    groups = history.groups()
+    assert sorted(i for _, _, ids in groups for i in ids) == list(range(40))
+    assert [(c, t) for c, t, _ in groups] == sorted((c, t) for c, t, _ in groups)
+    assert history.groups(range(0, 40, 2)) == [(c, t, [i for i in ids if i % 2 == 0]) for c, t, ids in groups
+                                               if any(i % 2 == 0 for i in ids)]
+
+
+def test_lines_follow_their_documents():
+    history = make_history(10)
+    ids = history.select(client=history.clients()[0])
+    lines = history.lines(ids, internal=True)
+    assert set(lines["_doc_id"]) == set(ids)
+    numbers = history.documents()["N° Document"]
+    assert (lines["N° Document"].to_numpy() == numbers.to_numpy()[lines["_doc_id"].to_numpy()]).all()
+    assert list(history.lines().columns[:2]) == ["Fichier", "N° Document"]
+    assert history.total_ttc(ids) == history.documents(ids)["Total TTC"].sum()
+
+
+def test_new_columns_and_versions():
+    history = HistoryStore()
+    versions = [history.version]
+    history.add("a.pdf", {"N° Document": "A", "Client": "SFR"}, None, "facture", "SFR", "01/03/2024 10:00")
+    versions.append(history.version)
+    frame = history.documents()
+    history.add("b.pdf", {"N° Document": "B", "Client": "Orange", "Notes": "urgent"}, pd.DataFrame([{"Description": "x"}]),
+                "devis", "Orange", "01/03/2024 10:00")
+    versions.append(history.version)
+    # Nouvelle colonne : complétée pour les documents déjà présents ; DataFrame reconstruit après un ajout
+    assert history.documents()["Notes"].tolist() == ["", "urgent"] and "Notes" not in frame
+    assert history.lines()["Fichier"].tolist() == ["b.pdf"]
+    assert history.documents(internal=True) is history.documents(internal=True)
+
+    history.rename_client("Orange", "SFR")
+    versions.append(history.version)
+    assert history.clients() == ["SFR"] and list(history.select("SFR", "devis")) == [1]
+    assert history.documents()["Client"].tolist() == ["SFR", "SFR"]
+    history.clear()
+    versions.append(history.version)
+    assert not history and versions == sorted(set(versions))
@@ -0,0 +1,77 @@
+import time
+
+from bench.bench_concurrency import TINY_PNG
+from docscan.history import HistoryStore
+from docscan.jobs import CANCELLED, DONE, EXTRACTED, FAILED, QUEUED, RUNNING, JobRunner
+from docscan.uploads import Upload
+
+
+def uploads(n):
+    return [Upload(f"scan_{i}.png", data=TINY_PNG) for i in range(n)]
+
+
+def wait(job, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        assert time.monotonic() < deadline, f"travail toujours {job.status}"
+        time.sleep(0.01)
+    return job
+
+
+def test_job_runs_in_the_background(stub):
+    state, url = stub(latency=0.1)
+    history = HistoryStore()
+    files = uploads(4)
+    job = JobRunner(workers=1).submit(files, history, "sk-test", max_in_flight=2, base_url=url)
+    assert job.status in (QUEUED, RUNNING) and not history
+    wait(job)
+    assert job.status == DONE and job.progress() == 1.0 and job.counts() == {EXTRACTED: 4}
+    assert len(history) == 4 and state.max_in_flight == 2
+    assert [doc["preview"] for doc in job.documents] == [TINY_PNG] * 4
+    assert all("Mise à plat" in trace["stages"] for trace in job.traces())
+    assert [f._data for f in files] == [None] * 4  # octets libérés une fois traités
+
+
+def test_cancel_stops_the_queue(stub):
+    state, url = stub(latency=0.3)
+    history = HistoryStore()
+    files = uploads(6)
+    job = JobRunner(workers=1).submit(files, history, "sk-test", max_in_flight=1, base_url=url)
+    while not job.completed():
+        time.sleep(0.01)
+    job.cancel()
+    wait(job)
+    counts = job.counts()
+    assert job.status == CANCELLED and counts[EXTRACTED] >= 1 and counts[CANCELLED] >= 4
+    assert counts[EXTRACTED] + counts[CANCELLED] == 6 and len(history) == counts[EXTRACTED]
+    time.sleep(0.4)
+    assert state.requests <= counts[EXTRACTED] + 1  # au plus le document en vol à l'annulation
+    assert [f._data for f in files] == [None] * 6
+
+
+def test_jobs_wait_for_a_free_worker(stub):
+    state, url = stub(latency=0.2)
+    runner = JobRunner(workers=1)
+    first = runner.submit(uploads(1), HistoryStore(), "sk-test", batch="a", base_url=url)
+    second = runner.submit(uploads(1), HistoryStore(), "sk-test", batch="b", base_url=url)
+    time.sleep(0.1)
+    assert (first.status, second.status) == (RUNNING, QUEUED)
+    second.cancel()
+    wait(first), wait(second)
+    assert (first.status, second.status) == (DONE, CANCELLED) and state.requests == 1
+    assert runner.jobs() == [second, first] and runner.jobs(batch="a") == [first]
+
+
+def test_invalid_key_fails_the_job(stub, no_backoff):
+    state, url = stub(error_rate=1.0, error_codes=(401,))
+    job = wait(JobRunner(workers=1).submit(uploads(5), HistoryStore(), "sk-test", max_in_flight=1, base_url=url))
+    assert job.status == FAILED and job.error == "Clé API invalide."
+    assert state.requests == 1 and job.counts()[FAILED] == 1 and job.counts()[CANCELLED] == 4
+
+
+def test_old_finished_jobs_are_dropped(stub):
+    state, url = stub()
+    runner = JobRunner(workers=1, max_jobs=2)
+    jobs = [wait(runner.submit(uploads(1), HistoryStore(), "sk-test", base_url=url)) for _ in range(4)]
+    runner.submit([], HistoryStore(), "sk-test", base_url=url)
+    assert runner.get(jobs[0].id) is None and runner.get(jobs[1].id) is None and runner.get(jobs[3].id) is jobs[3]
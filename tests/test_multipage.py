@@ -0,0 +1,58 @@
+import copy
+import re
+
+from bench.stub_openai import SAMPLE_DOCUMENT
+from bench.synthetic import make_truth, render_pages, to_pdf
+from docscan.extraction import extract_document, merge_pages
+from docscan.raster import RENDER_DPI
+from docscan.uploads import Upload
+
+
+def page(number, lines=1, totals=None, **document):
+    data = copy.deepcopy(SAMPLE_DOCUMENT)
+    data["document"].update(document)
+    data["lignes"] = [{**data["lignes"][0], "description": f"Ligne {number}.{i}"} for i in range(lines)]
+    data["totaux"] = totals if totals is not None else {"total_ht": "", "total_tva": "", "total_ttc": "", "devise": ""}
+    return data
+
+
+def test_merge_pages():
+    first = page(1, lines=2, numero="F-42", date_echeance="")
+    middle = page(2, lines=0, numero="", date_echeance="30/04/2024", totals={"total_ht": "90.00", "devise": "EUR"})
+    last = page(3, totals={"total_ht": "100.00", "total_tva": "", "total_ttc": "108.50", "devise": ""})
+    last["lignes"].append({"description": "", "quantite": "", "prix_unitaire_ht": "", "montant_ht": "", "tva_pourcent": ""})
+    merged = merge_pages([first, middle, last])
+    # En-têtes : première valeur non vide ; lignes dans l'ordre, sans lignes vides
+    assert merged["document"]["numero"] == "F-42" and merged["document"]["date_echeance"] == "30/04/2024"
+    assert [l["description"] for l in merged["lignes"]] == ["Ligne 1.0", "Ligne 1.1", "Ligne 3.0"]
+    # Totaux : la dernière page qui en porte, complétée par les précédentes
+    assert merged["totaux"] == {"total_ht": "100.00", "total_tva": "", "total_ttc": "108.50", "devise": "EUR"}
+    assert merge_pages([first]) == first
+
+
+def test_pages_are_extracted_in_flight_and_merged(stub, poppler, tmp_path):
+    truth = make_truth(3, "facture", n_lines=30)
+    pages = render_pages(truth, lines_per_page=10)
+    path = tmp_path / "long.pdf"
+    path.write_bytes(to_pdf(pages))
+    calls = poppler(pages)
+
+    def responder(request):
+        number, total = map(int, re.search(r"Page (\d+) sur (\d+)", request["messages"][-1]["content"][0]["text"]).groups())
+        return page(number, totals={"total_ht": f"{number}00.00"} if number == total else None)
+
+    state, url = stub(responder=responder, latency=0.05)
+    trace = {}
+    data, preview = extract_document(Upload("long.pdf", path=str(path)), "sk-test", base_url=url, multipage=True,
+                                     max_pages=2, pages_in_flight=2, trace=trace)
+    assert sorted(calls) == [(1, RENDER_DPI), (2, RENDER_DPI)] and state.requests == 2
+    assert state.max_in_flight == 2 and preview
+    assert [l["description"] for l in data["lignes"]] == ["Ligne 1.0", "Ligne 2.0"]
+    assert data["totaux"]["total_ht"] == "200.00"
+    assert trace["pages_total"] == 3 and [p["Page"] for p in trace["pages"]] == [1, 2]
+    assert trace["payload"]["tokens_after"] == sum(p["Tokens image"] for p in trace["pages"])
+
+    # Un seul rendu en vol : les pages passent une à une
+    state, url = stub(responder=responder, latency=0.05)
+    extract_document(Upload("long.pdf", path=str(path)), "sk-test", base_url=url, multipage=True, pages_in_flight=1)
+    assert state.requests == 3 and state.max_in_flight == 1
@@ -0,0 +1,69 @@
+import copy
+import math
+
+import pandas as pd
+
+from bench.stub_openai import SAMPLE_DOCUMENT
+from docscan.aggregates import NO_DATE, NO_RATE, by_client, by_month, vat_breakdown
+from docscan.extraction import add_to_history
+from docscan.normalize import RAW_COLUMN, normalize_documents, normalize_lines, to_date, to_number
+from docscan.repository import DocumentRepository
+
+
+def numbers(values):
+    return [None if math.isnan(v) else v for v in to_number(values)]
+
+
+def test_french_and_english_amounts():
+    assert numbers(["1 234,56 €", "1.234,56", "1,234.56", "1234.56", "8,5 %", "(12,00)", "-1.234.567,8",
+                    "12.345.678", " 42 ", 7, 2.5]) == [
+        1234.56, 1234.56, 1234.56, 1234.56, 8.5, -12.0, -1234567.8, 12345678.0, 42.0, 7.0, 2.5]
+
+
+def test_single_dot_is_a_decimal():
+    """Le prompt demande « 1234.56 » : un prix à trois décimales ou une quantité « 2.500 » ne sont pas des milliers."""
+    assert numbers(["1.859", "2.500"]) == [1.859, 2.5]
+    lines = normalize_lines(pd.DataFrame({"Quantité": ["2.500"], "Prix unitaire HT": ["1.859"]}))
+    assert lines.loc[0, "Quantité"] == 2.5 and lines.loc[0, "Prix unitaire HT"] == 1.859
+
+
+def test_unreadable_amounts():
+    assert numbers(["N/A", "", None, "12,34,56x"]) == [None, None, None, None]
+
+
+def test_dates():
+    dates = to_date(["12/03/2024", "1-2-24", "2024-03-12", "2024-03-12T10:00:00", "1er mars 2024",
+                     "12 févr. 2024", "31/02/2024", "Mars 2024", "", None, pd.Timestamp("2024-05-01")])
+    assert [None if pd.isna(d) else d.strftime("%Y-%m-%d") for d in dates] == [
+        "2024-03-12", "2024-02-01", "2024-03-12", "2024-03-12", "2024-03-01", "2024-02-12",
+        None, None, None, None, "2024-05-01"]
+
+
+def test_unreadable_text_is_kept():
+    df = normalize_documents(pd.DataFrame({"Total TTC": ["108,50", "N/A"], "Date émission": ["12/03/2024", "Mars 2024"]}))
+    assert df["Total TTC"].tolist()[0] == 108.5 and pd.isna(df["Total TTC"][1])
+    assert pd.isna(df[RAW_COLUMN][0])
+    assert df[RAW_COLUMN][1] == "Total TTC : N/A ; Date émission : Mars 2024"
+
+
+def test_ingest_then_aggregate():
+    repo = DocumentRepository(":memory:")
+    for client, ttc, date, rate in (("SFR", "108.50", "12/03/2024", "8.5"), ("SFR", "1 000,00", "20/03/2024", "20"),
+                                    ("EDF", "50", "Mars 2024", "")):
+        data = copy.deepcopy(SAMPLE_DOCUMENT)
+        data["client_detecte"] = client
+        data["document"]["date_emission"] = date
+        data["totaux"]["total_ttc"] = ttc
+        data["lignes"][0]["tva_pourcent"] = rate
+        add_to_history(repo, f"{client}.pdf", data, "01/04/2024 10:00")
+
+    clients = by_client(repo.amounts())
+    assert clients["Client"].tolist() == ["SFR", "EDF"]
+    assert clients["Total TTC"].tolist() == [1108.5, 50.0]
+    months = by_month(repo.amounts())
+    assert months["Mois"].tolist() == ["2024-03", NO_DATE]
+    assert months["Documents"].tolist() == [2, 1]
+    vat = vat_breakdown(repo.vat_lines())
+    assert vat["Taux"].tolist() == ["8.5 %", "20 %", NO_RATE]
+    assert vat["TVA calculée"].tolist()[:2] == [8.5, 20.0]
+    assert repo.documents()[RAW_COLUMN].tolist()[2] == "Date émission : Mars 2024"
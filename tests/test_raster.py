@@ -0,0 +1,63 @@
+import io
+import shutil
+
+import pytest
+from PIL import Image
+
+from bench.synthetic import make_truth, render_pages, to_pdf
+from docscan.cache import ExtractionCache
+from docscan.extraction import extract_document
+from docscan.raster import PREVIEW_DPI, PREVIEW_MAX_SIZE, RENDER_DPI, image_preview, rasterize_pdf
+from docscan.uploads import Upload
+
+PAGE = render_pages(make_truth(1, "facture"))[0]
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(to_pdf([PAGE]))
+    return path
+
+
+def test_one_render_gives_payload_and_preview(poppler, pdf):
+    calls = poppler([PAGE])
+    payload, ext, preview, stats = rasterize_pdf(str(pdf))
+    assert calls == [(1, RENDER_DPI)]
+    assert ext == "png" and Image.open(io.BytesIO(payload)).size == PAGE.size
+    with Image.open(io.BytesIO(preview)) as image:
+        assert image.format == "JPEG" and image.width <= PREVIEW_MAX_SIZE[0] and image.height <= PREVIEW_MAX_SIZE[1]
+    payload, ext, _, stats = rasterize_pdf(str(pdf), compaction={}, fingerprint=True)
+    assert ext == "jpeg" and len(calls) == 2 and stats["fingerprint"]
+
+
+def test_pdf_is_rendered_once_per_extraction(stub, poppler, pdf):
+    state, url = stub()
+    calls = poppler([PAGE])
+    cache = ExtractionCache(":memory:")
+    trace = {}
+    data, preview = extract_document(Upload("scan.pdf", path=str(pdf)), "sk-test", cache=cache, base_url=url,
+                                     trace=trace)
+    assert calls == [(1, RENDER_DPI)] and preview and state.requests == 1
+    assert trace["payload"]["bytes_after"] > 0 and "Rendu" in trace["stages"]
+
+    # Hit de cache : aperçu seul, à sa résolution ; sans aperçu, aucun rendu
+    _, preview = extract_document(Upload("scan.pdf", path=str(pdf)), "sk-test", cache=cache, base_url=url)
+    assert calls[1:] == [(1, PREVIEW_DPI)] and preview
+    _, preview = extract_document(Upload("scan.pdf", path=str(pdf)), "sk-test", cache=cache, base_url=url,
+                                  with_preview=False)
+    assert len(calls) == 2 and preview is None and state.requests == 1
+
+
+def test_image_preview_is_reduced(tmp_path):
+    path = tmp_path / "photo.jpg"
+    PAGE.resize((2480, 3508)).save(path, quality=85)
+    with Image.open(io.BytesIO(image_preview(str(path)))) as image:
+        assert image.width <= PREVIEW_MAX_SIZE[0] and image.height <= PREVIEW_MAX_SIZE[1]
+
+
+@pytest.mark.skipif(shutil.which("pdftoppm") is None, reason="poppler absent")
+def test_poppler_render(pdf):
+    payload, ext, preview, _ = rasterize_pdf(str(pdf))
+    width, height = Image.open(io.BytesIO(payload)).size
+    assert ext == "png" and abs(width - round(8.27 * RENDER_DPI)) <= 2 and preview
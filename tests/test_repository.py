@@ -0,0 +1,73 @@
+import pandas as pd
+
+from docscan.repository import DocumentRepository
+
+
+def add(repo, n, client="SFR", start=0):
+    ids = []
+    for i in range(start, start + n):
+        flat = {"N° Document": f"F-{i}", "Client": client, "Total TTC": 100.0 + i}
+        lines = pd.DataFrame([{"Description": "Prestation", "Montant HT": 100.0 + i}])
+        ids.append(repo.add(f"f{i}.pdf", flat, lines, "Facture", client, "01/03/2024 10:00"))
+    return ids
+
+
+def test_version_changes_on_every_write():
+    repo = DocumentRepository(":memory:")
+    assert repo.version == 0
+    versions = [repo.version]
+    add(repo, 2)
+    versions.append(repo.version)
+    repo.clear()
+    versions.append(repo.version)
+    add(repo, 2)
+    versions.append(repo.version)
+    assert len(set(versions)) == len(versions)
+    assert versions == sorted(versions)
+
+
+def test_clear_then_re_add_is_a_new_version():
+    """Mêmes id réattribués par SQLite et même nombre de documents : la version change quand même."""
+    repo = DocumentRepository(":memory:")
+    first = add(repo, 3)
+    before = repo.version
+    repo.clear()
+    assert len(repo) == 0 and not repo
+    assert repo.lines().empty
+    second = add(repo, 3)
+    assert second == first
+    assert repo.version != before
+    assert len(repo) == 3
+
+
+def test_clear_only_touches_its_batch(tmp_path):
+    path = str(tmp_path / "documents.sqlite")
+    main, other = DocumentRepository(path), DocumentRepository(path, batch="autre")
+    add(main, 2)
+    add(other, 1)
+    other_version = other.version
+    main.clear()
+    assert len(main) == 0 and len(other) == 1
+    assert other.version == other_version
+
+
+def test_version_seen_by_another_session(tmp_path):
+    path = str(tmp_path / "documents.sqlite")
+    mine, theirs = DocumentRepository(path), DocumentRepository(path)
+    before = mine.version
+    add(theirs, 1)
+    assert mine.version != before
+    assert len(mine) == 1
+
+
+def test_rename_client_bumps_batches_holding_it(tmp_path):
+    path = str(tmp_path / "documents.sqlite")
+    main, other = DocumentRepository(path), DocumentRepository(path, batch="autre")
+    add(main, 2, client="S.F.R.")
+    add(other, 1, client="Orange")
+    versions = main.version, other.version
+    main.rename_client("S.F.R.", "SFR")
+    assert main.clients() == ["SFR"]
+    assert main.documents()["Client"].tolist() == ["SFR", "SFR"]
+    assert main.version != versions[0]
+    assert other.version == versions[1]
@@ -0,0 +1,93 @@
+import copy
+import json
+
+import pytest
+
+from bench.stub_openai import CORRUPTIONS, SAMPLE_DOCUMENT
+from docscan.extraction import extract_text, parse_document
+from docscan.schema import InvalidResponse, check_response, conform, validate
+
+
+def test_valid_document_needs_no_fix():
+    assert validate(SAMPLE_DOCUMENT) == []
+    assert check_response(copy.deepcopy(SAMPLE_DOCUMENT)) == (SAMPLE_DOCUMENT, 0)
+
+
+def test_local_fixes():
+    doc = copy.deepcopy(SAMPLE_DOCUMENT)
+    del doc["notes"]
+    doc["totaux"]["total_ttc"] = 108.5
+    doc["emetteur"]["email"] = None
+    doc["type_document"] = "Facture"
+    doc["commentaire"] = "en trop"
+    fixed, fixes = check_response(doc)
+    assert fixes == 5
+    assert validate(fixed) == []
+    assert fixed["notes"] == "" and "commentaire" not in fixed
+    assert fixed["totaux"]["total_ttc"] == "108.50"
+    assert fixed["emetteur"]["email"] == ""
+    assert fixed["type_document"] == "facture"
+
+
+def test_unknown_enum_falls_back():
+    fixed, _ = check_response(dict(copy.deepcopy(SAMPLE_DOCUMENT), type_document="bon de cadeau", confiance_type="?"))
+    assert (fixed["type_document"], fixed["confiance_type"]) == ("autre", "basse")
+
+
+def test_wrong_structure_is_not_guessed():
+    doc = copy.deepcopy(SAMPLE_DOCUMENT)
+    doc["lignes"] = {"0": doc["lignes"][0]}
+    assert conform(doc) == (None, 0)
+    with pytest.raises(InvalidResponse) as exc:
+        check_response(doc)
+    assert exc.value.errors
+
+
+def test_parse_document_strips_fences():
+    data, fixes = parse_document("```json\n" + json.dumps(SAMPLE_DOCUMENT) + "\n```")
+    assert data == SAMPLE_DOCUMENT and fixes == 0
+    with pytest.raises(json.JSONDecodeError):
+        parse_document('{"type_document": ')
+
+
+def test_out_of_schema_response_is_repaired(stub, corruptions):
+    corruptions("structure")
+    state, url = stub(invalid_rate=1.0)
+    trace = {}
+    data = extract_text("Facture", "sk-test", base_url=url, trace=trace)
+    assert data == SAMPLE_DOCUMENT
+    assert trace["parse_failures"] == trace["repairs"] == trace["repaired"] == 1
+    assert state.requests == 2 and state.repairs == 1
+
+
+def test_repair_can_be_disabled(stub, corruptions):
+    corruptions("tronqué")
+    state, url = stub(invalid_rate=1.0)
+    with pytest.raises(InvalidResponse):
+        extract_text("Facture", "sk-test", base_url=url, repair=False)
+    assert state.requests == 1 and state.repairs == 0
+
+
+def test_failed_repair_raises(stub):
+    state, url = stub(responder=lambda request: {"lignes": "aucune"})
+    trace = {}
+    with pytest.raises(InvalidResponse) as exc:
+        extract_text("Facture", "sk-test", base_url=url, trace=trace)
+    assert exc.value.errors
+    assert state.requests == 2 and trace["repairs"] == 1 and "repaired" not in trace
+
+
+@pytest.mark.parametrize("kind", CORRUPTIONS)
+def test_streamed_response_is_repaired(stub, corruptions, kind):
+    corruptions(kind)
+    state, url = stub(invalid_rate=1.0)
+    fields, trace = [], {}
+    data = extract_text("Facture", "sk-test", base_url=url, stream=True, trace=trace,
+                        on_field=lambda path, value: fields.append(path))
+    assert data["document"] == SAMPLE_DOCUMENT["document"]
+    assert data["type_document"] == "facture"
+    assert state.invalid[kind] == 1
+    if kind == "corrigible":
+        assert trace["local_fixes"] > 0 and "repairs" not in trace and state.repairs == 0
+    else:
+        assert trace["repairs"] == trace["repaired"] == state.repairs == 1
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from bench.stub_openai import SAMPLE_DOCUMENT, corrupt
+from docscan.extraction import extract_text
+from docscan.stream import KEY_FIELDS, IncrementalJSON
+
+TEXT = json.dumps(SAMPLE_DOCUMENT, ensure_ascii=False)
+
+
+def feed(parser, text, size=3):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+def test_fields_as_they_complete():
+    parser = IncrementalJSON()
+    events = dict(feed(parser, "```json\n" + TEXT + "\n```"))
+    assert not parser.broken
+    assert parser.value == SAMPLE_DOCUMENT
+    assert events[("document", "numero")] == "F-0001"
+    assert events[("totaux", "total_ttc")] == "108.50"
+    assert events[("lignes", 0)] == SAMPLE_DOCUMENT["lignes"][0]
+    assert all(path in events for path in KEY_FIELDS)
+
+
+def test_key_field_before_end_of_text():
+    parser = IncrementalJSON()
+    cut = TEXT.index('"confiance_type"')
+    assert (("type_document",), "facture") in parser.feed(TEXT[:cut])
+
+
+def test_escapes_and_nested_quotes():
+    parser = IncrementalJSON()
+    text = json.dumps({"notes": 'dit "payé" \\ é\n', "lignes": [[1, 2.5, True, None]]}, ensure_ascii=True)
+    feed(parser, text, size=1)
+    assert parser.value == json.loads(text)
+
+
+@pytest.mark.parametrize("kind", ["littéral", "échappement"])
+def test_invalid_json_stops_without_raising(kind):
+    parser = IncrementalJSON()
+    events = feed(parser, corrupt(SAMPLE_DOCUMENT, kind))
+    assert parser.broken
+    assert (("type_document",), "facture") not in events
+    assert parser.feed('"encore"}') == []
+
+
+def test_streamed_extraction_matches_plain(stub):
+    _, url = stub(token_delay=0.001)
+    fields, trace = [], {}
+    streamed = extract_text("Facture", "sk-test", base_url=url, stream=True, trace=trace,
+                            on_field=lambda path, value: fields.append(path))
+    assert streamed == extract_text("Facture", "sk-test", base_url=url)
+    assert all(path in fields for path in KEY_FIELDS)
+    assert fields.index(("type_document",)) < fields.index(("totaux", "total_ttc"))
+    assert 0 < trace["first_field"] < trace["stages"]["Requête"]
+    assert trace["usage"]["completion_tokens"] > 0  # usage en fin de flux (include_usage)
@@ -0,0 +1,119 @@
+import os
+import shutil
+
+import pytest
+
+from bench.synthetic import make_truth, render_pages, to_pdf, to_text_pdf
+from docscan.extraction import extract_document
+from docscan.layouts import load_layouts, normalize_amount, parse_local
+from docscan.textlayer import compact_text, is_usable, pdf_text
+from docscan.uploads import Upload
+
+LAYOUTS = load_layouts(os.path.join(os.path.dirname(os.path.dirname(__file__)), "bench", "layouts_synthetic.json"))
+
+
+def layout_text(truth):
+    """Texte d'un PDF de to_text_pdf() tel que le rend pdftotext -layout (colonnes séparées par des espaces)."""
+    em, t = truth["emetteur"], truth["totaux"]
+    label = truth["type_document"].replace("_", " ").upper()
+    rows = [f"   {em['nom']}", f"   {em['adresse']}", f"   Tél : {em['telephone']}", f"   SIRET : {em['siret']}", "",
+            f"   {label} N° {truth['document']['numero']}            Date : {truth['document']['date_emission']}", "",
+            f"   Client : {truth['client_detecte']}", "",
+            "   Désignation                  Qté       PU HT      Montant HT"]
+    rows += [f"   {l['description']}          {l['quantite']}       {l['prix_unitaire_ht']}       {l['montant_ht']}"
+             for l in truth["lignes"]]
+    rows += ["", f"                        Total HT       {t['total_ht']} €",
+             f"                        TVA 8,5 %      {t['total_tva']} €",
+             f"                        Total TTC      {t['total_ttc']} €"]
+    return "\n".join(rows)
+
+
+def test_known_layouts_are_read_exactly():
+    for seed in range(12):
+        truth = make_truth(seed)
+        assert parse_local(layout_text(truth), LAYOUTS) == (truth, truth["emetteur"]["nom"])
+
+
+def test_unreliable_reads_go_to_the_api():
+    truth = make_truth(1)
+    text = layout_text(truth)
+    # Somme des lignes ≠ total HT, champ requis absent, fournisseur inconnu
+    assert parse_local(text.replace(f"Total HT       {truth['totaux']['total_ht']}", "Total HT       1.00"), LAYOUTS) is None
+    assert parse_local(text.replace("Client :", "Destinataire :"), LAYOUTS) is None
+    assert parse_local(text.replace(truth["emetteur"]["nom"], "Autre Fournisseur"), LAYOUTS) is None
+    assert parse_local(text, []) is None
+
+
+def test_amounts():
+    assert [normalize_amount(v) for v in ("1 234,56 €", "1.234,56", "1,234.56", "12,5", "7")] == \
+        ["1234.56", "1234.56", "1234.56", "12.5", "7"]
+    with pytest.raises(ValueError):
+        normalize_amount("n/a")
+
+
+def test_usable_text_and_compaction():
+    text = layout_text(make_truth(2))
+    assert is_usable([text]) and not is_usable([]) and not is_usable(["  12  \n"])
+    assert not is_usable([text + "�" * (len(text) // 20)])  # police sans table Unicode
+    compacted = compact_text([text, "Page      2\n\n\n\nfin"])
+    assert compacted.startswith("--- Page 1 ---\n") and "\n\n--- Page 2 ---\nPage  2\n\nfin" in compacted
+    assert "   " not in compacted.replace("\n", "")[20:] and len(compact_text([text], max_chars=100)) == 100
+
+
+@pytest.fixture
+def native(tmp_path, monkeypatch):
+    """PDF natif d'un fournisseur connu ; pdftotext remplacé par le texte qu'il en tirerait."""
+    truth = make_truth(4)
+    path = tmp_path / "natif.pdf"
+    path.write_bytes(to_text_pdf(truth))
+    monkeypatch.setattr("docscan.extraction.pdf_text", lambda pdf_path, last_page=1: [layout_text(truth)])
+    return truth, Upload("natif.pdf", path=str(path))
+
+
+def test_known_layout_needs_no_call(stub, native):
+    truth, upload = native
+    state, url = stub()
+    trace = {}
+    data, _ = extract_document(upload, "sk-test", base_url=url, text_layer=True, layouts=LAYOUTS,
+                               with_preview=False, trace=trace)
+    assert data == truth and state.requests == 0
+    assert (trace["path"], trace["layout"], trace["text_chars"]) == ("local", "Imprimerie du Sud", len(layout_text(truth)))
+
+
+def test_other_native_pdfs_send_text(stub, native):
+    truth, upload = native
+    sent = []
+
+    def responder(request):
+        sent.append(request["messages"][-1]["content"])
+        return truth
+
+    state, url = stub(responder=responder)
+    trace = {}
+    data, _ = extract_document(upload, "sk-test", base_url=url, text_layer=True, layouts=[], with_preview=False,
+                               trace=trace)
+    assert data == truth and trace["path"] == "texte" and len(sent) == 1
+    assert isinstance(sent[0], str) and compact_text([layout_text(truth)]) in sent[0]
+
+
+def test_scans_go_to_vision(stub, poppler, tmp_path, monkeypatch):
+    page = render_pages(make_truth(4))[0]
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(to_pdf([page]))
+    poppler([page])
+    monkeypatch.setattr("docscan.extraction.pdf_text", lambda pdf_path, last_page=1: [""])
+    state, url = stub()
+    trace = {}
+    extract_document(Upload("scan.pdf", path=str(path)), "sk-test", base_url=url, text_layer=True, layouts=LAYOUTS,
+                     with_preview=False, trace=trace)
+    assert trace["path"] == "vision" and state.requests == 1 and "Texte" in trace["stages"]
+
+
+@pytest.mark.skipif(shutil.which("pdftotext") is None, reason="poppler absent")
+def test_pdftotext(tmp_path):
+    truth = make_truth(4, n_lines=40)
+    path = tmp_path / "natif.pdf"
+    path.write_bytes(to_text_pdf(truth))
+    pages = pdf_text(str(path), last_page=2)
+    assert len(pages) == 2 and is_usable(pages)
+    assert parse_local("\n".join(pages), LAYOUTS)[0] == truth
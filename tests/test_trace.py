@@ -0,0 +1,58 @@
+import threading
+from types import SimpleNamespace
+
+from bench.bench_concurrency import TINY_PNG, FakeUpload
+from docscan.extraction import extract_document, get_client, retry_delay
+from docscan.trace import METRICS, STAGES, merge_into, path_summary, stage_table, summarize, usage_totals
+
+
+def test_one_client_per_key_and_url():
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(get_client("sk-pool", "http://127.0.0.1:1/v1")))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(c) for c in clients}) == 1 and clients[0].max_retries == 0
+    assert get_client("sk-pool", "http://127.0.0.1:2/v1") is not clients[0]
+    assert get_client("sk-pool-2", "http://127.0.0.1:1/v1") is not clients[0]
+
+
+def test_document_trace(stub):
+    state, url = stub()
+    traces = []
+    for _ in range(3):
+        trace = {}
+        extract_document(FakeUpload("scan.png", TINY_PNG), "sk-test", base_url=url, trace=trace)
+        traces.append(trace)
+    trace = traces[0]
+    assert set(trace["stages"]) >= {"Lecture", "Base64", "Requête", "Parse"} and set(trace["stages"]) <= set(STAGES)
+    assert trace["total"] >= sum(trace["stages"].values()) * 0.99 and trace["attempts"] == 1
+    assert trace["usage"]["total_tokens"] == trace["usage"]["prompt_tokens"] + trace["usage"]["completion_tokens"] > 0
+    assert stage_table(trace)["Étape"].tolist() == [s for s in STAGES if s in trace["stages"]] + \
+        [name for name, key in METRICS if key in trace]
+
+    summary = summarize(traces).set_index("Étape")
+    assert (summary.loc["Requête", "Docs"], summary.loc["Total", "Part"]) == (3, "")
+    assert usage_totals(traces)["total_tokens"] == 3 * trace["usage"]["total_tokens"]
+    assert path_summary(traces)[["Chemin", "Docs", "Part"]].values.tolist() == [["Vision", 3, "100%"]]
+
+
+def test_merge_and_paths():
+    pages = [{"stages": {"Rendu": 0.2, "Requête": 1.0}, "usage": {"total_tokens": 100}, "attempts": 2},
+             {"stages": {"Rendu": 0.3}, "usage": {"total_tokens": 50}, "attempts": 1, "repairs": 1}]
+    trace = {}
+    merge_into(trace, pages)
+    assert trace == {"stages": {"Rendu": 0.5, "Requête": 1.0}, "usage": {"total_tokens": 150}, "attempts": 3,
+                     "repairs": 1}
+    traces = [{"path": "vision", "total": 2.0, "usage": {"total_tokens": 1000}},
+              {"path": "cache", "total": 0.5, "usage": {}}]
+    rows = path_summary(traces).set_index("Chemin")
+    assert rows.loc["Cache", "Gain temps"] == "75%" and rows.loc["Cache", "Gain tokens"] == "100%"
+
+
+def test_retry_after_is_respected():
+    exc = SimpleNamespace(response=SimpleNamespace(headers={"retry-after": "7"}))
+    assert 7 <= retry_delay(0, exc=exc) <= 30
+    assert retry_delay(10, max_delay=30) <= 30
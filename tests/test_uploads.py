@@ -0,0 +1,54 @@
+import base64
+import io
+import json
+
+from bench.stub_openai import SAMPLE_DOCUMENT
+from docscan.extraction import extract_data
+from docscan.uploads import DataURL, Upload, b64_chunks, encode_body
+
+
+def test_b64_chunks_match_one_shot_encoding():
+    data = bytes(range(256)) * 41
+    for size in (1, 2, 3, 7, 1000):
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        assert b"".join(b64_chunks(chunks)) == base64.b64encode(data)
+
+
+def test_encode_body_writes_images_in_place(tmp_path):
+    image = bytes(range(256)) * 5000
+    path = tmp_path / "scan.png"
+    path.write_bytes(image)
+    expected = f"data:image/png;base64,{base64.b64encode(image).decode('ascii')}"
+    for source in (image, Upload("scan.png", path=str(path))):
+        url = DataURL(source, "png")
+        assert len(url) == len(expected) and str(url) == expected
+        body = {"messages": [{"content": [{"type": "text", "text": "Analyse « ce » document"},
+                                          {"type": "image_url", "image_url": {"url": url}}]}]}
+        out = encode_body(body)
+        assert isinstance(out, io.BytesIO) and out.tell() == 0
+        assert json.loads(out.read())["messages"][0]["content"][1]["image_url"]["url"] == expected
+
+
+def test_encode_body_without_image():
+    assert encode_body({"a": "é"}).getvalue() == '{"a": "é"}'.encode("utf-8")
+
+
+def test_image_reaches_the_api_whole(stub, no_backoff, tmp_path):
+    """Chemin réel du SDK (client.post, content= ou body= selon sa version) : le serveur reçoit toute l'image."""
+    image = bytes(range(256)) * 4000
+    path = tmp_path / "scan.png"
+    path.write_bytes(image)
+    received = []
+
+    def responder(request):
+        received.append(request["messages"][-1]["content"][-1]["image_url"]["url"])
+        return SAMPLE_DOCUMENT
+
+    # Une erreur sur deux : la nouvelle tentative relit le même corps depuis le début
+    state, url = stub(responder=responder, error_rate=0.5, error_codes=(503,))
+    for stream in (False, True):
+        data = extract_data(Upload("scan.png", path=str(path)), "png", "sk-test", base_url=url, stream=stream,
+                            max_retries=20)
+        assert data["document"]["numero"] == SAMPLE_DOCUMENT["document"]["numero"]
+    expected = f"data:image/png;base64,{base64.b64encode(image).decode('ascii')}"
+    assert received == [expected, expected]